@@ -1,9 +1,156 @@
 """
 Dependency injection for authenticated routes
 """
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+import httpx
 from fastapi import Header, HTTPException, status, Request
+from prisma import Prisma
 from app.core.config import settings
+from app.core.database import db
+from app.core.http import http_clients
+from app.core.singleflight import SingleFlight
+from app.core.security import (
+    TokenVerificationError,
+    UnknownSigningKeyError,
+    jwt_verifier,
+    session_cache,
+    token_expiry,
+    user_from_claims,
+)
+
+# Coalesces concurrent verifications of the same token
+auth_flight: SingleFlight[Dict[str, Any]] = SingleFlight()
+
+
+async def get_db() -> Prisma:
+    """
+    Get the application-wide Prisma client.
+
+    Every router should depend on this instead of creating its own client,
+    so all requests share the pooled connection opened at startup.
+
+    Returns:
+        Connected Prisma client
+    """
+    return await db.get_client()
+
+
+async def fetch_remote_user(token: str) -> Dict[str, Any]:
+    """
+    Verify a session by asking Supabase for the token's user.
+
+    Args:
+        token: Supabase access token
+
+    Returns:
+        User data dict
+
+    Raises:
+        HTTPException: If the token is rejected or Supabase is unavailable
+    """
+    try:
+        response = await http_clients.get("supabase").get(
+            "/auth/v1/user",
+            headers={
+                "Authorization": f"Bearer {token}",
+                "apikey": settings.supabase_anon_key
+            }
+        )
+    except httpx.TimeoutException:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service unavailable"
+        )
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication failed"
+        )
+
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired session"
+        )
+
+    return response.json()
+
+
+async def verify_token(token: str) -> Tuple[Dict[str, Any], Optional[float]]:
+    """
+    Verify an access token without consulting the session cache.
+
+    The signature and expiry are checked locally against the cached
+    signing keys. Supabase is only called when the token is signed with a
+    key this process does not know.
+
+    Args:
+        token: Supabase access token
+
+    Returns:
+        User data dict and the token expiry as a Unix timestamp
+
+    Raises:
+        HTTPException: If the token is invalid or expired
+    """
+    try:
+        claims = await jwt_verifier.verify(token)
+    except UnknownSigningKeyError:
+        user = await fetch_remote_user(token)
+        return user, token_expiry(token)
+    except TokenVerificationError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired session"
+        )
+
+    return user_from_claims(claims), claims.get("exp")
+
+
+async def _verify_and_cache(token: str) -> Dict[str, Any]:
+    """Verify a token and record the outcome in the session cache"""
+    try:
+        user, expires_at = await verify_token(token)
+    except HTTPException as e:
+        if e.status_code == status.HTTP_401_UNAUTHORIZED:
+            session_cache.set_invalid(token, e.detail)
+        raise
+
+    session_cache.set_valid(token, user, expires_at)
+    return user
+
+
+async def authenticate_token(token: str) -> Dict[str, Any]:
+    """
+    Verify an access token and return its user.
+
+    Results are cached by token hash: verified users until the token
+    expires (capped by the cache TTL), rejected tokens for a few seconds.
+    Upstream outages are not cached. Concurrent misses for the same token
+    share a single verification.
+
+    Args:
+        token: Supabase access token
+
+    Returns:
+        User data dict
+
+    Raises:
+        HTTPException: If the token is invalid or expired
+    """
+    cached = session_cache.get(token)
+    if cached is not None:
+        valid, value = cached
+        if valid:
+            return value
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=value
+        )
+
+    return await auth_flight.do(
+        session_cache.key(token), lambda: _verify_and_cache(token)
+    )
 
 
 async def get_current_user(
@@ -32,38 +179,7 @@ async def get_current_user(
             detail="Not authenticated"
         )
 
-    # Verify session with Supabase
-    import httpx
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{settings.supabase_url}/auth/v1/user",
-                headers={
-                    "Authorization": f"Bearer {session_token}",
-                    "apikey": settings.supabase_anon_key
-                },
-                timeout=10.0
-            )
-
-            if response.status_code == 200:
-                return response.json()
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid or expired session"
-                )
-
-        except httpx.TimeoutException:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Authentication service unavailable"
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Authentication failed"
-            )
+    return await authenticate_token(session_token)
 
 
 async def optional_auth(
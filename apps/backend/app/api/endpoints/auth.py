@@ -2,11 +2,13 @@
 OAuth authentication endpoints using Supabase Auth
 """
 import httpx
-from fastapi import APIRouter, HTTPException, status, Response, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 from app.core.config import settings
-from app.api.deps import get_current_user
+from app.core.http import http_clients
+from app.core.security import session_cache
+from app.api.deps import authenticate_token, get_current_user
 from typing import Dict, Any
 import secrets
 
@@ -129,66 +131,63 @@ async def callback_oauth_get(
         )
 
     # Exchange code for session with Supabase
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{settings.supabase_url}/auth/v1/token?grant_type=pkce",
-                headers={
-                    "apikey": settings.supabase_anon_key,
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "auth_code": code,
-                    "code_verifier": code_verifier
-                },
-                timeout=10.0
-            )
-
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Failed to exchange code for session"
-                )
+    try:
+        response = await http_clients.get("supabase").post(
+            "/auth/v1/token?grant_type=pkce",
+            headers={
+                "apikey": settings.supabase_anon_key,
+                "Content-Type": "application/json"
+            },
+            json={
+                "auth_code": code,
+                "code_verifier": code_verifier
+            }
+        )
+    except httpx.TimeoutException:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service unavailable"
+        )
 
-            session_data = response.json()
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Failed to exchange code for session"
+        )
 
-            # Create redirect response with session cookies
-            frontend_url = settings.frontend_url.rstrip("/")
-            redirect_response = RedirectResponse(
-                url=f"{frontend_url}{redirect_to}",
-                status_code=302
-            )
+    session_data = response.json()
 
-            # Set HTTP-only cookies for session
-            redirect_response.set_cookie(
-                key="sb-access-token",
-                value=session_data.get("access_token", ""),
-                httponly=True,
-                secure=False,  # Set to True in production with HTTPS
-                samesite="lax",
-                max_age=3600  # 1 hour
-            )
+    # Create redirect response with session cookies
+    frontend_url = settings.frontend_url.rstrip("/")
+    redirect_response = RedirectResponse(
+        url=f"{frontend_url}{redirect_to}",
+        status_code=302
+    )
 
-            redirect_response.set_cookie(
-                key="sb-refresh-token",
-                value=session_data.get("refresh_token", ""),
-                httponly=True,
-                secure=False,
-                samesite="lax",
-                max_age=2592000  # 30 days
-            )
+    # Set HTTP-only cookies for session
+    redirect_response.set_cookie(
+        key="sb-access-token",
+        value=session_data.get("access_token", ""),
+        httponly=True,
+        secure=False,  # Set to True in production with HTTPS
+        samesite="lax",
+        max_age=3600  # 1 hour
+    )
 
-            # Clear temporary cookies
-            redirect_response.delete_cookie("sb-code-verifier")
-            redirect_response.delete_cookie("sb-redirect-to")
+    redirect_response.set_cookie(
+        key="sb-refresh-token",
+        value=session_data.get("refresh_token", ""),
+        httponly=True,
+        secure=False,
+        samesite="lax",
+        max_age=2592000  # 30 days
+    )
 
-            return redirect_response
+    # Clear temporary cookies
+    redirect_response.delete_cookie("sb-code-verifier")
+    redirect_response.delete_cookie("sb-redirect-to")
 
-        except httpx.TimeoutException:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Authentication service unavailable"
-            )
+    return redirect_response
 
 
 @router.post("/logout")
@@ -202,21 +201,24 @@ async def logout(request: Request) -> Response:
     Returns:
         Response with cleared cookies
     """
+    # Drop the cached verification for the session being closed
+    access_token = request.cookies.get("sb-access-token")
+    if access_token:
+        session_cache.invalidate(access_token)
+
     # Get refresh token if available
     refresh_token = request.cookies.get("sb-refresh-token")
 
     # Revoke session with Supabase if refresh token exists
     if refresh_token:
         try:
-            async with httpx.AsyncClient() as client:
-                await client.post(
-                    f"{settings.supabase_url}/auth/v1/logout",
-                    headers={
-                        "apikey": settings.supabase_anon_key,
-                        "Authorization": f"Bearer {refresh_token}"
-                    },
-                    timeout=10.0
-                )
+            await http_clients.get("supabase").post(
+                "/auth/v1/logout",
+                headers={
+                    "apikey": settings.supabase_anon_key,
+                    "Authorization": f"Bearer {refresh_token}"
+                }
+            )
         except Exception:
             pass  # Continue even if revocation fails
 
@@ -234,7 +236,7 @@ async def logout(request: Request) -> Response:
 
 
 @router.get("/me")
-async def get_me(user: Dict[str, Any] = get_current_user) -> Dict[str, Any]:
+async def get_me(user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
     """
     Get current authenticated user data.
 
@@ -266,26 +268,12 @@ async def get_session(request: Request) -> Dict[str, Any]:
     if not access_token:
         return {"authenticated": False, "user": None}
 
-    # Verify session with Supabase
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{settings.supabase_url}/auth/v1/user",
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "apikey": settings.supabase_anon_key
-                },
-                timeout=10.0
-            )
-
-            if response.status_code == 200:
-                user = response.json()
-                return {
-                    "authenticated": True,
-                    "user": user
-                }
-            else:
-                return {"authenticated": False, "user": None}
-
-    except Exception:
+        user = await authenticate_token(access_token)
+    except HTTPException:
         return {"authenticated": False, "user": None}
+
+    return {
+        "authenticated": True,
+        "user": user
+    }
@@ -0,0 +1,323 @@
+"""
+Wardrobe (clothing item) endpoints
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from prisma import Prisma
+from pydantic import BaseModel
+
+from app.api.deps import get_current_user, get_db
+from app.core.config import settings
+from app.core.responses import DuplexStreamingResponse
+from app.core.sse import format_sse
+from app.services import duplicates
+from app.services.bulk_upload import (
+    BulkUploader,
+    BulkUploadError,
+    MemoryBudget,
+    read_multipart,
+    read_zip,
+)
+from app.services.image_processing import ImageProcessor
+from app.services.perceptual_hash import parse_hash
+from app.services.tagging import CATEGORIES, TaggingService, get_tagging_service
+from app.storage import FileTooLargeError, StorageInterface, get_storage
+from app.storage.streams import limit_stream
+
+router = APIRouter(prefix="/api/clothing", tags=["clothing"])
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+# Only what the wardrobe grid shows; descriptions, sizes and timestamps
+# other than createdAt are loaded with the item itself
+LIST_COLUMNS = ("id", "name", "imageUrl", "category", "color", "brand", "season", "tags")
+
+# (createdAt as stored, id) of the last item on a page
+Cursor = Tuple[str, str]
+
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+
+
+# Schemas
+class ClothingItemSummary(BaseModel):
+    id: str
+    name: str
+    imageUrl: str
+    category: str
+    color: Optional[str]
+    brand: Optional[str]
+    season: Optional[str]
+    tags: List[str]
+    createdAt: str
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "ClothingItemSummary":
+        """Convert a raw query row to the response model"""
+        tags: List[str] = []
+        if row["tags"]:
+            try:
+                tags = json.loads(row["tags"])
+            except ValueError:
+                pass
+
+        created_at = row["createdAt"]
+        return cls(
+            **{column: row[column] for column in LIST_COLUMNS if column != "tags"},
+            tags=tags,
+            createdAt=(
+                created_at.isoformat() if isinstance(created_at, datetime) else str(created_at)
+            ),
+        )
+
+
+class ClothingPage(BaseModel):
+    items: List[ClothingItemSummary]
+    nextCursor: Optional[str]
+
+
+class DuplicateItem(BaseModel):
+    id: str
+    distance: int  # differing perceptual hash bits, 0-64
+
+
+class DuplicateList(BaseModel):
+    items: List[DuplicateItem]
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    """Encode a keyset position as an opaque URL-safe token"""
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Cursor:
+    """
+    Decode a token from :func:`encode_cursor`.
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        created_at, item_id = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor") from None
+    if not isinstance(created_at, str) or not isinstance(item_id, str):
+        raise ValueError("Invalid cursor")
+    return created_at, item_id
+
+
+def build_clothing_query(
+    user_id: str,
+    *,
+    category: Optional[str] = None,
+    color: Optional[str] = None,
+    season: Optional[str] = None,
+    tag: Optional[str] = None,
+    after: Optional[Cursor] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Tuple[str, List[Any]]:
+    """
+    Build the wardrobe page query, newest first.
+
+    Pages are keyed on ``(createdAt, id)`` rather than offsets, so each
+    page is an index range seek whatever its depth. The predicate
+    ``createdAt <= ? AND (createdAt < ? OR id < ?)`` is the row-value
+    comparison ``(createdAt, id) < (?, ?)`` written so SQLite can seek on
+    ``createdAt``. Filters on category, color or season are served by the
+    ``(userId, <filter>, createdAt, id)`` indexes; tags are a JSON array,
+    so a tag filter is checked on the rows of the chosen index.
+
+    Args:
+        user_id: Owner of the items
+        category: Exact category
+        color: Exact color
+        season: Exact season
+        tag: Tag the item's ``tags`` array must contain
+        after: Position of the last item of the previous page
+        limit: Rows to fetch
+
+    Returns:
+        SQL with ``?`` placeholders and its parameters
+    """
+    where = ['"userId" = ?']
+    params: List[Any] = [user_id]
+    for column, value in (("category", category), ("color", color), ("season", season)):
+        if value is not None:
+            where.append(f'"{column}" = ?')
+            params.append(value)
+    if tag is not None:
+        where.append('instr("tags", ?) > 0')
+        params.append(json.dumps(tag))
+    if after is not None:
+        where.append('"createdAt" <= ? AND ("createdAt" < ? OR "id" < ?)')
+        params.extend([after[0], after[0], after[1]])
+
+    columns = ", ".join(f'"{column}"' for column in LIST_COLUMNS)
+    sql = (
+        f'SELECT {columns}, "createdAt", CAST("createdAt" AS TEXT) AS "cursorAt" '
+        f'FROM "clothing_items" WHERE {" AND ".join(where)} '
+        'ORDER BY "createdAt" DESC, "id" DESC LIMIT ?'
+    )
+    params.append(limit)
+    return sql, params
+
+
+@router.get("/", response_model=ClothingPage)
+async def list_clothing(
+    category: Optional[str] = None,
+    color: Optional[str] = None,
+    season: Optional[str] = None,
+    tag: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user: Dict[str, Any] = Depends(get_current_user),
+    prisma: Prisma = Depends(get_db),
+):
+    """
+    List the current user's clothing, newest first.
+
+    Pass ``nextCursor`` from a page as ``cursor`` to get the next one; it
+    is null on the last page.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    sql, params = build_clothing_query(
+        user["id"],
+        category=category,
+        color=color,
+        season=season,
+        tag=tag,
+        after=after,
+        limit=limit + 1,  # one extra row tells whether another page exists
+    )
+    rows = await prisma.query_raw(sql, *params)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor((str(rows[-1]["cursorAt"]), rows[-1]["id"]))
+
+    return ClothingPage(
+        items=[ClothingItemSummary.from_row(row) for row in rows], nextCursor=next_cursor
+    )
+
+
+@router.get("/{item_id}/duplicates", response_model=DuplicateList)
+async def list_duplicates(
+    item_id: str,
+    user: Dict[str, Any] = Depends(get_current_user),
+    prisma: Prisma = Depends(get_db),
+):
+    """
+    List the current user's items whose photos look like this item's.
+
+    Photos are compared by perceptual hash, nearest first. Items whose
+    photo has not been hashed yet have no duplicates.
+    """
+    rows = await prisma.query_raw(
+        'SELECT "perceptualHash" FROM "clothing_items" WHERE "id" = ? AND "userId" = ?',
+        item_id,
+        user["id"],
+    )
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Clothing item not found")
+    if not rows[0]["perceptualHash"]:
+        return DuplicateList(items=[])
+
+    matches = await duplicates.duplicate_index.find(
+        user["id"], parse_hash(rows[0]["perceptualHash"]), exclude=item_id
+    )
+    return DuplicateList(
+        items=[DuplicateItem(id=match.item_id, distance=match.distance) for match in matches]
+    )
+
+
+def get_bulk_uploader(
+    prisma: Prisma = Depends(get_db),
+    storage: StorageInterface = Depends(get_storage),
+    tagging: TaggingService = Depends(get_tagging_service),
+) -> BulkUploader:
+    """Bulk uploader storing into the configured storage"""
+    return BulkUploader(
+        prisma,
+        ImageProcessor(storage),
+        tagging,
+        concurrency=settings.bulk_upload_concurrency,
+        insert_batch_size=settings.bulk_upload_insert_batch,
+    )
+
+
+@router.post("/bulk")
+async def bulk_upload(
+    request: Request,
+    category: Optional[str] = Query(None, description="Category of every photo, instead of the tagged one"),
+    user: Dict[str, Any] = Depends(get_current_user),
+    uploader: BulkUploader = Depends(get_bulk_uploader),
+):
+    """
+    Add many clothing photos at once.
+
+    Send the photos as the file parts of a ``multipart/form-data`` body,
+    or as a zip archive with ``Content-Type: application/zip``. Multipart
+    photos are stored while the rest of the upload is still arriving, and
+    the request holds at most ``BULK_UPLOAD_MEMORY`` bytes of photos at
+    once; reading pauses until stored photos free their share.
+
+    The response is a server-sent event stream: an ``item`` event per
+    photo as it is stored or rejected, in the order they finish, then a
+    ``done`` event with the counts. If the upload cannot be read to its
+    end an ``error`` event comes first; photos read before are kept.
+    """
+    if category is not None and category not in CATEGORIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"category must be one of {', '.join(CATEGORIES)}",
+        )
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > settings.bulk_upload_max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Upload exceeds maximum size of {settings.bulk_upload_max_size} bytes",
+        )
+
+    content_type = request.headers.get("content-type", "")
+    media_type = content_type.partition(";")[0].strip().lower()
+    # A photo must fit in the budget on its own
+    budget = MemoryBudget(max(settings.bulk_upload_memory, settings.max_upload_size))
+    body = limit_stream(request.stream(), settings.bulk_upload_max_size)
+    if media_type == "multipart/form-data":
+        photos = read_multipart(
+            body, content_type, budget, settings.max_upload_size, settings.bulk_upload_max_files
+        )
+    elif media_type in ZIP_TYPES:
+        photos = read_zip(body, budget, settings.max_upload_size, settings.bulk_upload_max_files)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send photos as multipart/form-data or a zip archive",
+        )
+
+    async def events():
+        counts = {"created": 0, "failed": 0}
+        try:
+            async for result in uploader.run(user["id"], photos, budget, category):
+                counts[result.status] += 1
+                yield format_sse(result.model_dump_json(), event="item")
+        except (BulkUploadError, FileTooLargeError) as e:
+            yield format_sse(json.dumps({"detail": str(e)}), event="error")
+        yield format_sse(json.dumps(counts), event="done")
+
+    return DuplexStreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
@@ -0,0 +1,175 @@
+"""
+Outfit generation endpoints
+"""
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from prisma import Prisma
+from pydantic import BaseModel, Field
+
+from app.api.deps import get_current_user, get_db
+from app.api.endpoints import profiles
+from app.api.endpoints.profiles import ProfileResponse
+from app.core.sse import format_sse
+from app.services.cache_service import CachedOutfit, outfit_cache, outfit_cache_key
+from app.services.generation_jobs import GenerationJob, JobQueue, TooManyJobsError
+from app.services.outfit_generation import get_generation_queue
+from app.services.outfit_selection import WARDROBE_QUERY, select_outfit_items
+
+router = APIRouter(prefix="/api/outfits", tags=["outfits"])
+
+
+# Schemas
+class GenerateRequest(BaseModel):
+    occasion: Optional[str] = None
+    force_regenerate: bool = False
+    clothing_item_ids: Optional[List[str]] = Field(None, min_length=1, max_length=10)
+
+
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    progress: float
+    stage: Optional[str]
+    outfitId: Optional[str]
+    imageUrl: Optional[str]
+    error: Optional[str]
+    createdAt: str
+    updatedAt: str
+
+    @classmethod
+    def from_job(cls, job: GenerationJob) -> "JobResponse":
+        """Convert a generation job to its public view"""
+        return cls(
+            id=job.id,
+            status=job.status.value,
+            progress=round(job.progress, 3),
+            stage=job.stage,
+            outfitId=job.result.get("outfitId"),
+            imageUrl=job.result.get("imageUrl"),
+            error=job.error,
+            createdAt=job.createdAt.isoformat(),
+            updatedAt=job.updatedAt.isoformat(),
+        )
+
+
+class GenerateResponse(BaseModel):
+    cached: bool
+    outfit: Optional[CachedOutfit] = None
+    job: Optional[JobResponse] = None
+
+
+async def select_default_items(
+    prisma: Prisma, user_id: str, occasion: Optional[str]
+) -> List[str]:
+    """Pick the best outfit in the user's wardrobe for their profile and the occasion"""
+    rows = await prisma.query_raw(WARDROBE_QUERY, user_id)
+
+    async def load_profile() -> Optional[ProfileResponse]:
+        profile = await prisma.profile.find_unique(where={"userId": user_id})
+        return ProfileResponse.from_db(profile) if profile else None
+
+    profile = await profiles.profile_cache.get_or_load(user_id, load_profile)
+    styles = [profile.primaryStyle, profile.secondaryStyle] if profile else []
+    return select_outfit_items(rows, styles=styles, occasion=occasion)
+
+
+async def get_owned_job(job_id: str, user: Dict[str, Any], queue: JobQueue) -> GenerationJob:
+    job = await queue.get(job_id)
+    if job is None or job.userId != user["id"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.post("/generate", response_model=GenerateResponse, status_code=status.HTTP_202_ACCEPTED)
+async def generate_outfit(
+    body: GenerateRequest,
+    response: Response,
+    user: Dict[str, Any] = Depends(get_current_user),
+    prisma: Prisma = Depends(get_db),
+    queue: JobQueue = Depends(get_generation_queue),
+):
+    """
+    Generate an outfit image.
+
+    Without ``clothing_item_ids`` the items are selected from the wardrobe
+    by profile style, occasion, season and how often they were worn.
+    A cached outfit for the same items and occasion is returned directly
+    with 200. Otherwise a background job is queued (or an identical
+    unfinished one reused) and returned with 202; follow it at the
+    ``Location`` URL or its ``/events`` stream.
+    """
+    user_id = user["id"]
+    item_ids = body.clothing_item_ids or await select_default_items(
+        prisma, user_id, body.occasion
+    )
+    if not item_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Wardrobe has no clothing items"
+        )
+
+    cache_key = outfit_cache_key(user_id, item_ids, body.occasion)
+    if not body.force_regenerate:
+        cached = await outfit_cache.get(cache_key)
+        if cached is not None:
+            response.status_code = status.HTTP_200_OK
+            return GenerateResponse(cached=True, outfit=cached)
+
+    try:
+        job, _ = await queue.submit(
+            user_id,
+            cache_key,
+            {
+                "clothingItemIds": sorted(set(item_ids)),
+                "occasion": body.occasion,
+                "generation": await outfit_cache.generation(user_id),
+            },
+        )
+    except TooManyJobsError:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many outfit generations in progress",
+        )
+
+    response.headers["location"] = f"{router.prefix}/jobs/{job.id}"
+    return GenerateResponse(cached=False, job=JobResponse.from_job(job))
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    user: Dict[str, Any] = Depends(get_current_user),
+    queue: JobQueue = Depends(get_generation_queue),
+):
+    """Poll the state of a generation job"""
+    return JobResponse.from_job(await get_owned_job(job_id, user, queue))
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job(
+    job_id: str,
+    request: Request,
+    user: Dict[str, Any] = Depends(get_current_user),
+    queue: JobQueue = Depends(get_generation_queue),
+):
+    """
+    Follow a generation job as server-sent events.
+
+    Sends a ``progress`` event per update and a final ``done`` event,
+    then closes. Disconnecting does not cancel the job.
+    """
+    await get_owned_job(job_id, user, queue)
+
+    async def events():
+        async for job in queue.subscribe(job_id):
+            if await request.is_disconnected():
+                return
+            event = "done" if job.status.finished else "progress"
+            yield format_sse(JobResponse.from_job(job).model_dump_json(), event=event)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
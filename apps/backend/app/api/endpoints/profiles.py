@@ -2,7 +2,11 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List
 from prisma import Prisma
+from prisma.errors import ForeignKeyViolationError
 from enum import Enum
+from app.api.deps import get_db
+from app.core.config import settings
+from app.services.cache_service import ProfileCache, create_cache_backend
 import json
 
 router = APIRouter(prefix="/api/profile", tags=["profile"])
@@ -78,15 +82,15 @@ class ProfileResponse(BaseModel):
         )
 
 
-# Dependency
-async def get_prisma():
-    """Get Prisma client instance"""
-    prisma = Prisma()
-    await prisma.connect()
-    try:
-        yield prisma
-    finally:
-        await prisma.disconnect()
+# Decoded profiles shared by the profile, outfit and chat paths
+profile_cache = ProfileCache(
+    create_cache_backend(
+        "profile",
+        ProfileResponse,
+        maxsize=settings.profile_cache_size,
+        ttl=settings.profile_cache_ttl,
+    )
+)
 
 
 # Temporary: Get user ID from header (in production, use JWT auth)
@@ -102,13 +106,17 @@ async def get_current_user_id() -> str:
 
 @router.get("/", response_model=ProfileResponse, status_code=status.HTTP_200_OK)
 async def get_profile(
-    prisma: Prisma = Depends(get_prisma),
+    prisma: Prisma = Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
     """Get current user's profile"""
-    profile = await prisma.profile.find_unique(
-        where={"userId": user_id}
-    )
+    async def load_profile() -> Optional[ProfileResponse]:
+        profile = await prisma.profile.find_unique(
+            where={"userId": user_id}
+        )
+        return ProfileResponse.from_db(profile) if profile else None
+
+    profile = await profile_cache.get_or_load(user_id, load_profile)
 
     if not profile:
         raise HTTPException(
@@ -116,57 +124,45 @@ async def get_profile(
             detail="Profile not found"
         )
 
-    return ProfileResponse.from_db(profile)
+    return profile
 
 
 @router.put("/", response_model=ProfileResponse, status_code=status.HTTP_200_OK)
 async def update_profile(
     profile_data: ProfileCreate,
-    prisma: Prisma = Depends(get_prisma),
+    prisma: Prisma = Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
     """Update or create current user's profile"""
-    # Check if user exists
-    user = await prisma.user.find_unique(where={"id": user_id})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-
     # Convert occasions list to JSON string
     occasions_json = None
-    if profile_data.occasions:
+    if profile_data.occasions is not None:
         occasions_json = json.dumps([o.value for o in profile_data.occasions])
 
-    # Check if profile exists
-    existing_profile = await prisma.profile.find_unique(
-        where={"userId": user_id}
-    )
+    fields = {
+        "height": profile_data.height,
+        "weight": profile_data.weight,
+        "primaryStyle": profile_data.primary_style.value if profile_data.primary_style else None,
+        "secondaryStyle": profile_data.secondary_style.value if profile_data.secondary_style else None,
+        "occasions": occasions_json,
+    }
 
-    if existing_profile:
-        # Update existing profile
-        profile = await prisma.profile.update(
+    # Single atomic statement; the userId foreign key doubles as the
+    # user existence check
+    try:
+        profile = await prisma.profile.upsert(
             where={"userId": user_id},
             data={
-                "height": profile_data.height,
-                "weight": profile_data.weight,
-                "primaryStyle": profile_data.primary_style.value if profile_data.primary_style else None,
-                "secondaryStyle": profile_data.secondary_style.value if profile_data.secondary_style else None,
-                "occasions": occasions_json,
+                "create": {"userId": user_id, **fields},
+                "update": fields,
             }
         )
-    else:
-        # Create new profile
-        profile = await prisma.profile.create(
-            data={
-                "userId": user_id,
-                "height": profile_data.height,
-                "weight": profile_data.weight,
-                "primaryStyle": profile_data.primary_style.value if profile_data.primary_style else None,
-                "secondaryStyle": profile_data.secondary_style.value if profile_data.secondary_style else None,
-                "occasions": occasions_json,
-            }
+    except ForeignKeyViolationError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
         )
 
+    await profile_cache.invalidate(user_id)
+
     return ProfileResponse.from_db(profile)
@@ -0,0 +1,218 @@
+"""
+Serving of uploaded files
+"""
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Mapping, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.services.image_processing import ImageResizer, InvalidImageError, get_image_resizer
+from app.storage import StorageInterface, get_storage
+from app.storage.derivatives import IMAGE_FORMATS, RESIZE_WIDTHS
+from app.storage.interface import FileInfo
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+
+class RangeNotSatisfiable(ValueError):
+    """Raised for a Range header that selects no bytes of the file"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range ``Range`` header.
+
+    Args:
+        header: Header value, e.g. ``bytes=0-1023``, ``bytes=1024-`` or ``bytes=-512``
+        size: File size in bytes
+
+    Returns:
+        ``(start, end)`` with ``end`` exclusive, or None to serve the whole
+        file (no header, another unit, or multiple ranges)
+
+    Raises:
+        RangeNotSatisfiable: If the range is malformed or outside the file
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        raise RangeNotSatisfiable(header)
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable(header)
+            start, end = max(0, size - suffix), size
+    except ValueError:
+        raise RangeNotSatisfiable(header)
+
+    end = min(end, size)
+    if start < 0 or start >= end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def is_not_modified(headers: Mapping[str, str], info: FileInfo) -> bool:
+    """
+    Evaluate ``If-None-Match`` and ``If-Modified-Since`` against a file.
+
+    ``If-None-Match`` takes precedence when both are sent.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or info.etag.removeprefix("W/") in tags
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(info.modified) <= since
+    return False
+
+
+def _if_range_matches(headers: Mapping[str, str], info: FileInfo, last_modified: str) -> bool:
+    """Whether a Range request may be honoured given its ``If-Range`` validator"""
+    if_range = headers.get("if-range")
+    return if_range is None or if_range in (info.etag, last_modified)
+
+
+def _variant_etag(etag: str, width: int, fmt: str) -> str:
+    """Entity tag of a resized image, derived from its original's"""
+    tag = etag.removeprefix("W/").strip('"')
+    return f'"{tag}-{width}.{fmt}"'
+
+
+@router.api_route("/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_upload(
+    file_path: str,
+    request: Request,
+    w: Optional[int] = Query(None, description="Resize to this width in pixels"),
+    fmt: Optional[str] = Query(None, description="Transcode to webp or jpeg"),
+    storage: StorageInterface = Depends(get_storage),
+):
+    """
+    Serve a stored file with range and conditional request support.
+
+    Files on the local backend are sent with zero-copy ``sendfile`` where
+    the server supports it; other backends are streamed in chunks.
+
+    With ``w`` or ``fmt`` an image is resized (never enlarged) and
+    transcoded on demand instead. ``w`` must be one of ``RESIZE_WIDTHS``
+    and defaults to the largest; ``fmt`` defaults to WebP.
+    """
+    if w is not None or fmt is not None:
+        width = RESIZE_WIDTHS[-1] if w is None else w
+        fmt = fmt or IMAGE_FORMATS[0]
+        if width not in RESIZE_WIDTHS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"w must be one of {', '.join(map(str, RESIZE_WIDTHS))}",
+            )
+        if fmt not in IMAGE_FORMATS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"fmt must be one of {', '.join(IMAGE_FORMATS)}",
+            )
+        # Resolved here so plain downloads never set up the derivative cache
+        resizer = get_image_resizer()
+        return await _serve_resized(file_path, request, storage, resizer, width, fmt)
+
+    try:
+        info = await storage.stat(file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+    last_modified = formatdate(info.modified, usegmt=True)
+    headers = {
+        "etag": info.etag,
+        "last-modified": last_modified,
+        "accept-ranges": "bytes",
+    }
+    if is_not_modified(request.headers, info):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    media_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+    path = await run_in_threadpool(storage.local_path, file_path)
+    if path is not None:
+        # FileResponse handles Range/If-Range itself and uses the ASGI
+        # pathsend extension (sendfile) when the server offers it
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    byte_range = None
+    if _if_range_matches(request.headers, info, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get("range"), info.size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+                headers={"content-range": f"bytes */{info.size}"},
+            )
+
+    status_code = status.HTTP_200_OK
+    start, end = 0, info.size
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["content-range"] = f"bytes {start}-{end - 1}/{info.size}"
+    headers["content-length"] = str(end - start)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(
+        storage.download_stream(file_path, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
+
+
+async def _serve_resized(
+    file_path: str,
+    request: Request,
+    storage: StorageInterface,
+    resizer: ImageResizer,
+    width: int,
+    fmt: str,
+) -> Response:
+    """Serve a resized image, answering conditional requests before rendering"""
+    try:
+        original = await storage.stat(file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+    info = FileInfo(
+        size=0,  # not known until rendered; unused for validation
+        modified=original.modified,
+        etag=_variant_etag(original.etag, width, fmt),
+    )
+    headers = {
+        "etag": info.etag,
+        "last-modified": formatdate(info.modified, usegmt=True),
+    }
+    if is_not_modified(request.headers, info):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        content = await resizer.get(storage, file_path, original.etag, width, fmt)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    except InvalidImageError:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="File is not an image"
+        )
+    return Response(content=content, headers=headers, media_type=f"image/{fmt}")
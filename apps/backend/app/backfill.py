@@ -0,0 +1,305 @@
+"""
+Backfill what is derived from clothing photos for items stored before it
+existed.
+
+    python -m app.backfill images --batch-size 50 --concurrency 4
+    python -m app.backfill tags --batch-size 64 --concurrency 32
+"""
+import argparse
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import unquote
+
+from prisma import Prisma
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.http import HTTPClientRegistry, http_clients
+from app.services import duplicates
+from app.services.image_processing import (
+    ImageAnalysis,
+    ImageProcessor,
+    InvalidImageError,
+    shutdown_image_executor,
+)
+from app.services.tagging import (
+    TaggingError,
+    UNCATEGORIZED,
+    TaggingService,
+    close_tagging_service,
+    content_hash,
+    get_tagging_service,
+)
+from app.storage import StorageInterface, get_storage
+
+logger = logging.getLogger(__name__)
+
+LOCAL_URL_PREFIX = "/uploads/"
+
+# Items never analysed / never tagged, in id order so a run can resume
+# after any item
+UNANALYSED_QUERY = (
+    'SELECT "id", "userId", "imageUrl" FROM "clothing_items" '
+    'WHERE "perceptualHash" IS NULL AND "id" > ? ORDER BY "id" LIMIT ?'
+)
+UNTAGGED_QUERY = (
+    'SELECT "id", "userId", "imageUrl" FROM "clothing_items" '
+    'WHERE "pattern" IS NULL AND "id" > ? ORDER BY "id" LIMIT ?'
+)
+
+# Tagged columns the user may already have filled in, which tags only
+# fill when empty, with the value that counts as empty
+USER_COLUMNS: Dict[str, Optional[str]] = {
+    "category": UNCATEGORIZED,
+    "color": None,
+    "season": None,
+}
+
+# Row -> (item id, columns to set), or None if the item was skipped
+Processor = Callable[[Dict[str, Any]], Awaitable[Optional[Tuple[str, Dict[str, Any]]]]]
+
+
+def build_batch_update(
+    updates: Sequence[Tuple[str, Mapping[str, Any]]],
+    fill_only: Optional[Mapping[str, Optional[Any]]] = None,
+) -> Tuple[str, List[Any]]:
+    """
+    Build one UPDATE setting columns of several clothing items.
+
+    Args:
+        updates: (item id, column -> value) pairs, all with the same columns
+        fill_only: Columns only set where they are NULL, or hold the
+            placeholder value they map to
+
+    Returns:
+        SQL with ``?`` placeholders and its parameters
+    """
+    fill_only = fill_only or {}
+    columns = list(updates[0][1])
+    cases = " ".join("WHEN ? THEN ?" for _ in updates)
+    assignments = []
+    params: List[Any] = []
+    for column in columns:
+        case = f'CASE "id" {cases} END'
+        if column in fill_only:
+            current = f'"{column}"'
+            if fill_only[column] is not None:
+                current = f"NULLIF({current}, ?)"
+                params.append(fill_only[column])
+            case = f"COALESCE({current}, {case})"
+        assignments.append(f'"{column}" = {case}')
+        for item_id, values in updates:
+            params += [item_id, values[column]]
+
+    ids = [item_id for item_id, _ in updates]
+    sql = (
+        f'UPDATE "clothing_items" SET {", ".join(assignments)} '
+        f'WHERE "id" IN ({", ".join("?" for _ in ids)})'
+    )
+    return sql, params + ids
+
+
+def build_analysis_update(results: Sequence[Tuple[str, ImageAnalysis]]) -> Tuple[str, List[Any]]:
+    """Build one UPDATE storing the analyses of several clothing items"""
+    return build_batch_update([(item_id, analysis.columns()) for item_id, analysis in results])
+
+
+async def fetch_image(storage: StorageInterface, clients: HTTPClientRegistry, url: str) -> bytes:
+    """
+    Read a stored clothing photo.
+
+    Photos served by this application are read from storage; others,
+    such as seed data or a CDN in front of S3, are downloaded.
+
+    Raises:
+        FileNotFoundError: If the photo is not in storage
+        ValueError: If the download fails
+    """
+    if url.startswith(LOCAL_URL_PREFIX):
+        return await storage.download(unquote(url[len(LOCAL_URL_PREFIX):]))
+    response = await clients.get("image_download").get(url)
+    if response.status_code != 200:
+        raise ValueError(f"Download failed with {response.status_code}")
+    return response.content
+
+
+async def _backfill(
+    prisma: Prisma,
+    query: str,
+    process: Processor,
+    *,
+    batch_size: int,
+    concurrency: int,
+    limit: Optional[int],
+    done: str,
+    fill_only: Optional[Mapping[str, Optional[Any]]] = None,
+    rehashes: bool = False,
+) -> Dict[str, int]:
+    """
+    Read items in id-ordered batches, process them ``concurrency`` at a
+    time and write each batch back in one UPDATE. Updated items are
+    counted under ``done``. If the update ``rehashes`` items, their
+    owners' duplicate indexes are dropped.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {done: 0, "failed": 0}
+
+    async def bounded(row: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        async with semaphore:
+            return await process(row)
+
+    last_id = ""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        rows = await prisma.query_raw(query, last_id, size)
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        updates = [u for u in await asyncio.gather(*(bounded(row) for row in rows)) if u]
+        if updates:
+            sql, params = build_batch_update(updates, fill_only)
+            await prisma.execute_raw(sql, *params)
+        counts[done] += len(updates)
+        counts["failed"] += len(rows) - len(updates)
+        if remaining is not None:
+            remaining -= len(rows)
+        if rehashes:
+            for user_id in {row["userId"] for row in rows}:
+                duplicates.duplicate_index.invalidate(user_id)
+
+    return counts
+
+
+async def backfill_images(
+    prisma: Prisma,
+    storage: StorageInterface,
+    processor: ImageProcessor,
+    clients: HTTPClientRegistry = http_clients,
+    *,
+    batch_size: int = 50,
+    concurrency: int = 4,
+    limit: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Store the palette, color code and perceptual hash of unanalysed items.
+
+    Photos are fetched and analysed ``concurrency`` at a time in the image
+    worker pool. Photos that cannot be read or decoded are logged and
+    skipped, so a later run retries them.
+
+    Args:
+        prisma: Connected client
+        storage: Storage holding the photos
+        processor: Runs the analysis in the image worker pool
+        clients: Upstream clients for photos stored elsewhere
+        batch_size: Items read and written per statement
+        concurrency: Photos fetched and analysed at once
+        limit: Stop after this many items
+
+    Returns:
+        Counts of ``analysed`` and ``failed`` items
+    """
+
+    async def analyze(row: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        try:
+            content = await fetch_image(storage, clients, row["imageUrl"])
+            return row["id"], (await processor.analyze(content)).columns()
+        except (FileNotFoundError, InvalidImageError, ValueError, OSError) as e:
+            logger.warning("Cannot analyse clothing item %s: %s", row["id"], e)
+            return None
+
+    return await _backfill(
+        prisma, UNANALYSED_QUERY, analyze,
+        batch_size=batch_size, concurrency=concurrency, limit=limit, done="analysed",
+        rehashes=True,
+    )
+
+
+async def backfill_tags(
+    prisma: Prisma,
+    storage: StorageInterface,
+    processor: ImageProcessor,
+    tagging: TaggingService,
+    clients: HTTPClientRegistry = http_clients,
+    *,
+    batch_size: int = 64,
+    concurrency: int = 32,
+    limit: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Auto-tag the pattern and material of untagged items.
+
+    Requests go through the tagging service, so they are micro-batched
+    into model calls and served from its cache like uploads; keep
+    ``concurrency`` above the service's batch size to fill its batches.
+    Color and season are only filled where the item has none, and the
+    category only where it is ``UNCATEGORIZED``. Photos that cannot be read or tagged are
+    logged and skipped, so a later run retries them.
+
+    Args:
+        prisma: Connected client
+        storage: Storage holding the photos
+        processor: Shrinks photos to what the model is shown
+        tagging: Tagging service
+        clients: Upstream clients for photos stored elsewhere
+        batch_size: Items read and written per statement
+        concurrency: Photos being tagged at once
+        limit: Stop after this many items
+
+    Returns:
+        Counts of ``tagged`` and ``failed`` items
+    """
+
+    async def tag(row: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        try:
+            content = await fetch_image(storage, clients, row["imageUrl"])
+            image = await processor.resize(content, settings.tagging_image_size)
+            tags = await tagging.tag(content_hash(content), image)
+        except (FileNotFoundError, InvalidImageError, TaggingError, ValueError, OSError) as e:
+            logger.warning("Cannot tag clothing item %s: %s", row["id"], e)
+            return None
+        return row["id"], tags.model_dump(include={"pattern", "material", *USER_COLUMNS})
+
+    return await _backfill(
+        prisma, UNTAGGED_QUERY, tag,
+        batch_size=batch_size, concurrency=concurrency, limit=limit, done="tagged",
+        fill_only=USER_COLUMNS,
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    prisma = await db.connect()
+    storage = get_storage()
+    processor = ImageProcessor(storage)
+    options = dict(batch_size=args.batch_size, concurrency=args.concurrency, limit=args.limit)
+    try:
+        if args.command == "images":
+            counts = await backfill_images(prisma, storage, processor, **options)
+        else:
+            counts = await backfill_tags(
+                prisma, storage, processor, get_tagging_service(), **options
+            )
+    finally:
+        await close_tagging_service()
+        await http_clients.aclose()
+        await db.disconnect()
+        shutdown_image_executor()
+    print(", ".join(f"{count} {name}" for name, count in counts.items()))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help, batch_size, concurrency in (
+        ("images", "dominant colors and perceptual hashes of clothing photos", 50, 4),
+        ("tags", "AI pattern and material tags, through the batching tag service", 64, 32),
+    ):
+        command = commands.add_parser(name, help=help)
+        command.add_argument("--batch-size", type=int, default=batch_size)
+        command.add_argument("--concurrency", type=int, default=concurrency)
+        command.add_argument("--limit", type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
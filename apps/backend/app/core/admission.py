@@ -0,0 +1,292 @@
+"""
+Client-side admission control for rate-limited upstreams
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+
+import httpx
+
+# Errors that mean the upstream is struggling, not that the request was bad
+OVERLOAD_ERRORS = (asyncio.TimeoutError, httpx.TimeoutException)
+
+
+@dataclass(frozen=True)
+class AdmissionPolicy:
+    """Concurrency, rate and queueing limits for one upstream"""
+
+    initial_limit: int = 4
+    min_limit: int = 1
+    max_limit: int = 16
+    latency_target: float = 30.0  # seconds; slower calls count as congestion
+    decrease_factor: float = 0.5
+    max_queue: int = 32  # callers waiting beyond this fail fast; 0 never queues
+    queue_timeout: float = 30.0  # seconds a caller may wait to be admitted
+    rate: float = 0.0  # requests per second per key, 0 disables rate limiting
+    burst: int = 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call is not admitted because the upstream is saturated"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations rather than blocking.
+
+    The balance may go negative: each reservation takes a token now and
+    tells the caller how long to wait before it may use it, so callers
+    are served in order.
+    """
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """
+        Take a token.
+
+        Returns:
+            Seconds until the token may be used
+        """
+        self._refill()
+        self._tokens -= 1
+        return max(0.0, -self._tokens / self.rate)
+
+    def refund(self) -> None:
+        """Return a reserved token that will not be used"""
+        self._tokens = min(self.burst, self._tokens + 1)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back new tokens for ``seconds``, e.g. after a ``Retry-After``"""
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class Permit:
+    """An admitted call; mark it throttled when the upstream answers 429"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.retry_after: Optional[float] = None
+        self.is_throttled = False
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        """Record that the upstream rejected this call for load"""
+        self.is_throttled = True
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Adaptive concurrency limit, per-key token buckets and a bounded queue.
+
+    The concurrency limit follows AIMD: each call that completes within
+    ``latency_target`` raises it by ``1 / limit`` (about one per window of
+    calls), while a 429, a timeout or a slow call cuts it by
+    ``decrease_factor``. Congestion signals from calls that started before
+    the last cut are ignored, so one burst shrinks the limit only once.
+
+    Callers beyond the limit wait in FIFO order; once ``max_queue`` are
+    waiting, or a caller would wait longer than ``queue_timeout``, it fails
+    fast with AdmissionRejected instead.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        policy: AdmissionPolicy,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.policy = policy
+        self.clock = clock
+        self.limit = float(min(max(policy.initial_limit, policy.min_limit), policy.max_limit))
+        self._in_flight = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._last_decrease = -math.inf
+        self._admitted = 0
+        self._rejected = 0
+        self._throttled = 0
+        self._timeouts = 0
+        self._slow = 0
+        self._queue_max = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self._rejected += 1
+        return AdmissionRejected(
+            f"Upstream '{self.name}' is saturated: {reason}",
+            retry_after=self.policy.queue_timeout,
+        )
+
+    def _wake(self) -> None:
+        """Hand free slots to waiters in arrival order"""
+        while self._waiters and self._in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._wake()
+
+    async def _acquire(self, deadline: float) -> None:
+        if self._in_flight < int(self.limit) and not self._waiters:
+            self._in_flight += 1
+            return
+        if len(self._waiters) >= self.policy.max_queue:
+            raise self._reject("queue is full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._queue_max = max(self._queue_max, len(self._waiters))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), max(0.0, deadline - self.clock()))
+        except BaseException as exc:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over as we gave up; pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if isinstance(exc, asyncio.TimeoutError):
+                raise self._reject("timed out waiting for a slot") from None
+            raise
+
+    async def _take_token(self, key: str, deadline: float) -> None:
+        if self.policy.rate <= 0:
+            return
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(
+                self.policy.rate, self.policy.burst, self.clock
+            )
+        delay = bucket.reserve()
+        if delay > deadline - self.clock():
+            bucket.refund()
+            raise self._reject("rate limit exceeded")
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _record(self, started: float, latency: float, congested: bool) -> None:
+        """Adjust the concurrency limit after a call"""
+        policy = self.policy
+        if congested:
+            if started >= self._last_decrease:
+                self.limit = max(policy.min_limit, self.limit * policy.decrease_factor)
+                self._last_decrease = self.clock()
+        elif latency <= policy.latency_target:
+            self.limit = min(policy.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+
+    def _throttle(self, key: str, permit: Permit) -> None:
+        """Count a throttled call and hold the key's bucket for Retry-After"""
+        self._throttled += 1
+        if permit.retry_after and self.policy.rate > 0:
+            self._buckets[key].pause(permit.retry_after)
+
+    @asynccontextmanager
+    async def admit(self, key: str = "") -> AsyncIterator[Permit]:
+        """
+        Wait for a concurrency slot and a rate token, then run the call.
+
+        Args:
+            key: Rate-limit key, e.g. the API key the call is made with
+
+        Yields:
+            Permit to flag a throttled (429) response on
+
+        Raises:
+            AdmissionRejected: If the call cannot be admitted in time
+        """
+        arrived = self.clock()
+        deadline = arrived + self.policy.queue_timeout
+        await self._acquire(deadline)
+        try:
+            await self._take_token(key, deadline)
+            started = self.clock()
+            waited = started - arrived
+            self._admitted += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+            permit = Permit(key)
+            try:
+                yield permit
+            except OVERLOAD_ERRORS:
+                self._timeouts += 1
+                self._record(started, self.clock() - started, congested=True)
+                raise
+            except BaseException:
+                # Callers usually raise on the 429 they flagged; it still counts
+                if permit.is_throttled:
+                    self._throttle(key, permit)
+                    self._record(started, self.clock() - started, congested=True)
+                raise
+
+            latency = self.clock() - started
+            if permit.is_throttled:
+                self._throttle(key, permit)
+            elif latency > self.policy.latency_target:
+                self._slow += 1
+            self._record(
+                started,
+                latency,
+                congested=permit.is_throttled or latency > self.policy.latency_target,
+            )
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of admission state.
+
+        Returns:
+            Dict with the current limit, queue depth, outcomes and wait times
+        """
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "queued_max": self._queue_max,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "throttled": self._throttled,
+            "timeouts": self._timeouts,
+            "slow": self._slow,
+            "wait_time_total_ms": round(self._wait_total * 1000, 2),
+            "wait_time_max_ms": round(self._wait_max * 1000, 2),
+            "wait_time_avg_ms": round(
+                self._wait_total * 1000 / self._admitted, 2
+            ) if self._admitted else 0.0,
+        }
@@ -0,0 +1,265 @@
+"""
+Caching primitives and pluggable cache backends
+"""
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+from app.core.redis import RedisClient, RedisError
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[V]):
+    """
+    Bounded LRU cache with a per-entry time to live.
+
+    Entries expire after their own TTL and the least recently used entry is
+    evicted once ``maxsize`` is reached. Hit, miss and eviction counters are
+    kept so the cache can be sized from production traffic.
+
+    Not thread-safe; intended for use from a single event loop.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, record=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, record: bool = True) -> Any:
+        """
+        Get a live entry and mark it as recently used.
+
+        Args:
+            key: Cache key
+            default: Value returned on a miss
+            record: Whether to count the lookup in the hit/miss stats
+
+        Returns:
+            Cached value or ``default``
+        """
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                if record:
+                    self.hits += 1
+                return value
+            del self._data[key]
+            self.expirations += 1
+
+        if record:
+            self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        """
+        Store an entry.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Seconds to live, defaults to the cache TTL and is capped by it
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            self.delete(key)
+            return
+
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """
+        Remove an entry.
+
+        Returns:
+            True if the key was present
+        """
+        return self._data.pop(key, None) is not None
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class CacheBackend(ABC):
+    """Abstract async key/value cache backend"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """
+        Get a cached value
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached value, or None on a miss
+        """
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a value
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Seconds to live, defaults to the backend TTL
+        """
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """
+        Remove a value
+
+        Args:
+            key: Cache key
+        """
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get backend counters
+
+        Returns:
+            Dict of counters
+        """
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Per-process backend holding live Python objects.
+
+    Values are returned as stored, without any decoding step.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self._cache: TTLCache[Any] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._cache.set(key, value, ttl=ttl)
+
+    async def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Shared backend on any Redis-protocol server.
+
+    Values are serialized with ``encode``/``decode``. Server errors are
+    logged and treated as misses so a cache outage never fails a request.
+    """
+
+    def __init__(
+        self,
+        client: RedisClient,
+        namespace: str,
+        encode: Callable[[Any], bytes],
+        decode: Callable[[bytes], Any],
+        ttl: float = 300.0,
+    ):
+        self.client = client
+        self.namespace = namespace
+        self.encode = encode
+        self.decode = decode
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            data = await self.client.get(self._key(key))
+        except (RedisError, OSError, TimeoutError) as e:
+            self.errors += 1
+            logger.warning("Redis GET failed for %s: %s", self.namespace, e)
+            data = None
+
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.decode(data)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            await self.delete(key)
+            return
+        try:
+            await self.client.set(self._key(key), self.encode(value), ttl=ttl)
+        except (RedisError, OSError, TimeoutError) as e:
+            self.errors += 1
+            logger.warning("Redis SET failed for %s: %s", self.namespace, e)
+
+    async def delete(self, key: str) -> None:
+        try:
+            await self.client.delete(self._key(key))
+        except (RedisError, OSError, TimeoutError) as e:
+            self.errors += 1
+            logger.warning("Redis DEL failed for %s: %s", self.namespace, e)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+        }
@@ -11,21 +11,111 @@ class Settings(BaseSettings):
 
     # Database
     database_url: str = "file:./dev.db"
+    db_pool_size: int = 10
+    db_pool_timeout: int = 10  # seconds to wait for a free pooled connection
+    db_connect_timeout: int = 10  # seconds
+    db_query_timeout: int = 30  # seconds
+
+    # Caching
+    cache_backend: str = "memory"  # memory | redis
+    redis_url: str = "redis://localhost:6379/0"
+    profile_cache_size: int = 10000
+    profile_cache_ttl: int = 300  # seconds
+    outfit_cache_size: int = 10000
+    outfit_cache_ttl: int = 3600  # seconds in memory; rows stay valid until invalidated
+    outfit_cache_generation_ttl: int = 5  # seconds other processes may lag an invalidation
+    duplicate_index_size: int = 1000  # users whose photo hash indexes are kept
+    duplicate_index_ttl: int = 600  # seconds other processes may lag a new item
+    duplicate_hash_distance: int = 10  # most differing pHash bits of a possible duplicate
 
     # Frontend
     frontend_url: str = "http://localhost:3000"
 
     # Storage
     storage_type: str = "local"
+    storage_content_addressed: bool = False  # dedupe local files by SHA-256
     upload_dir: str = "./uploads"
+    upload_chunk_size: int = 1024 * 1024  # bytes per write
+    max_upload_size: int = 25 * 1024 * 1024  # bytes
+    bulk_upload_max_files: int = 200  # photos per bulk upload
+    bulk_upload_max_size: int = 1024 * 1024 * 1024  # bytes of a bulk upload request
+    bulk_upload_memory: int = 128 * 1024 * 1024  # bytes of photos a bulk upload holds at once
+    bulk_upload_concurrency: int = 8  # photos of a bulk upload processed at once
+    bulk_upload_insert_batch: int = 50  # rows per INSERT
+    storage_io_workers: int = 8  # threads for blocking filesystem calls
+    s3_endpoint_url: str = "https://s3.amazonaws.com"
+    s3_region: str = "us-east-1"
+    s3_bucket: str = ""
+    s3_access_key_id: str = ""
+    s3_secret_access_key: str = ""
+    s3_public_url: str = ""  # e.g. a CDN; empty serves objects through /uploads
+    s3_max_connections: int = 32
+    s3_timeout: float = 60.0  # seconds
+    s3_part_size: int = 8 * 1024 * 1024  # bytes, at least 5 MiB
+    s3_multipart_threshold: int = 16 * 1024 * 1024  # bytes
+    s3_multipart_concurrency: int = 4
+
+    # Image processing
+    image_process_workers: int = 2  # processes resizing and encoding images
+    image_webp_quality: int = 80
+    image_jpeg_quality: int = 85
+    image_palette_colors: int = 4  # dominant colors extracted from clothing photos
+    image_cache_dir: str = "./image-cache"  # resized images served on demand
+    image_cache_memory_size: int = 64 * 1024 * 1024  # bytes
+    image_cache_disk_size: int = 1024 * 1024 * 1024  # bytes
 
     # AI
     openai_api_key: str = ""
+    image_generation_url: str = "https://api.302.ai"
+    image_generation_max_connections: int = 8
+    image_generation_timeout: float = 60.0  # seconds
+    image_generation_api_key: str = ""
+    image_generation_model: str = "gpt-image-1"
+    image_generation_size: str = "1536x1024"
+    image_generation_partial_images: int = 2  # progress updates while streaming
+    image_generation_concurrency: int = 4  # starting limit, adapts up to max_connections
+    image_generation_latency_target: float = 45.0  # seconds before a call counts as slow
+    image_generation_queue_size: int = 32  # callers waiting beyond this fail fast
+    image_generation_queue_timeout: float = 30.0  # seconds
+    image_generation_rate_limit: float = 0.0  # requests per second per API key, 0 = off
+    image_generation_rate_burst: int = 5
+    tagging_backend: str = "openai"  # openai | mock
+    tagging_model: str = "gpt-4o-mini"
+    tagging_batch_size: int = 16  # photos per model call
+    tagging_batch_window: float = 0.05  # seconds a request waits for others to batch with
+    tagging_max_batches: int = 4  # model calls in flight
+    tagging_image_size: int = 512  # width in pixels of the rendition sent to the model
+    tagging_cache_size: int = 10000
+    tagging_cache_ttl: int = 30 * 24 * 3600  # seconds; keyed by content, so never stale
+
+    # Outfit generation jobs
+    generation_workers: int = 4
+    generation_user_concurrency: int = 1  # jobs per user running at once
+    generation_max_queued_per_user: int = 5  # further jobs waiting per user
+    generation_job_store: str = "memory"  # memory | sqlite
+    generation_job_db: str = "./generation_jobs.db"
+
+    # Outbound HTTP
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0  # seconds
+    http_timeout: float = 10.0  # seconds
+    http_connect_timeout: float = 5.0  # seconds
+    http_retry_attempts: int = 3
+    http_retry_backoff: float = 0.2  # seconds, doubled per attempt
 
     # Supabase
     supabase_url: str = ""
     supabase_anon_key: str = ""
     supabase_service_role_key: str = ""
+    supabase_jwt_secret: str = ""  # only needed for legacy HS256 projects
+    jwt_audience: str = "authenticated"
+    jwt_leeway: int = 0  # seconds of clock skew tolerated on exp/nbf
+    jwks_refresh_interval: int = 600  # seconds
+    jwks_min_refresh_interval: int = 30  # seconds between on-demand refreshes
+    session_cache_size: int = 10000
+    session_cache_ttl: int = 300  # seconds, capped by token expiry
+    session_cache_negative_ttl: int = 10  # seconds to remember rejected tokens
 
     class Config:
         env_file = ".env"
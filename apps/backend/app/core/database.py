@@ -0,0 +1,129 @@
+"""
+Application-lifetime database client
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from prisma import Prisma
+
+from app.core.config import settings
+
+
+def build_datasource_url(
+    url: str, pool_size: int, pool_timeout: int
+) -> str:
+    """
+    Add connection pool parameters to a database URL.
+
+    Parameters already present in the URL take precedence so that an
+    explicit DATABASE_URL can still tune the pool itself.
+
+    Args:
+        url: Base database URL
+        pool_size: Maximum number of pooled connections
+        pool_timeout: Seconds to wait for a free connection
+
+    Returns:
+        Database URL with pool parameters
+    """
+    base, _, query = url.partition("?")
+    params = dict(parse_qsl(query))
+    params.setdefault("connection_limit", str(pool_size))
+    params.setdefault("pool_timeout", str(pool_timeout))
+    return f"{base}?{urlencode(params)}"
+
+
+class Database:
+    """
+    Owns the single Prisma client shared by every request.
+
+    The client is connected once from the FastAPI lifespan hook and reused
+    by all routers through the ``get_db`` dependency. Connecting lazily on
+    first use keeps scripts and tests that skip the lifespan working.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        pool_timeout: Optional[int] = None,
+        connect_timeout: Optional[int] = None,
+        query_timeout: Optional[int] = None,
+    ):
+        self.url = url or settings.database_url
+        self.pool_size = pool_size or settings.db_pool_size
+        self.pool_timeout = pool_timeout or settings.db_pool_timeout
+        self.connect_timeout = connect_timeout or settings.db_connect_timeout
+        self.query_timeout = query_timeout or settings.db_query_timeout
+        self._client: Optional[Prisma] = None
+        self._lock = asyncio.Lock()
+
+    def _create_client(self) -> Prisma:
+        """Build a Prisma client configured for pooling"""
+        return Prisma(
+            datasource={
+                "url": build_datasource_url(
+                    self.url, self.pool_size, self.pool_timeout
+                )
+            },
+            connect_timeout=self.connect_timeout,
+            http={"timeout": self.query_timeout},
+        )
+
+    @property
+    def is_connected(self) -> bool:
+        """Whether the shared client is connected"""
+        return self._client is not None and self._client.is_connected()
+
+    async def connect(self) -> Prisma:
+        """
+        Connect the shared client if it is not connected yet.
+
+        Returns:
+            Connected Prisma client
+        """
+        if self.is_connected:
+            return self._client
+
+        async with self._lock:
+            if not self.is_connected:
+                client = self._client or self._create_client()
+                await client.connect()
+                self._client = client
+
+        return self._client
+
+    async def disconnect(self) -> None:
+        """Disconnect the shared client"""
+        async with self._lock:
+            if self._client is not None and self._client.is_connected():
+                await self._client.disconnect()
+            self._client = None
+
+    async def get_client(self) -> Prisma:
+        """Get the connected shared client"""
+        if self.is_connected:
+            return self._client
+        return await self.connect()
+
+    async def health_check(self) -> Dict[str, Any]:
+        """
+        Probe the database with a trivial query.
+
+        Returns:
+            Dict with ``status`` and round-trip ``latency_ms``
+        """
+        start = time.perf_counter()
+        try:
+            client = await self.get_client()
+            await client.query_raw("SELECT 1")
+        except Exception as e:
+            return {"status": "unhealthy", "error": str(e)}
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        return {"status": "healthy", "latency_ms": round(latency_ms, 2)}
+
+
+db = Database()
@@ -0,0 +1,437 @@
+"""
+Application-scoped outbound HTTP clients
+"""
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, FrozenSet, Optional
+
+import httpx
+
+from app.core.admission import AdmissionController, AdmissionPolicy, Permit
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Errors raised before the request reached the upstream, safe to retry for any method
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+# Errors that may happen after the upstream received the request
+TRANSIENT_ERRORS = (httpx.ReadTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Retry and exponential backoff policy for one upstream"""
+
+    attempts: int = 3
+    backoff_base: float = 0.2  # seconds
+    backoff_max: float = 5.0  # seconds
+    retry_statuses: FrozenSet[int] = frozenset({429, 502, 503, 504})
+
+    def backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """
+        Delay before the next attempt, using full jitter.
+
+        A ``Retry-After`` header on the failed response is honoured up to
+        ``backoff_max``.
+        """
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("retry-after"))
+            if retry_after is not None:
+                return min(retry_after, self.backoff_max)
+
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    """Connection pool, timeout and retry settings for one upstream"""
+
+    base_url: str = ""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0  # seconds
+    timeout: float = 10.0  # seconds, read/write
+    connect_timeout: float = 5.0  # seconds
+    pool_timeout: float = 5.0  # seconds to wait for a free connection
+    http2: bool = True
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    admission: Optional[AdmissionPolicy] = None  # adaptive limits, off by default
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a ``Retry-After`` header.
+
+    Args:
+        value: Header value in seconds or HTTP-date form
+
+    Returns:
+        Delay in seconds, or None if absent or unparseable
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class UpstreamClient:
+    """
+    Pooled client for one upstream with retries and pool statistics.
+
+    A semaphore sized to ``max_connections`` guards the pool so the time a
+    request spends waiting for a connection can be measured. Upstreams with
+    an admission policy additionally go through an AdmissionController,
+    which may reject a request with AdmissionRejected when saturated.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        config: UpstreamConfig,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.name = name
+        self.config = config
+        self.client = httpx.AsyncClient(
+            base_url=config.base_url,
+            http2=config.http2,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                config.timeout,
+                connect=config.connect_timeout,
+                pool=config.pool_timeout,
+            ),
+            transport=transport,
+        )
+        self.admission = (
+            AdmissionController(name, config.admission) if config.admission else None
+        )
+        self._slots = asyncio.Semaphore(config.max_connections)
+        self._in_use = 0
+        self._waiting = 0
+        self._requests = 0
+        self._retries = 0
+        self._errors = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        """Acquire a connection slot, recording how long it took"""
+        self._waiting += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.config.pool_timeout)
+        except asyncio.TimeoutError:
+            raise httpx.PoolTimeout(f"No free connection for upstream '{self.name}'")
+        finally:
+            self._waiting -= 1
+
+        waited = time.perf_counter() - start
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._in_use += 1
+        self._requests += 1
+        try:
+            yield
+        finally:
+            self._in_use -= 1
+            self._slots.release()
+
+    @asynccontextmanager
+    async def _admit(self, key: str) -> AsyncIterator[Optional[Permit]]:
+        """Admit a request through the controller, or pass when there is none"""
+        if self.admission is None:
+            yield None
+            return
+        async with self.admission.admit(key) as permit:
+            yield permit
+
+    @staticmethod
+    def _check_throttled(permit: Optional[Permit], response: httpx.Response) -> None:
+        if permit is not None and response.status_code == 429:
+            permit.throttled(parse_retry_after(response.headers.get("retry-after")))
+
+    async def request(
+        self, method: str, url: str, admission_key: str = "", **kwargs: Any
+    ) -> httpx.Response:
+        """
+        Send a request, retrying transient failures.
+
+        Connection failures are retried for every method; read failures
+        and retryable status codes only for idempotent methods.
+
+        Args:
+            method: HTTP method
+            url: Absolute URL or path relative to the upstream base URL
+            admission_key: Rate-limit key for the admission controller
+            **kwargs: Passed through to ``httpx.AsyncClient.request``
+
+        Returns:
+            The final response
+
+        Raises:
+            AdmissionRejected: If the upstream's admission controller is saturated
+        """
+        policy = self.config.retry
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        for attempt in range(policy.attempts):
+            last_attempt = attempt == policy.attempts - 1
+            response = None
+            try:
+                async with self._admit(admission_key) as permit, self._slot():
+                    response = await self.client.request(method, url, **kwargs)
+                    self._check_throttled(permit, response)
+            except CONNECT_ERRORS:
+                self._errors += 1
+                if last_attempt:
+                    raise
+            except TRANSIENT_ERRORS:
+                self._errors += 1
+                if last_attempt or not idempotent:
+                    raise
+            else:
+                if (
+                    last_attempt
+                    or not idempotent
+                    or response.status_code not in policy.retry_statuses
+                ):
+                    return response
+                await response.aclose()
+
+            self._retries += 1
+            delay = policy.backoff(attempt, response)
+            logger.debug(
+                "Retrying %s %s on upstream '%s' in %.2fs", method, url, self.name, delay
+            )
+            await asyncio.sleep(delay)
+
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a GET request"""
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a POST request"""
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(
+        self, method: str, url: str, admission_key: str = "", **kwargs: Any
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        Stream a response body. Streams are not retried.
+
+        The admission slot is held until the body has been consumed.
+
+        Args:
+            method: HTTP method
+            url: Absolute URL or path relative to the upstream base URL
+            admission_key: Rate-limit key for the admission controller
+            **kwargs: Passed through to ``httpx.AsyncClient.stream``
+
+        Raises:
+            AdmissionRejected: If the upstream's admission controller is saturated
+        """
+        async with self._admit(admission_key) as permit, self._slot():
+            async with self.client.stream(method, url, **kwargs) as response:
+                self._check_throttled(permit, response)
+                yield response
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of pool usage.
+
+        Returns:
+            Dict with in-use/idle connection counts and wait times
+        """
+        pool = getattr(self.client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        stats = {
+            "max_connections": self.config.max_connections,
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "requests": self._requests,
+            "retries": self._retries,
+            "errors": self._errors,
+            "wait_time_total_ms": round(self._wait_total * 1000, 2),
+            "wait_time_max_ms": round(self._wait_max * 1000, 2),
+            "wait_time_avg_ms": round(
+                self._wait_total * 1000 / self._requests, 2
+            ) if self._requests else 0.0,
+        }
+        if self.admission is not None:
+            stats["admission"] = self.admission.stats()
+        return stats
+
+    async def aclose(self) -> None:
+        """Close the underlying connection pool"""
+        await self.client.aclose()
+
+
+class HTTPClientRegistry:
+    """
+    Named upstream clients shared by the whole application.
+
+    Clients are created on first use and closed from the lifespan hook.
+    """
+
+    def __init__(self):
+        self._configs: Dict[str, UpstreamConfig] = {}
+        self._transports: Dict[str, Optional[httpx.AsyncBaseTransport]] = {}
+        self._clients: Dict[str, UpstreamClient] = {}
+
+    def register(
+        self,
+        name: str,
+        config: UpstreamConfig,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        """
+        Register (or replace) an upstream.
+
+        Replacing an upstream discards its current client without closing
+        it, so do this before the upstream is used.
+
+        Args:
+            name: Upstream name, e.g. ``"supabase"``
+            config: Pool and retry settings
+            transport: Optional custom transport (used by tests)
+        """
+        self._configs[name] = config
+        self._transports[name] = transport
+        self._clients.pop(name, None)
+
+    def config(self, name: str) -> UpstreamConfig:
+        """Get the configuration of a registered upstream"""
+        return self._configs[name]
+
+    def get(self, name: str) -> UpstreamClient:
+        """
+        Get the shared client for an upstream.
+
+        Raises:
+            KeyError: If the upstream is not registered
+        """
+        client = self._clients.get(name)
+        if client is None:
+            if name not in self._configs:
+                raise KeyError(f"Unknown upstream: {name}")
+            client = UpstreamClient(name, self._configs[name], self._transports[name])
+            self._clients[name] = client
+        return client
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Pool statistics for every upstream that has been used"""
+        return {name: client.stats() for name, client in self._clients.items()}
+
+    async def aclose(self) -> None:
+        """Close every open client"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        await asyncio.gather(*(client.aclose() for client in clients))
+
+
+def create_http_registry() -> HTTPClientRegistry:
+    """Build the registry with the upstreams the application talks to"""
+    registry = HTTPClientRegistry()
+    retry = RetryPolicy(
+        attempts=settings.http_retry_attempts,
+        backoff_base=settings.http_retry_backoff,
+    )
+    registry.register(
+        "supabase",
+        UpstreamConfig(
+            base_url=settings.supabase_url,
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+            timeout=settings.http_timeout,
+            connect_timeout=settings.http_connect_timeout,
+            retry=retry,
+        ),
+    )
+    registry.register(
+        "image_generation",
+        UpstreamConfig(
+            base_url=settings.image_generation_url,
+            max_connections=settings.image_generation_max_connections,
+            max_keepalive_connections=settings.image_generation_max_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+            timeout=settings.image_generation_timeout,
+            connect_timeout=settings.http_connect_timeout,
+            retry=retry,
+            admission=AdmissionPolicy(
+                initial_limit=settings.image_generation_concurrency,
+                max_limit=settings.image_generation_max_connections,
+                latency_target=settings.image_generation_latency_target,
+                max_queue=settings.image_generation_queue_size,
+                queue_timeout=settings.image_generation_queue_timeout,
+                rate=settings.image_generation_rate_limit,
+                burst=settings.image_generation_rate_burst,
+            ),
+        ),
+    )
+    # Images the generation upstream returns by URL, e.g. on a CDN
+    registry.register(
+        "image_download",
+        UpstreamConfig(
+            max_connections=settings.image_generation_max_connections,
+            max_keepalive_connections=settings.image_generation_max_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+            timeout=settings.image_generation_timeout,
+            connect_timeout=settings.http_connect_timeout,
+            retry=retry,
+        ),
+    )
+    registry.register(
+        "s3",
+        UpstreamConfig(
+            base_url=settings.s3_endpoint_url,
+            max_connections=settings.s3_max_connections,
+            max_keepalive_connections=settings.s3_max_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+            timeout=settings.s3_timeout,
+            connect_timeout=settings.http_connect_timeout,
+            retry=retry,
+        ),
+    )
+    registry.register(
+        "openai",
+        UpstreamConfig(
+            base_url="https://api.openai.com",
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+            timeout=settings.image_generation_timeout,
+            connect_timeout=settings.http_connect_timeout,
+            retry=retry,
+        ),
+    )
+    return registry
+
+
+http_clients = create_http_registry()
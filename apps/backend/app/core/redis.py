@@ -0,0 +1,172 @@
+"""
+Minimal asyncio client for the Redis protocol (RESP)
+"""
+import asyncio
+from typing import Any, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+
+class RedisError(Exception):
+    """Raised for error replies and protocol failures"""
+
+
+class RedisConnectionError(RedisError):
+    """Raised when the connection is closed or out of sync"""
+
+
+def parse_redis_url(url: str) -> Tuple[str, int, int, Optional[str], Optional[str]]:
+    """
+    Split a ``redis://[user:password@]host[:port][/db]`` URL.
+
+    Returns:
+        Tuple of host, port, database number, username and password
+    """
+    parsed = urlparse(url)
+    if parsed.scheme != "redis":
+        raise ValueError(f"Unsupported Redis URL scheme: {parsed.scheme}")
+    db = int(parsed.path.lstrip("/") or 0)
+    username = unquote(parsed.username) if parsed.username else None
+    password = unquote(parsed.password) if parsed.password else None
+    return parsed.hostname or "localhost", parsed.port or 6379, db, username, password
+
+
+def encode_command(*args: Any) -> bytes:
+    """Encode a command as a RESP array of bulk strings"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """
+    Read one RESP reply.
+
+    Raises:
+        RedisError: For error replies or malformed data
+    """
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise RedisConnectionError("Connection closed by server")
+
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        raise RedisError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(payload)
+        if count < 0:
+            return None
+        return [await read_reply(reader) for _ in range(count)]
+    raise RedisConnectionError(f"Unknown reply type: {kind!r}")
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def execute(self, *args: Any) -> Any:
+        self.writer.write(encode_command(*args))
+        await self.writer.drain()
+        return await read_reply(self.reader)
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class RedisClient:
+    """
+    Pooled client speaking the subset of Redis commands the caches use.
+
+    Works against Redis itself or any RESP-compatible server (Valkey,
+    KeyDB, Dragonfly, or a local stand-in in tests).
+    """
+
+    def __init__(self, url: str, max_connections: int = 10, timeout: float = 1.0):
+        self.host, self.port, self.db, self.username, self.password = parse_redis_url(url)
+        self.timeout = timeout
+        self._idle: List[_Connection] = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def _connect(self) -> _Connection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        conn = _Connection(reader, writer)
+        try:
+            if self.password:
+                if self.username:
+                    await conn.execute("AUTH", self.username, self.password)
+                else:
+                    await conn.execute("AUTH", self.password)
+            if self.db:
+                await conn.execute("SELECT", self.db)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    async def execute(self, *args: Any) -> Any:
+        """
+        Run one command on a pooled connection.
+
+        Connections that fail mid-command are discarded rather than reused.
+        """
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+            try:
+                if conn is None:
+                    conn = await asyncio.wait_for(self._connect(), self.timeout)
+                reply = await asyncio.wait_for(conn.execute(*args), self.timeout)
+            except RedisConnectionError:
+                if conn is not None:
+                    conn.close()
+                raise
+            except RedisError:
+                # Error replies leave the connection usable
+                if conn is not None:
+                    self._idle.append(conn)
+                raise
+            except BaseException:
+                if conn is not None:
+                    conn.close()
+                raise
+            self._idle.append(conn)
+            return reply
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """GET a key"""
+        return await self.execute("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """SET a key, with an optional TTL in seconds"""
+        if ttl is None:
+            await self.execute("SET", key, value)
+        else:
+            await self.execute("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def delete(self, *keys: str) -> int:
+        """DEL one or more keys"""
+        return await self.execute("DEL", *keys)
+
+    async def incr(self, key: str) -> int:
+        """INCR a counter"""
+        return await self.execute("INCR", key)
+
+    async def close(self) -> None:
+        """Close idle connections"""
+        for conn in self._idle:
+            conn.close()
+        self._idle.clear()
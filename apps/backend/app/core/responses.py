@@ -0,0 +1,90 @@
+"""
+Fast JSON responses, and streaming responses that read the request as they go
+"""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is a declared dependency
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    """Serialize values the fast encoders do not handle natively"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize content to compact UTF-8 JSON.
+
+    Pydantic models are dumped in one pass by pydantic-core; everything
+    else goes through orjson, or the stdlib encoder if orjson is missing.
+
+    Args:
+        content: Model, dict, list or scalar to serialize
+
+    Returns:
+        JSON bytes
+    """
+    if isinstance(content, BaseModel):
+        return content.model_dump_json().encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    ``JSONResponse`` rendered with :func:`dumps`.
+
+    As the app default, routes with a ``response_model`` hand it the
+    output of pydantic-core's JSON-mode dump, so serialization stays in
+    native code end to end. Returning ``FastJSONResponse(model)`` directly
+    skips FastAPI's encoding step and dumps the model in a single pass.
+
+    FastAPI 0.130 and later dump ``response_model`` output natively, and
+    only for the stock response class, which is why ``pyproject.toml``
+    keeps FastAPI below 0.130. Re-run ``benchmarks/bench_serialization.py``
+    before lifting that bound.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    ``StreamingResponse`` whose content is produced while the request body
+    is still being read, e.g. results of an upload sent as it arrives.
+
+    On servers older than ASGI 2.4 the base class watches for disconnects
+    by reading ``receive`` itself, which would swallow the body. Here the
+    body reader sees the disconnect instead (``request.stream()`` raises
+    ``ClientDisconnect``). Once the body has been read the content runs to
+    its end even if the client left, so work already accepted finishes.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,361 @@
+"""
+Local verification of Supabase access tokens
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import jwt
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.http import http_clients
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = {"RS256", "RS384", "RS512", "ES256", "ES384", "ES512", "EdDSA"}
+
+
+class TokenVerificationError(Exception):
+    """Raised when an access token is malformed, forged or expired"""
+
+
+class UnknownSigningKeyError(TokenVerificationError):
+    """Raised when a token is signed with a key ID missing from the JWKS"""
+
+
+class JWKSCache:
+    """
+    In-memory copy of the Supabase signing keys.
+
+    Keys are loaded on first use, refreshed in the background every
+    ``refresh_interval`` seconds, and re-fetched on demand (at most once
+    per ``min_refresh_interval``) when a token names an unknown key ID.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        refresh_interval: float = 600,
+        min_refresh_interval: float = 30,
+        timeout: float = 10.0,
+    ):
+        self.jwks_url = jwks_url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_stale(self) -> bool:
+        """Whether the cached keys are missing or older than the refresh interval"""
+        return (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at >= self.refresh_interval
+        )
+
+    def set_keys(self, jwks: Dict[str, Any]) -> None:
+        """
+        Replace the cached keys with a JWKS document.
+
+        Args:
+            jwks: Parsed JWKS JSON (``{"keys": [...]}``)
+        """
+        keys = {}
+        for key_data in jwks.get("keys", []):
+            try:
+                key = jwt.PyJWK.from_dict(key_data)
+            except jwt.PyJWTError:
+                # Skip key types this process cannot use
+                continue
+            if key.key_id:
+                keys[key.key_id] = key
+
+        self._keys = keys
+        self._loaded_at = time.monotonic()
+
+    async def _fetch(self) -> Dict[str, Any]:
+        """Download the JWKS document"""
+        response = await http_clients.get("supabase").get(
+            self.jwks_url, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def refresh(self, force: bool = False) -> None:
+        """
+        Reload keys from the JWKS endpoint.
+
+        Args:
+            force: Refresh even if the cache is fresh, subject to the
+                minimum refresh interval
+        """
+        async with self._lock:
+            if self._loaded_at is not None:
+                age = time.monotonic() - self._loaded_at
+                if age < self.min_refresh_interval:
+                    return
+                if not force and age < self.refresh_interval:
+                    return
+
+            if not self.jwks_url:
+                self.set_keys({})
+                return
+
+            try:
+                self.set_keys(await self._fetch())
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning("Failed to refresh JWKS from %s: %s", self.jwks_url, e)
+                # Keep serving the previous keys and retry after the minimum interval
+                self._loaded_at = (
+                    time.monotonic() - self.refresh_interval + self.min_refresh_interval
+                )
+
+    async def get_key(self, kid: str) -> Optional[jwt.PyJWK]:
+        """
+        Look up a signing key, refreshing once if the key ID is unknown.
+
+        Args:
+            kid: Key ID from the token header
+
+        Returns:
+            Matching key, or None if it is still unknown after a refresh
+        """
+        if self.is_stale:
+            await self.refresh()
+
+        key = self._keys.get(kid)
+        if key is None:
+            await self.refresh(force=True)
+            key = self._keys.get(kid)
+        return key
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    def start(self) -> None:
+        """Start the background refresh task"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """Stop the background refresh task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class JWTVerifier:
+    """
+    Validates Supabase access tokens in-process.
+
+    Asymmetrically signed tokens are checked against the cached JWKS;
+    HS256 tokens are checked against the project JWT secret when one is
+    configured. Signature, expiry, audience and issuer are all verified.
+    """
+
+    def __init__(
+        self,
+        jwks: JWKSCache,
+        jwt_secret: str = "",
+        audience: Optional[str] = "authenticated",
+        issuer: Optional[str] = None,
+        leeway: float = 0,
+    ):
+        self.jwks = jwks
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.issuer = issuer
+        self.leeway = leeway
+
+    async def _resolve_key(self, header: Dict[str, Any]) -> Any:
+        """Pick the verification key for a token header"""
+        alg = header.get("alg")
+
+        if alg == "HS256":
+            if not self.jwt_secret:
+                raise UnknownSigningKeyError("No secret configured for HS256 tokens")
+            return self.jwt_secret
+
+        if alg not in ASYMMETRIC_ALGORITHMS:
+            raise TokenVerificationError(f"Unsupported token algorithm: {alg}")
+
+        kid = header.get("kid")
+        key = await self.jwks.get_key(kid) if kid else None
+        if key is None:
+            raise UnknownSigningKeyError(f"Unknown signing key: {kid}")
+        if key.algorithm_name != alg:
+            raise TokenVerificationError("Token algorithm does not match signing key")
+        return key.key
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Verify a token and return its claims.
+
+        Args:
+            token: Encoded JWT
+
+        Returns:
+            Decoded claims
+
+        Raises:
+            UnknownSigningKeyError: If the signing key is not known locally
+            TokenVerificationError: If the token is invalid or expired
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise TokenVerificationError("Malformed token") from e
+
+        key = await self._resolve_key(header)
+
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[header["alg"]],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={"require": ["exp", "sub"]},
+            )
+        except jwt.PyJWTError as e:
+            raise TokenVerificationError(str(e)) from e
+
+
+def user_from_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a user dict shaped like Supabase's ``/auth/v1/user`` response.
+
+    Args:
+        claims: Verified access token claims
+
+    Returns:
+        User data dict
+    """
+    return {
+        "id": claims["sub"],
+        "aud": claims.get("aud"),
+        "role": claims.get("role"),
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "app_metadata": claims.get("app_metadata", {}),
+        "user_metadata": claims.get("user_metadata", {}),
+        "is_anonymous": claims.get("is_anonymous", False),
+    }
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """
+    Read the ``exp`` claim without verifying the token.
+
+    Only use this for tokens that have already been verified.
+
+    Args:
+        token: Encoded JWT
+
+    Returns:
+        Expiry as a Unix timestamp, or None if it cannot be read
+    """
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.PyJWTError:
+        return None
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+
+class SessionCache:
+    """
+    Cache of verification results keyed by a hash of the access token.
+
+    Verified users live until the earlier of the token's expiry and the
+    configured TTL. Rejected tokens are remembered for a short negative TTL
+    so a burst of requests with a bad cookie is not re-verified each time.
+    Raw tokens are never stored.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300, negative_ttl: float = 10):
+        self.negative_ttl = negative_ttl
+        self._cache: TTLCache[Tuple[bool, Any]] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def key(token: str) -> str:
+        """Cache key for a token"""
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[Tuple[bool, Any]]:
+        """
+        Look up a token.
+
+        Returns:
+            ``(True, user)`` for a verified token, ``(False, detail)`` for a
+            known-bad token, or None on a miss
+        """
+        return self._cache.get(self.key(token))
+
+    def set_valid(
+        self, token: str, user: Dict[str, Any], expires_at: Optional[float] = None
+    ) -> None:
+        """
+        Remember a verified token.
+
+        Args:
+            token: Access token
+            user: User data returned for the token
+            expires_at: Token expiry as a Unix timestamp
+        """
+        ttl = None if expires_at is None else expires_at - time.time()
+        self._cache.set(self.key(token), (True, user), ttl=ttl)
+
+    def set_invalid(self, token: str, detail: str) -> None:
+        """Remember a rejected token for the negative TTL"""
+        self._cache.set(self.key(token), (False, detail), ttl=self.negative_ttl)
+
+    def invalidate(self, token: str) -> None:
+        """Forget a token, e.g. on logout"""
+        self._cache.delete(self.key(token))
+
+    def clear(self) -> None:
+        """Forget every token"""
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss counters"""
+        return self._cache.stats()
+
+
+def create_jwt_verifier() -> JWTVerifier:
+    """Build the verifier from application settings"""
+    supabase_url = settings.supabase_url.rstrip("/")
+    jwks_url = f"{supabase_url}/auth/v1/.well-known/jwks.json" if supabase_url else ""
+    return JWTVerifier(
+        jwks=JWKSCache(
+            jwks_url=jwks_url,
+            refresh_interval=settings.jwks_refresh_interval,
+            min_refresh_interval=settings.jwks_min_refresh_interval,
+        ),
+        jwt_secret=settings.supabase_jwt_secret,
+        audience=settings.jwt_audience or None,
+        issuer=f"{supabase_url}/auth/v1" if supabase_url else None,
+        leeway=settings.jwt_leeway,
+    )
+
+
+jwt_verifier = create_jwt_verifier()
+session_cache = SessionCache(
+    maxsize=settings.session_cache_size,
+    ttl=settings.session_cache_ttl,
+    negative_ttl=settings.session_cache_negative_ttl,
+)
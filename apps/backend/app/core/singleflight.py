@@ -0,0 +1,70 @@
+"""
+Request coalescing for duplicate concurrent work
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Collapse concurrent calls for the same key into one execution.
+
+    The first caller for a key starts the work; callers arriving while it
+    is still running await the same task and receive the same result or
+    exception. Once the task finishes the key is released, so later calls
+    run again (pair this with a cache to reuse results over time).
+
+    The shared task is shielded: a caller that is cancelled, e.g. because
+    its client disconnected, does not cancel the work for the others.
+
+    Usable for any duplicate-prone fetch: token verification keyed by token
+    hash, profile loads keyed by user ID, outfit generation keyed by cache
+    key.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Task[T]"] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run ``fn`` once for all concurrent callers with the same key.
+
+        Args:
+            key: Identity of the work
+            fn: Zero-argument coroutine function doing the work
+
+        Returns:
+            Result of the shared execution
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._release(key, t))
+        else:
+            self.shared += 1
+
+        return await asyncio.shield(task)
+
+    def _release(self, key: Hashable, task: "asyncio.Task[T]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved when every waiter has gone
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Call and coalescing counters"""
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "in_flight": len(self._inflight),
+        }
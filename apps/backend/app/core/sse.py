@@ -0,0 +1,56 @@
+"""
+Server-sent events: encoding for our streams, parsing for upstream ones
+"""
+from typing import AsyncIterable, AsyncIterator, Optional, Tuple
+
+
+def format_sse(data: str, event: Optional[str] = None, id: Optional[str] = None) -> bytes:
+    """
+    Encode one server-sent event.
+
+    Args:
+        data: Payload, split over several ``data:`` lines if it has newlines
+        event: Event type, or None for the default ``message``
+        id: Event ID clients echo back in ``Last-Event-ID``
+
+    Returns:
+        The encoded event, terminated by a blank line
+    """
+    lines = []
+    if id is not None:
+        lines.append(f"id: {id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+async def parse_sse(lines: AsyncIterable[str]) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Decode a server-sent event stream.
+
+    Args:
+        lines: Lines of the stream without line endings, e.g.
+            ``httpx.Response.aiter_lines()``
+
+    Yields:
+        ``(event type, data)`` for each event with data; the type defaults
+        to ``message``
+    """
+    event, data = "message", []
+    async for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+            continue
+        if line.startswith(":"):
+            continue  # comment / keep-alive
+        field, _, value = line.partition(":")
+        value = value.removeprefix(" ")
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+    if data:
+        yield event, "\n".join(data)
@@ -1,10 +1,46 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.core.config import settings
+from app.core.database import db
+from app.core.http import http_clients
+from app.core.responses import FastJSONResponse
+from app.core.security import jwt_verifier, session_cache
+from app.services.cache_service import close_redis_client, outfit_cache
+from app.services.duplicates import duplicate_index
+from app.services.image_processing import shutdown_image_executor
+from app.services.outfit_generation import get_generation_queue
+from app.services.tagging import close_tagging_service, get_tagging_service
 from app.api import api_router
-from app.api.endpoints import profiles
+from app.api.deps import auth_flight
+from app.api.endpoints import clothing, outfits, profiles, uploads
 
-app = FastAPI(title="OOTD Mate API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources once at startup and release them on shutdown"""
+    await db.connect()
+    jwt_verifier.jwks.start()
+    generation_queue = get_generation_queue()
+    await generation_queue.start()
+    try:
+        yield
+    finally:
+        await generation_queue.stop()
+        await close_tagging_service()
+        await jwt_verifier.jwks.stop()
+        await http_clients.aclose()
+        await close_redis_client()
+        await db.disconnect()
+        shutdown_image_executor()
+
+
+app = FastAPI(
+    title="OOTD Mate API",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
 
 # Configure CORS
 app.add_middleware(
@@ -21,6 +57,15 @@ app.include_router(api_router, prefix="/api")
 # Include profiles router (from Task 2)
 app.include_router(profiles.router)
 
+# Wardrobe listing
+app.include_router(clothing.router)
+
+# Outfit generation jobs
+app.include_router(outfits.router)
+
+# Serve stored files at the URLs LocalStorage.get_public_url hands out
+app.include_router(uploads.router)
+
 
 @app.get("/health")
 async def health_check():
@@ -28,6 +73,43 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/health/db")
+async def database_health_check():
+    """Database connectivity probe"""
+    result = await db.health_check()
+    if result["status"] != "healthy":
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content=result
+        )
+    return result
+
+
+@app.get("/health/http")
+async def http_pool_stats():
+    """Outbound HTTP connection pool statistics"""
+    return http_clients.stats()
+
+
+@app.get("/health/jobs")
+async def generation_job_stats():
+    """Outfit generation queue depth and outcomes"""
+    return get_generation_queue().stats()
+
+
+@app.get("/health/cache")
+async def cache_stats():
+    """In-process cache sizes and hit rates"""
+    return {
+        "sessions": session_cache.stats(),
+        "auth_single_flight": auth_flight.stats(),
+        "profiles": profiles.profile_cache.stats(),
+        "outfits": outfit_cache.stats(),
+        "duplicates": duplicate_index.stats(),
+        "tagging": get_tagging_service().stats(),
+    }
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
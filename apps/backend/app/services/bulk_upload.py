@@ -0,0 +1,553 @@
+"""
+Bulk wardrobe uploads: many photos in one request, stored as a pipeline
+"""
+import asyncio
+import logging
+import tempfile
+import time
+import uuid
+import zipfile
+import zlib
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Mapping, Optional, Sequence, Set, Tuple, Union
+
+from prisma import Prisma
+from pydantic import BaseModel
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+from app.services.duplicates import DuplicateIndex, duplicate_index
+from app.services.image_processing import ImageProcessor, InvalidImageError, sniff_image
+from app.services.tagging import (
+    UNCATEGORIZED,
+    GarmentTags,
+    TaggingError,
+    TaggingService,
+    content_hash,
+)
+from app.storage.streams import FileTooLargeError
+
+logger = logging.getLogger(__name__)
+
+# Pillow format -> (extension, MIME type) of the photos accepted
+IMAGE_TYPES = {
+    "JPEG": ("jpg", "image/jpeg"),
+    "PNG": ("png", "image/png"),
+    "WEBP": ("webp", "image/webp"),
+}
+
+# Columns a bulk upload fills, in INSERT order
+INSERT_COLUMNS = (
+    "id", "userId", "name", "imageUrl", "category", "color", "pattern", "material",
+    "season", "palette", "colorCode", "perceptualHash", "createdAt", "updatedAt",
+)
+TAG_COLUMNS = ("color", "pattern", "material", "season")
+
+
+class BulkUploadError(Exception):
+    """Raised when the body of a bulk upload cannot be read"""
+
+
+class MemoryBudget:
+    """
+    Bytes of uploaded content one request may hold in memory at once.
+
+    Readers :meth:`acquire` what they buffer and wait while the budget is
+    spent, so the request body stops being read and TCP flow control
+    slows the client down. Whoever is done with the content releases it.
+    """
+
+    def __init__(self, limit: int):
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        self.limit = limit
+        self.held = 0
+        self.peak = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self, size: int) -> None:
+        """
+        Wait until ``size`` more bytes fit in the budget, then take them.
+
+        Raises:
+            ValueError: If ``size`` exceeds the whole budget
+        """
+        if size > self.limit:
+            raise ValueError(f"{size} bytes exceed the budget of {self.limit}")
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.held + size <= self.limit)
+            self.held += size
+            self.peak = max(self.peak, self.held)
+
+    async def release(self, size: int) -> None:
+        """Give back bytes taken with :meth:`acquire`"""
+        async with self._changed:
+            self.held -= size
+            self._changed.notify_all()
+
+
+@dataclass(frozen=True)
+class Photo:
+    """One photo of a bulk upload, as read from the request"""
+
+    index: int  # position in the upload
+    filename: str
+    content: bytes = b""  # charged to the request's MemoryBudget
+    error: Optional[str] = None  # why the photo was rejected while reading
+
+
+class BulkUploadItem(BaseModel):
+    """Outcome of one photo of a bulk upload"""
+
+    index: int
+    filename: str
+    status: str  # created | failed
+    id: Optional[str] = None
+    imageUrl: Optional[str] = None
+    category: Optional[str] = None
+    color: Optional[str] = None
+    pattern: Optional[str] = None
+    material: Optional[str] = None
+    season: Optional[str] = None
+    tagged: bool = False  # False if tagging failed; a tagging backfill retries
+    duplicates: List[str] = []  # existing items whose photos look the same
+    error: Optional[str] = None
+
+
+async def read_multipart(
+    chunks: AsyncIterable[bytes],
+    content_type: str,
+    budget: MemoryBudget,
+    max_size: int,
+    max_files: int,
+) -> AsyncIterator[Photo]:
+    """
+    Read the photos of a ``multipart/form-data`` body as it arrives.
+
+    Every file part is a photo; other fields are ignored. Each part is
+    charged to ``budget`` chunk by chunk while it arrives and yielded as
+    soon as it is complete. Parts over ``max_size`` or beyond
+    ``max_files`` are not buffered and are yielded with an error.
+
+    Args:
+        chunks: Request body
+        content_type: ``Content-Type`` header, with the boundary
+        budget: Memory budget of the request
+        max_size: Largest photo in bytes
+        max_files: Most photos to accept
+
+    Raises:
+        BulkUploadError: If the body is not valid multipart
+    """
+    _, options = parse_options_header(content_type)
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise BulkUploadError("Missing multipart boundary")
+
+    # The parser reports through callbacks; collect what one chunk
+    # produced, then handle it where awaiting is possible
+    events: List[Tuple[str, bytes]] = []
+
+    def on(kind: str):
+        return lambda data=b"", start=0, end=0: events.append((kind, data[start:end]))
+
+    parser = MultipartParser(
+        boundary,
+        callbacks={
+            "on_part_begin": on("begin"),
+            "on_header_field": on("field"),
+            "on_header_value": on("value"),
+            "on_header_end": on("header_end"),
+            "on_headers_finished": on("headers"),
+            "on_part_data": on("data"),
+            "on_part_end": on("end"),
+        },
+    )
+
+    index = 0
+    headers: Dict[bytes, bytes] = {}
+    field = value = b""
+    filename: Optional[str] = None  # None outside a file part
+    parts: List[bytes] = []
+    size = 0
+    error: Optional[str] = None
+    async for chunk in chunks:
+        try:
+            parser.write(chunk)
+        except MultipartParseError as e:
+            raise BulkUploadError(f"Invalid multipart body: {e}") from None
+
+        for kind, data in events:
+            if kind == "begin":
+                headers, field, value = {}, b"", b""
+            elif kind == "field":
+                field += data
+            elif kind == "value":
+                value += data
+            elif kind == "header_end":
+                headers[field.lower()] = value
+                field = value = b""
+            elif kind == "headers":
+                _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+                name = disposition.get(b"filename")
+                filename = None if name is None else name.decode("utf-8", "replace")
+                parts, size, error = [], 0, None
+                if filename is not None and index >= max_files:
+                    error = f"Only {max_files} photos can be uploaded at once"
+            elif kind == "data" and filename is not None and error is None:
+                if size + len(data) > max_size:
+                    await budget.release(size)
+                    parts, size, error = [], 0, str(FileTooLargeError(max_size))
+                    continue
+                await budget.acquire(len(data))
+                parts.append(data)
+                size += len(data)
+            elif kind == "end" and filename is not None:
+                if error is None:
+                    yield Photo(index, filename, b"".join(parts))
+                else:
+                    yield Photo(index, filename, error=error)
+                parts, filename = [], None
+                index += 1
+        events.clear()
+
+    if filename is not None:
+        await budget.release(size)
+        raise BulkUploadError("Multipart body ended in the middle of a photo")
+
+
+async def read_zip(
+    chunks: AsyncIterable[bytes],
+    budget: MemoryBudget,
+    max_size: int,
+    max_files: int,
+) -> AsyncIterator[Photo]:
+    """
+    Read the photos of a zip archive sent as the request body.
+
+    A zip's directory is at its end, so the body is first spooled to a
+    temporary file rather than memory. Members are then decompressed one
+    at a time, each charged to ``budget`` by its declared size, which
+    also caps what is decompressed. Folders, hidden files and macOS
+    resource forks are skipped. Members over ``max_size``, beyond
+    ``max_files`` or that fail to decompress are yielded with an error.
+
+    Args:
+        chunks: Request body
+        budget: Memory budget of the request
+        max_size: Largest photo in bytes
+        max_files: Most photos to accept
+
+    Raises:
+        BulkUploadError: If the body is not a zip archive
+    """
+    with tempfile.TemporaryFile() as spool:
+        async for chunk in chunks:
+            await run_in_threadpool(spool.write, chunk)
+        try:
+            archive = await run_in_threadpool(zipfile.ZipFile, spool)
+        except zipfile.BadZipFile:
+            raise BulkUploadError("Body is not a zip archive") from None
+
+        with archive:
+            index = 0
+            for info in archive.infolist():
+                path = PurePosixPath(info.filename)
+                if info.is_dir() or path.parts[0] == "__MACOSX" or path.name.startswith("."):
+                    continue
+                if index >= max_files:
+                    error = f"Only {max_files} photos can be uploaded at once"
+                elif info.file_size > max_size:
+                    error = str(FileTooLargeError(max_size))
+                else:
+                    await budget.acquire(info.file_size)
+                    try:
+                        content = await run_in_threadpool(archive.read, info)
+                    except (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError) as e:
+                        await budget.release(info.file_size)
+                        error = f"Cannot extract photo: {e}"
+                    else:
+                        yield Photo(index, info.filename, content)
+                        index += 1
+                        continue
+                yield Photo(index, info.filename, error=error)
+                index += 1
+
+
+def build_insert(rows: Sequence[Mapping[str, Any]]) -> Tuple[str, List[Any]]:
+    """
+    Build one INSERT of several clothing items.
+
+    Args:
+        rows: Values of every column in ``INSERT_COLUMNS``, per item
+
+    Returns:
+        SQL with ``?`` placeholders and its parameters
+    """
+    columns = ", ".join(f'"{column}"' for column in INSERT_COLUMNS)
+    values = "(" + ", ".join("?" for _ in INSERT_COLUMNS) + ")"
+    sql = f'INSERT INTO "clothing_items" ({columns}) VALUES {", ".join(values for _ in rows)}'
+    return sql, [row[column] for row in rows for column in INSERT_COLUMNS]
+
+
+def item_name(filename: str, index: int) -> str:
+    """Name of a new item: its photo's file name without folder or extension"""
+    stem = PurePosixPath(filename.replace("\\", "/")).stem.strip()
+    return stem[:100] or f"Item {index + 1}"
+
+
+@dataclass(frozen=True)
+class _Stored:
+    """A stored photo waiting for its row to be written"""
+
+    path: str
+    row: Dict[str, Any]
+    perceptual_hash: int
+    result: BulkUploadItem
+
+
+async def _once(content: bytes) -> AsyncIterator[bytes]:
+    yield content
+
+
+class BulkUploader:
+    """
+    Stores the photos of a bulk upload as clothing items.
+
+    Photos flow through a pipeline while the request is still being read.
+    Up to ``concurrency`` photos at a time are checked, then rendered,
+    analysed and shrunk for tagging in one image worker job, then stored
+    with their variants while the tagging service tags them. A single
+    writer inserts the rows of stored photos, taking everything that is
+    ready at once, up to ``insert_batch_size`` rows per INSERT, so the
+    busier the pipeline the fewer the statements.
+
+    A photo that cannot be tagged is still stored, as ``UNCATEGORIZED``
+    unless a category was given, for a tagging backfill to complete.
+    """
+
+    def __init__(
+        self,
+        prisma: Prisma,
+        processor: ImageProcessor,
+        tagging: TaggingService,
+        index: DuplicateIndex = duplicate_index,
+        *,
+        concurrency: int = 8,
+        insert_batch_size: int = 50,
+    ):
+        self.prisma = prisma
+        self.processor = processor
+        self.tagging = tagging
+        self.index = index
+        self.concurrency = concurrency
+        self.insert_batch_size = insert_batch_size
+
+    async def run(
+        self,
+        user_id: str,
+        photos: AsyncIterator[Photo],
+        budget: MemoryBudget,
+        category: Optional[str] = None,
+    ) -> AsyncIterator[BulkUploadItem]:
+        """
+        Store photos as they are read.
+
+        Args:
+            user_id: Owner of the new items
+            photos: Photos as read from the request, e.g. by
+                :func:`read_multipart`
+            budget: Budget the photos were charged to; each photo's
+                content is released once it is stored
+            category: Category of every photo, instead of the tagged one
+
+        Yields:
+            The outcome of every photo, in the order they finish
+
+        Raises:
+            BulkUploadError: If reading the photos failed, after the ones
+                read before are stored
+        """
+        results: "asyncio.Queue[Optional[BulkUploadItem]]" = asyncio.Queue()
+        stored: "asyncio.Queue[Optional[_Stored]]" = asyncio.Queue()
+        reader = asyncio.create_task(self._read(user_id, photos, budget, category, stored, results))
+        writer = asyncio.create_task(self._write(user_id, stored, results))
+        try:
+            while (result := await results.get()) is not None:
+                yield result
+            await reader
+        finally:
+            reader.cancel()
+            writer.cancel()
+            await asyncio.gather(reader, writer, return_exceptions=True)
+
+    async def _read(
+        self,
+        user_id: str,
+        photos: AsyncIterator[Photo],
+        budget: MemoryBudget,
+        category: Optional[str],
+        stored: "asyncio.Queue[Optional[_Stored]]",
+        results: "asyncio.Queue[Optional[BulkUploadItem]]",
+    ) -> None:
+        """Start processing each photo as it is read, ``concurrency`` at a time"""
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks: Set["asyncio.Task[None]"] = set()
+
+        async def process(photo: Photo) -> None:
+            try:
+                outcome = await self._process(user_id, photo, category)
+            finally:
+                await budget.release(len(photo.content))
+                slots.release()
+            if isinstance(outcome, _Stored):
+                await stored.put(outcome)
+            else:
+                await results.put(outcome)
+
+        try:
+            async for photo in photos:
+                if photo.error is not None:
+                    await results.put(self._failed(photo, photo.error))
+                    continue
+                await slots.acquire()
+                task = asyncio.create_task(process(photo))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await stored.put(None)
+
+    async def _process(
+        self, user_id: str, photo: Photo, category: Optional[str]
+    ) -> Union[_Stored, BulkUploadItem]:
+        """Check, render, store and tag one photo"""
+        try:
+            fmt, _ = await sniff_image(_once(photo.content))
+            if fmt not in IMAGE_TYPES:
+                raise InvalidImageError(f"Unsupported image format: {fmt}")
+            prepared = await self.processor.prepare(photo.content)
+        except InvalidImageError as e:
+            return self._failed(photo, str(e))
+
+        extension, content_type = IMAGE_TYPES[fmt]
+        item_id = uuid.uuid4().hex
+        path = f"clothing/{user_id}/{item_id}.{extension}"
+        try:
+            url, tags = await asyncio.gather(
+                self.processor.upload(
+                    path, photo.content, content_type, variants=prepared.variants
+                ),
+                self._tag(photo.content, prepared.preview),
+            )
+            matches = await self.index.find(user_id, prepared.analysis.perceptual_hash)
+        except asyncio.CancelledError:
+            await self.processor.delete(path)
+            raise
+        except Exception:
+            logger.exception("Cannot store photo %s of a bulk upload", photo.filename)
+            await self.processor.delete(path)
+            return self._failed(photo, "Could not store the photo")
+
+        values = tags.model_dump() if tags is not None else {}
+        now = int(time.time() * 1000)  # Prisma stores SQLite DateTimes as epoch milliseconds
+        row = {
+            "id": item_id,
+            "userId": user_id,
+            "name": item_name(photo.filename, photo.index),
+            "imageUrl": url,
+            "category": category or values.get("category", UNCATEGORIZED),
+            **{column: values.get(column) for column in TAG_COLUMNS},
+            **prepared.analysis.columns(),
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        return _Stored(
+            path=path,
+            row=row,
+            perceptual_hash=prepared.analysis.perceptual_hash,
+            result=BulkUploadItem(
+                index=photo.index,
+                filename=photo.filename,
+                status="created",
+                id=item_id,
+                imageUrl=url,
+                category=row["category"],
+                **{column: row[column] for column in TAG_COLUMNS},
+                tagged=tags is not None,
+                duplicates=[match.item_id for match in matches],
+            ),
+        )
+
+    async def _tag(self, content: bytes, preview: bytes) -> Optional[GarmentTags]:
+        try:
+            return await self.tagging.tag(content_hash(content), preview)
+        except TaggingError as e:
+            logger.warning("Cannot tag photo of a bulk upload: %s", e)
+            return None
+
+    async def _write(
+        self,
+        user_id: str,
+        stored: "asyncio.Queue[Optional[_Stored]]",
+        results: "asyncio.Queue[Optional[BulkUploadItem]]",
+    ) -> None:
+        """Insert stored photos in batches of whatever is ready"""
+        done = False
+        while not done:
+            item = await stored.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.insert_batch_size and not stored.empty():
+                item = stored.get_nowait()
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            await self._insert(user_id, batch, results)
+        await results.put(None)
+
+    async def _insert(
+        self,
+        user_id: str,
+        batch: List[_Stored],
+        results: "asyncio.Queue[Optional[BulkUploadItem]]",
+    ) -> None:
+        sql, params = build_insert([item.row for item in batch])
+        try:
+            await self.prisma.execute_raw(sql, *params)
+        except BaseException as e:
+            await asyncio.gather(
+                *(self.processor.delete(item.path) for item in batch), return_exceptions=True
+            )
+            if not isinstance(e, Exception):
+                raise
+            logger.exception("Cannot insert %d clothing items of a bulk upload", len(batch))
+            for item in batch:
+                await results.put(
+                    BulkUploadItem(
+                        index=item.result.index,
+                        filename=item.result.filename,
+                        status="failed",
+                        error="Could not save the item",
+                    )
+                )
+            return
+
+        for item in batch:
+            self.index.add(user_id, item.row["id"], item.perceptual_hash)
+            await results.put(item.result)
+
+    @staticmethod
+    def _failed(photo: Photo, error: str) -> BulkUploadItem:
+        return BulkUploadItem(
+            index=photo.index, filename=photo.filename, status="failed", error=error
+        )
@@ -0,0 +1,343 @@
+"""
+Application-level caches built on the pluggable cache backends
+"""
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+from app.core.cache import CacheBackend, MemoryCacheBackend, RedisCacheBackend, TTLCache
+from app.core.config import settings
+from app.core.database import Database, db
+from app.core.redis import RedisClient
+from app.core.singleflight import SingleFlight
+
+M = TypeVar("M", bound=BaseModel)
+
+_redis_client: Optional[RedisClient] = None
+
+
+def get_redis_client() -> RedisClient:
+    """Get the process-wide Redis client"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = RedisClient(settings.redis_url)
+    return _redis_client
+
+
+async def close_redis_client() -> None:
+    """Close the process-wide Redis client's idle connections"""
+    if _redis_client is not None:
+        await _redis_client.close()
+
+
+def create_cache_backend(
+    namespace: str, model: Type[BaseModel], maxsize: int, ttl: float
+) -> CacheBackend:
+    """
+    Build the backend selected by ``CACHE_BACKEND``.
+
+    Args:
+        namespace: Key prefix for shared backends
+        model: Pydantic model used to serialize values for shared backends
+        maxsize: Entry limit for the in-process backend
+        ttl: Seconds to live
+
+    Returns:
+        Cache backend
+    """
+    if settings.cache_backend == "memory":
+        return MemoryCacheBackend(maxsize=maxsize, ttl=ttl)
+    if settings.cache_backend == "redis":
+        return RedisCacheBackend(
+            get_redis_client(),
+            namespace=namespace,
+            encode=lambda value: value.model_dump_json().encode(),
+            decode=model.model_validate_json,
+            ttl=ttl,
+        )
+    raise ValueError(f"Unsupported cache backend: {settings.cache_backend}")
+
+
+class ProfileCache:
+    """
+    Read-through cache of decoded profile responses keyed by user ID.
+
+    Concurrent misses for one user share a single load. ``invalidate``
+    marks a load in flight as stale, so a load that started before an
+    update cannot write its result back afterwards.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._flight: SingleFlight[Optional[Any]] = SingleFlight()
+        # Users with a load in flight, and whether it went stale
+        self._loading: Dict[str, bool] = {}
+
+    async def get(self, user_id: str) -> Optional[Any]:
+        """Get a cached profile"""
+        return await self.backend.get(user_id)
+
+    async def get_or_load(
+        self, user_id: str, loader: Callable[[], Awaitable[Optional[M]]]
+    ) -> Optional[M]:
+        """
+        Get a profile, loading and caching it on a miss.
+
+        Args:
+            user_id: Owner of the profile
+            loader: Coroutine function returning the profile or None
+
+        Returns:
+            The profile, or None if the user has none
+        """
+        profile = await self.backend.get(user_id)
+        if profile is not None:
+            return profile
+
+        async def load() -> Optional[M]:
+            self._loading[user_id] = False
+            try:
+                loaded = await loader()
+                if loaded is not None and not self._loading[user_id]:
+                    await self.backend.set(user_id, loaded)
+                return loaded
+            finally:
+                del self._loading[user_id]
+
+        return await self._flight.do(user_id, load)
+
+    async def invalidate(self, user_id: str) -> None:
+        """Drop a user's cached profile after it changes"""
+        if user_id in self._loading:
+            self._loading[user_id] = True
+        await self.backend.delete(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend and coalescing counters"""
+        return {**self.backend.stats(), "single_flight": self._flight.stats()}
+
+
+def outfit_cache_key(user_id: str, clothing_item_ids: Iterable[str], occasion: Optional[str]) -> str:
+    """
+    Cache key of an outfit generation request.
+
+    Args:
+        user_id: Owner of the wardrobe
+        clothing_item_ids: Items the outfit is built from, in any order
+        occasion: Requested occasion, if any
+
+    Returns:
+        SHA-256 hex digest of ``{user_id}:{sorted ids}:{occasion}``
+    """
+    ids = ",".join(sorted(set(clothing_item_ids)))
+    return hashlib.sha256(f"{user_id}:{ids}:{occasion or ''}".encode()).hexdigest()
+
+
+class CachedOutfit(BaseModel):
+    """A generated outfit stored for reuse, with what it was generated from"""
+
+    id: str
+    userId: str
+    name: str
+    imageUrl: Optional[str]
+    occasion: Optional[str]
+    clothingItemIds: List[str]
+    cacheKey: str
+    generation: int
+
+    @classmethod
+    def from_db(cls, outfit) -> "CachedOutfit":
+        """Convert a Prisma outfit loaded with its ``clothingItems`` links"""
+        return cls(
+            id=outfit.id,
+            userId=outfit.userId,
+            name=outfit.name,
+            imageUrl=outfit.imageUrl,
+            occasion=outfit.occasion,
+            clothingItemIds=sorted(link.clothingItemId for link in outfit.clothingItems or []),
+            cacheKey=outfit.cacheKey,
+            generation=outfit.cacheGeneration or 0,
+        )
+
+
+class OutfitCache:
+    """
+    Exact-match cache of generated outfits, so an identical request never
+    pays for a second image generation.
+
+    Two tiers: an in-process LRU of ``CachedOutfit`` in front of the
+    ``Outfit`` rows themselves, which record the key and wardrobe
+    generation they were generated for.
+
+    Each user has a generation counter on their ``User`` row. Entries are
+    only served for the current generation, so ``invalidate_user`` is a
+    single-row increment no matter how many outfits the user has; stale
+    entries are never scanned and simply age out. Generations are cached
+    in process for ``generation_ttl`` seconds, which bounds how long
+    another process may serve an entry after an invalidation.
+
+    Every hit, from either tier, is checked with :meth:`is_valid`, so an
+    outfit whose items were deleted is not served even when nothing
+    invalidated the user.
+
+    Hits are counted as saved generations.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        maxsize: int = 10000,
+        ttl: float = 3600.0,
+        generation_ttl: float = 5.0,
+    ):
+        self.database = database
+        self._local: TTLCache[CachedOutfit] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations: TTLCache[int] = TTLCache(maxsize=maxsize, ttl=generation_ttl)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.invalid = 0
+
+    async def generation(self, user_id: str) -> int:
+        """
+        Current wardrobe generation of a user.
+
+        Read before starting a generation and pass it to :meth:`set`, so a
+        wardrobe change while it runs is not masked.
+        """
+        generation = self._generations.get(user_id, record=False)
+        if generation is None:
+            prisma = await self.database.get_client()
+            user = await prisma.user.find_unique(where={"id": user_id})
+            generation = user.outfitCacheGeneration if user is not None else 0
+            self._generations.set(user_id, generation)
+        return generation
+
+    async def get(self, cache_key: str) -> Optional[CachedOutfit]:
+        """
+        Retrieve a cached outfit if it exists and is still valid.
+
+        Args:
+            cache_key: Key from ``outfit_cache_key``
+
+        Returns:
+            The cached outfit, or None
+        """
+        cached = self._local.get(cache_key, record=False)
+        if cached is not None:
+            current = cached.generation == await self.generation(cached.userId)
+            if current and await self.is_valid(cached):
+                self.memory_hits += 1
+                return cached
+            # Fall through: the row decides, and is counted, as stale or invalid
+            self._local.delete(cache_key)
+
+        prisma = await self.database.get_client()
+        outfit = await prisma.outfit.find_first(
+            where={"cacheKey": cache_key},
+            include={"clothingItems": True},
+            order={"createdAt": "desc"},
+        )
+        if outfit is None:
+            self.misses += 1
+            return None
+
+        cached = CachedOutfit.from_db(outfit)
+        if cached.generation != await self.generation(cached.userId):
+            self.stale += 1
+            self.misses += 1
+            return None
+        if not await self.is_valid(cached):
+            self.invalid += 1
+            self.misses += 1
+            return None
+
+        self._local.set(cache_key, cached)
+        self.db_hits += 1
+        return cached
+
+    async def set(self, cache_key: str, outfit, generation: Optional[int] = None) -> CachedOutfit:
+        """
+        Store a generated outfit in the cache.
+
+        Args:
+            cache_key: Key from ``outfit_cache_key``
+            outfit: Prisma outfit loaded with its ``clothingItems`` links
+            generation: Wardrobe generation read before generating; defaults
+                to the current one
+
+        Returns:
+            The cached outfit
+        """
+        if generation is None:
+            generation = await self.generation(outfit.userId)
+
+        prisma = await self.database.get_client()
+        await prisma.outfit.update(
+            where={"id": outfit.id},
+            data={"cacheKey": cache_key, "cacheGeneration": generation},
+        )
+        outfit.cacheKey = cache_key
+        outfit.cacheGeneration = generation
+
+        cached = CachedOutfit.from_db(outfit)
+        if generation == await self.generation(outfit.userId):
+            self._local.set(cache_key, cached)
+        return cached
+
+    async def invalidate_user(self, user_id: str) -> None:
+        """Drop every cached outfit of a user after their wardrobe changes"""
+        prisma = await self.database.get_client()
+        user = await prisma.user.update(
+            where={"id": user_id},
+            data={"outfitCacheGeneration": {"increment": 1}},
+        )
+        if user is not None:
+            self._generations.set(user_id, user.outfitCacheGeneration)
+        else:
+            self._generations.delete(user_id)
+
+    async def is_valid(self, cached_outfit: CachedOutfit) -> bool:
+        """
+        Check that every clothing item the outfit was generated from still
+        exists, with one query.
+
+        Items deleted since are detected even though their links cascade
+        away, because the key is recomputed from the links.
+        """
+        ids = cached_outfit.clothingItemIds
+        key = outfit_cache_key(cached_outfit.userId, ids, cached_outfit.occasion)
+        if not ids or key != cached_outfit.cacheKey:
+            return False
+
+        prisma = await self.database.get_client()
+        found = await prisma.clothingitem.count(
+            where={"id": {"in": ids}, "userId": cached_outfit.userId}
+        )
+        return found == len(ids)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and saved generation counters"""
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "size": len(self._local),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "invalid": self.invalid,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "saved_generations": hits,
+        }
+
+
+# Generated outfits shared by the outfit and chat paths
+outfit_cache = OutfitCache(
+    db,
+    maxsize=settings.outfit_cache_size,
+    ttl=settings.outfit_cache_ttl,
+    generation_ttl=settings.outfit_cache_generation_ttl,
+)
@@ -0,0 +1,219 @@
+"""
+Dominant colors of garment photos and color-harmony lookup tables
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+# Colors are compared as one of 12 hue sectors of 30 degrees, red centred
+# on sector 0, or as a neutral that goes with anything
+HUE_BINS = 12
+NEUTRAL = HUE_BINS
+COLOR_CODES = HUE_BINS + 1
+
+# Harmony by circular distance between hue sectors, 0 to 6
+_HARMONY_BY_DISTANCE = (1.0, 0.9, 0.6, 0.4, 0.7, 0.75, 0.85)
+_RELATION_BY_DISTANCE = (
+    "monochrome", "analogous", None, None, "triadic", "split-complementary", "complementary",
+)
+
+
+def _build_tables():
+    codes = np.arange(COLOR_CODES)
+    a, b = np.meshgrid(codes, codes, indexing="ij")
+    distance = np.abs(a - b)
+    distance = np.minimum(distance, HUE_BINS - distance)
+    neutral = (a == NEUTRAL) | (b == NEUTRAL)
+    harmony = np.where(
+        neutral, 1.0, np.take(_HARMONY_BY_DISTANCE, np.minimum(distance, 6))
+    ).astype(np.float32)
+    return harmony, np.where(neutral, 0, distance)
+
+
+# HARMONY[a, b]: 0-1 compatibility of color codes a and b
+HARMONY, _DISTANCE = _build_tables()
+
+# Sector (or NEUTRAL) of color names found in free-text color fields
+NAMED_COLORS = {
+    **dict.fromkeys(("red", "scarlet", "crimson", "burgundy", "maroon", "wine"), 0),
+    **dict.fromkeys(("orange", "rust", "coral", "terracotta"), 1),
+    **dict.fromkeys(("yellow", "mustard", "gold", "golden"), 2),
+    **dict.fromkeys(("lime", "chartreuse"), 3),
+    **dict.fromkeys(("green", "olive", "emerald", "forest", "sage"), 4),
+    **dict.fromkeys(("mint", "jade"), 5),
+    **dict.fromkeys(("teal", "cyan", "turquoise", "aqua"), 6),
+    **dict.fromkeys(("sky", "azure", "cobalt"), 7),
+    **dict.fromkeys(("blue", "royal"), 8),
+    **dict.fromkeys(("purple", "violet", "indigo", "lavender", "lilac", "plum"), 9),
+    **dict.fromkeys(("magenta", "fuchsia"), 10),
+    **dict.fromkeys(("pink", "rose", "blush"), 11),
+    **dict.fromkeys((
+        "black", "white", "grey", "gray", "silver", "charcoal", "navy", "denim",
+        "beige", "cream", "ivory", "brown", "tan", "khaki", "camel", "taupe", "nude",
+    ), NEUTRAL),
+}
+
+
+@dataclass(frozen=True)
+class PaletteColor:
+    """One dominant color of an image"""
+
+    hex: str  # "#rrggbb"
+    share: float  # fraction of the garment's pixels, 0-1
+    code: int  # harmony code: hue sector 0-11 or NEUTRAL
+
+
+def quantize(rgb: np.ndarray) -> np.ndarray:
+    """
+    Harmony codes of RGB colors.
+
+    Greys, very dark and washed-out colors are NEUTRAL; the rest fall in
+    the hue sector of their hue.
+
+    Args:
+        rgb: (..., 3) array of 0-255 values
+
+    Returns:
+        Integer codes with the shape of ``rgb`` minus its last axis
+    """
+    rgb = np.asarray(rgb, dtype=np.float32) / 255.0
+    high = rgb.max(axis=-1)
+    low = rgb.min(axis=-1)
+    chroma = high - low
+    saturation = np.divide(chroma, high, out=np.zeros_like(high), where=high > 0)
+
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    safe = np.where(chroma > 0, chroma, 1.0)
+    hue = np.select(
+        [high == r, high == g],
+        [((g - b) / safe) % 6, (b - r) / safe + 2],
+        (r - g) / safe + 4,
+    ) * 60.0
+    sector = ((hue + 360.0 / HUE_BINS / 2) // (360.0 / HUE_BINS)).astype(np.int64) % HUE_BINS
+    return np.where((saturation < 0.2) | (high < 0.25), NEUTRAL, sector)
+
+
+def code_for_name(name: Optional[str]) -> int:
+    """
+    Harmony code of a free-text color such as ``"Dark Green"``.
+
+    Unknown or missing colors are NEUTRAL, so they never count as a clash.
+    """
+    if not name:
+        return NEUTRAL
+    for word in reversed(name.lower().replace("-", " ").replace("/", " ").split()):
+        if word in NAMED_COLORS:
+            return NAMED_COLORS[word]
+    return NEUTRAL
+
+
+def relation(a: int, b: int) -> Optional[str]:
+    """
+    Color-theory name of the relation between two harmony codes.
+
+    Returns:
+        ``"neutral"``, ``"monochrome"``, ``"analogous"``, ``"triadic"``,
+        ``"split-complementary"``, ``"complementary"``, or None for
+        pairings without a name
+    """
+    if a == NEUTRAL or b == NEUTRAL:
+        return "neutral"
+    return _RELATION_BY_DISTANCE[_DISTANCE[a, b]]
+
+
+def _kmeans(pixels: np.ndarray, k: int, iterations: int) -> np.ndarray:
+    """Cluster labels of (n, 3) pixels, seeded deterministically with k-means++"""
+    rng = np.random.default_rng(0)
+    centers = [pixels[rng.integers(len(pixels))]]
+    for _ in range(1, k):
+        distance = ((pixels[:, None, :] - np.array(centers)[None]) ** 2).sum(-1).min(1)
+        if not distance.any():
+            break
+        centers.append(pixels[rng.choice(len(pixels), p=distance / distance.sum())])
+    centers = np.array(centers)
+
+    labels = np.zeros(len(pixels), dtype=np.intp)
+    for _ in range(iterations):
+        distance = ((pixels[:, None, :] - centers[None]) ** 2).sum(-1)
+        new_labels = distance.argmin(1)
+        if np.array_equal(new_labels, labels) and _ > 0:
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=len(centers))
+        for channel in range(3):
+            sums = np.bincount(labels, weights=pixels[:, channel], minlength=len(centers))
+            centers[:, channel] = np.where(counts > 0, sums / np.maximum(counts, 1), centers[:, channel])
+    return labels
+
+
+def dominant_colors(
+    image: Image.Image,
+    k: int = 4,
+    size: int = 64,
+    iterations: int = 10,
+    min_share: float = 0.05,
+) -> List[PaletteColor]:
+    """
+    Dominant colors of a garment photo, largest first.
+
+    The image is sampled down to ``size`` pixels on its long edge, without
+    blending neighbouring pixels into colors the garment does not have,
+    and its pixels clustered with k-means. Transparent pixels are ignored,
+    and so is the cluster matching most of the border, taken to be the
+    backdrop, unless it is the only one.
+
+    Args:
+        image: Decoded image
+        k: Clusters to find
+        size: Long edge to sample down to
+        iterations: Maximum k-means iterations
+        min_share: Smallest share of the garment a color must cover
+
+    Returns:
+        Up to ``k`` colors with their share of the garment's pixels
+    """
+    scale = min(1.0, size / max(image.size))
+    small = image.resize(
+        (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+        Image.Resampling.NEAREST,
+    )
+    rgba = np.asarray(small.convert("RGBA"), dtype=np.float32)
+    opaque = rgba[..., 3] >= 128
+    border = np.zeros(opaque.shape, dtype=bool)
+    border[[0, -1], :] = border[:, [0, -1]] = True
+
+    pixels = rgba[..., :3][opaque]
+    if not len(pixels):
+        return []
+    labels = _kmeans(pixels, min(k, len(pixels)), iterations)
+    count = labels.max() + 1
+    centers = np.stack(
+        [np.bincount(labels, weights=pixels[:, c], minlength=count) for c in range(3)], axis=1
+    ) / np.maximum(np.bincount(labels, minlength=count), 1)[:, None]
+
+    counts = np.bincount(labels, minlength=count).astype(np.float64)
+    border_labels = labels[border[opaque]]
+    if count > 1 and len(border_labels):
+        backdrop = np.bincount(border_labels, minlength=count).argmax()
+        if (border_labels == backdrop).mean() > 0.5:
+            counts[backdrop] = 0
+    counts[counts < min_share * counts.sum()] = 0
+
+    codes = quantize(centers)
+    total = counts.sum()
+    return [
+        PaletteColor(
+            hex="#{:02x}{:02x}{:02x}".format(*np.rint(centers[i]).astype(int)),
+            share=round(float(counts[i] / total), 3),
+            code=int(codes[i]),
+        )
+        for i in np.argsort(-counts, kind="stable")
+        if counts[i] > 0
+    ]
+
+
+def main_color_code(palette: Sequence[PaletteColor]) -> int:
+    """Harmony code of a palette's largest color, NEUTRAL if there is none"""
+    return palette[0].code if palette else NEUTRAL
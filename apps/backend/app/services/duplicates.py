@@ -0,0 +1,130 @@
+"""
+Near-duplicate lookup of a user's clothing photos
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import Database, db
+from app.core.singleflight import SingleFlight
+from app.services.perceptual_hash import HashIndex, parse_hash
+
+
+@dataclass(frozen=True)
+class DuplicateMatch:
+    """A stored item whose photo looks like another"""
+
+    item_id: str
+    distance: int  # differing hash bits, 0-64
+
+
+# Every hashed item of one user
+HASHES_QUERY = (
+    'SELECT "id", "perceptualHash" FROM "clothing_items" '
+    'WHERE "userId" = ? AND "perceptualHash" IS NOT NULL'
+)
+
+
+class DuplicateIndex:
+    """
+    Per-user indexes of photo hashes, for "possible duplicate" checks.
+
+    A user's index is built from their hashed items on first use and kept
+    in an LRU for ``ttl`` seconds, which also bounds how long items added
+    or removed by another process go unseen. Items stored by this process
+    are added with :meth:`add`. Concurrent first lookups for one user share
+    a single load, and a load that started before an :meth:`add` or
+    :meth:`invalidate` does not cache its result.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        maxsize: int = 1000,
+        ttl: float = 600.0,
+        radius: int = 10,
+    ):
+        self.database = database
+        self.radius = radius
+        self._indexes: TTLCache[HashIndex] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flight: SingleFlight[HashIndex] = SingleFlight()
+        # Users with a load in flight, and whether it went stale
+        self._loading: Dict[str, bool] = {}
+
+    async def _load(self, user_id: str) -> HashIndex:
+        self._loading[user_id] = False
+        try:
+            prisma = await self.database.get_client()
+            rows = await prisma.query_raw(HASHES_QUERY, user_id)
+            index = HashIndex()
+            for row in rows:
+                try:
+                    index.add(parse_hash(row["perceptualHash"]), row["id"])
+                except ValueError:
+                    continue
+            if not self._loading[user_id]:
+                self._indexes.set(user_id, index)
+            return index
+        finally:
+            del self._loading[user_id]
+
+    async def index(self, user_id: str) -> HashIndex:
+        """Get a user's index, loading it on a miss"""
+        index = self._indexes.get(user_id)
+        if index is not None:
+            return index
+        return await self._flight.do(user_id, lambda: self._load(user_id))
+
+    async def find(
+        self,
+        user_id: str,
+        value: int,
+        radius: Optional[int] = None,
+        exclude: Optional[str] = None,
+    ) -> List[DuplicateMatch]:
+        """
+        Find a user's items whose photos look like a hash.
+
+        Args:
+            user_id: Owner of the wardrobe
+            value: Perceptual hash of the photo
+            radius: Most differing bits to count as a duplicate, defaults
+                to the index's
+            exclude: Item to leave out, such as the one being checked
+
+        Returns:
+            Matches, nearest first
+        """
+        index = await self.index(user_id)
+        return [
+            DuplicateMatch(item_id=item_id, distance=distance)
+            for distance, item_id in index.search(value, self.radius if radius is None else radius)
+            if item_id != exclude
+        ]
+
+    def add(self, user_id: str, item_id: str, value: int) -> None:
+        """Record a newly stored item in the user's index, if it is loaded"""
+        if user_id in self._loading:
+            self._loading[user_id] = True
+        index = self._indexes.get(user_id, record=False)
+        if index is not None:
+            index.add(value, item_id)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's index after items are removed or rehashed"""
+        if user_id in self._loading:
+            self._loading[user_id] = True
+        self._indexes.delete(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Index cache and coalescing counters"""
+        return {**self._indexes.stats(), "single_flight": self._flight.stats()}
+
+
+duplicate_index = DuplicateIndex(
+    db,
+    maxsize=settings.duplicate_index_size,
+    ttl=settings.duplicate_index_ttl,
+    radius=settings.duplicate_hash_distance,
+)
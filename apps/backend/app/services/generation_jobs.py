@@ -0,0 +1,554 @@
+"""
+Background job queue for outfit image generation
+"""
+import asyncio
+import logging
+import sqlite3
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from enum import Enum
+from functools import partial
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    @property
+    def finished(self) -> bool:
+        return self in (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class GenerationJob(BaseModel):
+    """State of one outfit generation"""
+
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    userId: str
+    cacheKey: str
+    status: JobStatus = JobStatus.QUEUED
+    progress: float = 0.0  # 0 to 1
+    stage: Optional[str] = None
+    params: Dict[str, Any] = Field(default_factory=dict)
+    result: Dict[str, Any] = Field(default_factory=dict)
+    error: Optional[str] = None
+    createdAt: datetime = Field(default_factory=_now)
+    updatedAt: datetime = Field(default_factory=_now)
+
+
+class TooManyJobsError(Exception):
+    """Raised when a user already has the maximum number of unfinished jobs"""
+
+
+class JobStore(ABC):
+    """Abstract persistence for generation jobs"""
+
+    @abstractmethod
+    async def save(self, job: GenerationJob) -> None:
+        """
+        Insert or replace a job
+
+        Args:
+            job: Job to store
+        """
+        pass
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[GenerationJob]:
+        """
+        Get a job
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            The job, or None if unknown
+        """
+        pass
+
+    @abstractmethod
+    async def find_unfinished(self, cache_key: str) -> Optional[GenerationJob]:
+        """
+        Get an unfinished job for a cache key
+
+        Args:
+            cache_key: Outfit cache key
+
+        Returns:
+            A queued or running job, or None
+        """
+        pass
+
+    @abstractmethod
+    async def list_unfinished(self) -> List[GenerationJob]:
+        """
+        Get every queued or running job, oldest first
+
+        Returns:
+            Jobs to resume after a restart
+        """
+        pass
+
+    async def close(self) -> None:
+        """Release resources held by the store"""
+
+
+class MemoryJobStore(JobStore):
+    """
+    In-process job store; jobs are lost on restart.
+
+    Only the most recent ``max_finished`` finished jobs are kept for
+    polling.
+    """
+
+    def __init__(self, max_finished: int = 10000):
+        self.max_finished = max_finished
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+
+    async def save(self, job: GenerationJob) -> None:
+        """Store a job, dropping the oldest finished jobs over the limit"""
+        self._jobs[job.id] = job
+        if job.status.finished:
+            self._finished[job.id] = None
+            while len(self._finished) > self.max_finished:
+                old_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_id, None)
+
+    async def get(self, job_id: str) -> Optional[GenerationJob]:
+        """Get a job"""
+        return self._jobs.get(job_id)
+
+    async def find_unfinished(self, cache_key: str) -> Optional[GenerationJob]:
+        """Get an unfinished job for a cache key"""
+        return next(
+            (
+                job
+                for job in self._jobs.values()
+                if job.cacheKey == cache_key and not job.status.finished
+            ),
+            None,
+        )
+
+    async def list_unfinished(self) -> List[GenerationJob]:
+        """Get every unfinished job, oldest first"""
+        jobs = [job for job in self._jobs.values() if not job.status.finished]
+        return sorted(jobs, key=lambda job: job.createdAt)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Durable job store in a SQLite file, so queued and interrupted jobs
+    survive a restart.
+
+    Queries run on a dedicated thread, which also serializes them.
+    Finished jobs older than ``retention`` seconds are removed at startup.
+    """
+
+    def __init__(self, path: str, retention: float = 7 * 24 * 3600):
+        self.path = path
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS generation_jobs (
+                    id TEXT PRIMARY KEY,
+                    cache_key TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS generation_jobs_cache_key_status_idx
+                    ON generation_jobs (cache_key, status);
+                CREATE INDEX IF NOT EXISTS generation_jobs_status_created_at_idx
+                    ON generation_jobs (status, created_at);
+                """
+            )
+            self._conn = conn
+            self._prune()
+        return self._conn
+
+    def _prune(self) -> None:
+        cutoff = datetime.fromtimestamp(_now().timestamp() - self.retention, timezone.utc)
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM generation_jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (JobStatus.SUCCEEDED.value, JobStatus.FAILED.value, cutoff.isoformat()),
+            )
+
+    async def _run(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args))
+
+    def _save_sync(self, job: GenerationJob) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO generation_jobs "
+                "(id, cache_key, status, created_at, updated_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    job.cacheKey,
+                    job.status.value,
+                    job.createdAt.isoformat(),
+                    job.updatedAt.isoformat(),
+                    job.model_dump_json(),
+                ),
+            )
+
+    def _query_sync(self, sql: str, params: Tuple) -> List[GenerationJob]:
+        rows = self._connect().execute(sql, params).fetchall()
+        return [GenerationJob.model_validate_json(row[0]) for row in rows]
+
+    async def save(self, job: GenerationJob) -> None:
+        """Insert or replace a job"""
+        await self._run(self._save_sync, job)
+
+    async def get(self, job_id: str) -> Optional[GenerationJob]:
+        """Get a job"""
+        jobs = await self._run(
+            self._query_sync, "SELECT data FROM generation_jobs WHERE id = ?", (job_id,)
+        )
+        return jobs[0] if jobs else None
+
+    async def find_unfinished(self, cache_key: str) -> Optional[GenerationJob]:
+        """Get an unfinished job for a cache key"""
+        jobs = await self._run(
+            self._query_sync,
+            "SELECT data FROM generation_jobs "
+            "WHERE cache_key = ? AND status IN (?, ?) LIMIT 1",
+            (cache_key, JobStatus.QUEUED.value, JobStatus.RUNNING.value),
+        )
+        return jobs[0] if jobs else None
+
+    async def list_unfinished(self) -> List[GenerationJob]:
+        """Get every unfinished job, oldest first"""
+        return await self._run(
+            self._query_sync,
+            "SELECT data FROM generation_jobs WHERE status IN (?, ?) ORDER BY created_at",
+            (JobStatus.QUEUED.value, JobStatus.RUNNING.value),
+        )
+
+    async def close(self) -> None:
+        """Close the database file; it is reopened on next use"""
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+
+
+# Reports progress: (fraction done, stage name)
+ProgressCallback = Callable[[float, str], Awaitable[None]]
+
+# Does the work of a job and returns what to store as its result
+JobRunner = Callable[[GenerationJob, ProgressCallback], Awaitable[Dict[str, Any]]]
+
+
+class JobQueue:
+    """
+    Bounded worker pool running generation jobs in the background.
+
+    Submitting returns immediately with a job clients can poll or follow
+    with :meth:`subscribe`; a disconnecting client does not affect it.
+
+    Jobs are deduplicated by cache key: submitting while an identical job
+    is unfinished returns that job. Each user has at most
+    ``per_user_concurrency`` jobs handed to the workers at a time, the
+    rest wait in a per-user backlog so one user cannot occupy every
+    worker, and at most ``max_queued_per_user`` jobs may be waiting.
+
+    Every state change is written to the ``JobStore``. With a durable
+    store, :meth:`start` resumes jobs that were queued or running when
+    the process stopped. Run one queue per store.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        runner: JobRunner,
+        workers: int = 4,
+        per_user_concurrency: int = 1,
+        max_queued_per_user: int = 5,
+    ):
+        self.store = store
+        self.runner = runner
+        self.workers = workers
+        self.per_user_concurrency = per_user_concurrency
+        self.max_queued_per_user = max_queued_per_user
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._jobs: Dict[str, GenerationJob] = {}  # unfinished jobs
+        self._by_key: Dict[str, str] = {}
+        self._pending: Dict[str, "asyncio.Future[Optional[GenerationJob]]"] = {}
+        self._reserved: Dict[str, int] = {}
+        self._dispatched: Dict[str, int] = {}
+        self._backlog: Dict[str, Deque[str]] = {}
+        self._subscribers: Dict[str, Set["asyncio.Queue[GenerationJob]"]] = {}
+        self._tasks: List["asyncio.Task[None]"] = []
+        self.succeeded = 0
+        self.failed = 0
+        self.deduplicated = 0
+
+    async def start(self) -> None:
+        """Start the workers, resuming unfinished jobs from the store"""
+        if self._tasks:
+            return
+        for job in await self.store.list_unfinished():
+            if job.id not in self._jobs:
+                job = job.model_copy(
+                    update={"status": JobStatus.QUEUED, "progress": 0.0, "stage": None}
+                )
+                self._register(job)
+                self._dispatch(job)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stop the workers; running jobs stay unfinished in the store"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.store.close()
+
+    async def submit(
+        self, user_id: str, cache_key: str, params: Dict[str, Any]
+    ) -> Tuple[GenerationJob, bool]:
+        """
+        Queue a job unless an identical one is unfinished.
+
+        Args:
+            user_id: Owner of the job
+            cache_key: Outfit cache key identifying the work
+            params: Runner input, stored with the job
+
+        Returns:
+            The job and whether it was newly created
+
+        Raises:
+            TooManyJobsError: If the user has too many unfinished jobs
+        """
+        while True:
+            existing = self._jobs.get(self._by_key.get(cache_key, ""))
+            if existing is not None:
+                self.deduplicated += 1
+                return existing, False
+            pending = self._pending.get(cache_key)
+            if pending is None:
+                break
+            # Another submit is checking the store for this key; share its job
+            job = await asyncio.shield(pending)
+            if job is not None:
+                self.deduplicated += 1
+                return job, False
+
+        # Claim the key and a slot for the user before awaiting the store,
+        # so concurrent submits neither duplicate the job nor pass the cap
+        unfinished = sum(1 for job in self._jobs.values() if job.userId == user_id)
+        unfinished += self._reserved.get(user_id, 0)
+        full = unfinished >= self.per_user_concurrency + self.max_queued_per_user
+        if not full:
+            self._reserved[user_id] = self._reserved.get(user_id, 0) + 1
+        pending = self._pending[cache_key] = asyncio.get_running_loop().create_future()
+        job: Optional[GenerationJob] = None
+        try:
+            job = await self.store.find_unfinished(cache_key)
+            if job is not None:
+                self.deduplicated += 1
+                return job, False
+            if full:
+                raise TooManyJobsError(f"User {user_id} has {unfinished} unfinished jobs")
+
+            job = GenerationJob(userId=user_id, cacheKey=cache_key, params=params)
+            try:
+                await self.store.save(job)
+            except BaseException:
+                job = None
+                raise
+            self._register(job)
+            self._dispatch(job)
+            return job, True
+        finally:
+            del self._pending[cache_key]
+            if not full:
+                self._reserved[user_id] -= 1
+                if not self._reserved[user_id]:
+                    del self._reserved[user_id]
+            pending.set_result(job)
+
+    async def get(self, job_id: str) -> Optional[GenerationJob]:
+        """
+        Get the current state of a job
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            The job, or None if unknown
+        """
+        return self._jobs.get(job_id) or await self.store.get(job_id)
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[GenerationJob]:
+        """
+        Follow a job until it finishes.
+
+        Yields the current state first, then every update. Slow consumers
+        may skip intermediate progress but always see the final state.
+
+        Args:
+            job_id: Job ID
+        """
+        updates: "asyncio.Queue[GenerationJob]" = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(updates)
+        try:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            yield job
+            while not job.status.finished:
+                job = await updates.get()
+                while not job.status.finished and not updates.empty():
+                    job = updates.get_nowait()
+                yield job
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(updates)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def _register(self, job: GenerationJob) -> None:
+        self._jobs[job.id] = job
+        self._by_key[job.cacheKey] = job.id
+
+    def _dispatch(self, job: GenerationJob) -> None:
+        """Hand a job to the workers, or park it until the user has a free slot"""
+        if self._dispatched.get(job.userId, 0) < self.per_user_concurrency:
+            self._dispatched[job.userId] = self._dispatched.get(job.userId, 0) + 1
+            self._queue.put_nowait(job.id)
+        else:
+            self._backlog.setdefault(job.userId, deque()).append(job.id)
+
+    def _release(self, user_id: str) -> None:
+        """Free a user's slot and dispatch their next waiting job"""
+        self._dispatched[user_id] -= 1
+        if not self._dispatched[user_id]:
+            del self._dispatched[user_id]
+        backlog = self._backlog.get(user_id)
+        if backlog:
+            job_id = backlog.popleft()
+            if not backlog:
+                del self._backlog[user_id]
+            self._dispatch(self._jobs[job_id])
+
+    async def _update(self, job: GenerationJob, **changes: Any) -> GenerationJob:
+        job = job.model_copy(update={**changes, "updatedAt": _now()})
+        if job.status.finished:
+            self._jobs.pop(job.id, None)
+            if self._by_key.get(job.cacheKey) == job.id:
+                del self._by_key[job.cacheKey]
+        else:
+            self._jobs[job.id] = job
+        try:
+            await self.store.save(job)
+        except Exception:
+            logger.exception("Could not persist generation job %s", job.id)
+        for updates in self._subscribers.get(job.id, ()):
+            updates.put_nowait(job)
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs[job_id]
+            try:
+                await self._run(job)
+            finally:
+                self._release(job.userId)
+                self._queue.task_done()
+
+    async def _run(self, job: GenerationJob) -> None:
+        job = await self._update(job, status=JobStatus.RUNNING, stage="starting")
+
+        async def report(progress: float, stage: str) -> None:
+            nonlocal job
+            job = await self._update(job, progress=min(max(progress, 0.0), 1.0), stage=stage)
+
+        try:
+            result = await self.runner(job, report)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Generation job %s failed: %s", job.id, e)
+            self.failed += 1
+            await self._update(job, status=JobStatus.FAILED, stage=None, error=str(e))
+        else:
+            self.succeeded += 1
+            await self._update(
+                job, status=JobStatus.SUCCEEDED, progress=1.0, stage=None, result=result
+            )
+
+    async def join(self) -> None:
+        """Wait until every submitted job has finished"""
+        # Backlogged jobs are dispatched before the job ahead of them is
+        # marked done, so the queue never drains while any are waiting
+        await self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and outcome counters"""
+        return {
+            "workers": self.workers,
+            "unfinished": len(self._jobs),
+            "queued": self._queue.qsize(),
+            "waiting_for_user_slot": sum(len(b) for b in self._backlog.values()),
+            "running": sum(self._dispatched.values()) - self._queue.qsize(),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "deduplicated": self.deduplicated,
+        }
+
+
+def create_job_store() -> JobStore:
+    """Build the job store selected by ``GENERATION_JOB_STORE``"""
+    from app.core.config import settings
+
+    if settings.generation_job_store == "memory":
+        return MemoryJobStore()
+    if settings.generation_job_store == "sqlite":
+        return SQLiteJobStore(settings.generation_job_db)
+    raise ValueError(f"Unsupported job store: {settings.generation_job_store}")
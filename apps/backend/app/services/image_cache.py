@@ -0,0 +1,201 @@
+"""
+Size-bounded cache of resized images, in memory and on local disk
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import Executor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, TypeVar
+
+from app.storage.local import get_io_executor
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ByteLRU:
+    """
+    In-memory LRU of byte strings bounded by their total size.
+
+    Values larger than an eighth of the budget are not kept, so one huge
+    image cannot flush every thumbnail.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: bytes) -> None:
+        if len(value) > self.max_bytes // 8:
+            return
+        previous = self._data.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._data[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class DerivativeCache:
+    """
+    Two-tier LRU cache of encoded derivatives: hot entries in memory, the
+    rest in a directory on local disk, each tier bounded by total bytes.
+
+    Disk hits are promoted to memory. The disk index lives in memory and
+    is rebuilt from the directory at startup in modification-time order,
+    so recency from before a restart is approximate. Files are written
+    atomically, and a file evicted while being read counts as a miss.
+
+    Keys should include the original's entity tag so a replaced original
+    never serves stale derivatives; stale entries simply age out.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        memory_bytes: int,
+        disk_bytes: int,
+        executor: Optional[Executor] = None,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory = ByteLRU(memory_bytes)
+        self.disk_bytes = disk_bytes
+        self.disk_size = 0
+        self.executor = executor or get_io_executor()
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._load_index()
+
+    def _load_index(self) -> None:
+        entries = []
+        for path in self.directory.iterdir():
+            if path.name.startswith("."):
+                path.unlink(missing_ok=True)  # temporary file of a crashed write
+                continue
+            stat_result = path.stat()
+            entries.append((stat_result.st_mtime, path.name, stat_result.st_size))
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self.disk_size += size
+
+    async def _run(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args))
+
+    @staticmethod
+    def _name(key: Hashable) -> str:
+        return hashlib.sha256(repr(key).encode()).hexdigest()
+
+    def _write_sync(self, name: str, value: bytes) -> None:
+        tmp_path = self.directory / f".{name}.{os.urandom(4).hex()}"
+        try:
+            tmp_path.write_bytes(value)
+            os.replace(tmp_path, self.directory / name)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def _delete_sync(self, names: List[str]) -> None:
+        for name in names:
+            (self.directory / name).unlink(missing_ok=True)
+
+    async def get(self, key: Hashable) -> Optional[bytes]:
+        """
+        Get a cached derivative
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Encoded image, or None on a miss
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        name = self._name(key)
+        if name in self._disk:
+            try:
+                value = await self._run((self.directory / name).read_bytes)
+            except FileNotFoundError:
+                self._forget(name)
+            else:
+                if name in self._disk:
+                    self._disk.move_to_end(name)
+                self.memory.set(key, value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: Hashable, value: bytes) -> None:
+        """
+        Store a derivative in both tiers, evicting the least recently used
+
+        Disk write failures are logged and leave the entry memory-only.
+
+        Args:
+            key: Cache key
+            value: Encoded image
+        """
+        self.memory.set(key, value)
+        if len(value) > self.disk_bytes:
+            return
+
+        name = self._name(key)
+        try:
+            await self._run(self._write_sync, name, value)
+        except OSError:
+            logger.warning("Could not write image cache entry", exc_info=True)
+            return
+
+        self._forget(name)
+        self._disk[name] = len(value)
+        self.disk_size += len(value)
+        evicted = []
+        while self.disk_size > self.disk_bytes:
+            old_name, size = self._disk.popitem(last=False)
+            self.disk_size -= size
+            evicted.append(old_name)
+        if evicted:
+            await self._run(self._delete_sync, evicted)
+
+    def _forget(self, name: str) -> None:
+        size = self._disk.pop(name, None)
+        if size is not None:
+            self.disk_size -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and size counters for both tiers"""
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self.disk_size,
+        }
@@ -0,0 +1,560 @@
+"""
+Resized and re-encoded variants of uploaded images
+"""
+import asyncio
+import io
+import json
+import math
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Any, AsyncIterable, Dict, List, Mapping, Optional, Tuple
+
+from PIL import Image, ImageFile, ImageOps, UnidentifiedImageError
+
+from app.core.config import settings
+from app.core.singleflight import SingleFlight
+from app.services.color_harmony import PaletteColor, dominant_colors, main_color_code
+from app.services.perceptual_hash import format_hash, perceptual_hash
+from app.services.image_cache import DerivativeCache
+from app.storage.derivatives import (
+    IMAGE_FORMATS,
+    IMAGE_SIZES,
+    derivative_path,
+    derivative_paths,
+)
+from app.storage.interface import StorageInterface
+
+# (size name, format) -> encoded image
+Variants = Dict[Tuple[str, str], bytes]
+
+ORIENTATION_TAG = 0x0112
+
+_image_executor: Optional[ProcessPoolExecutor] = None
+_image_resizer: Optional["ImageResizer"] = None
+
+
+# Long edge images are analysed at; colors and the 32x32 perceptual hash
+# survive far smaller thumbnails
+ANALYSIS_SIZE = 64
+
+
+class InvalidImageError(ValueError):
+    """Raised when uploaded content cannot be decoded as an image"""
+
+
+@dataclass(frozen=True)
+class ImageAnalysis:
+    """What is derived from a clothing photo's pixels at upload time"""
+
+    palette: List[PaletteColor]  # dominant colors, largest first
+    perceptual_hash: int  # 64-bit pHash, see ``app.services.perceptual_hash``
+
+    @property
+    def color_code(self) -> int:
+        """Harmony code of the main color (see ``app.services.color_harmony``)"""
+        return main_color_code(self.palette)
+
+    def columns(self) -> Dict[str, Any]:
+        """The ``ClothingItem`` columns this analysis fills"""
+        return {
+            "palette": json.dumps([asdict(color) for color in self.palette]),
+            "colorCode": self.color_code,
+            "perceptualHash": format_hash(self.perceptual_hash),
+        }
+
+
+@dataclass(frozen=True)
+class PreparedUpload:
+    """Everything derived from a new clothing photo before it is stored"""
+
+    variants: Variants
+    analysis: ImageAnalysis
+    preview: bytes  # small JPEG to show the tagging model
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    """Get the process pool shared by all image processing"""
+    global _image_executor
+    if _image_executor is None:
+        # Forking a process that already runs an event loop and thread
+        # pools can deadlock the child, so workers start fresh
+        _image_executor = ProcessPoolExecutor(
+            max_workers=settings.image_process_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _image_executor
+
+
+def shutdown_image_executor() -> None:
+    """Stop the image worker processes, if they were started"""
+    global _image_executor
+    if _image_executor is not None:
+        _image_executor.shutdown(wait=False, cancel_futures=True)
+        _image_executor = None
+
+
+# EXIF orientations that swap width and height
+_TRANSPOSED = {5, 6, 7, 8}
+
+
+async def sniff_image(chunks: AsyncIterable[bytes]) -> Tuple[str, Tuple[int, int]]:
+    """
+    Identify a streamed image from its header, without decoding pixels.
+
+    Chunks after the header are read and dropped, so this can run on one
+    branch of a :func:`~app.storage.streams.tee` while another stores the
+    content.
+
+    Args:
+        chunks: Image content as byte chunks
+
+    Returns:
+        Pillow format name (e.g. ``"PNG"``) and (width, height)
+
+    Raises:
+        InvalidImageError: If no supported image header was found
+    """
+    parser = ImageFile.Parser()
+    async for chunk in chunks:
+        if parser.image is None:
+            try:
+                parser.feed(chunk)
+            except (Image.DecompressionBombError, OSError) as e:
+                raise InvalidImageError(f"Cannot decode image: {e}") from None
+    if parser.image is None:
+        raise InvalidImageError("Content is not a supported image")
+    return parser.image.format, parser.image.size
+
+
+def _decode(content: bytes, box: Tuple[float, float]) -> Image.Image:
+    """
+    Decode an image upright, no larger than needed to fit ``box``
+
+    Args:
+        content: Image file
+        box: Largest (width, height) that will be produced, in upright
+            orientation; ``math.inf`` leaves a dimension unbounded
+    """
+    try:
+        image = Image.open(io.BytesIO(content))
+        width, height = image.size
+        if image.getexif().get(ORIENTATION_TAG) in _TRANSPOSED:
+            width, height = height, width
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale for a fraction of
+        # the work, as long as the result still covers the box
+        scale = min(box[0] / width, box[1] / height)
+        if scale < 1:
+            image.draft(
+                "RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale))
+            )
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImageError(f"Cannot decode image: {e}") from None
+
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        return image.convert("RGBA")
+    return image.convert("RGB")
+
+
+def _fit(image: Image.Image, box: Tuple[float, float]) -> Image.Image:
+    """Scale an image down to fit ``box``, never up"""
+    scale = min(box[0] / image.width, box[1] / image.height)
+    if scale >= 1:
+        return image
+    # reducing_gap first shrinks by an integer factor with reduce(), which
+    # is much cheaper than resampling the full image with LANCZOS
+    return image.resize(
+        (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+        Image.Resampling.LANCZOS,
+        reducing_gap=3.0,
+    )
+
+
+def _encode(image: Image.Image, fmt: str, webp_quality: int, jpeg_quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        image.save(buffer, "WEBP", quality=webp_quality, method=4)
+    else:
+        if image.mode == "RGBA":
+            # JPEG has no alpha channel: flatten onto white
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        image.save(buffer, "JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def render_variants(
+    content: bytes,
+    sizes: Mapping[str, int],
+    webp_quality: int = 80,
+    jpeg_quality: int = 85,
+) -> Variants:
+    """
+    Decode an image once and encode every size in WebP and JPEG (blocking)
+
+    Each size is resized from the next larger one rather than the
+    original, and images are never upscaled. Runs in a worker process.
+
+    Args:
+        content: Original image file
+        sizes: Size name -> longest edge in pixels
+        webp_quality: WebP quality, 0-100
+        jpeg_quality: JPEG quality, 0-100
+
+    Returns:
+        Encoded variant for each (size name, format)
+
+    Raises:
+        InvalidImageError: If the content is not a supported image
+    """
+    largest = max(sizes.values())
+    image = _decode(content, (largest, largest))
+    variants: Variants = {}
+    for name, edge in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        image = _fit(image, (edge, edge))
+        for fmt in IMAGE_FORMATS:
+            variants[(name, fmt)] = _encode(image, fmt, webp_quality, jpeg_quality)
+    return variants
+
+
+def resize_image(
+    content: bytes,
+    width: int,
+    fmt: str,
+    webp_quality: int = 80,
+    jpeg_quality: int = 85,
+) -> bytes:
+    """
+    Scale an image down to ``width`` and encode it (blocking)
+
+    Narrower images keep their size. Runs in a worker process.
+
+    Args:
+        content: Original image file
+        width: Largest width in pixels
+        fmt: Name from ``IMAGE_FORMATS``
+        webp_quality: WebP quality, 0-100
+        jpeg_quality: JPEG quality, 0-100
+
+    Returns:
+        Encoded image
+
+    Raises:
+        InvalidImageError: If the content is not a supported image
+    """
+    box = (width, math.inf)
+    return _encode(_fit(_decode(content, box), box), fmt, webp_quality, jpeg_quality)
+
+
+def analyze_image(content: bytes, colors: int = 4) -> ImageAnalysis:
+    """
+    Extract the dominant colors and perceptual hash of a clothing photo (blocking)
+
+    The image is decoded straight to a thumbnail, JPEGs at reduced scale,
+    so this costs a fraction of rendering the variants. Runs in a worker
+    process.
+
+    Args:
+        content: Original image file
+        colors: Dominant colors to extract
+
+    Returns:
+        The image's analysis
+
+    Raises:
+        InvalidImageError: If the content is not a supported image
+    """
+    return _analyze(_decode(content, (ANALYSIS_SIZE, ANALYSIS_SIZE)), colors)
+
+
+def _analyze(image: Image.Image, colors: int) -> ImageAnalysis:
+    return ImageAnalysis(
+        palette=dominant_colors(image, k=colors, size=ANALYSIS_SIZE),
+        perceptual_hash=perceptual_hash(image),
+    )
+
+
+def prepare_upload(
+    content: bytes,
+    sizes: Mapping[str, int],
+    colors: int = 4,
+    preview_width: int = 512,
+    webp_quality: int = 80,
+    jpeg_quality: int = 85,
+) -> PreparedUpload:
+    """
+    Render the variants, analysis and tagging preview of a new photo (blocking)
+
+    Does the work of :func:`render_variants`, :func:`analyze_image` and
+    :func:`resize_image` from a single decode: the preview is scaled from
+    the largest variant and the analysis runs on the smallest. Runs in a
+    worker process.
+
+    Args:
+        content: Original image file
+        sizes: Size name -> longest edge in pixels
+        colors: Dominant colors to extract
+        preview_width: Largest width of the preview in pixels
+        webp_quality: WebP quality, 0-100
+        jpeg_quality: JPEG quality, 0-100
+
+    Returns:
+        The encoded variants, analysis and preview
+
+    Raises:
+        InvalidImageError: If the content is not a supported image
+    """
+    largest = max(sizes.values())
+    image = _decode(content, (largest, largest))
+    preview = _encode(
+        _fit(image, (preview_width, math.inf)), "jpeg", webp_quality, jpeg_quality
+    )
+    variants: Variants = {}
+    for name, edge in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        image = _fit(image, (edge, edge))
+        for fmt in IMAGE_FORMATS:
+            variants[(name, fmt)] = _encode(image, fmt, webp_quality, jpeg_quality)
+    return PreparedUpload(variants=variants, analysis=_analyze(image, colors), preview=preview)
+
+
+class ImageProcessor:
+    """
+    Generates the size ladder of stored images off the event loop.
+
+    Decoding and encoding run in a process pool; the variants are then
+    written next to each other under ``derived/`` (see ``derivative_path``)
+    so ``get_public_url(path, size=...)`` can link them without a lookup.
+    """
+
+    def __init__(self, storage: StorageInterface, executor: Optional[Executor] = None):
+        self.storage = storage
+        self._executor = executor
+
+    @property
+    def executor(self) -> Executor:
+        """The given executor, else the shared pool (restarted after a shutdown)"""
+        return self._executor or get_image_executor()
+
+    async def render(self, content: bytes) -> Variants:
+        """
+        Encode every variant of an image in the worker pool
+
+        Raises:
+            InvalidImageError: If the content is not a supported image
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            partial(
+                render_variants,
+                content,
+                IMAGE_SIZES,
+                settings.image_webp_quality,
+                settings.image_jpeg_quality,
+            ),
+        )
+
+    async def analyze(self, content: bytes) -> ImageAnalysis:
+        """
+        Analyse an image's pixels in the worker pool
+
+        Raises:
+            InvalidImageError: If the content is not a supported image
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(analyze_image, content, settings.image_palette_colors)
+        )
+
+    async def prepare(self, content: bytes) -> PreparedUpload:
+        """
+        Render the variants, analysis and tagging preview of a new photo
+        in one worker job
+
+        Raises:
+            InvalidImageError: If the content is not a supported image
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            partial(
+                prepare_upload,
+                content,
+                IMAGE_SIZES,
+                settings.image_palette_colors,
+                settings.tagging_image_size,
+                settings.image_webp_quality,
+                settings.image_jpeg_quality,
+            ),
+        )
+
+    async def resize(self, content: bytes, width: int, fmt: str = "jpeg") -> bytes:
+        """
+        Scale an image down to ``width`` in the worker pool
+
+        Raises:
+            InvalidImageError: If the content is not a supported image
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            partial(
+                resize_image,
+                content,
+                width,
+                fmt,
+                settings.image_webp_quality,
+                settings.image_jpeg_quality,
+            ),
+        )
+
+    async def _store(self, file_path: str, variants: Variants) -> None:
+        await asyncio.gather(
+            *(
+                self.storage.upload(
+                    derivative_path(file_path, size, fmt), data, content_type=f"image/{fmt}"
+                )
+                for (size, fmt), data in variants.items()
+            )
+        )
+
+    async def process(self, file_path: str, content: bytes) -> Dict[str, str]:
+        """
+        Generate and store the variants of an already stored image
+
+        Callers on the request path can hand this to ``BackgroundTasks``;
+        until it finishes the variant URLs return 404.
+
+        Args:
+            file_path: Path of the original image
+            content: Original image file
+
+        Returns:
+            Public URL of the WebP variant for each size name
+
+        Raises:
+            InvalidImageError: If the content is not a supported image
+        """
+        variants = await self.render(content)
+        await self._store(file_path, variants)
+        return {size: self.storage.get_public_url(file_path, size) for size in IMAGE_SIZES}
+
+    async def upload(
+        self,
+        file_path: str,
+        content: bytes,
+        content_type: Optional[str] = None,
+        variants: Optional[Variants] = None,
+    ) -> str:
+        """
+        Store an image and its variants
+
+        The content is decoded before anything is stored, so a file that
+        is not an image is rejected without leaving an original behind.
+
+        Args:
+            file_path: Path where the original should be stored
+            content: Original image file
+            content_type: MIME type of the original
+            variants: Variants already rendered, e.g. by :meth:`prepare`
+
+        Returns:
+            Public URL of the original
+
+        Raises:
+            InvalidImageError: If the content is not a supported image
+        """
+        if variants is None:
+            variants = await self.render(content)
+        url = await self.storage.upload(file_path, content, content_type)
+        await self._store(file_path, variants)
+        return url
+
+    async def delete(self, file_path: str) -> None:
+        """Delete an image together with all of its variants"""
+        await self.storage.delete_many([file_path, *derivative_paths(file_path)])
+
+
+class ImageResizer:
+    """
+    Resizes and transcodes stored images on demand.
+
+    Results are kept in a ``DerivativeCache`` keyed by path, entity tag,
+    width and format. Concurrent misses for the same derivative share one
+    download and decode, so a burst of requests for a new thumbnail costs
+    a single worker job.
+    """
+
+    def __init__(self, cache: DerivativeCache, executor: Optional[Executor] = None):
+        self.cache = cache
+        self._executor = executor
+        self._flight: SingleFlight[bytes] = SingleFlight()
+
+    @property
+    def executor(self) -> Executor:
+        """The given executor, else the shared pool (restarted after a shutdown)"""
+        return self._executor or get_image_executor()
+
+    async def get(
+        self, storage: StorageInterface, file_path: str, etag: str, width: int, fmt: str
+    ) -> bytes:
+        """
+        Get a resized image, rendering it on a cache miss
+
+        Args:
+            storage: Storage holding the original
+            file_path: Path of the original image
+            etag: Entity tag of the original, so replacing it is a miss
+            width: Largest width in pixels
+            fmt: Name from ``IMAGE_FORMATS``
+
+        Returns:
+            Encoded image
+
+        Raises:
+            FileNotFoundError: If the original does not exist
+            InvalidImageError: If the original is not a supported image
+        """
+        key = (file_path, etag, width, fmt)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+        return await self._flight.do(
+            key, partial(self._render, storage, file_path, key, width, fmt)
+        )
+
+    async def _render(
+        self, storage: StorageInterface, file_path: str, key: Tuple, width: int, fmt: str
+    ) -> bytes:
+        content = await storage.download(file_path)
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(
+            self.executor,
+            partial(
+                resize_image,
+                content,
+                width,
+                fmt,
+                settings.image_webp_quality,
+                settings.image_jpeg_quality,
+            ),
+        )
+        await self.cache.set(key, data)
+        return data
+
+
+def get_image_resizer() -> ImageResizer:
+    """Get the process-wide on-demand image resizer"""
+    global _image_resizer
+    if _image_resizer is None:
+        _image_resizer = ImageResizer(
+            DerivativeCache(
+                settings.image_cache_dir,
+                memory_bytes=settings.image_cache_memory_size,
+                disk_bytes=settings.image_cache_disk_size,
+            )
+        )
+    return _image_resizer
@@ -0,0 +1,333 @@
+"""
+Outfit image generation: prompt building, the upstream call and storing
+the result
+"""
+import asyncio
+import base64
+import json
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Sequence
+
+from app.core.admission import AdmissionRejected
+from app.core.config import settings
+from app.core.database import Database, db
+from app.core.http import HTTPClientRegistry, http_clients
+from app.core.sse import parse_sse
+from app.services.cache_service import OutfitCache, outfit_cache
+from app.services.color_harmony import NEUTRAL, code_for_name, relation
+from app.services.generation_jobs import (
+    GenerationJob,
+    JobQueue,
+    ProgressCallback,
+    create_job_store,
+)
+from app.services.image_processing import InvalidImageError, sniff_image
+from app.storage import UploadResult, get_storage
+from app.storage.streams import TeeBranch, tee
+
+# Progress reported once the prompt is ready and before storing the image;
+# partial images from the upstream fill the range in between
+GENERATING_PROGRESS = 0.1
+STORING_PROGRESS = 0.9
+
+IMAGE_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+
+_generation_queue: Optional[JobQueue] = None
+
+
+class ImageGenerationError(Exception):
+    """Raised when the image generation upstream fails"""
+
+
+async def iter_base64(data: str, chunk_size: int) -> AsyncIterator[bytes]:
+    """
+    Decode base64 text in chunks instead of all at once.
+
+    Args:
+        data: Base64 text without line breaks
+        chunk_size: Approximate decoded bytes per chunk
+    """
+    step = max(1, chunk_size // 3) * 4
+    for start in range(0, len(data), step):
+        yield base64.b64decode(data[start:start + step])
+
+
+def describe_color_harmony(items: Sequence[Any]) -> str:
+    """
+    Name the color-theory relations between an outfit's items.
+
+    Items are compared by their stored ``colorCode``, or the code of their
+    color's name, e.g. ``"complementary Red top and Green skirt"``.
+    """
+    accents = []
+    for item in items:
+        code = getattr(item, "colorCode", None)
+        if code is None:
+            code = code_for_name(item.color)
+        if code != NEUTRAL:
+            accents.append((item.name, code))
+
+    if not accents:
+        return "neutral palette"
+    if len(accents) == 1:
+        return f"{accents[0][0]} as the accent against neutrals"
+    pairs = []
+    for i, (name, code) in enumerate(accents):
+        for other, other_code in accents[i + 1:]:
+            pairs.append(f"{relation(code, other_code) or 'contrasting'} {name} and {other}")
+    return "; ".join(pairs)
+
+
+def build_outfit_prompt(items: Sequence[Any], profile: Any, occasion: Optional[str]) -> str:
+    """
+    Build the image prompt for a set of clothing items.
+
+    Args:
+        items: Prisma clothing items
+        profile: Prisma profile of the user, or None
+        occasion: Requested occasion, if any
+
+    Returns:
+        Prompt following the SPEC's outfit prompt structure
+    """
+    person = []
+    styles = []
+    if profile is not None:
+        if profile.height:
+            person.append(f"{profile.height}cm")
+        if profile.weight:
+            person.append(f"{profile.weight:g}kg")
+        styles = [s for s in (profile.primaryStyle, profile.secondaryStyle) if s]
+
+    descriptions = []
+    for item in items:
+        details = ", ".join(filter(None, [item.color, item.category, item.brand]))
+        descriptions.append(f"  - {item.name} ({details})" if details else f"  - {item.name}")
+
+    return "\n".join(
+        [
+            "Generate a fashion outfit visualization featuring:",
+            f"- Person: {', '.join(person) or 'unspecified'}",
+            f"- Style: {', '.join(styles) or 'unspecified'}",
+            f"- Occasion: {occasion or 'everyday'}",
+            "- Items:",
+            *descriptions,
+            "",
+            "Fashion considerations:",
+            f"- Color harmony: {describe_color_harmony(items)}",
+            "- Balanced proportions and silhouette",
+            "- Texture coordination",
+            "",
+            "Aspect ratio: 4:3",
+        ]
+    )
+
+
+class OutfitGenerator:
+    """
+    Job runner that generates an outfit image and saves the outfit.
+
+    The image is requested from the OpenAI-compatible ``image_generation``
+    upstream as a stream; each partial image advances the job's progress.
+    The final image is streamed into storage, whether it arrives inline as
+    base64 or as a URL to download, and saved as an ``Outfit`` linked to
+    its items. The outfit is stored in the outfit cache under the job's
+    key, using the wardrobe generation read when the job was submitted.
+    """
+
+    def __init__(
+        self,
+        database: Database = db,
+        clients: HTTPClientRegistry = http_clients,
+        cache: OutfitCache = outfit_cache,
+    ):
+        self.database = database
+        self.clients = clients
+        self.cache = cache
+
+    async def __call__(self, job: GenerationJob, report: ProgressCallback) -> Dict[str, Any]:
+        params = job.params
+        item_ids: List[str] = params["clothingItemIds"]
+        occasion: Optional[str] = params.get("occasion")
+
+        prisma = await self.database.get_client()
+        items = await prisma.clothingitem.find_many(
+            where={"id": {"in": item_ids}, "userId": job.userId}
+        )
+        if len(items) != len(set(item_ids)):
+            raise ValueError("Some clothing items no longer exist")
+        profile = await prisma.profile.find_unique(where={"userId": job.userId})
+
+        await report(GENERATING_PROGRESS, "generating")
+        stored = await self.generate_image(
+            build_outfit_prompt(items, profile, occasion), report, f"outfits/{job.userId}/{job.id}"
+        )
+        image_url = stored.url
+        outfit = await prisma.outfit.create(
+            data={
+                "userId": job.userId,
+                "name": f"{(occasion or 'Daily').capitalize()} outfit",
+                "imageUrl": image_url,
+                "occasion": occasion,
+                "clothingItems": {"create": [{"clothingItemId": i} for i in item_ids]},
+            },
+            include={"clothingItems": True},
+        )
+        await self.cache.set(job.cacheKey, outfit, generation=params.get("generation"))
+        return {"outfitId": outfit.id, "imageUrl": image_url, "sha256": stored.sha256}
+
+    async def generate_image(
+        self, prompt: str, report: ProgressCallback, file_path: str
+    ) -> UploadResult:
+        """
+        Stream an image from the upstream into storage, reporting partial images.
+
+        Args:
+            prompt: Image prompt
+            report: Progress callback
+            file_path: Storage path without extension; one matching the
+                image type is added
+
+        Returns:
+            URL, size and SHA-256 of the stored image
+
+        Raises:
+            ImageGenerationError: If the upstream fails, is saturated or
+                sends no valid image
+        """
+        try:
+            image = await self._stream_image(prompt, report)
+            await report(STORING_PROGRESS, "storing")
+            if "b64_json" in image:
+                return await self.store_image(
+                    file_path,
+                    iter_base64(image["b64_json"], settings.upload_chunk_size),
+                    "image/png",
+                )
+            return await self.download_image(file_path, image["url"])
+        except AdmissionRejected as exc:
+            raise ImageGenerationError("Image generation is busy, try again later") from exc
+
+    async def _stream_image(self, prompt: str, report: ProgressCallback) -> Dict[str, Any]:
+        """Follow the upstream event stream to the completed image event"""
+        partials = settings.image_generation_partial_images
+        client = self.clients.get("image_generation")
+        async with client.stream(
+            "POST",
+            "/v1/images/generations",
+            json={
+                "model": settings.image_generation_model,
+                "prompt": prompt,
+                "size": settings.image_generation_size,
+                "stream": True,
+                "partial_images": partials,
+            },
+            headers={"authorization": f"Bearer {settings.image_generation_api_key}"},
+            admission_key=settings.image_generation_api_key,
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise ImageGenerationError(
+                    f"Image generation failed with {response.status_code}"
+                )
+            async for event, data in parse_sse(response.aiter_lines()):
+                payload = json.loads(data)
+                kind = payload.get("type", event)
+                if kind == "image_generation.partial_image":
+                    done = (payload.get("partial_image_index", 0) + 1) / (partials + 1)
+                    await report(
+                        GENERATING_PROGRESS + (STORING_PROGRESS - GENERATING_PROGRESS) * done,
+                        "generating",
+                    )
+                elif kind == "image_generation.completed":
+                    if not payload.get("b64_json") and not payload.get("url"):
+                        raise ImageGenerationError("Completed event carries no image")
+                    return payload
+                elif kind == "error":
+                    raise ImageGenerationError(payload.get("error", {}).get("message", data))
+        raise ImageGenerationError("Image stream ended without an image")
+
+    async def download_image(self, file_path: str, url: str) -> UploadResult:
+        """Stream an image the upstream returned by URL into storage"""
+        client = self.clients.get("image_download")
+        async with client.stream("GET", url) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise ImageGenerationError(
+                    f"Image download failed with {response.status_code}"
+                )
+            content_type = response.headers.get("content-type", "image/png")
+            return await self.store_image(
+                file_path,
+                response.aiter_bytes(settings.upload_chunk_size),
+                content_type.split(";")[0].strip(),
+            )
+
+    async def store_image(
+        self, file_path: str, chunks: AsyncIterator[bytes], content_type: str
+    ) -> UploadResult:
+        """
+        Write image chunks to storage while checking they form an image.
+
+        The chunks are teed: storage hashes and writes one branch while
+        the other is sniffed for an image header, so the image is never
+        held in memory as a whole. Content that is not an image is deleted
+        again.
+
+        Args:
+            file_path: Storage path without extension
+            chunks: Image content
+            content_type: MIME type reported by the upstream
+
+        Returns:
+            URL, size and SHA-256 of the stored image
+
+        Raises:
+            ImageGenerationError: If the content is not a supported image
+        """
+        extension = IMAGE_EXTENSIONS.get(content_type)
+        if extension is None:
+            raise ImageGenerationError(f"Unsupported image type: {content_type}")
+        path = f"{file_path}.{extension}"
+        storage = get_storage()
+        to_storage, to_sniffer = tee(chunks)
+
+        async def consume(branch: TeeBranch, reader: Awaitable[Any]) -> Any:
+            # A reader that stops early must not stall the other branch
+            try:
+                return await reader
+            finally:
+                await branch.aclose()
+
+        stored, sniffed = await asyncio.gather(
+            consume(
+                to_storage,
+                storage.upload_stream(
+                    path, to_storage, content_type=content_type,
+                    max_size=settings.max_upload_size,
+                ),
+            ),
+            consume(to_sniffer, sniff_image(to_sniffer)),
+            return_exceptions=True,
+        )
+        for outcome in (stored, sniffed):
+            if isinstance(outcome, BaseException):
+                if not isinstance(stored, BaseException):
+                    await storage.delete(path)
+                if isinstance(outcome, InvalidImageError):
+                    raise ImageGenerationError(str(outcome)) from outcome
+                raise outcome
+        return stored
+
+
+def get_generation_queue() -> JobQueue:
+    """Get the process-wide outfit generation queue"""
+    global _generation_queue
+    if _generation_queue is None:
+        _generation_queue = JobQueue(
+            create_job_store(),
+            OutfitGenerator(),
+            workers=settings.generation_workers,
+            per_user_concurrency=settings.generation_user_concurrency,
+            max_queued_per_user=settings.generation_max_queued_per_user,
+        )
+    return _generation_queue
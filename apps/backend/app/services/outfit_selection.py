@@ -0,0 +1,324 @@
+"""
+Outfit combination selection from a user's wardrobe
+"""
+import json
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.color_harmony import HARMONY, code_for_name
+
+SEASONS = ("spring", "summer", "autumn", "winter")
+SEASON_ALIASES = {"fall": "autumn"}
+ALL_SEASONS = (1 << len(SEASONS)) - 1
+
+# Slots an outfit is built from, in search order; optional slots may stay empty
+TEMPLATES: Tuple[Tuple[Tuple[str, bool], ...], ...] = (
+    (("top", True), ("bottom", True), ("shoes", True), ("outerwear", False)),
+    (("dress", True), ("shoes", True), ("outerwear", False)),
+)
+
+# Item attributes the selector reads; wearCount is how often it was worn
+WARDROBE_QUERY = (
+    'SELECT c."id", c."category", c."color", c."colorCode", c."season", c."tags", '
+    'COUNT(o."id") AS "wearCount" '
+    'FROM "clothing_items" c '
+    'LEFT JOIN "outfit_clothing_items" o ON o."clothingItemId" = c."id" '
+    'WHERE c."userId" = ? GROUP BY c."id"'
+)
+
+EMPTY = -1  # candidate index of an optional slot left empty
+
+
+@dataclass(frozen=True)
+class SelectionWeights:
+    """Relative weight of each scoring signal"""
+
+    style: float = 1.0  # per matching profile style tag
+    occasion: float = 1.5  # item tagged with the requested occasion
+    season: float = 1.0  # made for the season; out of season costs the same
+    rotation: float = 0.5  # per log(1 + wears), favours rarely worn items
+    optional: float = 0.5  # cost of filling an optional slot such as outerwear
+    color: float = 1.0  # per unit of color harmony a pair falls short of 1
+    season_clash: float = 0.5  # penalty for a pair without a season in common
+
+
+@dataclass(frozen=True)
+class OutfitCandidate:
+    """A scored combination of clothing items"""
+
+    item_ids: Tuple[str, ...]
+    score: float
+
+
+def season_of(day: date) -> str:
+    """Meteorological season of a date in the northern hemisphere"""
+    return ("winter", "spring", "summer", "autumn")[day.month % 12 // 3]
+
+
+def season_mask(value: Optional[str]) -> int:
+    """
+    Bitmask of the seasons named in a free-text season field.
+
+    Unknown or empty values count as all-season, e.g. ``"spring/summer"``
+    gives two bits and ``None`` all four.
+    """
+    if not value:
+        return ALL_SEASONS
+    mask = 0
+    for word in value.lower().replace("/", " ").replace(",", " ").split():
+        word = SEASON_ALIASES.get(word, word)
+        if word in SEASONS:
+            mask |= 1 << SEASONS.index(word)
+    return mask or ALL_SEASONS
+
+
+def _tags(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    try:
+        tags = json.loads(value)
+    except ValueError:
+        return []
+    return [str(t).lower() for t in tags] if isinstance(tags, list) else []
+
+
+class EncodedWardrobe:
+    """
+    Clothing items as parallel NumPy arrays.
+
+    Strings are interned once: categories become small integer codes,
+    colors their harmony code (the stored ``colorCode`` extracted from the
+    photo, else the code of the color's name), seasons a 4-bit mask and
+    the tags that matter for one request a bitmask of ``terms``, so
+    scoring never touches Python objects per item.
+    """
+
+    def __init__(self, rows: Sequence[Mapping[str, Any]], terms: Sequence[str] = ()):
+        self.ids: List[str] = [row["id"] for row in rows]
+        self.terms = [t.lower() for t in terms][:8]
+        bits = {term: 1 << i for i, term in enumerate(self.terms)}
+        categories: Dict[str, int] = {}
+        # Wardrobes repeat the same few color, season and tag strings, so
+        # each distinct string is parsed once
+        colors: Dict[Optional[str], int] = {}
+        seasons: Dict[Optional[str], int] = {}
+        tag_hits: Dict[Optional[str], int] = {}
+
+        category_codes, color_codes, season_masks, hits, wear = [], [], [], [], []
+        for row in rows:
+            category = (row["category"] or "").lower()
+            category_codes.append(categories.setdefault(category, len(categories)))
+            color_code = row.get("colorCode")
+            if color_code is None:
+                color = row["color"]
+                if color not in colors:
+                    colors[color] = code_for_name(color)
+                color_code = colors[color]
+            color_codes.append(color_code)
+            season = row["season"]
+            if season not in seasons:
+                seasons[season] = season_mask(season)
+            season_masks.append(seasons[season])
+            tags = row["tags"]
+            if tags not in tag_hits:
+                tag_hits[tags] = sum({bits.get(tag, 0) for tag in _tags(tags)})
+            hits.append(tag_hits[tags])
+            wear.append(row.get("wearCount") or 0)
+
+        self.categories: List[str] = list(categories)
+        self.category = np.array(category_codes, dtype=np.int16)
+        self.color = np.array(color_codes, dtype=np.uint8)
+        self.season = np.array(season_masks, dtype=np.uint8)
+        self.term_hits = np.array(hits, dtype=np.uint8)
+        self.wear = np.array(wear, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def indices(self, category: str) -> np.ndarray:
+        """Positions of the items in a category"""
+        try:
+            code = self.categories.index(category)
+        except ValueError:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero(self.category == code)
+
+
+class OutfitSelector:
+    """
+    Beam search for the best outfits in an encoded wardrobe.
+
+    Each item gets a unary score (profile styles, occasion, season and
+    rotation by wear count); pairs are only penalised, for colors short of
+    full harmony (read from the precomputed ``HARMONY`` table) or clashing
+    seasons, so an optional slot is filled only by an item that earns
+    more than ``optional``. Slots are filled in template order; every
+    partial outfit in the beam is extended with each candidate of the
+    next slot at once, adding the candidates' pairwise compatibility with
+    the items already chosen as a (beam x candidates) matrix. Only the
+    ``top_k`` best items per slot are considered and ``beam`` partial
+    outfits kept, so the work is independent of the number of
+    combinations.
+    """
+
+    def __init__(
+        self,
+        wardrobe: EncodedWardrobe,
+        *,
+        styles: Sequence[str] = (),
+        occasion: Optional[str] = None,
+        season: Optional[str] = None,
+        weights: SelectionWeights = SelectionWeights(),
+    ):
+        self.wardrobe = wardrobe
+        self.weights = weights
+        self.unary = self._unary(styles, occasion, season)
+
+    def _term_bits(self, terms: Sequence[Optional[str]]) -> int:
+        bits = 0
+        for term in terms:
+            if term and term.lower() in self.wardrobe.terms:
+                bits |= 1 << self.wardrobe.terms.index(term.lower())
+        return bits
+
+    def _unary(
+        self, styles: Sequence[str], occasion: Optional[str], season: Optional[str]
+    ) -> np.ndarray:
+        w = self.weights
+        items = self.wardrobe
+        hits = items.term_hits
+        score = np.zeros(len(items), dtype=np.float32)
+        for style in styles:
+            bit = self._term_bits([style])
+            if bit:
+                score += w.style * ((hits & bit) != 0)
+        bit = self._term_bits([occasion])
+        if bit:
+            score += w.occasion * ((hits & bit) != 0)
+        if season:
+            # All-season items are neutral; seasonal ones win or lose
+            in_season = (items.season & season_mask(season)) != 0
+            seasonal = items.season != ALL_SEASONS
+            score += np.where(in_season, w.season, -w.season) * seasonal
+        score -= w.rotation * np.log1p(items.wear)
+        return score
+
+    def _pair(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """Compatibility of items ``a`` (rows) with items ``b`` (columns)"""
+        items = self.wardrobe
+        ai, bi = np.maximum(a, 0), np.maximum(b, 0)
+        colors = HARMONY[items.color[ai][:, None], items.color[bi][None, :]]
+        score = self.weights.color * (colors - 1.0)
+        disjoint = (items.season[ai][:, None] & items.season[bi][None, :]) == 0
+        score = score - self.weights.season_clash * disjoint
+        present = (a >= 0)[:, None] & (b >= 0)[None, :]
+        return np.where(present, score, 0.0)
+
+    def _candidates(
+        self, category: str, required: bool, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """The ``top_k`` items for a slot and their unary scores"""
+        items = self.wardrobe.indices(category)
+        if len(items) > top_k:
+            best = np.argpartition(-self.unary[items], top_k - 1)[:top_k]
+            items = items[best]
+        scores = self.unary[items]
+        if not required:
+            items = np.append(items, EMPTY)
+            scores = np.append(scores - self.weights.optional, 0.0)
+        return items, scores
+
+    def _search(
+        self, template: Sequence[Tuple[str, bool]], beam: int, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Best (scores, item index paths) for one template, or empty arrays"""
+        slots = [self._candidates(category, required, top_k) for category, required in template]
+        if any(len(items) == 0 for items, _ in slots):
+            return np.empty(0, dtype=np.float32), np.empty((0, len(template)), dtype=np.intp)
+
+        paths, scores = slots[0][0][:, None], slots[0][1]
+        for candidates, unary in slots[1:]:
+            total = scores[:, None] + unary[None, :]
+            for j in range(paths.shape[1]):
+                total += self._pair(paths[:, j], candidates)
+            flat = total.ravel()
+            keep = min(beam, len(flat))
+            best = np.argpartition(-flat, keep - 1)[:keep]
+            rows, cols = np.unravel_index(best, total.shape)
+            scores = flat[best]
+            paths = np.column_stack([paths[rows], candidates[cols]])
+        return scores, paths
+
+    def best(self, n: int = 5, beam: int = 64, top_k: int = 32) -> List[OutfitCandidate]:
+        """
+        Find the highest scoring outfits.
+
+        Args:
+            n: Outfits to return
+            beam: Partial outfits kept after each slot
+            top_k: Items considered per slot
+
+        Returns:
+            Up to ``n`` outfits, best first; empty if no template can be
+            completed from the wardrobe
+        """
+        results = [self._search(template, max(beam, n), top_k) for template in TEMPLATES]
+        width = max(len(template) for template in TEMPLATES)
+        scores = np.concatenate([scores for scores, _ in results])
+        paths = np.concatenate([
+            np.pad(p, ((0, 0), (0, width - p.shape[1])), constant_values=EMPTY)
+            for _, p in results
+        ])
+
+        return [
+            OutfitCandidate(
+                item_ids=tuple(self.wardrobe.ids[p] for p in paths[i] if p != EMPTY),
+                score=float(scores[i]),
+            )
+            for i in np.argsort(-scores, kind="stable")[:n]
+        ]
+
+    def fallback(self) -> List[str]:
+        """Best scoring item of every category, for wardrobes no template fits"""
+        picks = []
+        for category in self.wardrobe.categories:
+            items = self.wardrobe.indices(category)
+            picks.append(self.wardrobe.ids[items[np.argmax(self.unary[items])]])
+        return picks
+
+
+def select_outfit_items(
+    rows: Sequence[Mapping[str, Any]],
+    *,
+    styles: Sequence[str] = (),
+    occasion: Optional[str] = None,
+    today: Optional[date] = None,
+) -> List[str]:
+    """
+    Choose the items for a generated outfit.
+
+    Args:
+        rows: Wardrobe rows as returned by :data:`WARDROBE_QUERY`
+        styles: The user's profile styles
+        occasion: Requested occasion, if any
+        today: Date whose season to dress for (defaults to today)
+
+    Returns:
+        IDs of the best outfit's items, or one item per category when no
+        outfit template can be filled; empty for an empty wardrobe
+    """
+    if not rows:
+        return []
+    styles = [s for s in styles if s]
+    wardrobe = EncodedWardrobe(rows, [*styles, *([occasion] if occasion else [])])
+    selector = OutfitSelector(
+        wardrobe,
+        styles=styles,
+        occasion=occasion,
+        season=season_of(today or date.today()),
+    )
+    best = selector.best(n=1)
+    return list(best[0].item_ids) if best else selector.fallback()
@@ -0,0 +1,109 @@
+"""
+Perceptual hashes of clothing photos and a Hamming-distance index
+"""
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8  # low-frequency DCT coefficients per side: a 64-bit hash
+DCT_SIZE = 32  # side the photo is shrunk to before the DCT
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+
+
+_DCT = _dct_matrix(DCT_SIZE)
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """
+    64-bit pHash of an image.
+
+    The image is flattened onto white, shrunk to 32x32 greyscale and
+    transformed with a 2-D DCT; each bit tells whether one of the 8x8
+    lowest frequencies is above their median. Resizing, recompression,
+    small crops and lighting changes move few bits, so near-duplicate
+    photos are a small Hamming distance apart.
+
+    Args:
+        image: Decoded image
+
+    Returns:
+        Hash as an unsigned 64-bit integer
+    """
+    if image.mode in ("RGBA", "LA", "PA"):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+        image = background
+    pixels = np.asarray(
+        image.convert("L").resize((DCT_SIZE, DCT_SIZE), Image.Resampling.LANCZOS),
+        dtype=np.float64,
+    )
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    bits = (low > np.median(low)).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def format_hash(value: int) -> str:
+    """Hash as the 16 hex digits stored in ``ClothingItem.perceptualHash``"""
+    return f"{value:016x}"
+
+
+def parse_hash(value: str) -> int:
+    """
+    Parse a stored hash.
+
+    Raises:
+        ValueError: If the value is not 16 hex digits
+    """
+    if len(value) != 16:
+        raise ValueError(f"Invalid perceptual hash: {value!r}")
+    return int(value, 16)
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of bits two hashes differ in"""
+    return (a ^ b).bit_count()
+
+
+class HashIndex:
+    """
+    64-bit hashes searched by Hamming distance.
+
+    Hashes are packed in one ``uint64`` array, so a search is a single
+    XOR against all of them and a vectorized popcount: microseconds for
+    thousands of photos. At the radius near-duplicate photos need (about
+    a sixth of the bits) tree structures such as BK-trees prune little
+    and pay Python overhead for every node they visit, which makes them
+    slower than this scan.
+    """
+
+    def __init__(self, capacity: int = 64) -> None:
+        self._values = np.empty(capacity, dtype=np.uint64)
+        self._ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, value: int, item_id: str) -> None:
+        """Insert an item's hash"""
+        size = len(self._ids)
+        if size == len(self._values):
+            self._values = np.resize(self._values, max(2 * size, 64))
+        self._values[size] = value
+        self._ids.append(item_id)
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, str]]:
+        """
+        Find the items within ``radius`` bits of a hash.
+
+        Returns:
+            (distance, item id) pairs, nearest first
+        """
+        distances = np.bitwise_count(self._values[: len(self._ids)] ^ np.uint64(value))
+        found = np.flatnonzero(distances <= radius)
+        return sorted((int(distances[i]), self._ids[i]) for i in found)
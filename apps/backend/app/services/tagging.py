@@ -0,0 +1,399 @@
+"""
+AI auto-tagging of clothing photos, batched and cached by content hash
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+from app.core.admission import AdmissionRejected
+from app.core.cache import CacheBackend
+from app.core.config import settings
+from app.core.http import HTTPClientRegistry, http_clients
+from app.services.cache_service import create_cache_backend
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("top", "bottom", "dress", "outerwear", "shoes", "accessories")
+# Category of items stored while tagging was unavailable, for a later
+# tagging run to replace
+UNCATEGORIZED = "uncategorized"
+PATTERNS = ("solid", "striped", "checked", "floral", "printed", "graphic", "dotted", "other")
+
+TAGGING_PROMPT = (
+    "You tag photos of single garments for a wardrobe app. For each photo, in "
+    "order, give its category (one of: " + ", ".join(CATEGORIES) + "), primary "
+    "color as a common color name, pattern (one of: " + ", ".join(PATTERNS) + "), "
+    "material if you can tell (else null) and season (spring, summer, autumn, "
+    "winter or null for all year). Answer with JSON only: "
+    '{"items": [{"category": ..., "color": ..., "pattern": ..., "material": ..., '
+    '"season": ...}, ...]} with exactly one entry per photo.'
+)
+
+_tagging_service: Optional["TaggingService"] = None
+
+
+class TaggingError(Exception):
+    """Raised when a photo could not be tagged"""
+
+
+class GarmentTags(BaseModel):
+    """What the tagger sees in a clothing photo"""
+
+    category: str
+    color: str
+    pattern: str
+    material: Optional[str] = None
+    season: Optional[str] = None
+
+    @field_validator("category")
+    @classmethod
+    def validate_category(cls, v: str) -> str:
+        v = v.strip().lower()
+        if v not in CATEGORIES:
+            raise ValueError(f"Unknown category: {v}")
+        return v
+
+    @field_validator("color", "pattern")
+    @classmethod
+    def normalize(cls, v: str) -> str:
+        return v.strip().lower()
+
+
+def content_hash(content: bytes) -> str:
+    """SHA-256 hex digest tags are cached under"""
+    return hashlib.sha256(content).hexdigest()
+
+
+# One photo's outcome in a batch
+TagResult = Union[GarmentTags, TaggingError]
+
+
+class Tagger(ABC):
+    """A model that tags several photos in one call"""
+
+    @abstractmethod
+    async def tag_batch(self, images: Sequence[bytes]) -> List[TagResult]:
+        """
+        Tag photos.
+
+        Args:
+            images: Encoded photos
+
+        Returns:
+            Tags or the error for each photo, in order
+
+        Raises:
+            TaggingError: If the call as a whole failed
+        """
+
+
+def _data_url(image: bytes) -> str:
+    if image.startswith(b"\x89PNG"):
+        mime = "image/png"
+    elif image[8:12] == b"WEBP":
+        mime = "image/webp"
+    else:
+        mime = "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(image).decode()}"
+
+
+class OpenAITagger(Tagger):
+    """
+    Tags photos with an OpenAI vision model, all of a batch in one chat
+    completion through the shared ``openai`` upstream.
+
+    Send small renditions (see ``tagging_image_size``): low-detail image
+    inputs cost the same tokens whatever their size.
+    """
+
+    def __init__(
+        self,
+        clients: HTTPClientRegistry = http_clients,
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+    ):
+        self.clients = clients
+        self.model = model or settings.tagging_model
+        self.api_key = api_key or settings.openai_api_key
+
+    async def tag_batch(self, images: Sequence[bytes]) -> List[TagResult]:
+        content: List[Dict[str, Any]] = [
+            {"type": "text", "text": f"Tag these {len(images)} photos."}
+        ]
+        content += [
+            {"type": "image_url", "image_url": {"url": _data_url(image), "detail": "low"}}
+            for image in images
+        ]
+        try:
+            response = await self.clients.get("openai").post(
+                "/v1/chat/completions",
+                json={
+                    "model": self.model,
+                    "messages": [
+                        {"role": "system", "content": TAGGING_PROMPT},
+                        {"role": "user", "content": content},
+                    ],
+                    "response_format": {"type": "json_object"},
+                    "temperature": 0,
+                },
+                headers={"authorization": f"Bearer {self.api_key}"},
+                admission_key=self.api_key,
+            )
+        except AdmissionRejected as e:
+            raise TaggingError(f"Tagging is busy: {e}") from None
+        if response.status_code != 200:
+            raise TaggingError(f"Tagging failed with {response.status_code}")
+
+        try:
+            message = response.json()["choices"][0]["message"]["content"]
+            items = json.loads(message)["items"]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise TaggingError("Tagging response is not the expected JSON") from None
+        if not isinstance(items, list) or len(items) != len(images):
+            raise TaggingError(f"Expected tags for {len(images)} photos")
+
+        results: List[TagResult] = []
+        for item in items:
+            try:
+                results.append(GarmentTags.model_validate(item))
+            except ValidationError as e:
+                results.append(TaggingError(f"Invalid tags: {e.errors()[0]['msg']}"))
+        return results
+
+
+class MockTagger(Tagger):
+    """
+    Deterministic local tagger for tests and development.
+
+    Tags are derived from the photo's SHA-256, so the same photo always
+    gets the same tags. Batch sizes are recorded in ``batches``.
+    """
+
+    COLORS = ("black", "white", "navy", "beige", "red", "green", "blue", "pink")
+    MATERIALS = ("cotton", "denim", "wool", "linen", "leather", None)
+    SEASONS = ("spring", "summer", "autumn", "winter", None)
+
+    def __init__(self) -> None:
+        self.batches: List[int] = []
+
+    async def tag_batch(self, images: Sequence[bytes]) -> List[TagResult]:
+        self.batches.append(len(images))
+        results: List[TagResult] = []
+        for image in images:
+            digest = hashlib.sha256(image).digest()
+            results.append(
+                GarmentTags(
+                    category=CATEGORIES[digest[0] % len(CATEGORIES)],
+                    color=self.COLORS[digest[1] % len(self.COLORS)],
+                    pattern=PATTERNS[digest[2] % len(PATTERNS)],
+                    material=self.MATERIALS[digest[3] % len(self.MATERIALS)],
+                    season=self.SEASONS[digest[4] % len(self.SEASONS)],
+                )
+            )
+        return results
+
+
+class TaggingService:
+    """
+    Micro-batches tag requests into model calls and caches the results.
+
+    Tags are cached under the photo's content hash, so an identical or
+    re-uploaded photo never reaches the model again; concurrent requests
+    for the same hash share one slot in a batch. Other requests wait up
+    to ``window`` seconds for company and go out as one call of up to
+    ``max_batch`` photos, with at most ``max_concurrent`` calls in flight.
+
+    Bulk callers just issue many requests at once (see :meth:`tag_many`)
+    and are batched the same way.
+    """
+
+    def __init__(
+        self,
+        tagger: Tagger,
+        cache: CacheBackend,
+        max_batch: int = 16,
+        window: float = 0.05,
+        max_concurrent: int = 4,
+    ):
+        if max_batch <= 0:
+            raise ValueError("max_batch must be positive")
+        self.tagger = tagger
+        self.cache = cache
+        self.max_batch = max_batch
+        self.window = window
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        # Content hash -> (image, result future), waiting for a batch
+        self._pending: Dict[str, Tuple[bytes, "asyncio.Future[GarmentTags]"]] = {}
+        # Content hash -> result future, for photos in a running batch
+        self._inflight: Dict[str, "asyncio.Future[GarmentTags]"] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.tagged = 0
+        self.failed = 0
+
+    async def tag(self, key: str, image: bytes) -> GarmentTags:
+        """
+        Tag a photo.
+
+        Args:
+            key: Content hash of the original upload (see :func:`content_hash`)
+            image: Photo to show the model, usually a small rendition
+
+        Returns:
+            The photo's tags
+
+        Raises:
+            TaggingError: If the model call failed or gave unusable tags
+        """
+        self.requests += 1
+        cached = await self.cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        future = self._inflight.get(key)
+        if future is None and key in self._pending:
+            future = self._pending[key][1]
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Waiters may all be cancelled; never leave a failure unretrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending[key] = (image, future)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    async def tag_many(self, items: Sequence[Tuple[str, bytes]]) -> List[TagResult]:
+        """
+        Tag many photos at once, e.g. for a bulk import or backfill.
+
+        Args:
+            items: (content hash, photo) pairs
+
+        Returns:
+            Tags or the error for each photo, in order
+        """
+        results = await asyncio.gather(
+            *(self.tag(key, image) for key, image in items), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, TaggingError):
+                raise result
+        return results
+
+    def _flush(self) -> None:
+        """Send everything pending as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        for key, (_, future) in batch.items():
+            self._inflight[key] = future
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[str, Tuple[bytes, "asyncio.Future[GarmentTags]"]]) -> None:
+        try:
+            async with self._semaphore:
+                self.batches += 1
+                try:
+                    results: List[Any] = await self.tagger.tag_batch(
+                        [image for image, _ in batch.values()]
+                    )
+                except TaggingError as e:
+                    results = [e] * len(batch)
+                except Exception as e:
+                    logger.exception("Tagging batch failed")
+                    results = [TaggingError(f"Tagging failed: {e}")] * len(batch)
+
+            for (key, (_, future)), result in zip(batch.items(), results):
+                if isinstance(result, GarmentTags):
+                    self.tagged += 1
+                    await self.cache.set(key, result)
+                    if not future.done():
+                        future.set_result(result)
+                else:
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(result)
+        finally:
+            for key, (_, future) in batch.items():
+                self._inflight.pop(key, None)
+                if not future.done():
+                    future.set_exception(TaggingError("Tagging was interrupted"))
+
+    async def aclose(self) -> None:
+        """Send what is pending and wait for running batches"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Request, batching and cache counters"""
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "tagged": self.tagged,
+            "failed": self.failed,
+            "mean_batch_size": round((self.tagged + self.failed) / self.batches, 2)
+            if self.batches
+            else 0.0,
+            "pending": len(self._pending),
+            "in_flight": len(self._inflight),
+            "cache": self.cache.stats(),
+        }
+
+
+def create_tagger() -> Tagger:
+    """Build the tagger selected by ``TAGGING_BACKEND``"""
+    if settings.tagging_backend == "openai":
+        return OpenAITagger()
+    if settings.tagging_backend == "mock":
+        return MockTagger()
+    raise ValueError(f"Unsupported tagging backend: {settings.tagging_backend}")
+
+
+async def close_tagging_service() -> None:
+    """Finish the process-wide tagging service's batches, if it was started"""
+    if _tagging_service is not None:
+        await _tagging_service.aclose()
+
+
+def get_tagging_service() -> TaggingService:
+    """Get the process-wide tagging service"""
+    global _tagging_service
+    if _tagging_service is None:
+        _tagging_service = TaggingService(
+            create_tagger(),
+            create_cache_backend(
+                "tags",
+                GarmentTags,
+                maxsize=settings.tagging_cache_size,
+                ttl=settings.tagging_cache_ttl,
+            ),
+            max_batch=settings.tagging_batch_size,
+            window=settings.tagging_batch_window,
+            max_concurrent=settings.tagging_max_batches,
+        )
+    return _tagging_service
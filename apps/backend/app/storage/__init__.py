@@ -1,15 +1,64 @@
+from typing import Dict, Tuple
+
 from app.storage.interface import StorageInterface
 from app.storage.local import LocalStorage
+from app.storage.cas import ContentAddressedStorage
+from app.storage.s3 import S3Storage
+from app.storage.streams import FileTooLargeError, UploadResult
 
+# One backend per configuration, shared by the whole process
+_instances: Dict[Tuple, StorageInterface] = {}
 
-def get_storage() -> StorageInterface:
-    """Factory function to get the appropriate storage implementation"""
+
+def create_storage() -> StorageInterface:
+    """Build the storage implementation selected in settings"""
     from app.core.config import settings
+    from app.core.http import http_clients
 
     if settings.storage_type == "local":
+        if settings.storage_content_addressed:
+            return ContentAddressedStorage()
         return LocalStorage()
+    elif settings.storage_type == "s3":
+        return S3Storage(
+            http_clients,
+            bucket=settings.s3_bucket,
+            access_key=settings.s3_access_key_id,
+            secret_key=settings.s3_secret_access_key,
+            region=settings.s3_region,
+            public_url=settings.s3_public_url,
+            part_size=settings.s3_part_size,
+            multipart_threshold=settings.s3_multipart_threshold,
+            concurrency=settings.s3_multipart_concurrency,
+        )
     else:
         raise ValueError(f"Unsupported storage type: {settings.storage_type}")
 
 
-__all__ = ["StorageInterface", "LocalStorage", "get_storage"]
+def get_storage() -> StorageInterface:
+    """Get the process-wide storage implementation selected in settings"""
+    from app.core.config import settings
+
+    key = (
+        settings.storage_type,
+        settings.storage_content_addressed,
+        settings.upload_dir,
+        settings.s3_endpoint_url,
+        settings.s3_bucket,
+    )
+    storage = _instances.get(key)
+    if storage is None:
+        storage = _instances[key] = create_storage()
+    return storage
+
+
+__all__ = [
+    "StorageInterface",
+    "LocalStorage",
+    "ContentAddressedStorage",
+    "S3Storage",
+    "FileTooLargeError",
+    "UploadResult",
+    "create_storage",
+    "get_storage",
+]
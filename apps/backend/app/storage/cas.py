@@ -0,0 +1,237 @@
+"""
+Content-addressed local storage
+"""
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from functools import partial
+from typing import AsyncIterator, Iterable, Optional
+
+from app.storage.interface import FileInfo
+from app.storage.local import LocalStorage
+from app.storage.streams import ByteSource, UploadResult
+
+
+class ContentAddressedStorage(LocalStorage):
+    """
+    Local storage that keeps each distinct content once, keyed by SHA-256.
+
+    Logical paths (what callers upload to and get URLs for) map to blobs.
+    Layout under ``base_dir``::
+
+        blobs/ab/cd/abcd...      content, sharded by the first two bytes of its hash
+        refs/ab/cd/abcd.../<h>   one marker per logical path using the blob
+        paths/<logical path>     hash of the blob the path points to
+
+    A blob's reference count is its number of markers. Deleting a logical
+    path drops its marker and removes the blob once no markers are left.
+    Uploading content that is already stored only writes the two small
+    metadata files.
+
+    Reference bookkeeping is serialized per process; run a single writer
+    process per ``base_dir``.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None, chunk_size: Optional[int] = None):
+        super().__init__(base_dir=base_dir, chunk_size=chunk_size)
+        self.blobs_dir = self.base_dir / "blobs"
+        self.refs_dir = self.base_dir / "refs"
+        self.paths_dir = self.base_dir / "paths"
+        self.tmp_dir = self.base_dir / "tmp"
+        for directory in (self.blobs_dir, self.refs_dir, self.paths_dir, self.tmp_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+            self._dirs.add(directory)
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _shard(root: Path, sha256: str) -> Path:
+        return root / sha256[:2] / sha256[2:4] / sha256
+
+    def _blob_path(self, sha256: str) -> Path:
+        return self._shard(self.blobs_dir, sha256)
+
+    def _ref_path(self, sha256: str, file_path: str) -> Path:
+        name = hashlib.sha256(file_path.encode()).hexdigest()
+        return self._shard(self.refs_dir, sha256) / name
+
+    def _path_file(self, file_path: str) -> Path:
+        return self._resolve(file_path, root=self.paths_dir)
+
+    def resolve_hash(self, file_path: str) -> Optional[str]:
+        """
+        Get the content hash a logical path points to.
+
+        Args:
+            file_path: Logical path
+
+        Returns:
+            SHA-256 hex digest, or None if the path does not exist
+        """
+        try:
+            return self._path_file(file_path).read_text().strip() or None
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
+
+    def _blob_for(self, file_path: str) -> Path:
+        sha256 = self.resolve_hash(file_path)
+        if sha256 is None:
+            raise FileNotFoundError(f"File not found: {file_path}")
+        return self._blob_path(sha256)
+
+    def refcount(self, sha256: str) -> int:
+        """Number of logical paths pointing at a blob"""
+        ref_dir = self._shard(self.refs_dir, sha256)
+        try:
+            return sum(1 for _ in ref_dir.iterdir())
+        except FileNotFoundError:
+            return 0
+
+    def _link_sync(self, file_path: str, sha256: str, tmp_path: Optional[Path]) -> bool:
+        path_file = self._path_file(file_path)
+        blob_path = self._blob_path(sha256)
+        stored = blob_path.exists()
+        if tmp_path is not None:
+            if stored:
+                tmp_path.unlink(missing_ok=True)
+            else:
+                self._makedirs(blob_path.parent)
+                os.replace(tmp_path, blob_path)
+        elif not stored:
+            return False
+
+        previous = self.resolve_hash(file_path)
+
+        ref_path = self._ref_path(sha256, file_path)
+        ref_path.parent.mkdir(parents=True, exist_ok=True)
+        ref_path.write_text(file_path)
+
+        self._makedirs(path_file.parent)
+        tmp_path_file = self.tmp_dir / f".{os.urandom(8).hex()}.path"
+        tmp_path_file.write_text(sha256)
+        os.replace(tmp_path_file, path_file)
+
+        if previous is not None and previous != sha256:
+            self._release(previous, file_path)
+        return stored
+
+    async def _link(self, file_path: str, sha256: str, tmp_path: Optional[Path]) -> bool:
+        """
+        Point a logical path at a blob, releasing its previous blob.
+
+        Args:
+            file_path: Logical path
+            sha256: Hash of the content
+            tmp_path: Temporary file holding the content, moved into place if
+                the blob is not stored yet and removed otherwise
+
+        Returns:
+            Whether the blob was already stored. Without ``tmp_path`` nothing
+            is linked when it was not.
+        """
+        async with self._lock:
+            return await self._run(self._link_sync, file_path, sha256, tmp_path)
+
+    def _release(self, sha256: str, file_path: str) -> None:
+        """Drop a logical path's reference and remove the blob if unreferenced"""
+        self._ref_path(sha256, file_path).unlink(missing_ok=True)
+        ref_dir = self._shard(self.refs_dir, sha256)
+        try:
+            ref_dir.rmdir()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return  # still referenced
+        self._blob_path(sha256).unlink(missing_ok=True)
+
+    async def upload(
+        self, file_path: str, content: bytes, content_type: Optional[str] = None
+    ) -> str:
+        """Store content once by hash and point ``file_path`` at it"""
+        sha256 = hashlib.sha256(content).hexdigest()
+        # Content already stored: only the metadata is written
+        if not await self._link(file_path, sha256, None):
+            tmp_path = self.tmp_dir / f".{os.urandom(8).hex()}.part"
+            try:
+                async with self._open(tmp_path, "wb") as f:
+                    await f.write(content)
+                await self._link(file_path, sha256, tmp_path)
+            except BaseException:
+                await self._run(partial(tmp_path.unlink, missing_ok=True))
+                raise
+        return self.get_public_url(file_path)
+
+    async def upload_stream(
+        self,
+        file_path: str,
+        source: ByteSource,
+        content_type: Optional[str] = None,
+        max_size: Optional[int] = None,
+    ) -> UploadResult:
+        """Stream content to a temporary file, keeping it only if it is new"""
+        # Reject bad paths before reading the stream
+        await self._run(self._path_file, file_path)
+        tmp_path, digest = await self._write_temp(self.tmp_dir, source, max_size)
+        sha256 = digest.hexdigest()
+        try:
+            deduplicated = await self._link(file_path, sha256, tmp_path)
+        except BaseException:
+            await self._run(partial(tmp_path.unlink, missing_ok=True))
+            raise
+
+        return UploadResult(
+            url=self.get_public_url(file_path),
+            size=digest.size,
+            sha256=sha256,
+            deduplicated=deduplicated,
+        )
+
+    async def download(self, file_path: str) -> bytes:
+        """Read the content a logical path points to"""
+        blob_path = await self._run(self._blob_for, file_path)
+        async with self._open(blob_path, "rb") as f:
+            return await f.read()
+
+    async def download_stream(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Stream the content a logical path points to"""
+        blob_path = await self._run(self._blob_for, file_path)
+        async for chunk in self._stream_file(blob_path, start, end):
+            yield chunk
+
+    def _stat_sync(self, file_path: str) -> FileInfo:
+        blob_path = self._blob_for(file_path)
+        stat_result = blob_path.stat()
+        # A path can be repointed at an older blob, so the mapping's own
+        # mtime counts too
+        linked_at = self._path_file(file_path).stat().st_mtime
+        return FileInfo(
+            size=stat_result.st_size,
+            modified=max(stat_result.st_mtime, linked_at),
+            etag=f'"{blob_path.name}"',
+        )
+
+    def local_path(self, file_path: str) -> Optional[Path]:
+        """Get the blob a logical path points to"""
+        return self._blob_for(file_path)
+
+    def _delete_sync(self, file_path: str) -> None:
+        sha256 = self.resolve_hash(file_path)
+        if sha256 is None:
+            return
+        self._path_file(file_path).unlink(missing_ok=True)
+        self._release(sha256, file_path)
+
+    def _exists_sync(self, file_path: str) -> bool:
+        return self.resolve_hash(file_path) is not None
+
+    async def delete(self, file_path: str) -> None:
+        """Remove a logical path, and its blob if nothing else uses it"""
+        async with self._lock:
+            await super().delete(file_path)
+
+    async def delete_many(self, file_paths: Iterable[str]) -> None:
+        """Remove several logical paths in one trip to the storage thread pool"""
+        async with self._lock:
+            await super().delete_many(file_paths)
@@ -0,0 +1,52 @@
+"""
+Where resized variants of stored images live
+"""
+from typing import Dict, List, Tuple
+
+# Size ladder: name -> longest edge in pixels
+IMAGE_SIZES: Dict[str, int] = {
+    "thumbnail": 256,
+    "medium": 800,
+    "full": 1600,
+}
+
+# Encodings generated for every size, preferred first
+IMAGE_FORMATS: Tuple[str, ...] = ("webp", "jpeg")
+
+# Widths the on-demand resize route accepts; a short allowlist keeps the
+# number of distinct cached derivatives per image small
+RESIZE_WIDTHS: Tuple[int, ...] = (64, 128, 256, 384, 640, 800, 1080, 1600)
+
+DERIVED_PREFIX = "derived"
+
+
+def derivative_path(file_path: str, size: str, fmt: str = "webp") -> str:
+    """
+    Get the storage path of a resized variant of an image
+
+    The original's name is kept whole so ``a.jpg`` and ``a.png`` never
+    share a derivative.
+
+    Args:
+        file_path: Path of the original image
+        size: Name from ``IMAGE_SIZES``
+        fmt: Name from ``IMAGE_FORMATS``
+
+    Returns:
+        Path such as ``derived/thumbnail/clothing/a.jpg.webp``
+
+    Raises:
+        ValueError: If the size or format is unknown
+    """
+    if size not in IMAGE_SIZES:
+        raise ValueError(f"Unknown image size: {size}")
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format: {fmt}")
+    return f"{DERIVED_PREFIX}/{size}/{file_path}.{fmt}"
+
+
+def derivative_paths(file_path: str) -> List[str]:
+    """Get the paths of every variant of an image, e.g. to delete them with it"""
+    return [
+        derivative_path(file_path, size, fmt) for size in IMAGE_SIZES for fmt in IMAGE_FORMATS
+    ]
@@ -1,6 +1,19 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from dataclasses import dataclass
+from pathlib import Path
+import asyncio
+from typing import AsyncIterator, Dict, Iterable, Optional
 import io
+from app.storage.streams import ByteSource, UploadResult
+
+
+@dataclass(frozen=True)
+class FileInfo:
+    """Metadata needed to serve a stored file over HTTP"""
+
+    size: int  # bytes
+    modified: float  # Unix timestamp
+    etag: str  # quoted entity tag
 
 
 class StorageInterface(ABC):
@@ -21,6 +34,35 @@ class StorageInterface(ABC):
         """
         pass
 
+    @abstractmethod
+    async def upload_stream(
+        self,
+        file_path: str,
+        source: ByteSource,
+        content_type: Optional[str] = None,
+        max_size: Optional[int] = None,
+    ) -> UploadResult:
+        """
+        Upload a file from a stream without buffering it in memory
+
+        Content is written in fixed-size chunks while its size and SHA-256
+        are computed. Nothing is left behind at ``file_path`` if the upload
+        fails or is too large.
+
+        Args:
+            file_path: Path where the file should be stored
+            source: Async iterator of bytes or file-like object
+            content_type: MIME type of the file
+            max_size: Maximum size in bytes, or None for no limit
+
+        Returns:
+            Public URL, size and SHA-256 of the uploaded file
+
+        Raises:
+            FileTooLargeError: If the content exceeds ``max_size``
+        """
+        pass
+
     @abstractmethod
     async def download(self, file_path: str) -> bytes:
         """
@@ -34,6 +76,71 @@ class StorageInterface(ABC):
         """
         pass
 
+    @abstractmethod
+    def download_stream(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream a file, or a byte range of it, in chunks
+
+        Args:
+            file_path: Path of the file to download
+            start: Offset of the first byte
+            end: Offset one past the last byte, or None for end of file
+
+        Returns:
+            Async iterator of byte chunks
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+        """
+        pass
+
+    async def download_range(self, file_path: str, start: int, end: int) -> bytes:
+        """
+        Read a byte range of a file
+
+        Args:
+            file_path: Path of the file to download
+            start: Offset of the first byte
+            end: Offset one past the last byte
+
+        Returns:
+            Content of the range, shorter if the file ends first
+        """
+        return b"".join([chunk async for chunk in self.download_stream(file_path, start, end)])
+
+    @abstractmethod
+    async def stat(self, file_path: str) -> FileInfo:
+        """
+        Get file metadata
+
+        Args:
+            file_path: Path of the file
+
+        Returns:
+            Size, modification time and entity tag
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+        """
+        pass
+
+    def local_path(self, file_path: str) -> Optional[Path]:
+        """
+        Get the file's path on the local filesystem, if it has one
+
+        Backends that return a path let the file be served with zero-copy
+        ``sendfile`` instead of streaming it through the application.
+
+        Args:
+            file_path: Path of the file
+
+        Returns:
+            Filesystem path, or None for remote backends
+        """
+        return None
+
     @abstractmethod
     async def delete(self, file_path: str) -> None:
         """
@@ -57,15 +164,47 @@ class StorageInterface(ABC):
         """
         pass
 
+    async def delete_many(self, file_paths: Iterable[str]) -> None:
+        """
+        Delete several files
+
+        Backends override this to batch the work into fewer round trips.
+
+        Args:
+            file_paths: Paths of the files to delete
+        """
+        await asyncio.gather(*(self.delete(path) for path in file_paths))
+
+    async def exists_many(self, file_paths: Iterable[str]) -> Dict[str, bool]:
+        """
+        Check which of several files exist
+
+        Backends override this to batch the work into fewer round trips.
+
+        Args:
+            file_paths: Paths to check
+
+        Returns:
+            Mapping of each path to whether it exists
+        """
+        paths = list(file_paths)
+        found = await asyncio.gather(*(self.exists(path) for path in paths))
+        return dict(zip(paths, found))
+
     @abstractmethod
-    def get_public_url(self, file_path: str) -> str:
+    def get_public_url(self, file_path: str, size: Optional[str] = None) -> str:
         """
         Get the public URL for a file
 
         Args:
             file_path: Path of the file
+            size: Name from ``IMAGE_SIZES`` to link the WebP variant of an
+                image instead of the original
 
         Returns:
             Public URL of the file
+
+        Raises:
+            ValueError: If the size is unknown
         """
         pass
@@ -1,54 +1,215 @@
+import asyncio
 import os
+import uuid
 import aiofiles
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Optional
-from app.storage.interface import StorageInterface
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+from app.storage.derivatives import derivative_path
+from app.storage.interface import FileInfo, StorageInterface
+from app.storage.streams import ByteSource, StreamDigest, UploadResult, iter_chunks
 from app.core.config import settings
 
+T = TypeVar("T")
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Get the bounded thread pool shared by all local storage instances"""
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(
+            max_workers=settings.storage_io_workers, thread_name_prefix="storage-io"
+        )
+    return _io_executor
+
 
 class LocalStorage(StorageInterface):
-    """Local filesystem storage implementation"""
+    """
+    Local filesystem storage implementation
 
-    def __init__(self, base_dir: Optional[str] = None):
+    Every blocking filesystem call (metadata as well as reads and writes)
+    runs on a bounded thread pool so slow disks never stall the event loop.
+    Directories created by uploads are remembered to skip repeated mkdirs,
+    so they must not be removed from under a running instance.
+    """
+
+    def __init__(
+        self,
+        base_dir: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
         self.base_dir = Path(base_dir or settings.upload_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size or settings.upload_chunk_size
+        self.executor = executor or get_io_executor()
+        self._dirs: Set[Path] = {self.base_dir}
+
+    async def _run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run a blocking function on the storage thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args))
+
+    def _open(self, path: Path, mode: str):
+        return aiofiles.open(path, mode, executor=self.executor)
+
+    def _makedirs(self, directory: Path) -> None:
+        """Create a directory unless an earlier call already did (blocking)"""
+        if directory not in self._dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._dirs.add(directory)
+
+    def _resolve(self, file_path: str, root: Optional[Path] = None) -> Path:
+        """Map a storage path to the filesystem, refusing paths outside the root"""
+        base = (root or self.base_dir).resolve()
+        full_path = (base / file_path).resolve()
+        if not full_path.is_relative_to(base) or full_path == base:
+            raise FileNotFoundError(f"File not found: {file_path}")
+        return full_path
+
+    async def _write_temp(
+        self, directory: Path, source: ByteSource, max_size: Optional[int]
+    ) -> Tuple[Path, StreamDigest]:
+        """
+        Stream content into a new temporary file in ``directory``.
+
+        The caller must rename or remove the returned file. On failure the
+        temporary file is removed before the error propagates.
+        """
+        tmp_path = directory / f".{uuid.uuid4().hex}.part"
+        digest = StreamDigest(max_size)
+        try:
+            async with self._open(tmp_path, "wb") as f:
+                async for chunk in iter_chunks(source, self.chunk_size, self.executor):
+                    digest.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            await self._run(partial(tmp_path.unlink, missing_ok=True))
+            raise
+        return tmp_path, digest
 
     async def upload(
         self, file_path: str, content: bytes, content_type: Optional[str] = None
     ) -> str:
         """Upload a file to local storage"""
         full_path = self.base_dir / file_path
-        full_path.parent.mkdir(parents=True, exist_ok=True)
+        await self._run(self._makedirs, full_path.parent)
 
-        async with aiofiles.open(full_path, "wb") as f:
+        async with self._open(full_path, "wb") as f:
             await f.write(content)
 
         return self.get_public_url(file_path)
 
+    async def upload_stream(
+        self,
+        file_path: str,
+        source: ByteSource,
+        content_type: Optional[str] = None,
+        max_size: Optional[int] = None,
+    ) -> UploadResult:
+        """Stream a file to local storage through a temporary file"""
+        full_path = self.base_dir / file_path
+        await self._run(self._makedirs, full_path.parent)
+        # Same directory as the target so the final rename is atomic
+        tmp_path, digest = await self._write_temp(full_path.parent, source, max_size)
+        try:
+            await self._run(os.replace, tmp_path, full_path)
+        except BaseException:
+            await self._run(partial(tmp_path.unlink, missing_ok=True))
+            raise
+
+        return UploadResult(
+            url=self.get_public_url(file_path),
+            size=digest.size,
+            sha256=digest.hexdigest(),
+        )
+
     async def download(self, file_path: str) -> bytes:
         """Download a file from local storage"""
         full_path = self.base_dir / file_path
 
-        if not full_path.exists():
+        try:
+            async with self._open(full_path, "rb") as f:
+                return await f.read()
+        except (FileNotFoundError, IsADirectoryError):
             raise FileNotFoundError(f"File not found: {file_path}")
 
-        async with aiofiles.open(full_path, "rb") as f:
-            return await f.read()
+    async def download_stream(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Stream a file, or a byte range of it, from local storage"""
+        full_path = await self._run(self._resolve, file_path)
+        async for chunk in self._stream_file(full_path, start, end):
+            yield chunk
+
+    async def _stream_file(
+        self, full_path: Path, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        remaining = None if end is None else max(0, end - start)
+
+        async with self._open(full_path, "rb") as f:
+            if start:
+                await f.seek(start)
+            while remaining is None or remaining > 0:
+                size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+                chunk = await f.read(size)
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def _stat_sync(self, file_path: str) -> FileInfo:
+        stat_result = self._resolve(file_path).stat()
+        return FileInfo(
+            size=stat_result.st_size,
+            modified=stat_result.st_mtime,
+            etag=f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+        )
+
+    async def stat(self, file_path: str) -> FileInfo:
+        """Get metadata of a file in local storage"""
+        return await self._run(self._stat_sync, file_path)
+
+    def local_path(self, file_path: str) -> Optional[Path]:
+        """Get the filesystem path of a local file"""
+        return self._resolve(file_path)
+
+    def _delete_sync(self, file_path: str) -> None:
+        (self.base_dir / file_path).unlink(missing_ok=True)
+
+    def _exists_sync(self, file_path: str) -> bool:
+        return (self.base_dir / file_path).exists()
 
     async def delete(self, file_path: str) -> None:
         """Delete a file from local storage"""
-        full_path = self.base_dir / file_path
-
-        if full_path.exists():
-            full_path.unlink()
+        await self._run(self._delete_sync, file_path)
 
     async def exists(self, file_path: str) -> bool:
         """Check if a file exists in local storage"""
-        full_path = self.base_dir / file_path
-        return full_path.exists()
+        return await self._run(self._exists_sync, file_path)
+
+    async def delete_many(self, file_paths: Iterable[str]) -> None:
+        """Delete several files in one trip to the storage thread pool"""
+        paths = list(file_paths)
+        if paths:
+            await self._run(lambda: [self._delete_sync(p) for p in paths])
+
+    async def exists_many(self, file_paths: Iterable[str]) -> Dict[str, bool]:
+        """Check several files in one trip to the storage thread pool"""
+        paths = list(file_paths)
+        if not paths:
+            return {}
+        found: List[bool] = await self._run(lambda: [self._exists_sync(p) for p in paths])
+        return dict(zip(paths, found))
 
-    def get_public_url(self, file_path: str) -> str:
-        """Get the public URL for a local file"""
+    def get_public_url(self, file_path: str, size: Optional[str] = None) -> str:
+        """Get the public URL for a local file or one of its image variants"""
+        if size is not None:
+            file_path = derivative_path(file_path, size)
         # In production, this would return a proper URL
         # For now, return a relative path
         return f"/uploads/{file_path}"
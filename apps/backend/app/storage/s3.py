@@ -0,0 +1,441 @@
+"""
+S3-compatible object storage over the shared async HTTP client
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Iterable, List, Mapping, Optional
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+import httpx
+
+from app.core.http import HTTPClientRegistry
+from app.storage.derivatives import derivative_path
+from app.storage.interface import FileInfo, StorageInterface
+from app.storage.streams import ByteSource, StreamDigest, UploadResult, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+# S3 rejects multipart parts smaller than this, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# DeleteObjects accepts at most this many keys per request
+MAX_DELETE_KEYS = 1000
+
+
+class S3Error(Exception):
+    """Raised for unexpected responses from the object store"""
+
+    def __init__(self, operation: str, response: httpx.Response):
+        self.status_code = response.status_code
+        self.code = _error_code(response.content)
+        super().__init__(f"S3 {operation} failed with {self.status_code} {self.code or ''}".rstrip())
+
+
+def _error_code(body: bytes) -> Optional[str]:
+    try:
+        return _find(ElementTree.fromstring(body), "Code")
+    except ElementTree.ParseError:
+        return None
+
+
+def _find(element: ElementTree.Element, tag: str) -> Optional[str]:
+    """Text of the first descendant with ``tag``, ignoring XML namespaces"""
+    for child in element.iter():
+        if child.tag.rsplit("}", 1)[-1] == tag:
+            return child.text
+    return None
+
+
+class SigV4Signer:
+    """
+    AWS Signature Version 4 request signer for the ``s3`` service.
+
+    Signing keys are derived once per day and reused.
+    """
+
+    def __init__(self, access_key: str, secret_key: str, region: str):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self._keys: Dict[str, bytes] = {}
+
+    def _signing_key(self, date: str) -> bytes:
+        key = self._keys.get(date)
+        if key is None:
+            key = ("AWS4" + self.secret_key).encode()
+            for part in (date, self.region, "s3", "aws4_request"):
+                key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+            self._keys = {date: key}
+        return key
+
+    def sign(
+        self,
+        method: str,
+        url: httpx.URL,
+        headers: Mapping[str, str],
+        payload_hash: str,
+        now: Optional[datetime] = None,
+    ) -> Dict[str, str]:
+        """
+        Sign a request.
+
+        Args:
+            method: HTTP method
+            url: Full request URL, with its query string
+            headers: Headers to sign besides host and the x-amz ones added here
+            payload_hash: Hex SHA-256 of the body
+            now: Signing time, defaults to the current time
+
+        Returns:
+            The headers to send, including ``Authorization``
+        """
+        now = now or datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date = amz_date[:8]
+
+        signed = {key.lower(): str(value).strip() for key, value in headers.items()}
+        signed["host"] = url.netloc.decode()
+        signed["x-amz-content-sha256"] = payload_hash
+        signed["x-amz-date"] = amz_date
+        names = sorted(signed)
+
+        query = sorted(
+            (quote(key, safe="-_.~"), quote(value, safe="-_.~"))
+            for key, value in url.params.multi_items()
+        )
+        canonical_request = "\n".join(
+            [
+                method.upper(),
+                quote(url.path, safe="/-_.~"),
+                "&".join(f"{key}={value}" for key, value in query),
+                "".join(f"{name}:{signed[name]}\n" for name in names),
+                ";".join(names),
+                payload_hash,
+            ]
+        )
+        scope = f"{date}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                amz_date,
+                scope,
+                hashlib.sha256(canonical_request.encode()).hexdigest(),
+            ]
+        )
+        signature = hmac.new(
+            self._signing_key(date), string_to_sign.encode(), hashlib.sha256
+        ).hexdigest()
+
+        signed.pop("host")
+        signed["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(names)}, Signature={signature}"
+        )
+        return signed
+
+
+class S3Storage(StorageInterface):
+    """
+    Storage on Amazon S3 or any S3-compatible service (MinIO, R2, ...).
+
+    Requests go through the registry's pooled ``"s3"`` upstream, looked up
+    per request so a client closed at shutdown is replaced on next use;
+    connections are reused and transient failures retried. Objects above
+    ``multipart_threshold`` are uploaded as parts of ``part_size`` bytes,
+    up to ``concurrency`` parts at a time. Streamed uploads keep at most
+    that many parts in memory.
+
+    Uses path-style addressing (``{endpoint}/{bucket}/{key}``).
+    """
+
+    def __init__(
+        self,
+        clients: HTTPClientRegistry,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        endpoint_url: Optional[str] = None,
+        public_url: str = "",
+        part_size: int = 8 * 1024 * 1024,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        concurrency: int = 4,
+    ):
+        self.clients = clients
+        self.bucket = bucket
+        self.endpoint_url = (endpoint_url or clients.config("s3").base_url).rstrip("/")
+        self.public_url = public_url.rstrip("/")
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.multipart_threshold = max(multipart_threshold, 1)
+        self.concurrency = max(concurrency, 1)
+        self.signer = SigV4Signer(access_key, secret_key, region)
+
+    def _url(self, key: str = "", query: str = "") -> httpx.URL:
+        path = f"/{self.bucket}/{key}" if key else f"/{self.bucket}"
+        url = self.endpoint_url + quote(path, safe="/-_.~")
+        return httpx.URL(f"{url}?{query}" if query else url)
+
+    async def _request(
+        self,
+        method: str,
+        key: str = "",
+        query: str = "",
+        content: bytes = b"",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        url = self._url(key, query)
+        payload_hash = hashlib.sha256(content).hexdigest() if content else EMPTY_SHA256
+        signed = self.signer.sign(method, url, headers or {}, payload_hash)
+        client = self.clients.get("s3")
+        return await client.request(method, url, content=content or None, headers=signed)
+
+    # Uploads
+
+    async def upload(self, file_path: str, content: bytes, content_type: Optional[str] = None) -> str:
+        """Upload an object, in parallel parts if it is large"""
+        if len(content) <= self.multipart_threshold:
+            await self._put_object(file_path, content, content_type)
+        else:
+            view = memoryview(content)
+            parts = (
+                bytes(view[offset:offset + self.part_size])
+                for offset in range(0, len(content), self.part_size)
+            )
+            await self._multipart_upload(file_path, self._aiter(parts), content_type)
+        return self.get_public_url(file_path)
+
+    @staticmethod
+    async def _aiter(items: Iterable[bytes]) -> AsyncIterator[bytes]:
+        for item in items:
+            yield item
+
+    async def upload_stream(
+        self,
+        file_path: str,
+        source: ByteSource,
+        content_type: Optional[str] = None,
+        max_size: Optional[int] = None,
+    ) -> UploadResult:
+        """
+        Stream an object to the store.
+
+        Content up to ``multipart_threshold`` is sent with one PUT; anything
+        larger switches to a multipart upload as soon as the threshold is
+        crossed.
+        """
+        digest = StreamDigest(max_size)
+        chunks = iter_chunks(source, self.part_size)
+
+        head = bytearray()
+        async for chunk in chunks:
+            digest.update(chunk)
+            head += chunk
+            if len(head) > self.multipart_threshold:
+                break
+        else:
+            await self._put_object(file_path, bytes(head), content_type)
+            return UploadResult(
+                url=self.get_public_url(file_path),
+                size=digest.size,
+                sha256=digest.hexdigest(),
+            )
+
+        async def parts() -> AsyncIterator[bytes]:
+            buffer = head
+            while True:
+                while len(buffer) >= self.part_size:
+                    yield bytes(buffer[:self.part_size])
+                    del buffer[:self.part_size]
+                chunk = await anext(chunks, None)
+                if chunk is None:
+                    break
+                digest.update(chunk)
+                buffer += chunk
+            if buffer:
+                yield bytes(buffer)
+
+        await self._multipart_upload(file_path, parts(), content_type)
+        return UploadResult(
+            url=self.get_public_url(file_path),
+            size=digest.size,
+            sha256=digest.hexdigest(),
+        )
+
+    async def _put_object(self, key: str, content: bytes, content_type: Optional[str]) -> None:
+        headers = {"content-type": content_type} if content_type else {}
+        response = await self._request("PUT", key, content=content, headers=headers)
+        if response.status_code != 200:
+            raise S3Error("PutObject", response)
+
+    async def _multipart_upload(
+        self, key: str, parts: AsyncIterator[bytes], content_type: Optional[str]
+    ) -> None:
+        headers = {"content-type": content_type} if content_type else {}
+        response = await self._request("POST", key, query="uploads=", headers=headers)
+        if response.status_code != 200:
+            raise S3Error("CreateMultipartUpload", response)
+        upload_id = _find(ElementTree.fromstring(response.content), "UploadId")
+
+        etags: Dict[int, str] = {}
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks: List["asyncio.Task[None]"] = []
+
+        async def upload_part(number: int, content: bytes) -> None:
+            try:
+                query = f"partNumber={number}&uploadId={quote(upload_id, safe='')}"
+                response = await self._request("PUT", key, query=query, content=content)
+                if response.status_code != 200:
+                    raise S3Error("UploadPart", response)
+                etags[number] = response.headers["etag"]
+            finally:
+                slots.release()
+
+        try:
+            number = 0
+            async for content in parts:
+                # Waiting here bounds the parts held in memory
+                await slots.acquire()
+                for task in tasks:
+                    if task.done() and not task.cancelled() and task.exception():
+                        slots.release()
+                        await task  # stop reading the source after a failed part
+                number += 1
+                tasks.append(asyncio.create_task(upload_part(number, content)))
+            await asyncio.gather(*tasks)
+
+            body = "".join(
+                f"<Part><PartNumber>{n}</PartNumber><ETag>{etags[n]}</ETag></Part>"
+                for n in sorted(etags)
+            )
+            response = await self._request(
+                "POST",
+                key,
+                query=f"uploadId={quote(upload_id, safe='')}",
+                content=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode(),
+            )
+            # CompleteMultipartUpload can fail with a 200 and an error body
+            if response.status_code != 200 or _error_code(response.content):
+                raise S3Error("CompleteMultipartUpload", response)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                await self._request("DELETE", key, query=f"uploadId={quote(upload_id, safe='')}")
+            except Exception as e:
+                logger.warning("Could not abort multipart upload of %s: %s", key, e)
+            raise
+
+    # Downloads
+
+    async def download(self, file_path: str) -> bytes:
+        """Download an object"""
+        response = await self._request("GET", file_path)
+        if response.status_code == 404:
+            raise FileNotFoundError(f"File not found: {file_path}")
+        if response.status_code != 200:
+            raise S3Error("GetObject", response)
+        return response.content
+
+    async def download_stream(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Stream an object, or a byte range of it, with a ranged GET"""
+        if end is not None and end <= start:
+            return
+        headers = {}
+        if start or end is not None:
+            headers["range"] = f"bytes={start}-{'' if end is None else end - 1}"
+
+        url = self._url(file_path)
+        signed = self.signer.sign("GET", url, headers, EMPTY_SHA256)
+        async with self.clients.get("s3").stream("GET", url, headers=signed) as response:
+            if response.status_code == 404:
+                raise FileNotFoundError(f"File not found: {file_path}")
+            if response.status_code == 416:
+                return
+            if response.status_code not in (200, 206):
+                await response.aread()
+                raise S3Error("GetObject", response)
+            async for chunk in response.aiter_bytes():
+                yield chunk
+
+    async def stat(self, file_path: str) -> FileInfo:
+        """Get object metadata with a HEAD request"""
+        response = await self._request("HEAD", file_path)
+        if response.status_code == 404:
+            raise FileNotFoundError(f"File not found: {file_path}")
+        if response.status_code != 200:
+            raise S3Error("HeadObject", response)
+        last_modified = response.headers.get("last-modified")
+        return FileInfo(
+            size=int(response.headers.get("content-length", 0)),
+            modified=parsedate_to_datetime(last_modified).timestamp() if last_modified else 0.0,
+            etag=response.headers.get("etag", ""),
+        )
+
+    async def exists(self, file_path: str) -> bool:
+        """Check if an object exists"""
+        try:
+            await self.stat(file_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    # Deletes
+
+    async def delete(self, file_path: str) -> None:
+        """Delete an object; deleting a missing object succeeds"""
+        response = await self._request("DELETE", file_path)
+        if response.status_code not in (200, 204, 404):
+            raise S3Error("DeleteObject", response)
+
+    async def delete_many(self, file_paths: Iterable[str]) -> None:
+        """Delete objects with batched DeleteObjects requests"""
+        keys = list(dict.fromkeys(file_paths))
+        batches = [keys[i:i + MAX_DELETE_KEYS] for i in range(0, len(keys), MAX_DELETE_KEYS)]
+        await asyncio.gather(*(self._delete_batch(batch) for batch in batches))
+
+    async def _delete_batch(self, keys: List[str]) -> None:
+        objects = "".join(f"<Object><Key>{_xml_escape(key)}</Key></Object>" for key in keys)
+        body = f"<Delete><Quiet>true</Quiet>{objects}</Delete>".encode()
+        # DeleteObjects requires a body checksum
+        content_md5 = base64.b64encode(hashlib.md5(body).digest()).decode()
+        response = await self._request(
+            "POST", query="delete=", content=body, headers={"content-md5": content_md5}
+        )
+        if response.status_code != 200:
+            raise S3Error("DeleteObjects", response)
+        failed = [
+            _find(error, "Key")
+            for error in ElementTree.fromstring(response.content).iter()
+            if error.tag.rsplit("}", 1)[-1] == "Error"
+        ]
+        if failed:
+            raise S3Error(f"DeleteObjects ({len(failed)} keys)", response)
+
+    def get_public_url(self, file_path: str, size: Optional[str] = None) -> str:
+        """Get the public URL of an object or one of its image variants"""
+        if size is not None:
+            file_path = derivative_path(file_path, size)
+        if self.public_url:
+            return f"{self.public_url}/{quote(file_path, safe='/-_.~')}"
+        # Served through the application's /uploads route
+        return f"/uploads/{file_path}"
+
+
+def _xml_escape(value: str) -> str:
+    return (
+        value.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+    )
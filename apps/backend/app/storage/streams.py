@@ -0,0 +1,227 @@
+"""
+Helpers for streaming file content through the storage backends
+"""
+import asyncio
+import hashlib
+import inspect
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, AsyncIterator, List, Optional, Set, Tuple, Union
+
+# Anything a streaming upload accepts: an async iterator of byte chunks
+# (e.g. a request body stream) or a file-like object with a sync or async
+# ``read(size)`` (e.g. FastAPI's ``UploadFile`` or an open file)
+ByteSource = Union[AsyncIterable[bytes], Any]
+
+
+class FileTooLargeError(ValueError):
+    """Raised when streamed content exceeds the allowed size"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File exceeds maximum size of {max_size} bytes")
+        self.max_size = max_size
+
+
+@dataclass(frozen=True)
+class UploadResult:
+    """Outcome of a streaming upload"""
+
+    url: str
+    size: int  # bytes
+    sha256: str  # hex digest of the content
+    deduplicated: bool = False  # content was already stored
+
+
+async def iter_chunks(
+    source: ByteSource, chunk_size: int, executor: Optional[Executor] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yield the content of ``source`` in chunks of ``chunk_size`` bytes.
+
+    Async iterators are re-chunked, so a client sending tiny or huge
+    chunks does not set the size of writes and parts downstream. Sync
+    ``read()`` calls run on ``executor`` (the storage I/O pool by default)
+    so a file on a slow disk never blocks the event loop.
+
+    Args:
+        source: Async iterator of bytes or file-like object
+        chunk_size: Bytes per chunk; only the last may be shorter
+        executor: Pool for sync reads
+    """
+    if hasattr(source, "__aiter__"):
+        buffer = bytearray()
+        async for chunk in source:
+            buffer += chunk
+            while len(buffer) >= chunk_size:
+                yield bytes(buffer[:chunk_size])
+                del buffer[:chunk_size]
+        if buffer:
+            yield bytes(buffer)
+        return
+
+    read = getattr(source, "read", None)
+    if read is None:
+        raise TypeError(f"Unsupported upload source: {type(source).__name__}")
+
+    blocking = not inspect.iscoroutinefunction(read)
+    if blocking and executor is None:
+        from app.storage.local import get_io_executor
+
+        executor = get_io_executor()
+    loop = asyncio.get_running_loop()
+
+    while True:
+        if blocking:
+            chunk = await loop.run_in_executor(executor, read, chunk_size)
+        else:
+            chunk = read(chunk_size)
+        if inspect.isawaitable(chunk):
+            chunk = await chunk
+        if not chunk:
+            return
+        yield chunk
+
+
+async def limit_stream(chunks: AsyncIterable[bytes], max_size: int) -> AsyncIterator[bytes]:
+    """
+    Pass byte chunks through, up to a total size.
+
+    Raises:
+        FileTooLargeError: Once more than ``max_size`` bytes went by
+    """
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_size:
+            raise FileTooLargeError(max_size)
+        yield chunk
+
+
+class StreamDigest:
+    """
+    Running size and SHA-256 of streamed content, with a size limit.
+
+    Call :meth:`update` for every chunk before it is written so an
+    oversized upload is rejected without buffering it.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def update(self, chunk: bytes) -> None:
+        """
+        Account for one chunk.
+
+        Raises:
+            FileTooLargeError: If the running size exceeds ``max_size``
+        """
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            raise FileTooLargeError(self.max_size)
+        self._hash.update(chunk)
+
+    def hexdigest(self) -> str:
+        """SHA-256 of the content seen so far"""
+        return self._hash.hexdigest()
+
+
+_END = object()
+
+
+class _Tee:
+    """Shared state of the branches returned by :func:`tee`"""
+
+    def __init__(self, source: AsyncIterable[bytes], branches: int, max_chunks: int):
+        self._source = source
+        self._queues: List[asyncio.Queue] = [asyncio.Queue(max_chunks) for _ in range(branches)]
+        self._open: Set[int] = set(range(branches))
+        self._error: Optional[BaseException] = None
+        self._pump: Optional["asyncio.Task[None]"] = None
+
+    async def _run(self) -> None:
+        """Read the source once, handing every chunk to each open branch"""
+        try:
+            async for chunk in self._source:
+                for i in list(self._open):
+                    await self._queues[i].put(chunk)
+                if not self._open:
+                    return
+        except Exception as exc:
+            self._error = exc
+        finally:
+            aclose = getattr(self._source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        for i in list(self._open):
+            await self._queues[i].put(_END)
+
+    def _detach(self, i: int) -> None:
+        """Stop feeding a branch, unblocking the pump if it waits on it"""
+        self._open.discard(i)
+        queue = self._queues[i]
+        while not queue.empty():
+            queue.get_nowait()
+        if not self._open and self._pump is not None and not self._pump.done():
+            self._pump.cancel()
+
+    async def get(self, i: int) -> bytes:
+        """Next chunk for branch ``i``"""
+        if self._pump is None:
+            self._pump = asyncio.create_task(self._run())
+        if i not in self._open:
+            raise StopAsyncIteration
+        chunk = await self._queues[i].get()
+        if chunk is _END:
+            self._detach(i)
+            if self._error is not None:
+                raise self._error
+            raise StopAsyncIteration
+        return chunk
+
+
+class TeeBranch:
+    """One branch of a :func:`tee`; close it when done reading early"""
+
+    def __init__(self, shared: _Tee, index: int):
+        self._shared = shared
+        self._index = index
+
+    def __aiter__(self) -> "TeeBranch":
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            return await self._shared.get(self._index)
+        except asyncio.CancelledError:
+            self._shared._detach(self._index)
+            raise
+
+    async def aclose(self) -> None:
+        """Stop receiving chunks without stalling the other branches"""
+        self._shared._detach(self._index)
+
+
+def tee(
+    source: AsyncIterable[bytes], branches: int = 2, max_chunks: int = 4
+) -> Tuple[TeeBranch, ...]:
+    """
+    Split a byte stream into branches that consume it concurrently.
+
+    The source is read once. Each branch buffers at most ``max_chunks``
+    chunks, so memory stays bounded and the slowest branch sets the pace.
+    Every branch must be consumed or closed with ``aclose()``; a closed
+    branch stops receiving chunks without stalling the others. Errors from
+    the source are raised in every branch still reading.
+
+    Args:
+        source: Async iterator of byte chunks
+        branches: Number of branches
+        max_chunks: Chunks buffered per branch
+
+    Returns:
+        One async iterator per branch
+    """
+    shared = _Tee(source, branches, max_chunks)
+    return tuple(TeeBranch(shared, i) for i in range(branches))
@@ -0,0 +1,134 @@
+"""
+Benchmark a bulk wardrobe upload through BulkUploader: one photo at a
+time with an INSERT each, against the pipeline at several concurrencies.
+Photos are rendered in the image worker processes and stored locally;
+the tagging model and the database are simulated with fixed latencies.
+Peak memory is the most photo content the request held at once.
+
+No database or network needed:
+
+    python -m benchmarks.bench_bulk_upload --photos 100 --concurrency 4 8
+"""
+import argparse
+import asyncio
+import io
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import List
+
+from PIL import Image
+
+from app.core.cache import MemoryCacheBackend
+from app.services.bulk_upload import BulkUploader, MemoryBudget, Photo
+from app.services.duplicates import DuplicateIndex
+from app.services.image_processing import ImageProcessor, get_image_executor, shutdown_image_executor
+from app.services.tagging import MockTagger, TaggingService
+from app.storage import LocalStorage
+
+
+class SimulatedTagger(MockTagger):
+    """Mock tagger with the latency of a remote vision model"""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    async def tag_batch(self, images):
+        await asyncio.sleep(self.latency)
+        return await super().tag_batch(images)
+
+
+class SimulatedDatabase:
+    """Raw query client with a fixed round trip per statement"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.statements = 0
+
+    async def query_raw(self, sql, *params):
+        await asyncio.sleep(self.latency)
+        return []
+
+    async def execute_raw(self, sql, *params):
+        self.statements += 1
+        await asyncio.sleep(self.latency)
+        return 0
+
+
+def make_photos(count: int, size: int, seed: int = 0) -> List[bytes]:
+    """Distinct JPEG photos of garments on a light backdrop"""
+    rng = random.Random(seed)
+    photos = []
+    for _ in range(count):
+        image = Image.new("RGB", (size * 3 // 4, size), (245, 245, 240))
+        color = tuple(rng.randrange(256) for _ in range(3))
+        image.paste(color, (size // 8, size // 8, size * 5 // 8, size * 7 // 8))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=90)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+async def run(
+    photos: List[bytes], concurrency: int, batch: int, args: argparse.Namespace, report: bool = True
+) -> None:
+    database = SimulatedDatabase(args.db_latency)
+    with tempfile.TemporaryDirectory() as directory:
+        uploader = BulkUploader(
+            database,
+            ImageProcessor(LocalStorage(base_dir=directory), executor=get_image_executor()),
+            TaggingService(SimulatedTagger(args.tag_latency), MemoryCacheBackend()),
+            DuplicateIndex(SimpleNamespace(get_client=lambda: _ready(database))),
+            concurrency=concurrency,
+            insert_batch_size=batch,
+        )
+        budget = MemoryBudget(args.memory_mb * 1024 * 1024)
+
+        async def read():
+            for i, content in enumerate(photos):
+                await budget.acquire(len(content))
+                yield Photo(i, f"{i}.jpg", content)
+
+        start = time.perf_counter()
+        results = [result async for result in uploader.run("user", read(), budget)]
+        elapsed = time.perf_counter() - start
+
+    assert all(result.status == "created" for result in results)
+    if not report:
+        return
+    print(
+        f"{concurrency:>11} {batch:>6} {elapsed:>9.2f} s {len(photos) / elapsed:>9.1f} "
+        f"{database.statements:>8} {budget.peak / 1024 / 1024:>9.1f} MB"
+    )
+
+
+async def _ready(value):
+    return value
+
+
+def main(args: argparse.Namespace) -> None:
+    photos = make_photos(args.photos, args.size)
+    print(f"{len(photos)} photos, {sum(map(len, photos)) / 1024 / 1024:.1f} MB")
+    print(f"{'concurrency':>11} {'batch':>6} {'elapsed':>11} {'photos/s':>9} {'INSERTs':>8} {'peak held':>12}")
+    try:
+        # Start the worker processes before timing anything
+        asyncio.run(run(photos[:2], 2, 1, args, report=False))
+        asyncio.run(run(photos, 1, 1, args))
+        for concurrency in args.concurrency:
+            asyncio.run(run(photos, concurrency, args.batch, args))
+    finally:
+        shutdown_image_executor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=100)
+    parser.add_argument("--size", type=int, default=1600, help="photo height in pixels")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--batch", type=int, default=50, help="rows per INSERT")
+    parser.add_argument("--memory-mb", type=int, default=128)
+    parser.add_argument("--tag-latency", type=float, default=0.8)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    main(parser.parse_args())
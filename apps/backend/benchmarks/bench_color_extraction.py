@@ -0,0 +1,79 @@
+"""
+Benchmark dominant-color extraction on photos of increasing size, and
+pairwise color scoring through the harmony lookup table against
+computing each pair's hue distance in Python.
+
+No database needed:
+
+    python -m benchmarks.bench_color_extraction --sizes 800 2000 4000 --rounds 10
+"""
+import argparse
+import io
+import random
+import time
+from typing import Any, Callable, List
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.services.color_harmony import HARMONY, HUE_BINS, NEUTRAL
+from app.services.image_processing import analyze_image
+
+
+def make_photo(edge: int, seed: int = 0) -> bytes:
+    """A JPEG garment photo: blocks of color on a light backdrop"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (edge * 3 // 4, edge), (245, 245, 240))
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x, y = rng.randrange(edge // 2), rng.randrange(edge // 2)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle([x, y, x + edge // 3, y + edge // 3], fill=color)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def best_of(fn: Callable[[], Any], rounds: int) -> float:
+    """Fastest of ``rounds`` runs, in milliseconds"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def harmony_per_pair(codes: List[int]) -> float:
+    """Sum of pairwise harmony computed pair by pair, as without the table"""
+    scores = (1.0, 0.9, 0.6, 0.4, 0.7, 0.75, 0.85)
+    total = 0.0
+    for a in codes:
+        for b in codes:
+            if a == NEUTRAL or b == NEUTRAL:
+                total += 1.0
+            else:
+                distance = abs(a - b)
+                total += scores[min(distance, HUE_BINS - distance)]
+    return total
+
+
+def main(sizes: List[int], rounds: int) -> None:
+    print(f"{'photo':>11} {'bytes':>10} {'extract':>10}")
+    for edge in sizes:
+        photo = make_photo(edge)
+        extract = best_of(lambda: analyze_image(photo), rounds)
+        print(f"{edge * 3 // 4:>5}x{edge:<5} {len(photo):>10,} {extract:>7.2f} ms")
+
+    codes = np.random.default_rng(0).integers(0, NEUTRAL + 1, 500)
+    table = best_of(lambda: HARMONY[codes[:, None], codes[None, :]].sum(), rounds)
+    python = best_of(lambda: harmony_per_pair(codes.tolist()), rounds)
+    print(f"\n500 x 500 pairs: lookup table {table:.2f} ms, per pair {python:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[800, 2000, 4000])
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+    main(args.sizes, args.rounds)
@@ -0,0 +1,112 @@
+"""
+Benchmark near-duplicate lookup in a user's photo hashes, for wardrobes
+of increasing size made of clusters of near-identical photos: building
+and searching the packed HashIndex, a BK-tree, and a plain Python scan.
+
+No database needed:
+
+    python -m benchmarks.bench_duplicates --sizes 1000 5000 20000 --radius 10
+"""
+import argparse
+import random
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from app.services.perceptual_hash import HashIndex, hamming
+
+
+class BKTree:
+    """Burkhard-Keller tree under Hamming distance, for comparison"""
+
+    def __init__(self) -> None:
+        self.root: Optional[list] = None
+
+    def add(self, value: int, item_id: str) -> None:
+        if self.root is None:
+            self.root = [value, [item_id], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item_id)
+                return
+            if distance not in node[2]:
+                node[2][distance] = [value, [item_id], {}]
+                return
+            node = node[2][distance]
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, str]]:
+        found: List[Tuple[int, str]] = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_value, item_ids, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                found.extend((distance, item_id) for item_id in item_ids)
+            stack.extend(c for d, c in children.items() if abs(d - distance) <= radius)
+        return sorted(found)
+
+
+def make_hashes(size: int, seed: int = 0) -> List[int]:
+    """Hashes of ``size`` photos, taken about three to a garment"""
+    rng = random.Random(seed)
+    garments = [rng.getrandbits(64) for _ in range(max(1, size // 3))]
+    hashes = []
+    for _ in range(size):
+        value = rng.choice(garments)
+        for _ in range(rng.randrange(8)):
+            value ^= 1 << rng.randrange(64)
+        hashes.append(value)
+    return hashes
+
+
+def best_of(fn: Callable[[], Any], rounds: int) -> float:
+    """Fastest of ``rounds`` runs, in milliseconds"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main(sizes: List[int], radius: int, rounds: int) -> None:
+    print(
+        f"{'items':>7} {'index build':>12} {'index lookup':>13} "
+        f"{'bk-tree lookup':>15} {'python scan':>12}"
+    )
+    for size in sizes:
+        hashes = make_hashes(size)
+        queries = random.Random(1).sample(hashes, 20)
+
+        def build(cls):
+            structure = cls()
+            for i, value in enumerate(hashes):
+                structure.add(value, str(i))
+            return structure
+
+        index, tree = build(HashIndex), build(BKTree)
+        assert all(index.search(q, radius) == tree.search(q, radius) for q in queries)
+
+        built = best_of(lambda: build(HashIndex), max(1, rounds // 10))
+
+        def lookup(structure) -> float:
+            return best_of(lambda: [structure.search(q, radius) for q in queries], rounds) / len(queries)
+
+        scan = best_of(
+            lambda: [[v for v in hashes if hamming(q, v) <= radius] for q in queries], rounds
+        ) / len(queries)
+        print(
+            f"{size:>7} {built:>9.1f} ms {lookup(index):>10.3f} ms "
+            f"{lookup(tree):>12.3f} ms {scan:>9.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--radius", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    main(args.sizes, args.radius, args.rounds)
@@ -0,0 +1,76 @@
+"""
+Benchmark image variant throughput: the full size ladder in WebP and JPEG
+for camera-sized photos, in one process and across the worker pool.
+
+Reports images/sec overall and per core. The "full decode" row turns off
+JPEG draft decoding to show what reduced-scale decoding saves:
+
+    python -m benchmarks.bench_image_pipeline --images 40 --workers 4
+"""
+import argparse
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, List
+from unittest import mock
+
+from PIL import Image, ImageFilter
+
+from app.storage.derivatives import IMAGE_SIZES
+from app.services.image_processing import render_variants
+
+
+def make_photo(width: int, height: int, seed: int) -> bytes:
+    """A JPEG with enough texture to make encoding do real work"""
+    image = Image.effect_mandelbrot((width, height), (-2 + seed * 0.01, -1.2, 1, 1.2), 100)
+    image = Image.merge("RGB", (image, image.filter(ImageFilter.BLUR), image.rotate(180)))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def render_full_decode(content: bytes) -> None:
+    with mock.patch.object(Image.Image, "draft", lambda self, mode, size: None):
+        render_variants(content, IMAGE_SIZES)
+
+
+def timed(label: str, cores: int, count: int, run: Callable[[], None]) -> None:
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed
+    print(f"{label:>22}: {rate:7.2f} images/s  {rate / cores:6.2f} images/s/core")
+
+
+def main(images: int, workers: int, width: int, height: int) -> None:
+    photos: List[bytes] = [make_photo(width, height, i) for i in range(images)]
+    print(f"{images} photos of {width}x{height}, sizes {IMAGE_SIZES}")
+
+    timed("full decode, 1 core", 1, images, lambda: [render_full_decode(p) for p in photos])
+    timed(
+        "draft decode, 1 core",
+        1,
+        images,
+        lambda: [render_variants(p, IMAGE_SIZES) for p in photos],
+    )
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Start the workers before timing
+        list(pool.map(partial(render_variants, sizes={"thumbnail": 16}), photos[:workers]))
+        timed(
+            f"pool, {workers} workers",
+            workers,
+            images,
+            lambda: list(pool.map(partial(render_variants, sizes=IMAGE_SIZES), photos)),
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    args = parser.parse_args()
+    main(args.images, args.workers, args.width, args.height)
@@ -0,0 +1,102 @@
+"""
+Benchmark outfit selection on synthetic wardrobes of increasing size:
+encoding rows into arrays, the beam search, and for wardrobes small
+enough the exhaustive top x bottom x shoes x outerwear loop it replaces.
+
+No database needed:
+
+    python -m benchmarks.bench_outfit_selection --sizes 50 500 5000 --rounds 20
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from app.services.outfit_selection import EncodedWardrobe, OutfitSelector
+
+# Above this many combinations the exhaustive loop is only estimated
+EXHAUSTIVE_LIMIT = 200_000
+
+
+def make_wardrobe(size: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    categories = ["top"] * 30 + ["bottom"] * 20 + ["shoes"] * 15 + ["outerwear"] * 10
+    categories += ["dress"] * 8 + ["accessories"] * 5
+    colors = ["black", "white", "navy", "beige", "red", "green", "yellow", "pink", None]
+    seasons = [None, "spring", "summer", "autumn", "winter", "spring/summer", "fall/winter"]
+    tags = ["casual", "formal", "minimalist", "streetwear", "work", "date", "athletic"]
+    return [
+        {
+            "id": f"item-{i:06d}",
+            "category": rng.choice(categories),
+            "color": rng.choice(colors),
+            "season": rng.choice(seasons),
+            "tags": json.dumps(rng.sample(tags, rng.randint(0, 3))),
+            "wearCount": rng.randint(0, 40),
+        }
+        for i in range(size)
+    ]
+
+
+def best_of(fn: Callable[[], Any], rounds: int) -> float:
+    """Fastest of ``rounds`` runs, in milliseconds"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def exhaustive(selector: OutfitSelector) -> float:
+    """Best top/bottom/shoes(/outerwear) score by trying every combination"""
+    wardrobe = selector.wardrobe
+    slots = [wardrobe.indices(c) for c in ("top", "bottom", "shoes")]
+    outerwear = [*wardrobe.indices("outerwear"), -1]
+    best = -np.inf
+    for path in itertools.product(*slots, outerwear):
+        items = np.array([p for p in path if p >= 0])
+        score = selector.unary[items].sum() - selector.weights.optional * (path[-1] >= 0)
+        score += np.triu(selector._pair(items, items), 1).sum()
+        best = max(best, score)
+    return best
+
+
+def main(sizes: List[int], rounds: int) -> None:
+    terms = ["casual", "work"]
+    print(f"{'items':>6} {'combinations':>14} {'encode':>10} {'search':>10} {'exhaustive':>12}")
+    for size in sizes:
+        rows = make_wardrobe(size)
+        wardrobe = EncodedWardrobe(rows, terms)
+        selector = OutfitSelector(wardrobe, styles=["casual"], occasion="work", season="summer")
+        combinations = (
+            len(wardrobe.indices("top"))
+            * len(wardrobe.indices("bottom"))
+            * len(wardrobe.indices("shoes"))
+            * (len(wardrobe.indices("outerwear")) + 1)
+        )
+
+        encode = best_of(lambda: EncodedWardrobe(rows, terms), rounds)
+        search = best_of(
+            lambda: OutfitSelector(
+                wardrobe, styles=["casual"], occasion="work", season="summer"
+            ).best(n=5),
+            rounds,
+        )
+        if combinations <= EXHAUSTIVE_LIMIT:
+            full = f"{best_of(lambda: exhaustive(selector), 1):9.1f} ms"
+        else:
+            full = "(skipped)"
+        print(f"{size:>6} {combinations:>14,} {encode:>7.2f} ms {search:>7.2f} ms {full:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    main(args.sizes, args.rounds)
@@ -0,0 +1,98 @@
+"""
+Benchmark GET /api/profile/ with a per-request Prisma client versus the
+shared application-lifetime client.
+
+Requires a generated Prisma client and a migrated database:
+
+    prisma generate && prisma migrate dev
+    python -m benchmarks.bench_profile_db --requests 500 --concurrency 20
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from prisma import Prisma
+
+from app.api.deps import get_db
+from app.api.endpoints.profiles import get_current_user_id
+from app.core.database import db
+from app.main import app
+
+
+async def per_request_db():
+    """The previous dependency: connect and disconnect on every request"""
+    prisma = Prisma()
+    await prisma.connect()
+    try:
+        yield prisma
+    finally:
+        await prisma.disconnect()
+
+
+async def seed(user_id: str) -> None:
+    """Make sure the benchmark user and profile exist"""
+    client = await db.get_client()
+    await client.user.upsert(
+        where={"id": user_id},
+        data={
+            "create": {"id": user_id, "email": f"{user_id}@bench.local"},
+            "update": {},
+        },
+    )
+    await client.profile.upsert(
+        where={"userId": user_id},
+        data={
+            "create": {"userId": user_id, "height": 170, "occasions": '["work"]'},
+            "update": {},
+        },
+    )
+
+
+async def run(total: int, concurrency: int) -> float:
+    """Issue ``total`` requests with ``concurrency`` workers, return req/s"""
+    transport = httpx.ASGITransport(app=app)
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                response = await client.get("/api/profile/")
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return total / elapsed
+
+
+async def main(total: int, concurrency: int) -> None:
+    user_id = "bench-user"
+    app.dependency_overrides[get_current_user_id] = lambda: user_id
+    await seed(user_id)
+
+    app.dependency_overrides[get_db] = per_request_db
+    before = await run(total, concurrency)
+
+    app.dependency_overrides.pop(get_db)
+    after = await run(total, concurrency)
+
+    await db.disconnect()
+    print(f"per-request client: {before:10.1f} req/s")
+    print(f"shared client:      {after:10.1f} req/s")
+    print(f"speedup:            {after / before:10.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
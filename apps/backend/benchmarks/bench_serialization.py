@@ -0,0 +1,130 @@
+"""
+Benchmark response serialization through real FastAPI routes: each
+payload is served by a route left on FastAPI's default response class
+and by one using FastJSONResponse, and requests go through the full
+ASGI stack.
+
+Routes declaring a ``response_model`` and routes returning bare dicts
+take different paths in FastAPI, and which is faster depends on the
+FastAPI version: since 0.130 ``response_model`` routes with the default
+response class are dumped straight to JSON by pydantic-core, and
+setting any ``response_class`` turns that off. The project keeps FastAPI
+below 0.130 for that reason; run this before moving that bound or
+changing the app's default response class.
+
+No database or network needed:
+
+    python -m benchmarks.bench_serialization --items 5000 --rounds 20
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Callable, Dict, List
+
+import fastapi
+import httpx
+from fastapi import FastAPI
+from fastapi.datastructures import Default
+from fastapi.responses import JSONResponse
+
+from app.api.endpoints.profiles import ProfileResponse
+from app.core.responses import FastJSONResponse
+
+
+def make_profile(i: int) -> ProfileResponse:
+    return ProfileResponse(
+        id=f"profile-{i:08d}",
+        userId=f"00000000-0000-0000-0000-{i:012d}",
+        height=150 + i % 50,
+        weight=50.0 + i % 40,
+        primaryStyle="casual",
+        secondaryStyle="minimalist",
+        occasions=["work", "date", "events/formal"],
+        createdAt="2025-01-01T08:00:00+00:00",
+        updatedAt="2025-01-02T08:00:00+00:00",
+    )
+
+
+def best_of(fn: Callable[[], Any], rounds: int) -> float:
+    """Fastest of ``rounds`` runs, in milliseconds"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def build_app(items: int) -> FastAPI:
+    """Pairs of identical routes, one on the default response class"""
+    profile = make_profile(0)
+    profiles = [make_profile(i) for i in range(items)]
+    session = {"authenticated": True, "user": {"id": profile.userId, "email": "user@example.com"}}
+    stats = {
+        f"cache-{i}": {"size": i, "hits": i * 3, "misses": i, "hit_rate": 0.75}
+        for i in range(items)
+    }
+
+    app = FastAPI()
+    for prefix, response_class in (("stock", Default(JSONResponse)), ("fast", FastJSONResponse)):
+
+        @app.get(f"/{prefix}/profile", response_model=ProfileResponse, response_class=response_class)
+        async def get_profile():
+            return profile
+
+        @app.get(
+            f"/{prefix}/profiles", response_model=List[ProfileResponse], response_class=response_class
+        )
+        async def list_profiles():
+            return profiles
+
+        @app.get(f"/{prefix}/session", response_class=response_class)
+        async def get_session() -> Dict[str, Any]:
+            return session
+
+        @app.get(f"/{prefix}/stats", response_class=response_class)
+        async def get_stats():
+            return stats
+
+    return app
+
+
+def compare(
+    client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop, label: str, path: str, rounds: int
+) -> None:
+    def fetch(prefix: str) -> httpx.Response:
+        return loop.run_until_complete(client.get(f"/{prefix}{path}"))
+
+    # Both routes must produce the same document
+    assert fetch("stock").json() == fetch("fast").json()
+    stock = best_of(lambda: fetch("stock"), rounds)
+    fast = best_of(lambda: fetch("fast"), rounds)
+
+    print(f"{label}")
+    print(f"  JSONResponse:     {stock:10.3f} ms")
+    print(f"  FastJSONResponse: {fast:10.3f} ms")
+    print(f"  speedup:          {stock / fast:10.2f}x")
+
+
+def main(items: int, rounds: int) -> None:
+    print(f"FastAPI {fastapi.__version__}")
+    loop = asyncio.new_event_loop()
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=build_app(items)), base_url="http://test"
+    )
+    try:
+        compare(client, loop, "response_model=ProfileResponse", "/profile", rounds * 50)
+        compare(client, loop, f"response_model=List[ProfileResponse] x {items}", "/profiles", rounds)
+        compare(client, loop, "dict (auth session)", "/session", rounds * 50)
+        compare(client, loop, f"dict of {items} stats", "/stats", rounds)
+    finally:
+        loop.run_until_complete(client.aclose())
+        loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    main(args.items, args.rounds)
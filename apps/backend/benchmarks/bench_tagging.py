@@ -0,0 +1,82 @@
+"""
+Benchmark auto-tagging a bulk import through the TaggingService against
+one model call per photo, with a simulated model whose calls take a fixed
+latency plus a little per photo. A share of the photos are re-uploads and
+should be served from the cache.
+
+No network needed:
+
+    python -m benchmarks.bench_tagging --photos 200 --latency 0.8 --batch-sizes 1 8 16
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import List
+
+from app.core.cache import MemoryCacheBackend
+from app.services.tagging import MockTagger, TaggingService, content_hash
+
+
+class SimulatedTagger(MockTagger):
+    """Mock tagger with the latency of a remote vision model"""
+
+    def __init__(self, latency: float, per_image: float):
+        super().__init__()
+        self.latency = latency
+        self.per_image = per_image
+
+    async def tag_batch(self, images):
+        await asyncio.sleep(self.latency + self.per_image * len(images))
+        return await super().tag_batch(images)
+
+
+def make_photos(count: int, repeats: float, seed: int = 0) -> List[bytes]:
+    """``count`` photos, ``repeats`` of them copies of earlier ones"""
+    rng = random.Random(seed)
+    photos: List[bytes] = []
+    for i in range(count):
+        if photos and rng.random() < repeats:
+            photos.append(rng.choice(photos))
+        else:
+            photos.append(f"photo-{i}".encode())
+    return photos
+
+
+async def run(photos: List[bytes], batch_size: int, args: argparse.Namespace) -> None:
+    tagger = SimulatedTagger(args.latency, args.per_image)
+    service = TaggingService(
+        tagger,
+        MemoryCacheBackend(),
+        max_batch=batch_size,
+        window=args.window,
+        max_concurrent=args.max_batches,
+    )
+    start = time.perf_counter()
+    await service.tag_many([(content_hash(photo), photo) for photo in photos])
+    elapsed = time.perf_counter() - start
+    stats = service.stats()
+    print(
+        f"{batch_size:>6} {len(tagger.batches):>7} {stats['cache_hits'] + stats['coalesced']:>8} "
+        f"{stats['mean_batch_size']:>11.1f} {elapsed:>9.2f} s"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    photos = make_photos(args.photos, args.repeats)
+    print(f"{len(photos)} photos, {len(set(photos))} distinct")
+    print(f"{'batch':>6} {'calls':>7} {'reused':>8} {'mean batch':>11} {'elapsed':>11}")
+    for batch_size in args.batch_sizes:
+        asyncio.run(run(photos, batch_size, args))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=200)
+    parser.add_argument("--repeats", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.8)
+    parser.add_argument("--per-image", type=float, default=0.02)
+    parser.add_argument("--window", type=float, default=0.05)
+    parser.add_argument("--max-batches", type=int, default=4)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 16])
+    main(parser.parse_args())
@@ -0,0 +1,82 @@
+"""
+Benchmark peak RSS of concurrent uploads through LocalStorage.upload
+(whole-file bytes) versus LocalStorage.upload_stream (fixed-size chunks).
+
+Each mode runs in a fresh interpreter because peak RSS never goes down:
+
+    python -m benchmarks.bench_upload_memory --uploads 8 --size-mb 20
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from typing import AsyncIterator
+
+from app.storage.local import LocalStorage
+
+BODY_CHUNK = 64 * 1024  # what a server hands the app per receive()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def request_body(size: int) -> AsyncIterator[bytes]:
+    """Simulated request body arriving in server-sized chunks"""
+    chunk = os.urandom(BODY_CHUNK)
+    sent = 0
+    while sent < size:
+        piece = chunk[: min(BODY_CHUNK, size - sent)]
+        sent += len(piece)
+        yield piece
+        await asyncio.sleep(0)
+
+
+async def upload_bytes(storage: LocalStorage, path: str, size: int) -> None:
+    content = b"".join([chunk async for chunk in request_body(size)])
+    await storage.upload(path, content)
+
+
+async def upload_stream(storage: LocalStorage, path: str, size: int) -> None:
+    await storage.upload_stream(path, request_body(size))
+
+
+async def run(mode: str, uploads: int, size: int) -> None:
+    upload = upload_bytes if mode == "bytes" else upload_stream
+    with tempfile.TemporaryDirectory() as base_dir:
+        storage = LocalStorage(base_dir=base_dir)
+        baseline = peak_rss_mb()
+        await asyncio.gather(
+            *(upload(storage, f"bench/{i}.jpg", size) for i in range(uploads))
+        )
+        print(f"{mode:>6}: peak RSS {peak_rss_mb():8.1f} MB (baseline {baseline:.1f} MB)")
+
+
+def main(uploads: int, size_mb: int) -> None:
+    for mode in ("bytes", "stream"):
+        subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.bench_upload_memory",
+                "--mode", mode,
+                "--uploads", str(uploads),
+                "--size-mb", str(size_mb),
+            ],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=20)
+    parser.add_argument("--mode", choices=["bytes", "stream"])
+    args = parser.parse_args()
+    if args.mode:
+        asyncio.run(run(args.mode, args.uploads, args.size_mb * 1024 * 1024))
+    else:
+        main(args.uploads, args.size_mb)
@@ -0,0 +1,9 @@
+-- AlterTable
+ALTER TABLE "users" ADD COLUMN "outfitCacheGeneration" INTEGER NOT NULL DEFAULT 0;
+
+-- AlterTable
+ALTER TABLE "outfits" ADD COLUMN "cacheKey" TEXT;
+ALTER TABLE "outfits" ADD COLUMN "cacheGeneration" INTEGER;
+
+-- CreateIndex
+CREATE INDEX "outfits_cacheKey_idx" ON "outfits"("cacheKey");
@@ -0,0 +1,14 @@
+-- DropIndex
+DROP INDEX "clothing_items_userId_idx";
+
+-- CreateIndex
+CREATE INDEX "clothing_items_userId_createdAt_id_idx" ON "clothing_items"("userId", "createdAt", "id");
+
+-- CreateIndex
+CREATE INDEX "clothing_items_userId_category_createdAt_id_idx" ON "clothing_items"("userId", "category", "createdAt", "id");
+
+-- CreateIndex
+CREATE INDEX "clothing_items_userId_color_createdAt_id_idx" ON "clothing_items"("userId", "color", "createdAt", "id");
+
+-- CreateIndex
+CREATE INDEX "clothing_items_userId_season_createdAt_id_idx" ON "clothing_items"("userId", "season", "createdAt", "id");
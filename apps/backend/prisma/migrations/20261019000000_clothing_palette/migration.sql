@@ -0,0 +1,3 @@
+-- AlterTable
+ALTER TABLE "clothing_items" ADD COLUMN "palette" TEXT;
+ALTER TABLE "clothing_items" ADD COLUMN "colorCode" INTEGER;
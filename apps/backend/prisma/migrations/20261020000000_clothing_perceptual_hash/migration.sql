@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "clothing_items" ADD COLUMN "perceptualHash" TEXT;
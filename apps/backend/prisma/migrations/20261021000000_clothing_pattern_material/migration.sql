@@ -0,0 +1,3 @@
+-- AlterTable
+ALTER TABLE "clothing_items" ADD COLUMN "pattern" TEXT;
+ALTER TABLE "clothing_items" ADD COLUMN "material" TEXT;
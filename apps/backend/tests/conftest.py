@@ -1,5 +1,8 @@
 import pytest
+import time
+import jwt
 from datetime import datetime
+from cryptography.hazmat.primitives.asymmetric import rsa
 from unittest.mock import AsyncMock, MagicMock
 from typing import TYPE_CHECKING
 
@@ -40,16 +43,50 @@ async def mock_prisma():
         profile.updatedAt = datetime.now()
         return profile
 
+    def upsert_mock_profile(where, data):
+        fields = data["create"]
+        return create_mock_profile(
+            user_id=where["userId"],
+            height=fields.get("height"),
+            weight=fields.get("weight"),
+            primary_style=fields.get("primaryStyle"),
+            secondary_style=fields.get("secondaryStyle"),
+            occasions=fields.get("occasions"),
+        )
+
     prisma.user.find_unique = AsyncMock(return_value=mock_user)
     prisma.profile.find_unique = AsyncMock(return_value=None)
     prisma.profile.create = AsyncMock(side_effect=create_mock_profile)
     prisma.profile.update = AsyncMock(side_effect=lambda **kwargs: create_mock_profile())
+    prisma.profile.upsert = AsyncMock(side_effect=upsert_mock_profile)
     prisma.connect = AsyncMock()
     prisma.disconnect = AsyncMock()
 
     return prisma
 
 
+@pytest.fixture
+def migrated_db():
+    """
+    In-memory SQLite database built from the Prisma migrations, with two
+    users. Back ``query_raw``/``execute_raw`` with it to run raw SQL for real.
+    """
+    import sqlite3
+    from pathlib import Path
+
+    migrations = Path(__file__).resolve().parent.parent / "prisma" / "migrations"
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for migration in sorted(migrations.glob("*/migration.sql")):
+        conn.executescript(migration.read_text())
+    conn.executemany(
+        'INSERT INTO "users" ("id", "email", "updatedAt") VALUES (?, ?, 0)',
+        [("user-123", "a@example.com"), ("user-456", "b@example.com")],
+    )
+    yield conn
+    conn.close()
+
+
 @pytest.fixture
 def test_user_id():
     """Test user ID"""
@@ -66,3 +103,321 @@ def sample_profile_data():
         "secondary_style": "minimalist",
         "occasions": ["work", "casual", "date"],
     }
+
+
+@pytest.fixture
+def signing_key():
+    """Locally generated RSA key pair standing in for the Supabase signing key"""
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def jwks(signing_key):
+    """JWKS document publishing the public half of the signing key"""
+    public_jwk = jwt.algorithms.RSAAlgorithm.to_jwk(
+        signing_key.public_key(), as_dict=True
+    )
+    public_jwk.update({"kid": "test-key", "alg": "RS256", "use": "sig"})
+    return {"keys": [public_jwk]}
+
+
+@pytest.fixture
+def make_token(signing_key):
+    """Factory for access tokens signed with the local key"""
+    def _make_token(kid="test-key", expires_in=3600, **claims):
+        payload = {
+            "sub": "user-123",
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": "test@example.com",
+            "exp": int(time.time()) + expires_in,
+            "user_metadata": {"full_name": "Test User"},
+        }
+        payload.update(claims)
+        return jwt.encode(
+            payload, signing_key, algorithm="RS256", headers={"kid": kid}
+        )
+
+    return _make_token
+
+
+@pytest.fixture
+def installed_jwks(jwks):
+    """Load the local JWKS into the application verifier"""
+    from app.core.security import jwt_verifier
+
+    previous = jwt_verifier.jwks._keys, jwt_verifier.jwks._loaded_at
+    jwt_verifier.jwks.set_keys(jwks)
+    yield jwt_verifier
+    jwt_verifier.jwks._keys, jwt_verifier.jwks._loaded_at = previous
+
+
+@pytest.fixture
+def supabase_api():
+    """
+    Route the shared Supabase client through a mock transport.
+
+    Set ``return_value`` or ``side_effect`` on the returned mock to
+    control responses; every outgoing ``httpx.Request`` is passed to it.
+    """
+    import dataclasses
+    import httpx
+    from app.core.http import RetryPolicy, http_clients
+
+    handler = MagicMock(return_value=httpx.Response(200, json={}))
+    original = http_clients.config("supabase")
+    http_clients.register(
+        "supabase",
+        dataclasses.replace(
+            original,
+            base_url="https://test.supabase.co",
+            retry=RetryPolicy(attempts=2, backoff_base=0),
+        ),
+        transport=httpx.MockTransport(lambda request: handler(request)),
+    )
+    yield handler
+    http_clients.register("supabase", original)
+
+
+@pytest.fixture(autouse=True)
+def clear_session_cache():
+    """Start every test with an empty verified-session cache"""
+    from app.core.security import session_cache
+
+    session_cache.clear()
+    yield
+    session_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def fresh_profile_cache(monkeypatch):
+    """Give every test its own empty in-process profile cache"""
+    from app.api.endpoints import profiles
+    from app.core.cache import MemoryCacheBackend
+    from app.services.cache_service import ProfileCache
+
+    cache = ProfileCache(MemoryCacheBackend(maxsize=100, ttl=60))
+    monkeypatch.setattr(profiles, "profile_cache", cache)
+    return cache
+
+
+@pytest.fixture
+async def redis_server():
+    """
+    Local stand-in for a Redis server.
+
+    Speaks enough RESP for the cache backends (GET, SET with PX, DEL, INCR,
+    AUTH, SELECT, PING) and yields its ``redis://`` URL.
+    """
+    import asyncio
+    from app.core.redis import read_reply
+
+    store = {}
+
+    def reply(value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        return b"+%s\r\n" % value.encode()
+
+    def live(key):
+        entry = store.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del store[key]
+            return None
+        return entry
+
+    async def handle(reader, writer):
+        while True:
+            try:
+                command = await read_reply(reader)
+            except Exception:
+                break
+            name, args = command[0].upper(), command[1:]
+            if name == b"GET":
+                entry = live(args[0])
+                writer.write(reply(entry[0] if entry else None))
+            elif name == b"SET":
+                expires = None
+                if len(args) == 4 and args[2].upper() == b"PX":
+                    expires = time.monotonic() + int(args[3]) / 1000
+                store[args[0]] = (args[1], expires)
+                writer.write(reply("OK"))
+            elif name == b"DEL":
+                writer.write(reply(sum(1 for k in args if store.pop(k, None) is not None)))
+            elif name == b"INCR":
+                entry = live(args[0])
+                value = int(entry[0]) + 1 if entry else 1
+                store[args[0]] = (str(value).encode(), None)
+                writer.write(reply(value))
+            elif name in (b"AUTH", b"SELECT", b"PING"):
+                writer.write(reply("OK"))
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    server.store = store
+    server.url = f"redis://127.0.0.1:{port}/0"
+    yield server
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.fixture
+def s3_server():
+    """
+    Local stand-in for an S3-compatible object store.
+
+    Handles PUT/GET/HEAD/DELETE on objects (with Range), DeleteObjects and
+    multipart uploads, and rejects requests whose SigV4 signature or
+    payload hash does not check out. Route a client through ``.transport``;
+    objects live in ``.objects`` as ``key -> bytes``.
+    """
+    import asyncio
+    import base64
+    import hashlib
+    import re
+    import uuid
+    from email.utils import formatdate
+    from xml.etree import ElementTree
+    import httpx
+    from app.storage.s3 import SigV4Signer
+
+    class S3StandIn:
+        bucket = "wardrobe"
+        access_key = "test-access-key"
+        secret_key = "test-secret-key"
+        region = "us-east-1"
+
+        def __init__(self):
+            self.objects = {}
+            self.uploads = {}
+            self.requests = []
+            self.fail_parts = set()
+            self.part_delay = 0.0
+            self.parts_in_flight = 0
+            self.max_parts_in_flight = 0
+            self.signer = SigV4Signer(self.access_key, self.secret_key, self.region)
+            self.transport = httpx.MockTransport(self.handle)
+
+        @staticmethod
+        def error(status_code, code):
+            body = f"<Error><Code>{code}</Code></Error>"
+            return httpx.Response(status_code, content=body.encode())
+
+        def verify(self, request, body):
+            auth = request.headers.get("authorization", "")
+            match = re.search(r"SignedHeaders=([^,]+), Signature=(\w+)", auth)
+            if not match:
+                return False
+            if request.headers.get("x-amz-content-sha256") != hashlib.sha256(body).hexdigest():
+                return False
+            signed_names = match.group(1).split(";")
+            headers = {
+                name: request.headers[name]
+                for name in signed_names
+                if name not in ("host", "x-amz-content-sha256", "x-amz-date")
+            }
+            amz_date = datetime.strptime(request.headers["x-amz-date"], "%Y%m%dT%H%M%SZ")
+            expected = self.signer.sign(
+                request.method,
+                request.url,
+                headers,
+                request.headers["x-amz-content-sha256"],
+                now=amz_date,
+            )
+            return expected["authorization"] == auth
+
+        async def handle(self, request):
+            body = await request.aread()
+            params = request.url.params
+            _, bucket, key = (request.url.path.split("/", 2) + [""])[:3]
+            self.requests.append((request.method, key, str(params)))
+
+            if bucket != self.bucket:
+                return self.error(404, "NoSuchBucket")
+            if not self.verify(request, body):
+                return self.error(403, "SignatureDoesNotMatch")
+
+            if request.method == "POST" and "delete" in params:
+                md5 = base64.b64encode(hashlib.md5(body).digest()).decode()
+                if request.headers.get("content-md5") != md5:
+                    return self.error(400, "InvalidDigest")
+                root = ElementTree.fromstring(body)
+                for element in root.iter("Key"):
+                    self.objects.pop(element.text, None)
+                return httpx.Response(200, content=b"<DeleteResult/>")
+
+            if request.method == "POST" and "uploads" in params:
+                upload_id = uuid.uuid4().hex
+                self.uploads[upload_id] = {"key": key, "parts": {}}
+                xml = f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+                return httpx.Response(200, content=xml.encode())
+
+            if "uploadId" in params:
+                upload = self.uploads.get(params["uploadId"])
+                if upload is None:
+                    return self.error(404, "NoSuchUpload")
+                if request.method == "PUT":
+                    number = int(params["partNumber"])
+                    self.parts_in_flight += 1
+                    self.max_parts_in_flight = max(self.max_parts_in_flight, self.parts_in_flight)
+                    try:
+                        await asyncio.sleep(self.part_delay)
+                    finally:
+                        self.parts_in_flight -= 1
+                    if number in self.fail_parts:
+                        return self.error(500, "InternalError")
+                    etag = f'"{hashlib.md5(body).hexdigest()}"'
+                    upload["parts"][number] = (etag, body)
+                    return httpx.Response(200, headers={"etag": etag})
+                if request.method == "POST":
+                    root = ElementTree.fromstring(body)
+                    numbers = [int(e.text) for e in root.iter("PartNumber")]
+                    etags = [e.text for e in root.iter("ETag")]
+                    parts = upload["parts"]
+                    if any(parts.get(n, (None,))[0] != etag for n, etag in zip(numbers, etags)):
+                        return self.error(400, "InvalidPart")
+                    self.objects[key] = b"".join(parts[n][1] for n in numbers)
+                    del self.uploads[params["uploadId"]]
+                    return httpx.Response(200, content=b"<CompleteMultipartUploadResult/>")
+                if request.method == "DELETE":
+                    del self.uploads[params["uploadId"]]
+                    return httpx.Response(204)
+
+            if request.method == "PUT":
+                self.objects[key] = body
+                return httpx.Response(200, headers={"etag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+            if request.method == "DELETE":
+                self.objects.pop(key, None)
+                return httpx.Response(204)
+
+            if key not in self.objects:
+                return self.error(404, "NoSuchKey")
+            data = self.objects[key]
+            headers = {
+                "etag": f'"{hashlib.md5(data).hexdigest()}"',
+                "last-modified": formatdate(0, usegmt=True),
+                "content-length": str(len(data)),
+            }
+            if request.method == "HEAD":
+                return httpx.Response(200, headers=headers)
+
+            match = re.fullmatch(r"bytes=(\d+)-(\d*)", request.headers.get("range", ""))
+            if match:
+                start = int(match.group(1))
+                end = int(match.group(2)) + 1 if match.group(2) else len(data)
+                if start >= len(data):
+                    return self.error(416, "InvalidRange")
+                headers["content-length"] = str(len(data[start:end]))
+                return httpx.Response(206, headers=headers, content=data[start:end])
+            return httpx.Response(200, headers=headers, content=data)
+
+    return S3StandIn()
@@ -0,0 +1,364 @@
+"""
+Unit tests for upstream admission control
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.admission import (
+    AdmissionController,
+    AdmissionPolicy,
+    AdmissionRejected,
+    TokenBucket,
+)
+from app.core.http import RetryPolicy, UpstreamClient, UpstreamConfig
+
+
+class Clock:
+    """Manually advanced clock"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def controller(**policy):
+    return AdmissionController("test", AdmissionPolicy(**policy))
+
+
+async def hold(ctrl, release, key=""):
+    async with ctrl.admit(key):
+        await release.wait()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestTokenBucket:
+    """Tests for TokenBucket"""
+
+    def test_burst_then_rate(self):
+        """Test the burst is free and later tokens are spaced by the rate"""
+        clock = Clock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+
+        assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+
+        clock.now += 2
+        assert bucket.reserve() == 0
+
+    def test_refund_and_pause(self):
+        """Test refunded tokens are reusable and pauses delay new ones"""
+        clock = Clock()
+        bucket = TokenBucket(rate=1, burst=1, clock=clock)
+
+        bucket.reserve()
+        bucket.refund()
+        assert bucket.reserve() == 0
+
+        bucket.pause(3)
+        assert bucket.reserve() == 4
+
+
+class TestAdmissionController:
+    """Tests for AdmissionController"""
+
+    async def test_queues_beyond_limit_in_order(self):
+        """Test callers past the limit wait and are admitted first come first served"""
+        ctrl = controller(initial_limit=1, max_limit=1)
+        release = asyncio.Event()
+        order = []
+
+        async def call(n):
+            async with ctrl.admit():
+                order.append(n)
+                await release.wait()
+
+        tasks = [asyncio.create_task(call(n)) for n in range(3)]
+        await settle()
+
+        assert order == [0]
+        assert ctrl.stats()["in_flight"] == 1
+        assert ctrl.stats()["queued"] == 2
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert order == [0, 1, 2]
+        stats = ctrl.stats()
+        assert stats["queued_max"] == 2
+        assert stats["admitted"] == 3
+        assert stats["wait_time_max_ms"] > 0
+
+    async def test_full_queue_fails_fast(self):
+        """Test callers are rejected at once when the queue is full"""
+        ctrl = controller(initial_limit=1, max_limit=1, max_queue=1)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(ctrl, release)) for _ in range(2)]
+        await settle()
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            async with ctrl.admit():
+                pass
+
+        assert exc_info.value.retry_after > 0
+        assert ctrl.stats()["rejected"] == 1
+        release.set()
+        await asyncio.gather(*tasks)
+
+    async def test_queue_timeout(self):
+        """Test a waiter gives up after queue_timeout and leaves the queue"""
+        ctrl = controller(initial_limit=1, max_limit=1, queue_timeout=0.01)
+        release = asyncio.Event()
+        task = asyncio.create_task(hold(ctrl, release))
+        await settle()
+
+        with pytest.raises(AdmissionRejected):
+            async with ctrl.admit():
+                pass
+
+        assert ctrl.stats()["queued"] == 0
+        release.set()
+        await task
+        assert ctrl.stats()["in_flight"] == 0
+
+    async def test_cancelled_waiter_leaves_queue(self):
+        """Test a cancelled waiter does not take a slot"""
+        ctrl = controller(initial_limit=1, max_limit=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(ctrl, release))
+        await settle()
+        waiter = asyncio.create_task(hold(ctrl, release))
+        await settle()
+
+        waiter.cancel()
+        await settle()
+        release.set()
+        await holder
+
+        assert ctrl.stats()["in_flight"] == 0
+        assert ctrl.stats()["queued"] == 0
+
+    async def test_additive_increase(self):
+        """Test fast successful calls raise the limit up to max_limit"""
+        ctrl = controller(initial_limit=2, max_limit=3)
+
+        for _ in range(2):
+            async with ctrl.admit():
+                pass
+        assert ctrl.limit == pytest.approx(2 + 1 / 2 + 1 / 2.5)
+
+        for _ in range(10):
+            async with ctrl.admit():
+                pass
+        assert ctrl.limit == 3
+
+    async def test_throttled_burst_decreases_once(self):
+        """Test concurrent 429s halve the limit once, not once per call"""
+        ctrl = controller(initial_limit=8, max_limit=8)
+        release = asyncio.Event()
+
+        async def throttled():
+            async with ctrl.admit() as permit:
+                await release.wait()
+                permit.throttled()
+
+        tasks = [asyncio.create_task(throttled()) for _ in range(4)]
+        await settle()
+        release.set()
+        await asyncio.gather(*tasks)
+
+        assert ctrl.limit == 4
+        assert ctrl.stats()["throttled"] == 4
+
+        async with ctrl.admit() as permit:
+            permit.throttled()
+        assert ctrl.limit == 2
+
+    async def test_limit_floor(self):
+        """Test the limit never drops below min_limit"""
+        ctrl = controller(initial_limit=2, min_limit=1)
+
+        for _ in range(3):
+            async with ctrl.admit() as permit:
+                permit.throttled()
+
+        assert ctrl.limit == 1
+
+    async def test_slow_calls_and_timeouts_decrease(self):
+        """Test calls over the latency target and timeouts count as congestion"""
+        ctrl = controller(initial_limit=8, latency_target=0.01)
+
+        async with ctrl.admit():
+            await asyncio.sleep(0.02)
+        assert ctrl.limit == 4
+        assert ctrl.stats()["slow"] == 1
+
+        with pytest.raises(httpx.ReadTimeout):
+            async with ctrl.admit():
+                raise httpx.ReadTimeout("slow")
+        assert ctrl.limit == 2
+        assert ctrl.stats()["timeouts"] == 1
+
+    async def test_other_errors_leave_limit(self):
+        """Test unrelated failures release the slot without adapting"""
+        ctrl = controller(initial_limit=4)
+
+        with pytest.raises(ValueError):
+            async with ctrl.admit():
+                raise ValueError("bad request")
+
+        assert ctrl.limit == 4
+        assert ctrl.stats()["in_flight"] == 0
+
+    async def test_throttled_then_raised(self):
+        """Test a 429 still counts when the caller raises on it"""
+        ctrl = controller(initial_limit=8, rate=100, burst=1, queue_timeout=0.5)
+
+        with pytest.raises(ValueError):
+            async with ctrl.admit("key") as permit:
+                permit.throttled(retry_after=1.0)
+                raise ValueError("upstream returned 429")
+
+        assert ctrl.limit == 4
+        assert ctrl.stats()["throttled"] == 1
+        assert ctrl.stats()["in_flight"] == 0
+        with pytest.raises(AdmissionRejected):
+            async with ctrl.admit("key"):
+                pass
+
+    async def test_rate_limit_per_key(self):
+        """Test each key has its own bucket and excess calls are rejected"""
+        ctrl = controller(rate=1, burst=1, queue_timeout=0.5)
+
+        async with ctrl.admit("key-a"):
+            pass
+        async with ctrl.admit("key-b"):
+            pass
+
+        with pytest.raises(AdmissionRejected):
+            async with ctrl.admit("key-a"):
+                pass
+        assert ctrl.stats()["rejected"] == 1
+
+    async def test_retry_after_pauses_key(self):
+        """Test a 429 with Retry-After holds back that key's next call"""
+        ctrl = controller(rate=100, burst=1, queue_timeout=0.5)
+
+        async with ctrl.admit("key") as permit:
+            permit.throttled(retry_after=1.0)
+
+        with pytest.raises(AdmissionRejected):
+            async with ctrl.admit("key"):
+                pass
+
+
+class TestUpstreamAdmission:
+    """Tests for admission control against a mock upstream"""
+
+    @pytest.fixture
+    def upstream(self):
+        """Upstream with injectable latency and 429s that tracks concurrency"""
+
+        class Upstream:
+            latency = 0.0
+            capacity = 100
+            active = 0
+            peak = 0
+            throttled = 0
+
+            async def __call__(self, request):
+                if self.active >= self.capacity:
+                    self.throttled += 1
+                    return httpx.Response(429, headers={"retry-after": "0"})
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+                try:
+                    await asyncio.sleep(self.latency)
+                finally:
+                    self.active -= 1
+                return httpx.Response(200, text="data: {}\n\n")
+
+        return Upstream()
+
+    def make_client(self, upstream, **policy):
+        return UpstreamClient(
+            "images",
+            UpstreamConfig(
+                base_url="https://images.test",
+                retry=RetryPolicy(attempts=1),
+                admission=AdmissionPolicy(**policy),
+            ),
+            transport=httpx.MockTransport(upstream),
+        )
+
+    async def test_limits_concurrency(self, upstream):
+        """Test no more calls than the limit reach the upstream at once"""
+        upstream.latency = 0.01
+        client = self.make_client(upstream, initial_limit=2, max_limit=2)
+
+        responses = await asyncio.gather(*(client.post("/generate") for _ in range(6)))
+
+        assert all(r.status_code == 200 for r in responses)
+        assert upstream.peak == 2
+        assert client.stats()["admission"]["admitted"] == 6
+        await client.aclose()
+
+    async def test_adapts_to_upstream_capacity(self, upstream):
+        """Test 429s shrink the limit towards what the upstream accepts"""
+        upstream.latency = 0.005
+        upstream.capacity = 2
+        client = self.make_client(upstream, initial_limit=8, max_limit=8)
+
+        for _ in range(5):
+            await asyncio.gather(*(client.post("/generate") for _ in range(8)))
+
+        assert client.admission.limit <= 4
+        assert client.stats()["admission"]["throttled"] == upstream.throttled > 0
+        await client.aclose()
+
+    async def test_streams_hold_slot_and_fail_fast(self, upstream):
+        """Test a stream keeps its slot until closed and overflow is rejected"""
+        client = self.make_client(
+            upstream, initial_limit=1, max_limit=1, max_queue=0
+        )
+
+        async with client.stream("POST", "/generate") as response:
+            assert response.status_code == 200
+            with pytest.raises(AdmissionRejected):
+                await client.post("/generate")
+
+        assert (await client.post("/generate")).status_code == 200
+        await client.aclose()
+
+    async def test_stream_raising_on_429_decreases(self, upstream):
+        """Test a streamed 429 the caller raises on still shrinks the limit"""
+        upstream.capacity = 0
+        client = self.make_client(upstream, initial_limit=8, max_limit=8)
+
+        for _ in range(3):
+            with pytest.raises(RuntimeError):
+                async with client.stream("POST", "/generate") as response:
+                    if response.status_code != 200:
+                        raise RuntimeError(f"Image generation failed with {response.status_code}")
+
+        stats = client.stats()["admission"]
+        assert stats["throttled"] == 3
+        assert stats["limit"] < 8
+        await client.aclose()
+
+    async def test_disabled_without_policy(self, upstream):
+        """Test upstreams without a policy skip admission"""
+        client = UpstreamClient(
+            "plain", UpstreamConfig(base_url="https://plain.test"),
+            transport=httpx.MockTransport(upstream),
+        )
+
+        assert (await client.get("/")).status_code == 200
+        assert client.admission is None
+        assert "admission" not in client.stats()
+        await client.aclose()
@@ -0,0 +1,204 @@
+"""
+Unit tests for backfilling derived clothing columns
+"""
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+from PIL import Image
+
+from app.backfill import backfill_images, backfill_tags, build_analysis_update, build_batch_update
+from app.core.cache import MemoryCacheBackend
+from app.services.color_harmony import NEUTRAL
+from app.services.image_processing import ImageProcessor, analyze_image
+from app.services.perceptual_hash import format_hash
+from app.services.tagging import UNCATEGORIZED, MockTagger, TaggingService
+from app.storage import LocalStorage
+
+
+def make_photo(color, fmt="PNG") -> bytes:
+    image = Image.new("RGB", (120, 160), (250, 250, 250))
+    image.paste(color, (30, 30, 90, 130))
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(base_dir=str(tmp_path))
+
+
+@pytest.fixture
+async def wardrobe(migrated_db, storage):
+    """Unanalysed items: stored photos, a remote one, a missing and a broken one"""
+    await storage.upload("clothing/red.png", make_photo((200, 20, 30)))
+    await storage.upload("clothing/blue.png", make_photo((20, 40, 200)))
+    await storage.upload("clothing/broken.png", b"not an image")
+    items = [
+        ("a-red", "user-123", "/uploads/clothing/red.png"),
+        ("b-blue", "user-456", "/uploads/clothing/blue.png"),
+        ("c-remote", "user-123", "https://cdn.example.com/green.jpg"),
+        ("d-missing", "user-123", "/uploads/clothing/missing.png"),
+        ("e-broken", "user-123", "/uploads/clothing/broken.png"),
+    ]
+    migrated_db.executemany(
+        'INSERT INTO "clothing_items" ("id", "userId", "name", "imageUrl", "category",'
+        ' "updatedAt") VALUES (?, ?, ?, ?, ?, 0)',
+        [(item_id, user_id, item_id, url, "top") for item_id, user_id, url in items],
+    )
+    return migrated_db
+
+
+@pytest.fixture
+def prisma(wardrobe):
+    """Raw queries run against the SQLite wardrobe"""
+    return SimpleNamespace(
+        query_raw=AsyncMock(
+            side_effect=lambda sql, *params: [dict(r) for r in wardrobe.execute(sql, params)]
+        ),
+        execute_raw=AsyncMock(side_effect=lambda sql, *params: wardrobe.execute(sql, params).rowcount),
+    )
+
+
+@pytest.fixture
+def clients():
+    """Upstream registry whose image downloads return a green photo"""
+    client = SimpleNamespace(
+        get=AsyncMock(return_value=httpx.Response(200, content=make_photo((30, 180, 40), "JPEG")))
+    )
+    return SimpleNamespace(get=lambda name: client)
+
+
+@pytest.fixture
+def processor(storage):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield ImageProcessor(storage, executor=executor)
+
+
+def stored(wardrobe):
+    rows = wardrobe.execute(
+        'SELECT "id", "palette", "colorCode", "perceptualHash" FROM "clothing_items" ORDER BY "id"'
+    )
+    return {row["id"]: dict(row) for row in rows}
+
+
+class TestBackfillImages:
+    """Tests for backfill_images()"""
+
+    async def test_backfill(self, prisma, wardrobe, storage, processor, clients):
+        """Test readable photos are analysed and the rest skipped"""
+        counts = await backfill_images(prisma, storage, processor, clients, batch_size=2)
+
+        assert counts == {"analysed": 3, "failed": 2}
+        items = stored(wardrobe)
+        assert [items[i]["colorCode"] for i in ("a-red", "b-blue", "c-remote")] == [0, 8, 4]
+        assert json.loads(items["a-red"]["palette"])[0]["code"] == 0
+        assert items["a-red"]["perceptualHash"] == format_hash(
+            analyze_image(make_photo((200, 20, 30))).perceptual_hash
+        )
+        assert items["d-missing"]["perceptualHash"] is None
+        assert items["e-broken"]["perceptualHash"] is None
+        assert prisma.query_raw.await_count == 4  # three batches and the empty read
+        assert prisma.execute_raw.await_count == 2  # the last batch had nothing to write
+
+    async def test_resumes(self, prisma, wardrobe, storage, processor, clients):
+        """Test a limited run stops early and a later one picks up the rest"""
+        assert await backfill_images(
+            prisma, storage, processor, clients, limit=2
+        ) == {"analysed": 2, "failed": 0}
+        assert stored(wardrobe)["c-remote"]["perceptualHash"] is None
+
+        assert await backfill_images(prisma, storage, processor, clients) == {
+            "analysed": 1, "failed": 2
+        }
+
+    def test_update_statement(self, migrated_db):
+        """Test one statement writes every item of a batch"""
+        migrated_db.executemany(
+            'INSERT INTO "clothing_items" ("id", "userId", "name", "imageUrl", "category",'
+            ' "updatedAt") VALUES (?, ?, ?, ?, ?, 0)',
+            [(i, "user-123", i, "/x.png", "top") for i in ("x", "y", "z")],
+        )
+        analysis = analyze_image(make_photo((128, 128, 128)))
+
+        sql, params = build_analysis_update([("x", analysis), ("z", analysis)])
+        migrated_db.execute(sql, params)
+
+        items = stored(migrated_db)
+        assert items["x"]["colorCode"] == items["z"]["colorCode"] == NEUTRAL
+        assert items["y"]["colorCode"] is None
+
+
+class TestBackfillTags:
+    """Tests for backfill_tags()"""
+
+    @pytest.fixture
+    def tagging(self):
+        return TaggingService(MockTagger(), MemoryCacheBackend(), max_batch=4, window=0.01)
+
+    async def test_backfill(self, prisma, wardrobe, storage, processor, clients, tagging):
+        """Test readable photos are tagged in shared batches and the rest skipped"""
+        wardrobe.execute('UPDATE "clothing_items" SET "color" = ? WHERE "id" = ?', ("Red", "a-red"))
+
+        counts = await backfill_tags(
+            prisma, storage, processor, tagging, clients, batch_size=5, concurrency=5
+        )
+
+        assert counts == {"tagged": 3, "failed": 2}
+        assert tagging.tagger.batches == [3]
+        rows = {
+            row["id"]: dict(row)
+            for row in wardrobe.execute(
+                'SELECT "id", "category", "color", "pattern", "material" FROM "clothing_items"'
+            )
+        }
+        assert all(rows[i]["pattern"] for i in ("a-red", "b-blue", "c-remote"))
+        assert rows["d-missing"]["pattern"] is None
+        # What the user entered is kept
+        assert rows["a-red"]["color"] == "Red"
+        assert rows["b-blue"]["color"] is not None
+        assert {row["category"] for row in rows.values()} == {"top"}
+
+    async def test_tags_cached_by_content(self, prisma, wardrobe, storage, processor, clients, tagging):
+        """Test a photo stored twice is only shown to the model once"""
+        wardrobe.execute(
+            'UPDATE "clothing_items" SET "imageUrl" = ? WHERE "id" = ?',
+            ("/uploads/clothing/red.png", "b-blue"),
+        )
+
+        await backfill_tags(prisma, storage, processor, tagging, clients, batch_size=1)
+
+        assert sum(tagging.tagger.batches) == 2  # red and the remote photo
+
+    def test_fill_only_statement(self, migrated_db):
+        """Test fill-only columns keep values already stored, unless placeholders"""
+        migrated_db.executemany(
+            'INSERT INTO "clothing_items" ("id", "userId", "name", "imageUrl", "category",'
+            ' "color", "updatedAt") VALUES (?, ?, ?, ?, ?, ?, 0)',
+            [
+                ("x", "user-123", "x", "/x.png", "top", "Red"),
+                ("y", "user-123", "y", "/y.png", UNCATEGORIZED, None),
+            ],
+        )
+
+        sql, params = build_batch_update(
+            [
+                ("x", {"category": "dress", "color": "navy", "pattern": "solid"}),
+                ("y", {"category": "shoes", "color": "navy", "pattern": "dotted"}),
+            ],
+            fill_only={"category": UNCATEGORIZED, "color": None},
+        )
+        migrated_db.execute(sql, params)
+
+        rows = {
+            row["id"]: (row["category"], row["color"], row["pattern"])
+            for row in migrated_db.execute(
+                'SELECT "id", "category", "color", "pattern" FROM "clothing_items"'
+            )
+        }
+        assert rows == {"x": ("top", "Red", "solid"), "y": ("shoes", "navy", "dotted")}
@@ -0,0 +1,416 @@
+"""
+Unit tests for bulk wardrobe uploads
+"""
+import asyncio
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from PIL import Image
+
+from app.core.cache import MemoryCacheBackend
+from app.services.bulk_upload import (
+    BulkUploader,
+    BulkUploadError,
+    MemoryBudget,
+    Photo,
+    build_insert,
+    item_name,
+    read_multipart,
+    read_zip,
+)
+from app.services.duplicates import DuplicateIndex
+from app.services.image_processing import ImageProcessor, analyze_image
+from app.services.perceptual_hash import format_hash
+from app.services.tagging import UNCATEGORIZED, MockTagger, TaggingError, TaggingService
+from app.storage import LocalStorage
+
+BOUNDARY = "bulk-boundary"
+
+
+def make_photo(color, fmt="PNG") -> bytes:
+    image = Image.new("RGB", (120, 160), (250, 250, 250))
+    image.paste(color, (30, 30, 90, 130))
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def multipart_body(files, fields=()) -> bytes:
+    """``multipart/form-data`` body with (filename, content) files and (name, value) fields"""
+    body = b""
+    for name, value in fields:
+        body += (
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n"
+        ).encode()
+    for filename, content in files:
+        body += (
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="files"; '
+            f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+        ).encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def zip_body(members) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members:
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+async def chunked(body: bytes, size: int = 1000):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+async def collect(photos):
+    return [photo async for photo in photos]
+
+
+def read_form(body, budget, max_size=10**6, max_files=10):
+    return read_multipart(
+        chunked(body, 7), f"multipart/form-data; boundary={BOUNDARY}", budget, max_size, max_files
+    )
+
+
+class TestMemoryBudget:
+    """Tests for MemoryBudget"""
+
+    async def test_waits_for_release(self):
+        """Test acquiring past the limit waits until enough is released"""
+        budget = MemoryBudget(100)
+        await budget.acquire(60)
+
+        waiting = asyncio.create_task(budget.acquire(50))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+
+        await budget.release(20)
+        await asyncio.wait_for(waiting, timeout=1)
+        assert budget.held == 90
+        assert budget.peak == 90
+
+    async def test_larger_than_budget(self):
+        """Test a request for more than the whole budget fails instead of waiting"""
+        with pytest.raises(ValueError):
+            await MemoryBudget(100).acquire(101)
+
+
+class TestReadMultipart:
+    """Tests for read_multipart()"""
+
+    async def test_file_parts(self):
+        """Test every file part is a photo and other fields are ignored"""
+        red, blue = make_photo((200, 20, 30)), make_photo((20, 40, 200))
+        budget = MemoryBudget(10**6)
+
+        photos = await collect(
+            read_form(multipart_body([("red.png", red), ("blue.png", blue)], [("note", "hi")]), budget)
+        )
+
+        assert photos == [Photo(0, "red.png", red), Photo(1, "blue.png", blue)]
+        assert budget.held == len(red) + len(blue)
+
+    async def test_rejected_parts(self):
+        """Test oversized parts and parts past the limit are not buffered"""
+        small, large = b"s" * 10, b"L" * 100
+        budget = MemoryBudget(10**6)
+        body = multipart_body([("large", large), ("small", small), ("extra", small)])
+
+        photos = await collect(read_form(body, budget, max_size=50, max_files=2))
+
+        assert [(p.filename, p.content, p.error is None) for p in photos] == [
+            ("large", b"", False), ("small", small, True), ("extra", b"", False),
+        ]
+        assert "maximum size" in photos[0].error
+        assert "Only 2 photos" in photos[2].error
+        assert budget.held == len(small)
+
+    async def test_backpressure(self):
+        """Test reading pauses while the budget is spent"""
+        first, second = b"1" * 600, b"2" * 600
+        budget = MemoryBudget(1000)
+        photos = read_form(multipart_body([("a", first), ("b", second)]), budget)
+
+        assert (await anext(photos)).content == first
+        pending = asyncio.ensure_future(anext(photos))
+        await asyncio.sleep(0.01)
+        assert not pending.done()
+        assert budget.held <= 1000
+
+        await budget.release(len(first))
+        assert (await asyncio.wait_for(pending, timeout=1)).content == second
+
+    async def test_missing_boundary(self):
+        """Test a multipart content type without boundary is rejected"""
+        photos = read_multipart(chunked(b""), "multipart/form-data", MemoryBudget(10), 10, 1)
+
+        with pytest.raises(BulkUploadError):
+            await collect(photos)
+
+    async def test_truncated(self):
+        """Test a body ending in the middle of a photo is an error"""
+        body = multipart_body([("a", b"x" * 100)])[:-60]
+
+        with pytest.raises(BulkUploadError):
+            await collect(read_form(body, MemoryBudget(10**6)))
+
+
+class TestReadZip:
+    """Tests for read_zip()"""
+
+    async def test_members(self):
+        """Test photos are read and folders, hidden files and resource forks skipped"""
+        red = make_photo((200, 20, 30))
+        body = zip_body([
+            ("shirts/", b""),
+            ("shirts/red.png", red),
+            ("shirts/.DS_Store", b"junk"),
+            ("__MACOSX/shirts/._red.png", b"junk"),
+            ("huge.png", b"x" * (len(red) + 1)),
+            ("blue.png", red),
+        ])
+        budget = MemoryBudget(10**6)
+
+        photos = await collect(read_zip(chunked(body), budget, max_size=len(red), max_files=2))
+
+        assert [(p.index, p.filename, p.error is None) for p in photos] == [
+            (0, "shirts/red.png", True), (1, "huge.png", False), (2, "blue.png", False),
+        ]
+        assert photos[0].content == red
+        assert budget.held == len(red)
+
+    async def test_not_a_zip(self):
+        """Test a body that is not a zip archive is rejected"""
+        with pytest.raises(BulkUploadError):
+            await collect(read_zip(chunked(b"not a zip"), MemoryBudget(10), 10, 1))
+
+
+def test_item_name():
+    """Test items are named after their photo's file name"""
+    assert item_name("shirts/Blue Oxford.jpg", 0) == "Blue Oxford"
+    assert item_name("C:\\Photos\\IMG_0001.JPG", 0) == "IMG_0001"
+    assert item_name("", 4) == "Item 5"
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(base_dir=str(tmp_path))
+
+
+@pytest.fixture
+def prisma(migrated_db):
+    """Raw queries run against the migrated SQLite database"""
+    return SimpleNamespace(
+        query_raw=AsyncMock(
+            side_effect=lambda sql, *params: [dict(r) for r in migrated_db.execute(sql, params)]
+        ),
+        execute_raw=AsyncMock(
+            side_effect=lambda sql, *params: migrated_db.execute(sql, params).rowcount
+        ),
+    )
+
+
+@pytest.fixture
+def tagging():
+    return TaggingService(MockTagger(), MemoryCacheBackend(), max_batch=8, window=0.01)
+
+
+@pytest.fixture
+def uploader(prisma, storage, tagging):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield BulkUploader(
+            prisma,
+            ImageProcessor(storage, executor=executor),
+            tagging,
+            DuplicateIndex(SimpleNamespace(get_client=AsyncMock(return_value=prisma))),
+            concurrency=3,
+        )
+
+
+async def charged(budget, photos):
+    """Photos charged to a budget, as the readers hand them over"""
+    for photo in photos:
+        await budget.acquire(len(photo.content))
+        yield photo
+
+
+def stored_items(conn):
+    return {row["name"]: dict(row) for row in conn.execute('SELECT * FROM "clothing_items"')}
+
+
+COLORS = [(200, 20, 30), (20, 40, 200), (30, 180, 40), (240, 200, 20), (120, 40, 160)]
+
+
+class TestBulkUploader:
+    """Tests for BulkUploader"""
+
+    async def test_pipeline(self, uploader, migrated_db, storage, tagging):
+        """Test photos are stored, tagged and inserted, and failures reported"""
+        photos = [Photo(i, f"photo-{i}.png", make_photo(color)) for i, color in enumerate(COLORS)]
+        gif = io.BytesIO()
+        Image.new("RGB", (10, 10)).save(gif, "GIF")
+        photos += [
+            Photo(5, "notes.txt", b"not an image"),
+            Photo(6, "anim.gif", gif.getvalue()),
+            Photo(7, "huge.png", error="File exceeds maximum size of 10 bytes"),
+        ]
+        budget = MemoryBudget(10**6)
+
+        results = [r async for r in uploader.run("user-123", charged(budget, photos), budget)]
+
+        assert sorted(r.index for r in results) == list(range(8))
+        created = {r.index: r for r in results if r.status == "created"}
+        assert sorted(created) == [0, 1, 2, 3, 4]
+        failed = {r.index: r.error for r in results if r.status == "failed"}
+        assert "supported image" in failed[5]
+        assert "GIF" in failed[6]
+        assert "maximum size" in failed[7]
+
+        items = stored_items(migrated_db)
+        assert sorted(items) == [f"photo-{i}" for i in range(5)]
+        red = items["photo-0"]
+        assert red["id"] == created[0].id
+        assert red["userId"] == "user-123"
+        assert red["category"] == created[0].category
+        assert red["pattern"] == created[0].pattern and created[0].tagged
+        assert red["colorCode"] == 0
+        assert red["perceptualHash"] == format_hash(analyze_image(photos[0].content).perceptual_hash)
+        assert await storage.exists(red["imageUrl"].removeprefix("/uploads/"))
+        assert await storage.exists(f"derived/thumbnail/{red['imageUrl'].removeprefix('/uploads/')}.webp")
+
+        assert budget.held == 0
+        assert sum(tagging.tagger.batches) == 5
+        assert len(tagging.tagger.batches) < 5
+
+    async def test_batched_inserts(self, uploader, prisma, migrated_db):
+        """Test rows that are ready together are written in one statement"""
+        insert = prisma.execute_raw.side_effect
+
+        async def slow_insert(sql, *params):
+            await asyncio.sleep(0.2)
+            return insert(sql, *params)
+
+        prisma.execute_raw.side_effect = slow_insert
+        photos = [Photo(i, f"{i}.png", make_photo(color)) for i, color in enumerate(COLORS)]
+        budget = MemoryBudget(10**6)
+
+        results = [r async for r in uploader.run("user-123", charged(budget, photos), budget)]
+
+        assert all(r.status == "created" for r in results)
+        assert len(stored_items(migrated_db)) == 5
+        assert prisma.execute_raw.await_count < 5
+
+    async def test_concurrency(self, uploader):
+        """Test no more than ``concurrency`` photos are processed at once"""
+        running = peak = 0
+        prepare = uploader.processor.prepare
+
+        async def counted(content):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            try:
+                await asyncio.sleep(0.02)
+                return await prepare(content)
+            finally:
+                running -= 1
+
+        uploader.processor.prepare = counted
+        photos = [Photo(i, f"{i}.png", make_photo(COLORS[i % 5])) for i in range(8)]
+        budget = MemoryBudget(10**6)
+
+        results = [r async for r in uploader.run("user-123", charged(budget, photos), budget)]
+
+        assert len(results) == 8
+        assert peak == 3
+
+    async def test_tagging_unavailable(self, uploader, tagging, migrated_db):
+        """Test photos are kept uncategorized, or in the given category, when tagging fails"""
+        tagging.tagger.tag_batch = AsyncMock(side_effect=TaggingError("Tagging is busy"))
+        budget = MemoryBudget(10**6)
+
+        results = [
+            r async for r in uploader.run(
+                "user-123", charged(budget, [Photo(0, "a.png", make_photo(COLORS[0]))]), budget
+            )
+        ] + [
+            r async for r in uploader.run(
+                "user-123", charged(budget, [Photo(0, "b.png", make_photo(COLORS[1]))]), budget, "shoes"
+            )
+        ]
+
+        assert [(r.status, r.tagged, r.category) for r in results] == [
+            ("created", False, UNCATEGORIZED), ("created", False, "shoes"),
+        ]
+        items = stored_items(migrated_db)
+        assert items["a"]["category"] == UNCATEGORIZED
+        assert items["a"]["pattern"] is None  # left for the tagging backfill
+
+    async def test_insert_failure(self, uploader, prisma, storage):
+        """Test photos whose rows cannot be written are reported and removed"""
+        prisma.execute_raw.side_effect = RuntimeError("database is locked")
+        budget = MemoryBudget(10**6)
+
+        results = [
+            r async for r in uploader.run(
+                "user-123", charged(budget, [Photo(0, "a.png", make_photo(COLORS[0]))]), budget
+            )
+        ]
+
+        assert [(r.status, r.error) for r in results] == [("failed", "Could not save the item")]
+        assert not any(storage.base_dir.glob("**/*.png"))
+
+    async def test_duplicates(self, uploader):
+        """Test photos that look like items already stored are flagged"""
+        photo = make_photo(COLORS[0])
+        budget = MemoryBudget(10**6)
+
+        first = [r async for r in uploader.run("user-123", charged(budget, [Photo(0, "a.png", photo)]), budget)]
+        again = [r async for r in uploader.run("user-123", charged(budget, [Photo(0, "b.png", photo)]), budget)]
+        other = [r async for r in uploader.run("user-456", charged(budget, [Photo(0, "c.png", photo)]), budget)]
+
+        assert first[0].duplicates == []
+        assert again[0].duplicates == [first[0].id]
+        assert other[0].duplicates == []
+
+    async def test_read_error(self, uploader, migrated_db):
+        """Test photos read before the upload broke off are still stored"""
+        budget = MemoryBudget(10**6)
+
+        async def broken():
+            photo = Photo(0, "a.png", make_photo(COLORS[0]))
+            await budget.acquire(len(photo.content))
+            yield photo
+            raise BulkUploadError("Multipart body ended in the middle of a photo")
+
+        results = []
+        with pytest.raises(BulkUploadError):
+            async for result in uploader.run("user-123", broken(), budget):
+                results.append(result)
+
+        assert [r.status for r in results] == ["created"]
+        assert list(stored_items(migrated_db)) == ["a"]
+
+
+def test_build_insert(migrated_db):
+    """Test one statement inserts every row"""
+    rows = [
+        {
+            "id": f"item-{i}", "userId": "user-123", "name": f"Item {i}", "imageUrl": f"/{i}.png",
+            "category": "top", "color": "red", "pattern": "solid", "material": None,
+            "season": None, "palette": "[]", "colorCode": 0, "perceptualHash": "00",
+            "createdAt": 1, "updatedAt": 1,
+        }
+        for i in range(3)
+    ]
+
+    sql, params = build_insert(rows)
+    migrated_db.execute(sql, params)
+
+    assert sorted(stored_items(migrated_db)) == ["Item 0", "Item 1", "Item 2"]
@@ -0,0 +1,505 @@
+"""
+Unit tests for in-process caches
+"""
+import time
+import pytest
+from app.core.cache import TTLCache
+from app.core.security import SessionCache
+
+
+class TestTTLCache:
+    """Tests for the bounded TTL/LRU cache"""
+
+    def test_get_and_set(self):
+        """Test basic storage and hit/miss counting"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+        assert cache.stats()["evictions"] == 1
+
+    def test_expiry(self):
+        """Test entries expire after their TTL"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1, ttl=0.01)
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+        assert len(cache) == 0
+
+    def test_ttl_capped_by_default(self):
+        """Test a per-entry TTL cannot exceed the cache TTL"""
+        cache = TTLCache(maxsize=10, ttl=0.01)
+        cache.set("a", 1, ttl=3600)
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
+
+    def test_non_positive_ttl_not_stored(self):
+        """Test already-expired entries are not stored"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+        cache.set("a", 2, ttl=-5)
+
+        assert "a" not in cache
+
+    def test_invalid_maxsize(self):
+        """Test maxsize must be positive"""
+        with pytest.raises(ValueError):
+            TTLCache(maxsize=0)
+
+
+class TestSessionCache:
+    """Tests for the verified-session cache"""
+
+    def test_keyed_by_token_hash(self):
+        """Test raw tokens are not used as keys"""
+        cache = SessionCache()
+        cache.set_valid("secret-token", {"id": "user-123"})
+
+        assert "secret-token" not in cache._cache._data
+        assert cache.get("secret-token") == (True, {"id": "user-123"})
+
+    def test_expires_with_token(self):
+        """Test entries do not outlive the token"""
+        cache = SessionCache(ttl=300)
+        cache.set_valid("token", {"id": "user-123"}, expires_at=time.time() + 0.01)
+        time.sleep(0.02)
+
+        assert cache.get("token") is None
+
+    def test_expired_token_not_cached(self):
+        """Test tokens past expiry are not stored"""
+        cache = SessionCache(ttl=300)
+        cache.set_valid("token", {"id": "user-123"}, expires_at=time.time() - 1)
+
+        assert cache.get("token") is None
+
+    def test_negative_entries(self):
+        """Test rejected tokens use the short negative TTL"""
+        cache = SessionCache(ttl=300, negative_ttl=0.01)
+        cache.set_invalid("token", "Invalid or expired session")
+
+        assert cache.get("token") == (False, "Invalid or expired session")
+        time.sleep(0.02)
+        assert cache.get("token") is None
+
+    def test_invalidate(self):
+        """Test invalidation removes an entry"""
+        cache = SessionCache()
+        cache.set_valid("token", {"id": "user-123"})
+        cache.invalidate("token")
+
+        assert cache.get("token") is None
+
+
+class TestRedisClient:
+    """Tests for the RESP client against a local stand-in server"""
+
+    async def test_get_set_delete(self, redis_server):
+        """Test basic commands round trip"""
+        from app.core.redis import RedisClient
+
+        client = RedisClient(redis_server.url)
+        await client.set("key", b"value")
+
+        assert await client.get("key") == b"value"
+        assert await client.delete("key") == 1
+        assert await client.get("key") is None
+        await client.close()
+
+    async def test_ttl(self, redis_server):
+        """Test SET with a TTL expires"""
+        import asyncio
+        from app.core.redis import RedisClient
+
+        client = RedisClient(redis_server.url)
+        await client.set("key", b"value", ttl=0.01)
+        await asyncio.sleep(0.02)
+
+        assert await client.get("key") is None
+        await client.close()
+
+    async def test_error_reply(self, redis_server):
+        """Test error replies raise RedisError and keep the connection"""
+        from app.core.redis import RedisClient, RedisError
+
+        client = RedisClient(redis_server.url)
+        with pytest.raises(RedisError):
+            await client.execute("BOGUS")
+
+        assert await client.incr("counter") == 1
+        await client.close()
+
+    def test_parse_redis_url(self):
+        """Test URL parsing"""
+        from app.core.redis import parse_redis_url
+
+        assert parse_redis_url("redis://:secret@cache:6380/2") == ("cache", 6380, 2, None, "secret")
+        assert parse_redis_url("redis://localhost") == ("localhost", 6379, 0, None, None)
+        with pytest.raises(ValueError):
+            parse_redis_url("http://localhost")
+
+
+class TestCacheBackends:
+    """Tests for the pluggable cache backends"""
+
+    async def test_memory_backend_returns_same_object(self):
+        """Test the in-process backend stores objects without encoding"""
+        from app.core.cache import MemoryCacheBackend
+
+        backend = MemoryCacheBackend(maxsize=10, ttl=60)
+        value = {"decoded": True}
+        await backend.set("key", value)
+
+        assert await backend.get("key") is value
+
+    async def test_redis_backend_round_trips_models(self, redis_server):
+        """Test models are serialized through the Redis protocol"""
+        from app.api.endpoints.profiles import ProfileResponse
+        from app.core.cache import RedisCacheBackend
+        from app.core.redis import RedisClient
+
+        backend = RedisCacheBackend(
+            RedisClient(redis_server.url),
+            namespace="profile",
+            encode=lambda m: m.model_dump_json().encode(),
+            decode=ProfileResponse.model_validate_json,
+            ttl=60,
+        )
+        profile = ProfileResponse(
+            id="profile-123", userId="user-123", height=170, weight=None,
+            primaryStyle="casual", secondaryStyle=None, occasions=["work"],
+            createdAt="2026-01-01T00:00:00", updatedAt="2026-01-01T00:00:00",
+        )
+        await backend.set("user-123", profile)
+
+        assert b"profile:user-123" in redis_server.store
+        assert await backend.get("user-123") == profile
+
+        await backend.delete("user-123")
+        assert await backend.get("user-123") is None
+        assert backend.stats()["hits"] == 1
+
+    async def test_redis_backend_outage_is_a_miss(self):
+        """Test an unreachable server degrades to cache misses"""
+        from app.core.cache import RedisCacheBackend
+        from app.core.redis import RedisClient
+
+        backend = RedisCacheBackend(
+            RedisClient("redis://127.0.0.1:1/0", timeout=0.2),
+            namespace="profile", encode=str.encode, decode=bytes.decode,
+        )
+        await backend.set("key", "value")
+
+        assert await backend.get("key") is None
+        assert backend.stats()["errors"] == 2
+
+
+class TestProfileCache:
+    """Tests for the read-through profile cache"""
+
+    async def test_concurrent_misses_load_once(self):
+        """Test simultaneous misses share one load"""
+        import asyncio
+        from app.core.cache import MemoryCacheBackend
+        from app.services.cache_service import ProfileCache
+
+        cache = ProfileCache(MemoryCacheBackend())
+        loads = 0
+
+        async def loader():
+            nonlocal loads
+            loads += 1
+            await asyncio.sleep(0.01)
+            return "profile"
+
+        results = await asyncio.gather(
+            *(cache.get_or_load("user-123", loader) for _ in range(5))
+        )
+
+        assert results == ["profile"] * 5
+        assert loads == 1
+        assert await cache.get("user-123") == "profile"
+
+    async def test_invalidate_during_load_discards_stale_result(self):
+        """Test a load racing an update does not repopulate stale data"""
+        import asyncio
+        from app.core.cache import MemoryCacheBackend
+        from app.services.cache_service import ProfileCache
+
+        cache = ProfileCache(MemoryCacheBackend())
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def loader():
+            started.set()
+            await release.wait()
+            return "stale"
+
+        load = asyncio.create_task(cache.get_or_load("user-123", loader))
+        await started.wait()
+        await cache.invalidate("user-123")
+        release.set()
+
+        assert await load == "stale"
+        assert await cache.get("user-123") is None
+
+    async def test_no_state_kept_per_user(self):
+        """Test invalidations and finished loads leave nothing behind"""
+        from unittest.mock import AsyncMock
+        from app.core.cache import MemoryCacheBackend
+        from app.services.cache_service import ProfileCache
+
+        cache = ProfileCache(MemoryCacheBackend())
+
+        for i in range(100):
+            await cache.invalidate(f"user-{i}")
+        await cache.get_or_load("user-1", AsyncMock(return_value="profile"))
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load("user-2", AsyncMock(side_effect=RuntimeError("db down")))
+
+        assert cache._loading == {}
+        assert await cache.get("user-1") == "profile"
+
+    async def test_redis_backed_profile_cache(self, redis_server, monkeypatch):
+        """Test the profile cache works end to end on the Redis backend"""
+        from app.api.endpoints.profiles import ProfileResponse
+        from app.core.config import settings
+        from app.services import cache_service
+
+        monkeypatch.setattr(settings, "cache_backend", "redis")
+        monkeypatch.setattr(settings, "redis_url", redis_server.url)
+        monkeypatch.setattr(cache_service, "_redis_client", None)
+        cache = cache_service.ProfileCache(
+            cache_service.create_cache_backend("profile", ProfileResponse, 10, 60)
+        )
+        profile = ProfileResponse(
+            id="profile-123", userId="user-123", height=None, weight=None,
+            primaryStyle=None, secondaryStyle=None, occasions=None,
+            createdAt="2026-01-01T00:00:00", updatedAt="2026-01-01T00:00:00",
+        )
+
+        async def loader():
+            return profile
+
+        assert await cache.get_or_load("user-123", loader) == profile
+        assert await cache.get("user-123") == profile
+        await cache_service.close_redis_client()
+
+
+class FakeOutfitDatabase:
+    """In-memory stand-in for the tables OutfitCache touches"""
+
+    def __init__(self):
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+
+        self.users = {"user-123": SimpleNamespace(id="user-123", outfitCacheGeneration=0)}
+        self.items = {"top": "user-123", "jeans": "user-123", "shoes": "user-123"}
+        self.outfits = []
+        self.prisma = SimpleNamespace(
+            user=SimpleNamespace(
+                find_unique=AsyncMock(side_effect=self._find_user),
+                update=AsyncMock(side_effect=self._update_user),
+            ),
+            outfit=SimpleNamespace(
+                find_first=AsyncMock(side_effect=self._find_outfit),
+                update=AsyncMock(side_effect=self._update_outfit),
+            ),
+            clothingitem=SimpleNamespace(count=AsyncMock(side_effect=self._count_items)),
+        )
+
+    async def get_client(self):
+        return self.prisma
+
+    def add_outfit(self, item_ids, occasion="work"):
+        from types import SimpleNamespace
+
+        outfit = SimpleNamespace(
+            id=f"outfit-{len(self.outfits)}", userId="user-123", name="Look",
+            imageUrl="/uploads/look.png", occasion=occasion, cacheKey=None,
+            cacheGeneration=None, created=len(self.outfits),
+            clothingItems=[SimpleNamespace(clothingItemId=i) for i in item_ids],
+        )
+        self.outfits.append(outfit)
+        return outfit
+
+    def delete_item(self, item_id):
+        del self.items[item_id]
+        for outfit in self.outfits:  # ON DELETE CASCADE
+            outfit.clothingItems = [link for link in outfit.clothingItems if link.clothingItemId != item_id]
+
+    def _find_user(self, where):
+        return self.users.get(where["id"])
+
+    def _update_user(self, where, data):
+        user = self.users.get(where["id"])
+        if user is not None:
+            user.outfitCacheGeneration += data["outfitCacheGeneration"]["increment"]
+        return user
+
+    def _find_outfit(self, where, include, order):
+        matches = [o for o in self.outfits if o.cacheKey == where["cacheKey"]]
+        return max(matches, key=lambda o: o.created, default=None)
+
+    def _update_outfit(self, where, data):
+        outfit = next(o for o in self.outfits if o.id == where["id"])
+        for field, value in data.items():
+            setattr(outfit, field, value)
+        return outfit
+
+    def _count_items(self, where):
+        return sum(
+            1 for i in where["id"]["in"] if self.items.get(i) == where["userId"]
+        )
+
+
+class TestOutfitCache:
+    """Tests for the two-tier outfit generation cache"""
+
+    @pytest.fixture
+    def outfit_db(self):
+        return FakeOutfitDatabase()
+
+    @pytest.fixture
+    def cache(self, outfit_db):
+        from app.services.cache_service import OutfitCache
+
+        return OutfitCache(outfit_db, generation_ttl=60)
+
+    def test_cache_key(self):
+        """Test keys ignore item order and duplicates but not occasion"""
+        from app.services.cache_service import outfit_cache_key
+
+        key = outfit_cache_key("user-123", ["b", "a"], "work")
+
+        assert key == outfit_cache_key("user-123", ["a", "b", "a"], "work")
+        assert key != outfit_cache_key("user-123", ["a", "b"], "date")
+        assert key != outfit_cache_key("user-456", ["a", "b"], "work")
+        assert len(key) == 64
+
+    async def test_set_then_get_from_memory(self, cache, outfit_db):
+        """Test a stored outfit is served from memory without loading its row"""
+        from app.services.cache_service import outfit_cache_key
+
+        key = outfit_cache_key("user-123", ["top", "jeans"], "work")
+        await cache.set(key, outfit_db.add_outfit(["top", "jeans"]))
+
+        cached = await cache.get(key)
+
+        assert cached.id == "outfit-0"
+        assert cached.clothingItemIds == ["jeans", "top"]
+        assert outfit_db.outfits[0].cacheKey == key
+        outfit_db.prisma.outfit.find_first.assert_not_called()
+        assert outfit_db.prisma.clothingitem.count.await_count == 1
+        assert cache.stats()["memory_hits"] == 1
+        assert cache.stats()["saved_generations"] == 1
+
+    async def test_get_from_database(self, cache, outfit_db):
+        """Test rows written by another process are found and validated"""
+        from app.services.cache_service import outfit_cache_key
+
+        key = outfit_cache_key("user-123", ["top", "jeans"], "work")
+        outfit = outfit_db.add_outfit(["top", "jeans"])
+        outfit.cacheKey, outfit.cacheGeneration = key, 0
+
+        assert (await cache.get(key)).id == "outfit-0"
+        assert (await cache.get(key)).id == "outfit-0"
+        assert outfit_db.prisma.outfit.find_first.await_count == 1
+        assert outfit_db.prisma.clothingitem.count.await_count == 2
+        assert cache.stats()["db_hits"] == 1
+        assert cache.stats()["memory_hits"] == 1
+
+    async def test_miss(self, cache):
+        """Test unknown keys are misses"""
+        assert await cache.get("unknown") is None
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["hit_rate"] == 0.0
+
+    async def test_invalidate_user(self, cache, outfit_db):
+        """Test invalidation is one counter increment that hides every entry"""
+        from app.services.cache_service import outfit_cache_key
+
+        keys = []
+        for items in (["top", "jeans"], ["top", "shoes"]):
+            keys.append(outfit_cache_key("user-123", items, "work"))
+            await cache.set(keys[-1], outfit_db.add_outfit(items))
+
+        await cache.invalidate_user("user-123")
+
+        assert outfit_db.prisma.user.update.await_count == 1
+        assert outfit_db.prisma.outfit.update.await_count == 2  # only the two sets
+        assert [await cache.get(key) for key in keys] == [None, None]
+        assert cache.stats()["stale"] == 2
+
+    async def test_set_with_outdated_generation(self, cache, outfit_db):
+        """Test an outfit generated before an invalidation is not served"""
+        from app.services.cache_service import outfit_cache_key
+
+        key = outfit_cache_key("user-123", ["top", "jeans"], "work")
+        generation = await cache.generation("user-123")
+        await cache.invalidate_user("user-123")  # wardrobe changed mid-generation
+
+        await cache.set(key, outfit_db.add_outfit(["top", "jeans"]), generation=generation)
+
+        assert await cache.get(key) is None
+
+    async def test_deleted_item_invalidates(self, cache, outfit_db):
+        """Test a row whose items were deleted is not served"""
+        from app.services.cache_service import outfit_cache_key
+
+        key = outfit_cache_key("user-123", ["top", "jeans"], "work")
+        outfit = outfit_db.add_outfit(["top", "jeans"])
+        outfit.cacheKey, outfit.cacheGeneration = key, 0
+        outfit_db.delete_item("jeans")
+
+        assert await cache.get(key) is None
+        assert cache.stats()["invalid"] == 1
+
+    async def test_deleted_item_invalidates_memory_entry(self, cache, outfit_db):
+        """Test an outfit held in memory is dropped once its items are deleted"""
+        from app.services.cache_service import outfit_cache_key
+
+        key = outfit_cache_key("user-123", ["top", "jeans"], "work")
+        await cache.set(key, outfit_db.add_outfit(["top", "jeans"]))
+        assert (await cache.get(key)).id == "outfit-0"
+
+        outfit_db.delete_item("jeans")
+
+        assert await cache.get(key) is None
+        assert len(cache._local) == 0
+        assert cache.stats()["memory_hits"] == 1
+        assert cache.stats()["invalid"] == 1
+
+    async def test_is_valid_checks_items_in_one_query(self, cache, outfit_db):
+        """Test item existence is checked with a single bulk query"""
+        from app.services.cache_service import CachedOutfit, outfit_cache_key
+
+        ids = ["jeans", "shoes", "top"]
+        cached = CachedOutfit(
+            id="outfit-0", userId="user-123", name="Look", imageUrl=None, occasion="work",
+            clothingItemIds=ids, cacheKey=outfit_cache_key("user-123", ids, "work"),
+            generation=0,
+        )
+
+        assert await cache.is_valid(cached)
+        del outfit_db.items["shoes"]
+        assert not await cache.is_valid(cached)
+        assert outfit_db.prisma.clothingitem.count.await_count == 2
@@ -0,0 +1,331 @@
+"""
+Unit tests for the wardrobe listing endpoint
+"""
+import io
+import json
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.api.deps import get_current_user, get_db
+from app.api.endpoints import clothing
+from app.api.endpoints.clothing import build_clothing_query, decode_cursor, encode_cursor
+from app.core.cache import MemoryCacheBackend
+from app.main import app
+from app.services.bulk_upload import BulkUploader
+from app.services.duplicates import DuplicateIndex
+from app.services.image_processing import ImageProcessor
+from app.services.perceptual_hash import format_hash
+from app.services.tagging import MockTagger, TaggingService
+from app.storage import LocalStorage
+
+BASE_TIME = 1_760_000_000_000  # Prisma stores SQLite DateTimes as epoch milliseconds
+
+
+@pytest.fixture
+def wardrobe(migrated_db):
+    """SQLite database built from the migrations, with a user's items"""
+    conn = migrated_db
+    items = []
+    for n in range(25):
+        items.append((
+            f"item-{n:02d}",
+            "user-123",
+            f"Item {n}",
+            f"/uploads/{n}.png",
+            ("top", "bottom", "shoes")[n % 3],
+            ("red", "blue")[n % 2],
+            "summer" if n % 5 == 0 else None,
+            json.dumps(["work", "casual"] if n % 4 == 0 else ["casual"]),
+            BASE_TIME + n // 3 * 1000,  # items created in the same second tie on createdAt
+        ))
+    items.append(("other-1", "user-456", "Other", "/o.png", "top", "red", None, None, BASE_TIME))
+    conn.executemany(
+        'INSERT INTO "clothing_items" ("id", "userId", "name", "imageUrl", "category", "color",'
+        ' "season", "tags", "createdAt", "updatedAt") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)',
+        items,
+    )
+    return conn
+
+
+def run(conn, sql, params):
+    return [dict(row) for row in conn.execute(sql, params)]
+
+
+@pytest.fixture
+def client(mock_prisma, wardrobe):
+    """Test client whose raw queries run against the SQLite wardrobe"""
+    mock_prisma.query_raw = AsyncMock(side_effect=lambda sql, *params: run(wardrobe, sql, params))
+    app.dependency_overrides[get_current_user] = lambda: {"id": "user-123"}
+    app.dependency_overrides[get_db] = lambda: mock_prisma
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_current_user, None)
+    app.dependency_overrides.pop(get_db, None)
+
+
+def all_pages(client, **params):
+    """Follow nextCursor to the end, returning the pages"""
+    pages = []
+    cursor = None
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        response = client.get("/api/clothing/", params=query)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = pages[-1]["nextCursor"]
+        if cursor is None:
+            return pages
+
+
+class TestCursor:
+    """Tests for cursor encoding"""
+
+    def test_round_trip(self):
+        """Test cursors decode to what was encoded"""
+        assert decode_cursor(encode_cursor(("1760000000000", "item-01"))) == (
+            "1760000000000", "item-01"
+        )
+
+    @pytest.mark.parametrize("token", ["???", "bm90IGpzb24", encode_cursor([1, 2])])
+    def test_invalid(self, token):
+        """Test malformed cursors raise ValueError"""
+        with pytest.raises(ValueError):
+            decode_cursor(token)
+
+
+class TestListClothing:
+    """Tests for GET /api/clothing"""
+
+    def test_pages_cover_wardrobe_once(self, client):
+        """Test paging visits every item once, newest first, across createdAt ties"""
+        pages = all_pages(client, limit=4)
+
+        ids = [item["id"] for page in pages for item in page["items"]]
+        assert len(pages) == 7
+        assert ids == [f"item-{n:02d}" for n in reversed(range(25))]
+
+    def test_filters(self, client):
+        """Test filters combine and tags match whole elements"""
+        items = [
+            item
+            for page in all_pages(client, category="top", tag="work", limit=2)
+            for item in page["items"]
+        ]
+
+        assert [item["id"] for item in items] == ["item-24", "item-12", "item-00"]
+        assert all(item["category"] == "top" and "work" in item["tags"] for item in items)
+        assert all_pages(client, tag="wor")[0]["items"] == []
+
+    def test_response_fields(self, client, mock_prisma):
+        """Test only the listed columns are selected and returned"""
+        item = client.get("/api/clothing/", params={"limit": 1}).json()["items"][0]
+
+        assert item == {
+            "id": "item-24",
+            "name": "Item 24",
+            "imageUrl": "/uploads/24.png",
+            "category": "top",
+            "color": "red",
+            "brand": None,
+            "season": None,
+            "tags": ["work", "casual"],
+            "createdAt": str(BASE_TIME + 8000),
+        }
+        sql = mock_prisma.query_raw.call_args.args[0]
+        assert '"description"' not in sql and "*" not in sql
+
+    def test_other_users_items_hidden(self, client):
+        """Test only the current user's items are listed"""
+        ids = [item["id"] for page in all_pages(client) for item in page["items"]]
+
+        assert "other-1" not in ids
+
+    @pytest.mark.parametrize("params", [{"cursor": "not-a-cursor"}, {"limit": 0}, {"limit": 101}])
+    def test_bad_request(self, client, params):
+        """Test invalid cursors and limits are rejected"""
+        response = client.get("/api/clothing/", params=params)
+
+        assert response.status_code in (400, 422)
+
+
+class TestListDuplicates:
+    """Tests for GET /api/clothing/{id}/duplicates"""
+
+    @pytest.fixture(autouse=True)
+    def hashes(self, wardrobe, mock_prisma, monkeypatch):
+        """Hash a few photos and index them from the SQLite wardrobe"""
+        for item_id, value in [
+            ("item-00", 0xF0F0), ("item-01", 0xF0F1), ("item-02", 0xF0F3), ("item-03", 0x0F0F),
+        ]:
+            wardrobe.execute(
+                'UPDATE "clothing_items" SET "perceptualHash" = ? WHERE "id" = ?',
+                (format_hash(value), item_id),
+            )
+        wardrobe.execute(
+            'UPDATE "clothing_items" SET "perceptualHash" = ? WHERE "id" = ?',
+            (format_hash(0xF0F0), "other-1"),
+        )
+        database = SimpleNamespace(get_client=AsyncMock(return_value=mock_prisma))
+        monkeypatch.setattr(clothing.duplicates, "duplicate_index", DuplicateIndex(database, radius=4))
+
+    def test_near_duplicates(self, client):
+        """Test the user's look-alike photos are listed nearest first"""
+        response = client.get("/api/clothing/item-00/duplicates")
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "items": [{"id": "item-01", "distance": 1}, {"id": "item-02", "distance": 2}]
+        }
+
+    def test_unhashed_item(self, client):
+        """Test items without a hash have no duplicates"""
+        assert client.get("/api/clothing/item-10/duplicates").json() == {"items": []}
+
+    @pytest.mark.parametrize("item_id", ["missing", "other-1"])
+    def test_not_found(self, client, item_id):
+        """Test unknown and other users' items are not found"""
+        assert client.get(f"/api/clothing/{item_id}/duplicates").status_code == 404
+
+
+def parse_events(text):
+    """(event, data) of a server-sent event stream"""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def make_photo(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (80, 120), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class TestBulkUpload:
+    """Tests for POST /api/clothing/bulk"""
+
+    @pytest.fixture(autouse=True)
+    def uploader(self, client, mock_prisma, wardrobe, tmp_path):
+        """Uploader storing under tmp_path, with a local tagger and SQLite rows"""
+        mock_prisma.execute_raw = AsyncMock(
+            side_effect=lambda sql, *params: wardrobe.execute(sql, params).rowcount
+        )
+        database = SimpleNamespace(get_client=AsyncMock(return_value=mock_prisma))
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            app.dependency_overrides[clothing.get_bulk_uploader] = lambda: BulkUploader(
+                mock_prisma,
+                ImageProcessor(LocalStorage(base_dir=str(tmp_path)), executor=executor),
+                TaggingService(MockTagger(), MemoryCacheBackend(), window=0.01),
+                DuplicateIndex(database),
+            )
+            yield
+        app.dependency_overrides.pop(clothing.get_bulk_uploader, None)
+
+    def test_multipart(self, client, wardrobe):
+        """Test every file part becomes an item, reported as it is stored"""
+        response = client.post(
+            "/api/clothing/bulk",
+            files=[
+                ("files", ("red.png", make_photo((200, 20, 30)), "image/png")),
+                ("files", ("blue.png", make_photo((20, 40, 200)), "image/png")),
+                ("files", ("notes.txt", b"not a photo", "text/plain")),
+            ],
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_events(response.text)
+        assert events[-1] == ("done", {"created": 2, "failed": 1})
+        items = {data["filename"]: data for event, data in events if event == "item"}
+        assert items["notes.txt"]["status"] == "failed"
+        red = items["red.png"]
+        assert red["status"] == "created" and red["tagged"]
+        row = wardrobe.execute(
+            'SELECT "name", "userId", "category", "colorCode" FROM "clothing_items" WHERE "id" = ?',
+            (red["id"],),
+        ).fetchone()
+        assert tuple(row) == ("red", "user-123", red["category"], 0)
+
+    def test_zip(self, client, wardrobe):
+        """Test a zip archive's photos become items in the given category"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("shoes/boots.png", make_photo((90, 60, 30)))
+            archive.writestr("shoes/sneakers.png", make_photo((250, 250, 250)))
+
+        response = client.post(
+            "/api/clothing/bulk?category=shoes",
+            content=buffer.getvalue(),
+            headers={"content-type": "application/zip"},
+        )
+
+        events = parse_events(response.text)
+        assert events[-1] == ("done", {"created": 2, "failed": 0})
+        assert {data["category"] for event, data in events if event == "item"} == {"shoes"}
+        assert wardrobe.execute(
+            'SELECT COUNT(*) FROM "clothing_items" WHERE "name" IN (?, ?)', ("boots", "sneakers")
+        ).fetchone()[0] == 2
+
+    def test_unreadable_upload(self, client):
+        """Test an upload that cannot be read reports an error event"""
+        response = client.post(
+            "/api/clothing/bulk", content=b"not a zip", headers={"content-type": "application/zip"}
+        )
+
+        assert parse_events(response.text) == [
+            ("error", {"detail": "Body is not a zip archive"}),
+            ("done", {"created": 0, "failed": 0}),
+        ]
+
+    def test_unsupported_media_type(self, client):
+        """Test bodies other than multipart or zip are rejected"""
+        response = client.post("/api/clothing/bulk", json={"files": []})
+
+        assert response.status_code == 415
+
+    def test_unknown_category(self, client):
+        """Test the category must be one the app knows"""
+        response = client.post(
+            "/api/clothing/bulk?category=hats", files=[("files", ("a.png", b"", "image/png"))]
+        )
+
+        assert response.status_code == 400
+
+    def test_too_large(self, client, monkeypatch):
+        """Test uploads declaring more than the maximum size are refused up front"""
+        monkeypatch.setattr(clothing.settings, "bulk_upload_max_size", 100)
+
+        response = client.post(
+            "/api/clothing/bulk", content=b"x" * 101, headers={"content-type": "application/zip"}
+        )
+
+        assert response.status_code == 413
+
+
+class TestQueryPlan:
+    """Tests that wardrobe queries are served by the composite indexes"""
+
+    @pytest.mark.parametrize("filters,index", [
+        ({}, "clothing_items_userId_createdAt_id_idx"),
+        ({"tag": "work"}, "clothing_items_userId_createdAt_id_idx"),
+        ({"category": "top"}, "clothing_items_userId_category_createdAt_id_idx"),
+        ({"color": "red"}, "clothing_items_userId_color_createdAt_id_idx"),
+        ({"season": "summer"}, "clothing_items_userId_season_createdAt_id_idx"),
+    ])
+    @pytest.mark.parametrize("after", [None, (str(BASE_TIME), "item-05")])
+    def test_index_seek_without_sort(self, wardrobe, filters, index, after):
+        """Test each query seeks an index and reads it in order, with no sort step"""
+        sql, params = build_clothing_query("user-123", after=after, **filters)
+
+        plan = " | ".join(row["detail"] for row in wardrobe.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+        assert f"USING INDEX {index}" in plan
+        assert "TEMP B-TREE" not in plan
+        if after is not None:
+            assert "createdAt<?" in plan
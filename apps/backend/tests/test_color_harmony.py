@@ -0,0 +1,119 @@
+"""
+Unit tests for dominant colors and color harmony
+"""
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from app.services.color_harmony import (
+    HARMONY,
+    NEUTRAL,
+    code_for_name,
+    dominant_colors,
+    quantize,
+    relation,
+)
+
+
+def garment(size=(200, 300), backdrop=(250, 250, 250), colors=((20, 40, 160),), mode="RGB"):
+    """A backdrop with a block per color, the first block the largest"""
+    image = Image.new(mode, size, backdrop)
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    top = height // 6
+    for i, color in enumerate(colors):
+        bottom = top + (height * 2 // 3 if i == 0 else height // 8)
+        draw.rectangle([width // 6, top, width * 5 // 6, bottom], fill=color)
+        top = bottom + 1
+    return image
+
+
+class TestHarmonyTable:
+    """Tests for the precomputed harmony lookup table"""
+
+    def test_shape_and_symmetry(self):
+        """Test every pair of codes has one symmetric score"""
+        assert HARMONY.shape == (NEUTRAL + 1, NEUTRAL + 1)
+        assert np.array_equal(HARMONY, HARMONY.T)
+        assert ((HARMONY > 0) & (HARMONY <= 1)).all()
+
+    def test_scores(self):
+        """Test neutrals and matches score highest and near misses lowest"""
+        red, orange, yellow, green, cyan = 0, 1, 2, 4, 6
+
+        assert HARMONY[red, NEUTRAL] == HARMONY[NEUTRAL, NEUTRAL] == HARMONY[red, red] == 1.0
+        assert HARMONY[red, orange] > HARMONY[red, cyan] > HARMONY[red, green]
+        assert HARMONY[red, cyan] > HARMONY[red, yellow]
+        assert HARMONY[11, 1] == HARMONY[red, yellow]  # distance wraps around the wheel
+
+    @pytest.mark.parametrize("a,b,expected", [
+        (0, NEUTRAL, "neutral"),
+        (8, 8, "monochrome"),
+        (11, 0, "analogous"),
+        (0, 4, "triadic"),
+        (0, 7, "split-complementary"),
+        (2, 8, "complementary"),
+        (0, 2, None),
+    ])
+    def test_relation(self, a, b, expected):
+        """Test pairs of codes are named by color theory"""
+        assert relation(a, b) == expected
+
+
+class TestQuantize:
+    """Tests for quantize() and code_for_name()"""
+
+    def test_codes(self):
+        """Test hues land in their sector and greys, darks and pastels are neutral"""
+        rgb = [
+            (255, 0, 0), (250, 10, 60), (255, 128, 0), (0, 200, 0), (0, 0, 255),
+            (128, 128, 128), (20, 10, 40), (245, 240, 225), (0, 0, 0),
+        ]
+
+        assert quantize(np.array(rgb)).tolist() == [0, 0, 1, 4, 8] + [NEUTRAL] * 4
+
+    @pytest.mark.parametrize("name,code", [
+        ("Red", 0), ("dark green", 4), ("Navy", NEUTRAL), ("sky-blue", 8),
+        ("pink/white", NEUTRAL), ("white/pink", 11), ("", NEUTRAL), (None, NEUTRAL),
+        ("iridescent", NEUTRAL),
+    ])
+    def test_names(self, name, code):
+        """Test free-text colors are coded by their last known color word"""
+        assert code_for_name(name) == code
+
+
+class TestDominantColors:
+    """Tests for dominant_colors()"""
+
+    def test_backdrop_ignored(self):
+        """Test the garment's colors are found and the backdrop left out"""
+        palette = dominant_colors(garment(colors=[(20, 40, 160), (230, 200, 20)]), k=3)
+
+        assert [color.code for color in palette] == [8, 2]
+        assert palette[0].hex == "#1428a0"
+        assert palette[0].share > palette[1].share
+        assert sum(color.share for color in palette) == pytest.approx(1.0, abs=0.01)
+
+    def test_transparent_pixels_ignored(self):
+        """Test transparent backdrops do not count"""
+        image = garment(mode="RGBA", backdrop=(0, 0, 0, 0), colors=[(200, 30, 60, 255)])
+
+        assert [color.code for color in dominant_colors(image)] == [0]
+
+    def test_single_color(self):
+        """Test a plain image is its own color, even matching the border"""
+        palette = dominant_colors(Image.new("RGB", (50, 50), (128, 128, 128)))
+
+        assert [(color.hex, color.share, color.code) for color in palette] == [
+            ("#808080", 1.0, NEUTRAL)
+        ]
+
+    def test_fully_transparent(self):
+        """Test an image with no opaque pixels has no colors"""
+        assert dominant_colors(Image.new("RGBA", (10, 10))) == []
+
+    def test_deterministic(self):
+        """Test the same image always gives the same palette"""
+        image = garment(colors=[(20, 40, 160), (230, 200, 20), (200, 30, 60)])
+
+        assert dominant_colors(image) == dominant_colors(image)
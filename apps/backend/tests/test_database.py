@@ -0,0 +1,111 @@
+"""
+Unit tests for the shared database client
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.core.database import Database, build_datasource_url
+
+
+@pytest.fixture
+def mock_client():
+    """Mock Prisma client that tracks its connection state"""
+    client = MagicMock()
+    state = {"connected": False}
+
+    async def connect():
+        await asyncio.sleep(0)
+        state["connected"] = True
+
+    async def disconnect():
+        state["connected"] = False
+
+    client.connect = AsyncMock(side_effect=connect)
+    client.disconnect = AsyncMock(side_effect=disconnect)
+    client.is_connected = MagicMock(side_effect=lambda: state["connected"])
+    client.query_raw = AsyncMock(return_value=[{"1": 1}])
+    return client
+
+
+class TestBuildDatasourceUrl:
+    """Tests for pool parameters on the datasource URL"""
+
+    def test_adds_pool_parameters(self):
+        """Test pool size and timeout are appended"""
+        url = build_datasource_url("file:./dev.db", 5, 7)
+
+        assert url == "file:./dev.db?connection_limit=5&pool_timeout=7"
+
+    def test_keeps_explicit_parameters(self):
+        """Test parameters already in the URL win"""
+        url = build_datasource_url(
+            "postgresql://localhost/db?connection_limit=50&sslmode=require", 5, 7
+        )
+
+        assert "connection_limit=50" in url
+        assert "sslmode=require" in url
+        assert "pool_timeout=7" in url
+
+
+class TestDatabase:
+    """Tests for the Database lifecycle"""
+
+    async def test_concurrent_get_client_connects_once(self, mock_client):
+        """Test concurrent first requests share a single connect"""
+        database = Database(url="file:./test.db")
+
+        with patch("app.core.database.Prisma", return_value=mock_client) as prisma_cls:
+            clients = await asyncio.gather(*(database.get_client() for _ in range(10)))
+
+        assert all(c is mock_client for c in clients)
+        prisma_cls.assert_called_once()
+        mock_client.connect.assert_awaited_once()
+
+    async def test_client_configuration(self, mock_client):
+        """Test the client is built with pool and timeout settings"""
+        database = Database(
+            url="file:./test.db", pool_size=3, pool_timeout=4,
+            connect_timeout=5, query_timeout=6
+        )
+
+        with patch("app.core.database.Prisma", return_value=mock_client) as prisma_cls:
+            await database.connect()
+
+        kwargs = prisma_cls.call_args.kwargs
+        assert "connection_limit=3" in kwargs["datasource"]["url"]
+        assert "pool_timeout=4" in kwargs["datasource"]["url"]
+        assert kwargs["connect_timeout"] == 5
+        assert kwargs["http"] == {"timeout": 6}
+
+    async def test_disconnect(self, mock_client):
+        """Test disconnect releases the client"""
+        database = Database(url="file:./test.db")
+
+        with patch("app.core.database.Prisma", return_value=mock_client):
+            await database.connect()
+            await database.disconnect()
+
+        mock_client.disconnect.assert_awaited_once()
+        assert database.is_connected is False
+
+    async def test_health_check_healthy(self, mock_client):
+        """Test health probe runs a trivial query"""
+        database = Database(url="file:./test.db")
+
+        with patch("app.core.database.Prisma", return_value=mock_client):
+            result = await database.health_check()
+
+        assert result["status"] == "healthy"
+        assert "latency_ms" in result
+        mock_client.query_raw.assert_awaited_once_with("SELECT 1")
+
+    async def test_health_check_unhealthy(self, mock_client):
+        """Test health probe reports query failures"""
+        mock_client.query_raw = AsyncMock(side_effect=RuntimeError("database is locked"))
+        database = Database(url="file:./test.db")
+
+        with patch("app.core.database.Prisma", return_value=mock_client):
+            result = await database.health_check()
+
+        assert result["status"] == "unhealthy"
+        assert "database is locked" in result["error"]
@@ -0,0 +1,103 @@
+"""
+Unit tests for the near-duplicate index
+"""
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services.duplicates import DuplicateIndex, DuplicateMatch
+from app.services.perceptual_hash import format_hash
+
+
+@pytest.fixture
+def prisma():
+    rows = [
+        {"id": "shirt", "perceptualHash": format_hash(0b1111)},
+        {"id": "shirt-again", "perceptualHash": format_hash(0b0111)},
+        {"id": "jeans", "perceptualHash": format_hash(0xFFFF_0000)},
+        {"id": "broken", "perceptualHash": "not-a-hash"},
+    ]
+    return SimpleNamespace(query_raw=AsyncMock(return_value=rows))
+
+
+@pytest.fixture
+def index(prisma):
+    return DuplicateIndex(SimpleNamespace(get_client=AsyncMock(return_value=prisma)), radius=4)
+
+
+class TestDuplicateIndex:
+    """Tests for DuplicateIndex"""
+
+    async def test_find(self, index):
+        """Test near hashes are found nearest first, skipping the checked item"""
+        assert await index.find("user-123", 0b1111) == [
+            DuplicateMatch("shirt", 0), DuplicateMatch("shirt-again", 1)
+        ]
+        assert await index.find("user-123", 0b1111, exclude="shirt") == [
+            DuplicateMatch("shirt-again", 1)
+        ]
+        assert await index.find("user-123", 0xFFFF_0001, radius=1) == [DuplicateMatch("jeans", 1)]
+
+    async def test_index_loaded_once(self, index, prisma):
+        """Test concurrent and later lookups share one load"""
+        await asyncio.gather(*(index.find("user-123", 0) for _ in range(5)))
+        await index.find("user-123", 0)
+
+        prisma.query_raw.assert_awaited_once()
+        assert prisma.query_raw.call_args.args[1] == "user-123"
+        assert len(await index.index("user-123")) == 3
+
+    async def test_add(self, index, prisma):
+        """Test new items join a loaded index without a reload"""
+        await index.index("user-123")
+
+        index.add("user-123", "coat", 0xAAAA)
+        index.add("user-456", "hat", 0xAAAA)
+
+        assert await index.find("user-123", 0xAAAA) == [DuplicateMatch("coat", 0)]
+        assert prisma.query_raw.await_count == 1
+
+    async def test_invalidate(self, index, prisma):
+        """Test invalidated indexes are reloaded"""
+        await index.index("user-123")
+
+        index.invalidate("user-123")
+        await index.index("user-123")
+
+        assert prisma.query_raw.await_count == 2
+
+    async def test_add_during_load_not_cached(self, index, prisma):
+        """Test a load that raced an add is not kept"""
+        started, release = asyncio.Event(), asyncio.Event()
+        rows = prisma.query_raw.return_value
+
+        async def slow_query(*args):
+            started.set()
+            await release.wait()
+            return rows
+
+        prisma.query_raw.side_effect = slow_query
+        loading = asyncio.create_task(index.index("user-123"))
+        await started.wait()
+        index.add("user-123", "coat", 0xAAAA)
+        release.set()
+        await loading
+
+        prisma.query_raw.side_effect = None
+        await index.index("user-123")
+        assert prisma.query_raw.await_count == 2
+
+    async def test_no_state_kept_per_user(self, index, prisma):
+        """Test adds, invalidations and finished loads leave nothing behind"""
+        for i in range(100):
+            index.add(f"user-{i}", "coat", 0xAAAA)
+            index.invalidate(f"user-{i}")
+        await index.index("user-1")
+        prisma.query_raw.side_effect = RuntimeError("db down")
+        with pytest.raises(RuntimeError):
+            await index.index("user-2")
+
+        assert index._loading == {}
+        assert index.stats()["size"] == 1
@@ -0,0 +1,441 @@
+"""
+Unit tests for the outfit generation job queue
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import sqlite3
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+from PIL import Image
+
+from app.core.admission import AdmissionRejected
+from app.core.http import HTTPClientRegistry, UpstreamConfig
+from app.core.sse import format_sse, parse_sse
+from app.services.generation_jobs import (
+    JobQueue,
+    JobStatus,
+    MemoryJobStore,
+    SQLiteJobStore,
+    TooManyJobsError,
+)
+from app.services import outfit_generation
+from app.services.outfit_generation import (
+    ImageGenerationError,
+    OutfitGenerator,
+    build_outfit_prompt,
+    describe_color_harmony,
+    iter_base64,
+)
+from app.storage import LocalStorage
+
+
+class Gate:
+    """Runner whose jobs block until released, recording what ran"""
+
+    def __init__(self):
+        self.started = []
+        self.release = asyncio.Event()
+        self.fail = set()
+
+    async def __call__(self, job, report):
+        self.started.append(job.params["n"])
+        await report(0.5, "generating")
+        await self.release.wait()
+        if job.params["n"] in self.fail:
+            raise RuntimeError("upstream down")
+        return {"outfitId": f"outfit-{job.params['n']}"}
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+async def gate():
+    return Gate()
+
+
+@pytest.fixture
+async def queue(gate):
+    queue = JobQueue(MemoryJobStore(), gate, workers=2, per_user_concurrency=1, max_queued_per_user=2)
+    await queue.start()
+    yield queue
+    gate.release.set()
+    await queue.stop()
+
+
+class TestSSE:
+    """Tests for server-sent event encoding and parsing"""
+
+    async def test_round_trip(self):
+        """Test encoded events parse back, including multi-line data"""
+        raw = format_sse("a\nb", event="progress", id="1") + b": keep-alive\n\n" + format_sse("{}")
+
+        async def lines():
+            for line in raw.decode().split("\n"):
+                yield line
+
+        events = [e async for e in parse_sse(lines())]
+
+        assert events == [("progress", "a\nb"), ("message", "{}")]
+
+
+class TestJobQueue:
+    """Tests for JobQueue"""
+
+    async def test_submit_runs_in_background(self, queue, gate):
+        """Test submit returns at once and the job completes later"""
+        job, created = await queue.submit("user-1", "key-1", {"n": 1})
+
+        assert created
+        assert job.status == JobStatus.QUEUED
+        await settle()
+        assert (await queue.get(job.id)).status == JobStatus.RUNNING
+
+        gate.release.set()
+        await queue.join()
+
+        done = await queue.get(job.id)
+        assert done.status == JobStatus.SUCCEEDED
+        assert done.progress == 1.0
+        assert done.result == {"outfitId": "outfit-1"}
+
+    async def test_deduplicated_by_cache_key(self, queue, gate):
+        """Test identical unfinished jobs are shared"""
+        first, _ = await queue.submit("user-1", "key-1", {"n": 1})
+        second, created = await queue.submit("user-1", "key-1", {"n": 2})
+
+        assert second.id == first.id
+        assert not created
+        gate.release.set()
+        await queue.join()
+        assert gate.started == [1]
+
+        third, created = await queue.submit("user-1", "key-1", {"n": 3})
+        assert created and third.id != first.id
+
+    async def test_per_user_concurrency(self, queue, gate):
+        """Test one user's jobs run one at a time while others proceed"""
+        await queue.submit("user-1", "a", {"n": 1})
+        await queue.submit("user-1", "b", {"n": 2})
+        await queue.submit("user-2", "c", {"n": 3})
+        await settle()
+
+        assert sorted(gate.started) == [1, 3]
+        assert queue.stats()["waiting_for_user_slot"] == 1
+
+        gate.release.set()
+        await queue.join()
+        assert sorted(gate.started) == [1, 2, 3]
+
+    async def test_too_many_jobs(self, queue):
+        """Test a user is limited in unfinished jobs"""
+        for n in range(3):
+            await queue.submit("user-1", f"key-{n}", {"n": n})
+
+        with pytest.raises(TooManyJobsError):
+            await queue.submit("user-1", "key-3", {"n": 3})
+        await queue.submit("user-2", "key-4", {"n": 4})
+
+    async def test_failure(self, queue, gate):
+        """Test runner errors fail the job and free the worker"""
+        gate.fail = {1}
+        failed, _ = await queue.submit("user-1", "a", {"n": 1})
+        ok, _ = await queue.submit("user-1", "b", {"n": 2})
+        gate.release.set()
+        await queue.join()
+
+        assert (await queue.get(failed.id)).status == JobStatus.FAILED
+        assert (await queue.get(failed.id)).error == "upstream down"
+        assert (await queue.get(ok.id)).status == JobStatus.SUCCEEDED
+        assert queue.stats()["failed"] == 1
+
+    async def test_subscribe(self, queue, gate):
+        """Test subscribers see progress and end with the final state"""
+        job, _ = await queue.submit("user-1", "a", {"n": 1})
+        seen = []
+
+        async def follow():
+            async for update in queue.subscribe(job.id):
+                seen.append((update.status, update.progress))
+
+        follower = asyncio.create_task(follow())
+        await settle()
+        gate.release.set()
+        await asyncio.wait_for(follower, 1)
+
+        assert seen[0][0] in (JobStatus.QUEUED, JobStatus.RUNNING)
+        assert (JobStatus.RUNNING, 0.5) in seen
+        assert seen[-1] == (JobStatus.SUCCEEDED, 1.0)
+
+    async def test_subscribe_finished_and_unknown(self, queue, gate):
+        """Test following a finished job yields it once, unknown jobs nothing"""
+        gate.release.set()
+        job, _ = await queue.submit("user-1", "a", {"n": 1})
+        await queue.join()
+
+        assert [j.status async for j in queue.subscribe(job.id)] == [JobStatus.SUCCEEDED]
+        assert [j async for j in queue.subscribe("missing")] == []
+
+
+class TestSQLiteJobStore:
+    """Tests for the durable job store"""
+
+    async def test_round_trip(self, tmp_path):
+        """Test jobs are persisted and found by key and state"""
+        store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+        queue = JobQueue(store, AsyncMock(return_value={"outfitId": "o"}), workers=1)
+        await queue.start()
+        job, _ = await queue.submit("user-1", "key-1", {"n": 1})
+        await queue.join()
+        await queue.stop()
+
+        reopened = SQLiteJobStore(str(tmp_path / "jobs.db"))
+        stored = await reopened.get(job.id)
+        assert stored.status == JobStatus.SUCCEEDED
+        assert stored.result == {"outfitId": "o"}
+        assert await reopened.find_unfinished("key-1") is None
+        await reopened.close()
+
+    async def test_unfinished_jobs_resume(self, tmp_path, gate):
+        """Test jobs interrupted by a shutdown run again after a restart"""
+        path = str(tmp_path / "jobs.db")
+        first = JobQueue(SQLiteJobStore(path), gate, workers=1)
+        await first.start()
+        running, _ = await first.submit("user-1", "a", {"n": 1})
+        queued, _ = await first.submit("user-1", "b", {"n": 2})
+        await settle()
+        await first.stop()
+        assert gate.started == [1]
+
+        restarted = JobQueue(SQLiteJobStore(path), gate, workers=1)
+        assert (await restarted.store.find_unfinished("a")).status == JobStatus.RUNNING
+        await restarted.start()
+        gate.release.set()
+        await restarted.join()
+
+        assert gate.started == [1, 1, 2]
+        assert (await restarted.get(running.id)).status == JobStatus.SUCCEEDED
+        assert (await restarted.get(queued.id)).status == JobStatus.SUCCEEDED
+        await restarted.stop()
+
+    async def test_concurrent_submits(self, tmp_path, gate):
+        """Test concurrent submits share one job and respect the cap"""
+        queue = JobQueue(
+            SQLiteJobStore(str(tmp_path / "jobs.db")), gate, workers=1, max_queued_per_user=1
+        )
+        await queue.start()
+
+        same = await asyncio.gather(*(queue.submit("user-1", "key", {"n": n}) for n in range(3)))
+        assert len({job.id for job, _ in same}) == 1
+        assert [created for _, created in same].count(True) == 1
+
+        others = await asyncio.gather(
+            *(queue.submit("user-1", f"key-{n}", {"n": n}) for n in range(3, 6)),
+            return_exceptions=True,
+        )
+        assert sum(isinstance(result, TooManyJobsError) for result in others) == 2
+        assert len(queue._jobs) == 2
+
+        gate.release.set()
+        await queue.join()
+        assert len(gate.started) == 2
+        await queue.stop()
+
+    async def test_failed_save_releases_key(self, tmp_path, gate):
+        """Test a submit whose save fails can be retried"""
+        store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+        queue = JobQueue(store, gate, workers=1)
+        save = store.save
+        store.save = AsyncMock(side_effect=sqlite3.OperationalError("disk I/O error"))
+
+        with pytest.raises(sqlite3.OperationalError):
+            await queue.submit("user-1", "key", {"n": 1})
+
+        store.save = save
+        job, created = await queue.submit("user-1", "key", {"n": 1})
+        assert created
+        assert await store.find_unfinished("key") == job
+        await store.close()
+
+
+def image_stream(*events):
+    return b"".join(format_sse(json.dumps(e), event=e["type"]) for e in events)
+
+
+def make_png(size=(64, 48)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, "navy").save(buf, "PNG")
+    return buf.getvalue()
+
+
+class TestOutfitGenerator:
+    """Tests for the outfit generation runner"""
+
+    @pytest.fixture
+    def storage(self, tmp_path, monkeypatch):
+        storage = LocalStorage(base_dir=str(tmp_path))
+        monkeypatch.setattr(outfit_generation, "get_storage", lambda: storage)
+        return storage
+
+    @pytest.fixture
+    def upstream(self, storage):
+        """Image generation upstream and image CDN served by mock handlers"""
+        handler = SimpleNamespace(
+            requests=[], body=b"", status=200, image=make_png(), image_type="image/png"
+        )
+
+        def respond(request):
+            handler.requests.append(json.loads(request.content))
+            return httpx.Response(
+                handler.status, content=handler.body,
+                headers={"content-type": "text/event-stream"},
+            )
+
+        def serve_image(request):
+            if request.url.path != "/images/1.png":
+                return httpx.Response(404)
+            return httpx.Response(
+                200, content=handler.image, headers={"content-type": handler.image_type}
+            )
+
+        registry = HTTPClientRegistry()
+        registry.register(
+            "image_generation",
+            UpstreamConfig(base_url="http://images.test"),
+            transport=httpx.MockTransport(respond),
+        )
+        registry.register(
+            "image_download", UpstreamConfig(), transport=httpx.MockTransport(serve_image)
+        )
+        handler.registry = registry
+        return handler
+
+    async def test_generate_image_reports_partials(self, upstream, storage):
+        """Test partial images advance progress and the final image is decoded"""
+        upstream.body = image_stream(
+            {"type": "image_generation.partial_image", "partial_image_index": 0, "b64_json": ""},
+            {"type": "image_generation.partial_image", "partial_image_index": 1, "b64_json": ""},
+            {
+                "type": "image_generation.completed",
+                "b64_json": base64.b64encode(upstream.image).decode(),
+            },
+        )
+        generator = OutfitGenerator(database=None, clients=upstream.registry, cache=None)
+        progress = []
+
+        async def report(value, stage):
+            progress.append(round(value, 2))
+
+        stored = await generator.generate_image("prompt", report, "outfits/u/1")
+
+        assert stored.url == "/uploads/outfits/u/1.png"
+        assert stored.size == len(upstream.image)
+        assert stored.sha256 == hashlib.sha256(upstream.image).hexdigest()
+        assert await storage.download("outfits/u/1.png") == upstream.image
+        assert progress == [0.37, 0.63, 0.9]
+        assert upstream.requests[0]["stream"] is True
+        await upstream.registry.aclose()
+
+    async def test_generate_image_from_url(self, upstream, storage):
+        """Test an image returned by URL is streamed from the download into storage"""
+        upstream.image, upstream.image_type = make_png((32, 32)), "image/webp"
+        upstream.body = image_stream(
+            {"type": "image_generation.completed", "url": "https://cdn.test/images/1.png"},
+        )
+        generator = OutfitGenerator(database=None, clients=upstream.registry, cache=None)
+
+        stored = await generator.generate_image("prompt", AsyncMock(), "outfits/u/2")
+
+        assert stored.url == "/uploads/outfits/u/2.webp"
+        assert await storage.download("outfits/u/2.webp") == upstream.image
+        await upstream.registry.aclose()
+
+    @pytest.mark.parametrize("image,image_type,url", [
+        (b"<html>not an image</html>", "image/png", "https://cdn.test/images/1.png"),
+        (make_png(), "text/html", "https://cdn.test/images/1.png"),
+        (make_png(), "image/png", "https://cdn.test/missing.png"),
+    ])
+    async def test_download_rejected(self, upstream, storage, image, image_type, url):
+        """Test downloads that are missing or not images leave nothing behind"""
+        upstream.image, upstream.image_type = image, image_type
+        upstream.body = image_stream({"type": "image_generation.completed", "url": url})
+        generator = OutfitGenerator(database=None, clients=upstream.registry, cache=None)
+
+        with pytest.raises(ImageGenerationError):
+            await generator.generate_image("prompt", AsyncMock(), "outfits/u/3")
+
+        assert not await storage.exists("outfits/u/3.png")
+        await upstream.registry.aclose()
+
+    @pytest.mark.parametrize("status_code,body", [
+        (500, b""),
+        (200, b""),
+        (200, image_stream({"type": "error", "error": {"message": "content policy"}})),
+        (200, image_stream({"type": "image_generation.completed"})),
+    ])
+    async def test_generate_image_errors(self, upstream, status_code, body):
+        """Test upstream errors and truncated streams raise ImageGenerationError"""
+        upstream.status, upstream.body = status_code, body
+        generator = OutfitGenerator(database=None, clients=upstream.registry, cache=None)
+
+        with pytest.raises(ImageGenerationError):
+            await generator.generate_image("prompt", AsyncMock(), "outfits/u/1")
+        await upstream.registry.aclose()
+
+    async def test_generate_image_saturated(self, upstream, monkeypatch):
+        """Test an upstream rejected by admission control fails the generation"""
+        generator = OutfitGenerator(database=None, clients=upstream.registry, cache=None)
+        monkeypatch.setattr(
+            generator, "_stream_image", AsyncMock(side_effect=AdmissionRejected("full", 30))
+        )
+
+        with pytest.raises(ImageGenerationError, match="busy"):
+            await generator.generate_image("prompt", AsyncMock(), "outfits/u/1")
+
+    async def test_iter_base64(self):
+        """Test chunked base64 decoding matches decoding at once"""
+        data = bytes(range(256)) * 10
+        encoded = base64.b64encode(data).decode()
+
+        chunks = [c async for c in iter_base64(encoded, 100)]
+
+        assert b"".join(chunks) == data
+        assert max(len(c) for c in chunks) <= 99
+
+    def test_prompt(self):
+        """Test the prompt lists the person, style, occasion and items"""
+        items = [
+            SimpleNamespace(name="Oxford shirt", color="white", category="top", brand=None),
+            SimpleNamespace(name="Chinos", color=None, category=None, brand=None),
+        ]
+        profile = SimpleNamespace(
+            height=175, weight=68.5, primaryStyle="casual", secondaryStyle="minimalist"
+        )
+
+        prompt = build_outfit_prompt(items, profile, "work")
+
+        assert "- Person: 175cm, 68.5kg" in prompt
+        assert "- Style: casual, minimalist" in prompt
+        assert "- Occasion: work" in prompt
+        assert "  - Oxford shirt (white, top)" in prompt
+        assert "  - Chinos" in prompt
+        assert "- Color harmony: neutral palette" in prompt
+
+    def test_prompt_color_harmony(self):
+        """Test the prompt names the relation between accent colors"""
+        items = [
+            SimpleNamespace(name="Tee", color="white", colorCode=0, category="top", brand=None),
+            SimpleNamespace(name="Skirt", color="green", colorCode=None, category=None, brand=None),
+            SimpleNamespace(name="Boots", color="black", colorCode=None, category=None, brand=None),
+        ]
+
+        assert describe_color_harmony(items) == "triadic Tee and Skirt"
+        assert describe_color_harmony(items[1:]) == "Skirt as the accent against neutrals"
@@ -0,0 +1,200 @@
+"""
+Unit tests for the shared outbound HTTP client registry
+"""
+import asyncio
+import httpx
+import pytest
+from unittest.mock import MagicMock
+from app.core.http import (
+    HTTPClientRegistry,
+    RetryPolicy,
+    UpstreamClient,
+    UpstreamConfig,
+    parse_retry_after,
+)
+
+
+def make_client(handler, **config):
+    """Upstream client backed by a mock transport"""
+    config.setdefault("retry", RetryPolicy(attempts=3, backoff_base=0))
+    return UpstreamClient(
+        "test",
+        UpstreamConfig(base_url="https://upstream.test", **config),
+        transport=httpx.MockTransport(handler),
+    )
+
+
+class TestRetryPolicy:
+    """Tests for retries and backoff"""
+
+    async def test_retries_retryable_status_for_get(self):
+        """Test idempotent requests are retried on 503"""
+        handler = MagicMock(side_effect=[
+            httpx.Response(503), httpx.Response(503), httpx.Response(200, json={"ok": True})
+        ])
+        client = make_client(handler)
+
+        response = await client.get("/resource")
+
+        assert response.status_code == 200
+        assert handler.call_count == 3
+        assert client.stats()["retries"] == 2
+
+    async def test_returns_last_response_when_attempts_exhausted(self):
+        """Test the final failed response is returned, not raised"""
+        handler = MagicMock(return_value=httpx.Response(502))
+        client = make_client(handler)
+
+        response = await client.get("/resource")
+
+        assert response.status_code == 502
+        assert handler.call_count == 3
+
+    async def test_post_not_retried_on_status(self):
+        """Test non-idempotent requests are not replayed on 503"""
+        handler = MagicMock(return_value=httpx.Response(503))
+        client = make_client(handler)
+
+        response = await client.post("/token")
+
+        assert response.status_code == 503
+        assert handler.call_count == 1
+
+    async def test_post_not_retried_on_read_timeout(self):
+        """Test non-idempotent requests are not replayed after a read timeout"""
+        handler = MagicMock(side_effect=httpx.ReadTimeout("slow"))
+        client = make_client(handler)
+
+        with pytest.raises(httpx.ReadTimeout):
+            await client.post("/token")
+        assert handler.call_count == 1
+
+    async def test_connect_errors_retried_for_post(self):
+        """Test requests that never reached the upstream are retried"""
+        handler = MagicMock(side_effect=[
+            httpx.ConnectError("refused"), httpx.Response(200)
+        ])
+        client = make_client(handler)
+
+        response = await client.post("/token")
+
+        assert response.status_code == 200
+        assert handler.call_count == 2
+
+    async def test_retry_after_header(self):
+        """Test Retry-After is honoured up to the backoff cap"""
+        policy = RetryPolicy(backoff_max=2.0)
+
+        assert policy.backoff(0, httpx.Response(429, headers={"retry-after": "1"})) == 1.0
+        assert policy.backoff(0, httpx.Response(429, headers={"retry-after": "60"})) == 2.0
+
+    def test_backoff_is_bounded(self):
+        """Test jittered backoff never exceeds the cap"""
+        policy = RetryPolicy(backoff_base=1.0, backoff_max=3.0)
+
+        assert all(0 <= policy.backoff(attempt) <= 3.0 for attempt in range(10))
+
+    def test_parse_retry_after(self):
+        """Test both Retry-After forms"""
+        assert parse_retry_after("5") == 5.0
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("garbage") is None
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+class TestUpstreamClient:
+    """Tests for pooling and statistics"""
+
+    async def test_base_url(self):
+        """Test relative paths resolve against the upstream base URL"""
+        handler = MagicMock(return_value=httpx.Response(200))
+        client = make_client(handler)
+
+        await client.get("/auth/v1/user")
+
+        assert str(handler.call_args.args[0].url) == "https://upstream.test/auth/v1/user"
+
+    async def test_concurrency_capped_and_wait_recorded(self):
+        """Test requests beyond max_connections wait for a slot"""
+        active = 0
+        peak = 0
+
+        async def handler(request):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+            return httpx.Response(200)
+
+        client = make_client(handler, max_connections=2, max_keepalive_connections=2)
+
+        await asyncio.gather(*(client.get("/slow") for _ in range(6)))
+
+        stats = client.stats()
+        assert peak == 2
+        assert stats["requests"] == 6
+        assert stats["in_use"] == 0
+        assert stats["wait_time_max_ms"] > 0
+
+    async def test_pool_timeout(self):
+        """Test waiting longer than pool_timeout fails fast"""
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+            return httpx.Response(200)
+
+        client = make_client(handler, max_connections=1, pool_timeout=0.01)
+
+        first = asyncio.create_task(client.get("/slow"))
+        await asyncio.sleep(0)
+        with pytest.raises(httpx.PoolTimeout):
+            await client.post("/blocked")
+
+        release.set()
+        await first
+
+    async def test_stream(self):
+        """Test streaming responses hold a slot until closed"""
+        client = make_client(lambda request: httpx.Response(200, content=b"abc" * 10))
+
+        async with client.stream("POST", "/generate") as response:
+            assert client.stats()["in_use"] == 1
+            body = b"".join([chunk async for chunk in response.aiter_bytes()])
+
+        assert body == b"abc" * 10
+        assert client.stats()["in_use"] == 0
+
+
+class TestHTTPClientRegistry:
+    """Tests for the application-scoped registry"""
+
+    async def test_get_returns_shared_client(self):
+        """Test the same client is reused for an upstream"""
+        registry = HTTPClientRegistry()
+        registry.register("supabase", UpstreamConfig(http2=False))
+
+        assert registry.get("supabase") is registry.get("supabase")
+        await registry.aclose()
+
+    def test_unknown_upstream(self):
+        """Test unknown upstream names raise KeyError"""
+        with pytest.raises(KeyError):
+            HTTPClientRegistry().get("missing")
+
+    async def test_stats_and_aclose(self):
+        """Test stats cover used upstreams and aclose drops them"""
+        registry = HTTPClientRegistry()
+        registry.register(
+            "supabase", UpstreamConfig(),
+            transport=httpx.MockTransport(lambda request: httpx.Response(200))
+        )
+        await registry.get("supabase").get("https://supabase.test/health")
+
+        stats = registry.stats()
+        assert stats["supabase"]["requests"] == 1
+        assert "idle_connections" in stats["supabase"]
+
+        await registry.aclose()
+        assert registry.stats() == {}
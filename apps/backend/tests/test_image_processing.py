@@ -0,0 +1,386 @@
+"""
+Unit tests for image variant generation
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image, JpegImagePlugin
+
+from app.services.image_cache import ByteLRU, DerivativeCache
+from app.services.image_processing import (
+    ImageProcessor,
+    ImageResizer,
+    InvalidImageError,
+    analyze_image,
+    get_image_executor,
+    prepare_upload,
+    render_variants,
+    resize_image,
+    shutdown_image_executor,
+)
+from app.storage import LocalStorage
+from app.storage.derivatives import IMAGE_SIZES, derivative_path, derivative_paths
+
+
+def make_image(size, fmt="JPEG", mode="RGB", **save_args) -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 30, 60, 128)[: len(mode)]).save(buffer, fmt, **save_args)
+    return buffer.getvalue()
+
+
+def open_image(data: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(base_dir=str(tmp_path))
+
+
+@pytest.fixture
+def processor(storage):
+    """Processor running in threads instead of worker processes"""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield ImageProcessor(storage, executor=executor)
+
+
+class TestDerivativePaths:
+    """Tests for the derived path layout"""
+
+    def test_path(self):
+        """Test variants keep the original name, extension included"""
+        assert derivative_path("clothing/a.jpg", "thumbnail") == "derived/thumbnail/clothing/a.jpg.webp"
+        assert derivative_path("clothing/a.png", "medium", "jpeg") == "derived/medium/clothing/a.png.jpeg"
+
+    def test_unknown(self):
+        """Test unknown sizes and formats are rejected"""
+        with pytest.raises(ValueError):
+            derivative_path("a.jpg", "huge")
+        with pytest.raises(ValueError):
+            derivative_path("a.jpg", "thumbnail", "gif")
+
+    def test_all_paths(self):
+        """Test every size and format is listed"""
+        assert len(derivative_paths("a.jpg")) == len(IMAGE_SIZES) * 2
+
+    def test_public_url_size_hint(self, storage):
+        """Test get_public_url links the WebP variant for a size"""
+        assert storage.get_public_url("a.jpg") == "/uploads/a.jpg"
+        assert storage.get_public_url("a.jpg", size="thumbnail") == "/uploads/derived/thumbnail/a.jpg.webp"
+        with pytest.raises(ValueError):
+            storage.get_public_url("a.jpg", size="huge")
+
+
+class TestRenderVariants:
+    """Tests for render_variants()"""
+
+    def test_size_ladder(self):
+        """Test each size is bounded by its longest edge, keeping the aspect ratio"""
+        variants = render_variants(make_image((3200, 1600)), IMAGE_SIZES)
+
+        assert set(variants) == {(size, fmt) for size in IMAGE_SIZES for fmt in ("webp", "jpeg")}
+        for size, edge in IMAGE_SIZES.items():
+            webp = open_image(variants[(size, "webp")])
+            jpeg = open_image(variants[(size, "jpeg")])
+            assert webp.format == "WEBP"
+            assert jpeg.format == "JPEG"
+            assert webp.size == jpeg.size == (edge, edge // 2)
+
+    def test_no_upscaling(self):
+        """Test small images keep their size"""
+        variants = render_variants(make_image((300, 100), "PNG"), IMAGE_SIZES)
+
+        assert open_image(variants[("full", "webp")]).size == (300, 100)
+        assert open_image(variants[("thumbnail", "webp")]).size == (256, 85)
+
+    def test_exif_orientation(self):
+        """Test rotated camera photos come out upright"""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees clockwise
+        content = make_image((400, 200), exif=exif.tobytes())
+
+        variants = render_variants(content, {"thumbnail": 256})
+
+        assert open_image(variants[("thumbnail", "jpeg")]).size == (128, 256)
+
+    def test_transparency(self):
+        """Test alpha is kept in WebP and flattened onto white in JPEG"""
+        content = make_image((10, 10), "PNG", mode="RGBA")
+
+        variants = render_variants(content, {"thumbnail": 256})
+
+        assert open_image(variants[("thumbnail", "webp")]).mode == "RGBA"
+        jpeg = open_image(variants[("thumbnail", "jpeg")])
+        assert jpeg.mode == "RGB"
+        red, green, _ = jpeg.getpixel((5, 5))
+        assert red > 200 and green > 100
+
+    def test_invalid(self):
+        """Test content that is not an image raises InvalidImageError"""
+        with pytest.raises(InvalidImageError):
+            render_variants(b"not an image", IMAGE_SIZES)
+
+
+class TestPrepareUpload:
+    """Tests for prepare_upload()"""
+
+    def test_matches_separate_jobs(self):
+        """Test one decode gives what rendering and analysing separately give"""
+        content = make_image((1200, 900))
+
+        prepared = prepare_upload(content, IMAGE_SIZES, preview_width=300)
+
+        assert prepared.variants == render_variants(content, IMAGE_SIZES)
+        assert prepared.analysis.palette == analyze_image(content).palette
+        assert open_image(prepared.preview).format == "JPEG"
+        assert open_image(prepared.preview).size == (300, 225)
+
+    def test_invalid(self):
+        """Test content that is not an image raises InvalidImageError"""
+        with pytest.raises(InvalidImageError):
+            prepare_upload(b"not an image", IMAGE_SIZES)
+
+
+class TestImageProcessor:
+    """Tests for ImageProcessor"""
+
+    async def test_upload(self, processor, storage):
+        """Test the original and every variant are stored"""
+        content = make_image((1000, 500))
+
+        url = await processor.upload("clothing/a.jpg", content, "image/jpeg")
+
+        assert url == "/uploads/clothing/a.jpg"
+        assert await storage.download("clothing/a.jpg") == content
+        found = await storage.exists_many(derivative_paths("clothing/a.jpg"))
+        assert all(found.values())
+        thumbnail = await storage.download(derivative_path("clothing/a.jpg", "thumbnail"))
+        assert open_image(thumbnail).size == (256, 128)
+
+    async def test_upload_invalid(self, processor, storage):
+        """Test nothing is stored when the content is not an image"""
+        with pytest.raises(InvalidImageError):
+            await processor.upload("clothing/a.jpg", b"not an image")
+
+        assert not await storage.exists("clothing/a.jpg")
+
+    async def test_process(self, processor, storage):
+        """Test variants of an already stored image return their URLs"""
+        content = make_image((100, 100))
+        await storage.upload("a.jpg", content)
+
+        urls = await processor.process("a.jpg", content)
+
+        assert urls == {size: f"/uploads/derived/{size}/a.jpg.webp" for size in IMAGE_SIZES}
+
+    async def test_delete(self, processor, storage):
+        """Test deleting an image removes its variants"""
+        await processor.upload("a.jpg", make_image((100, 100)))
+
+        await processor.delete("a.jpg")
+
+        found = await storage.exists_many(["a.jpg", *derivative_paths("a.jpg")])
+        assert not any(found.values())
+
+    async def test_analyze(self, processor):
+        """Test a photo's dominant colors come back with its main color's code"""
+        analysis = await processor.analyze(make_image((3000, 2000)))
+
+        assert len(analysis.palette) == 1
+        assert analysis.palette[0].share == 1.0
+        assert analysis.color_code == 0  # red
+
+    async def test_prepare_and_upload(self, processor, storage):
+        """Test an upload stores the variants prepared in one job"""
+        content = make_image((2000, 1000))
+
+        prepared = await processor.prepare(content)
+        await processor.upload("a.jpg", content, "image/jpeg", variants=prepared.variants)
+
+        assert prepared.analysis.color_code == 0
+        assert open_image(prepared.preview).size == (512, 256)
+        stored = await storage.download(derivative_path("a.jpg", "thumbnail"))
+        assert stored == prepared.variants[("thumbnail", "webp")]
+
+    async def test_analyze_invalid(self, processor):
+        """Test content that is not an image is rejected"""
+        with pytest.raises(InvalidImageError):
+            await processor.analyze(b"not an image")
+
+    async def test_process_pool(self, storage):
+        """Test rendering in the shared worker processes"""
+        try:
+            processor = ImageProcessor(storage, executor=get_image_executor())
+            variants = await processor.render(make_image((600, 600)))
+        finally:
+            shutdown_image_executor()
+
+        assert open_image(variants[("medium", "webp")]).size == (600, 600)
+
+    async def test_pool_restarted_after_shutdown(self, storage):
+        """Test a long-lived processor keeps working across lifespan cycles"""
+        processor = ImageProcessor(storage)
+        try:
+            await processor.render(make_image((64, 64)))
+            shutdown_image_executor()
+            variants = await processor.render(make_image((64, 64)))
+        finally:
+            shutdown_image_executor()
+
+        assert open_image(variants[("medium", "webp")]).size == (64, 64)
+
+
+class TestResizeImage:
+    """Tests for resize_image()"""
+
+    def test_width(self):
+        """Test images are scaled to the width and never enlarged"""
+        assert open_image(resize_image(make_image((1000, 500)), 250, "webp")).size == (250, 125)
+        assert open_image(resize_image(make_image((100, 50)), 250, "jpeg")).size == (100, 50)
+
+    def test_jpeg_draft(self, monkeypatch):
+        """Test large JPEGs are decoded at reduced scale"""
+        requested = []
+        draft = JpegImagePlugin.JpegImageFile.draft
+
+        def spy(self, mode, size):
+            requested.append(size)
+            return draft(self, mode, size)
+
+        monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", spy)
+
+        resize_image(make_image((4000, 3000)), 400, "webp")
+
+        assert requested == [(400, 300)]
+
+    def test_draft_respects_orientation(self, monkeypatch):
+        """Test the draft size is computed on the upright image"""
+        requested = []
+        draft = JpegImagePlugin.JpegImageFile.draft
+        monkeypatch.setattr(
+            JpegImagePlugin.JpegImageFile,
+            "draft",
+            lambda self, mode, size: requested.append(size) or draft(self, mode, size),
+        )
+        exif = Image.Exif()
+        exif[0x0112] = 6
+
+        data = resize_image(make_image((4000, 2000), exif=exif.tobytes()), 500, "jpeg")
+
+        assert requested == [(1000, 500)]
+        assert open_image(data).size == (500, 1000)
+
+
+class TestByteLRU:
+    """Tests for ByteLRU"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the total size stays within budget"""
+        lru = ByteLRU(max_bytes=80)
+        lru.set("a", b"x" * 10)
+        lru.set("b", b"x" * 10)
+        lru.get("a")
+        for i in range(7):
+            lru.set(i, b"x" * 10)
+
+        assert lru.size == 80
+        assert lru.get("a") is not None
+        assert lru.get("b") is None
+
+    def test_skips_large_values(self):
+        """Test values over an eighth of the budget are not kept"""
+        lru = ByteLRU(max_bytes=80)
+        lru.set("a", b"x" * 11)
+
+        assert lru.get("a") is None
+
+
+class TestDerivativeCache:
+    """Tests for DerivativeCache"""
+
+    async def test_memory_and_disk(self, tmp_path):
+        """Test entries evicted from memory are still found on disk"""
+        cache = DerivativeCache(str(tmp_path), memory_bytes=80, disk_bytes=1000)
+        await cache.set("a", b"a" * 10)
+        for i in range(8):
+            await cache.set(i, b"x" * 10)
+
+        assert cache.memory.get("a") is None
+        assert await cache.get("a") == b"a" * 10
+        assert cache.stats()["disk_hits"] == 1
+        assert cache.memory.get("a") == b"a" * 10
+
+    async def test_disk_bound(self, tmp_path):
+        """Test the disk tier evicts least recently used files"""
+        cache = DerivativeCache(str(tmp_path), memory_bytes=8, disk_bytes=30)
+        await cache.set("a", b"a" * 10)
+        await cache.set("b", b"b" * 10)
+        await cache.get("a")
+        await cache.set("c", b"c" * 10)
+        await cache.set("d", b"d" * 10)
+
+        assert cache.disk_size == 30
+        assert len(os.listdir(tmp_path)) == 3
+        assert await cache.get("b") is None
+        assert await cache.get("a") == b"a" * 10
+
+    async def test_index_rebuilt(self, tmp_path):
+        """Test a new instance picks up files from an earlier one"""
+        first = DerivativeCache(str(tmp_path), memory_bytes=80, disk_bytes=1000)
+        await first.set("a", b"a" * 10)
+        (tmp_path / ".leftover").write_bytes(b"partial")
+
+        second = DerivativeCache(str(tmp_path), memory_bytes=80, disk_bytes=1000)
+
+        assert await second.get("a") == b"a" * 10
+        assert second.disk_size == 10
+        assert not (tmp_path / ".leftover").exists()
+
+    async def test_file_removed(self, tmp_path):
+        """Test a file deleted from under the cache is a miss"""
+        cache = DerivativeCache(str(tmp_path), memory_bytes=8, disk_bytes=1000)
+        await cache.set("a", b"a" * 10)
+        for path in tmp_path.iterdir():
+            path.unlink()
+
+        assert await cache.get("a") is None
+        assert cache.disk_size == 0
+
+
+class CountingStorage(LocalStorage):
+    """Local storage counting downloads"""
+
+    downloads = 0
+
+    async def download(self, file_path: str) -> bytes:
+        self.downloads += 1
+        await asyncio.sleep(0.01)
+        return await super().download(file_path)
+
+
+class TestImageResizer:
+    """Tests for ImageResizer"""
+
+    async def test_single_flight(self, tmp_path):
+        """Test a burst of requests for a new derivative renders it once"""
+        storage = CountingStorage(base_dir=str(tmp_path / "files"))
+        await storage.upload("a.jpg", make_image((800, 600)))
+        cache = DerivativeCache(str(tmp_path / "cache"), memory_bytes=1 << 20, disk_bytes=1 << 20)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            resizer = ImageResizer(cache, executor=executor)
+
+            results = await asyncio.gather(
+                *(resizer.get(storage, "a.jpg", '"v1"', 128, "webp") for _ in range(20))
+            )
+            again = await resizer.get(storage, "a.jpg", '"v1"', 128, "webp")
+            await resizer.get(storage, "a.jpg", '"v2"', 128, "webp")
+
+        assert len(set(results)) == 1
+        assert again == results[0]
+        assert storage.downloads == 2
+        assert open_image(results[0]).size == (128, 96)
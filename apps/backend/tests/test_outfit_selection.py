@@ -0,0 +1,209 @@
+"""
+Unit tests for outfit combination selection
+"""
+import itertools
+import json
+import random
+from datetime import date
+
+import numpy as np
+import pytest
+
+from app.services.color_harmony import NEUTRAL
+from app.services.outfit_selection import (
+    ALL_SEASONS,
+    EncodedWardrobe,
+    OutfitSelector,
+    season_mask,
+    season_of,
+    select_outfit_items,
+)
+
+SUMMER = date(2026, 7, 1)
+
+
+def item(item_id, category, color=None, season=None, tags=None, wear=0):
+    return {
+        "id": item_id,
+        "category": category,
+        "color": color,
+        "season": season,
+        "tags": json.dumps(tags) if tags is not None else None,
+        "wearCount": wear,
+    }
+
+
+def synthetic_wardrobe(n, seed=0):
+    rng = random.Random(seed)
+    categories = ["top"] * 6 + ["bottom"] * 4 + ["shoes"] * 3 + ["outerwear"] * 2 + ["dress"]
+    return [
+        item(
+            f"item-{i}",
+            rng.choice(categories),
+            rng.choice(["black", "white", "red", "green", "navy", None]),
+            rng.choice([None, "summer", "winter", "spring/summer", "fall"]),
+            rng.sample(["casual", "work", "formal", "date"], 2),
+            rng.randint(0, 10),
+        )
+        for i in range(n)
+    ]
+
+
+class TestEncoding:
+    """Tests for attribute encoding"""
+
+    @pytest.mark.parametrize("value,expected", [
+        (None, ALL_SEASONS),
+        ("summer", 0b0010),
+        ("Spring/Summer", 0b0011),
+        ("fall, winter", 0b1100),
+        ("all year", ALL_SEASONS),
+    ])
+    def test_season_mask(self, value, expected):
+        """Test free-text seasons become bitmasks"""
+        assert season_mask(value) == expected
+
+    @pytest.mark.parametrize("month,season", [
+        (1, "winter"), (3, "spring"), (7, "summer"), (10, "autumn"), (12, "winter"),
+    ])
+    def test_season_of(self, month, season):
+        """Test dates map to meteorological seasons"""
+        assert season_of(date(2026, month, 15)) == season
+
+    def test_arrays(self):
+        """Test rows become compact parallel arrays"""
+        wardrobe = EncodedWardrobe(
+            [
+                item("a", "Top", "Red", "summer", ["Work", "casual"], wear=2),
+                item("b", "bottom", None, None, None),
+                item("c", "top", "red", "summer", ["work"]),
+            ],
+            terms=["work", "formal"],
+        )
+
+        assert wardrobe.categories == ["top", "bottom"]
+        assert wardrobe.category.tolist() == [0, 1, 0]
+        assert wardrobe.color.tolist() == [0, NEUTRAL, 0]
+        assert wardrobe.season.tolist() == [0b0010, ALL_SEASONS, 0b0010]
+        assert wardrobe.term_hits.tolist() == [0b01, 0, 0b01]
+        assert wardrobe.wear.tolist() == [2, 0, 0]
+        assert wardrobe.indices("top").tolist() == [0, 2]
+        assert wardrobe.indices("dress").tolist() == []
+
+    def test_stored_color_code(self):
+        """Test the color code extracted from the photo wins over the color name"""
+        rows = [item("a", "top", "Black"), {**item("b", "top", "Black"), "colorCode": 8}]
+
+        assert EncodedWardrobe(rows).color.tolist() == [NEUTRAL, 8]
+
+
+class TestOutfitSelector:
+    """Tests for OutfitSelector"""
+
+    def test_prefers_profile_occasion_and_season(self):
+        """Test style, occasion and season tags drive the choice"""
+        rows = [
+            item("tee", "top", tags=["casual"]),
+            item("shirt", "top", tags=["formal", "work"]),
+            item("coat", "outerwear", season="winter"),
+            item("trousers", "bottom", tags=["formal", "work"]),
+            item("shorts", "bottom", season="summer", tags=["casual"]),
+            item("loafers", "shoes"),
+        ]
+
+        formal = select_outfit_items(rows, styles=["formal"], occasion="work", today=SUMMER)
+        casual = select_outfit_items(rows, styles=["casual"], today=SUMMER)
+
+        assert formal == ["shirt", "trousers", "loafers"]
+        assert casual == ["tee", "shorts", "loafers"]
+
+    def test_rotation_prefers_less_worn(self):
+        """Test equally good items rotate by wear count"""
+        rows = [
+            item("top-worn", "top", wear=9),
+            item("top-fresh", "top", wear=1),
+            item("jeans", "bottom"),
+            item("boots", "shoes"),
+        ]
+
+        assert select_outfit_items(rows, today=SUMMER)[0] == "top-fresh"
+
+    def test_colors_and_optional_slots(self):
+        """Test clashing colors are avoided and outerwear is added when it helps"""
+        rows = [
+            item("red-top", "top", "red"),
+            item("green-skirt", "bottom", "green"),
+            item("black-skirt", "bottom", "black"),
+            item("flats", "shoes", "black"),
+            item("jacket", "outerwear", "navy", season="winter"),
+        ]
+
+        assert select_outfit_items(rows, today=SUMMER) == ["red-top", "black-skirt", "flats"]
+        assert select_outfit_items(rows, today=date(2026, 1, 10)) == [
+            "red-top", "black-skirt", "flats", "jacket"
+        ]
+
+    def test_prefers_harmonious_accents(self):
+        """Test analogous colors beat a near-miss pairing"""
+        rows = [
+            item("red-top", "top", "red"),
+            item("yellow-skirt", "bottom", "yellow"),
+            item("orange-skirt", "bottom", "orange"),
+            item("flats", "shoes", "black"),
+        ]
+
+        assert select_outfit_items(rows, today=SUMMER)[1] == "orange-skirt"
+
+    def test_dress_template(self):
+        """Test a dress can replace top and bottom"""
+        rows = [item("dress", "dress", tags=["date"]), item("heels", "shoes")]
+
+        assert select_outfit_items(rows, occasion="date", today=SUMMER) == ["dress", "heels"]
+
+    def test_fallback_and_empty(self):
+        """Test wardrobes no template fits get one item per category"""
+        rows = [item("tee", "top"), item("cap", "accessories")]
+
+        assert select_outfit_items(rows, today=SUMMER) == ["tee", "cap"]
+        assert select_outfit_items([], today=SUMMER) == []
+
+    def test_best_n_sorted_and_distinct(self):
+        """Test several outfits come back best first without repeats"""
+        selector = OutfitSelector(EncodedWardrobe(synthetic_wardrobe(200)), season="summer")
+
+        outfits = selector.best(n=10)
+
+        assert len(outfits) == 10
+        assert [o.score for o in outfits] == sorted((o.score for o in outfits), reverse=True)
+        assert len({o.item_ids for o in outfits}) == 10
+
+    def test_matches_exhaustive_search(self):
+        """Test beam search finds the same best outfit as trying every combination"""
+        rows = synthetic_wardrobe(60, seed=3)
+        wardrobe = EncodedWardrobe(rows, ["work", "casual"])
+        selector = OutfitSelector(
+            wardrobe, styles=["casual"], occasion="work", season="summer"
+        )
+
+        outerwear = set(wardrobe.indices("outerwear").tolist())
+
+        def score(path):
+            total = sum(float(selector.unary[i]) for i in path)
+            total -= selector.weights.optional * len(outerwear.intersection(path))
+            for a, b in itertools.combinations(path, 2):
+                total += float(selector._pair(np.array([a]), np.array([b]))[0, 0])
+            return total
+
+        tops, bottoms, shoes = (wardrobe.indices(c) for c in ("top", "bottom", "shoes"))
+        outer = [*wardrobe.indices("outerwear"), None]
+        exhaustive = max(
+            score([p for p in path if p is not None])
+            for path in itertools.product(tops, bottoms, shoes, outer)
+        )
+        dresses = max(
+            score([p for p in path if p is not None])
+            for path in itertools.product(wardrobe.indices("dress"), shoes, outer)
+        )
+
+        best = selector.best(n=1, beam=64, top_k=64)[0]
+        assert best.score == pytest.approx(max(exhaustive, dresses), rel=1e-5)
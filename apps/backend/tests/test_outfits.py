@@ -0,0 +1,210 @@
+"""
+Unit tests for the outfit generation endpoints
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from app.api.deps import get_current_user, get_db
+from app.api.endpoints import outfits
+from app.main import app
+from app.services.cache_service import CachedOutfit, outfit_cache_key
+from app.services.generation_jobs import JobQueue, MemoryJobStore
+from app.services.outfit_generation import get_generation_queue
+
+USER = {"id": "user-123", "email": "test@example.com"}
+
+
+def wardrobe_row(item_id, category, **fields):
+    return {
+        "id": item_id, "category": category, "color": None, "season": None,
+        "tags": None, "wearCount": 0, **fields,
+    }
+
+
+class Runner:
+    """Job runner that waits for the test to release it"""
+
+    def __init__(self):
+        self.jobs = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, job, report):
+        self.jobs.append(job)
+        await report(0.5, "generating")
+        await self.release.wait()
+        return {"outfitId": "outfit-1", "imageUrl": "/uploads/outfits/user-123/1.png"}
+
+
+@pytest.fixture
+async def runner():
+    return Runner()
+
+
+@pytest.fixture
+async def queue(runner):
+    queue = JobQueue(MemoryJobStore(), runner, workers=2, max_queued_per_user=1)
+    await queue.start()
+    yield queue
+    runner.release.set()
+    await queue.stop()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Outfit cache that misses unless told otherwise"""
+    cache = SimpleNamespace(get=AsyncMock(return_value=None), generation=AsyncMock(return_value=7))
+    monkeypatch.setattr(outfits, "outfit_cache", cache)
+    return cache
+
+
+@pytest.fixture
+async def client(mock_prisma, queue, cache):
+    """Async client running in the test's event loop, so jobs run too"""
+    mock_prisma.query_raw = AsyncMock(return_value=[
+        wardrobe_row("top-1", "top", wearCount=3),
+        wardrobe_row("top-2", "top"),
+        wardrobe_row("jeans", "bottom"),
+        wardrobe_row("sneakers", "shoes"),
+    ])
+    app.dependency_overrides[get_current_user] = lambda: USER
+    app.dependency_overrides[get_db] = lambda: mock_prisma
+    app.dependency_overrides[get_generation_queue] = lambda: queue
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        yield client
+    for dependency in (get_current_user, get_db, get_generation_queue):
+        app.dependency_overrides.pop(dependency, None)
+
+
+class TestGenerateOutfit:
+    """Tests for POST /api/outfits/generate"""
+
+    async def test_queues_job(self, client, runner):
+        """Test a cache miss returns 202 with a job to follow"""
+        response = await client.post("/api/outfits/generate", json={"occasion": "work"})
+
+        assert response.status_code == 202
+        data = response.json()
+        assert data["cached"] is False
+        assert data["job"]["status"] == "queued"
+        assert response.headers["location"] == f"/api/outfits/jobs/{data['job']['id']}"
+
+        await asyncio.sleep(0.01)
+        job = runner.jobs[0]
+        assert job.params == {
+            "clothingItemIds": ["jeans", "sneakers", "top-2"],  # least worn top
+            "occasion": "work",
+            "generation": 7,
+        }
+        assert job.cacheKey == outfit_cache_key("user-123", ["top-2", "jeans", "sneakers"], "work")
+
+    async def test_cached(self, client, cache, runner):
+        """Test a cached outfit is returned directly without a job"""
+        cache.get.return_value = CachedOutfit(
+            id="outfit-1", userId="user-123", name="Look", imageUrl="/uploads/look.png",
+            occasion=None, clothingItemIds=["a", "b"], cacheKey="k", generation=0,
+        )
+
+        response = await client.post("/api/outfits/generate", json={"clothing_item_ids": ["a", "b"]})
+
+        assert response.status_code == 200
+        assert response.json()["cached"] is True
+        assert response.json()["outfit"]["id"] == "outfit-1"
+        assert runner.jobs == []
+
+    async def test_force_regenerate_skips_cache(self, client, cache):
+        """Test force_regenerate always queues a job"""
+        cache.get.return_value = object()
+
+        response = await client.post(
+            "/api/outfits/generate", json={"clothing_item_ids": ["a"], "force_regenerate": True}
+        )
+
+        assert response.status_code == 202
+        cache.get.assert_not_called()
+
+    async def test_identical_requests_share_a_job(self, client):
+        """Test duplicate submissions are deduplicated by cache key"""
+        body = {"clothing_item_ids": ["b", "a"], "occasion": "date"}
+        first = (await client.post("/api/outfits/generate", json=body)).json()
+        body["clothing_item_ids"] = ["a", "b"]
+        second = (await client.post("/api/outfits/generate", json=body)).json()
+
+        assert first["job"]["id"] == second["job"]["id"]
+
+    async def test_too_many_jobs(self, client):
+        """Test a user over their job limit gets 429"""
+        for ids in (["a"], ["b"]):
+            response = await client.post("/api/outfits/generate", json={"clothing_item_ids": ids})
+            assert response.status_code == 202
+
+        response = await client.post("/api/outfits/generate", json={"clothing_item_ids": ["c"]})
+
+        assert response.status_code == 429
+
+    async def test_empty_wardrobe(self, client, mock_prisma):
+        """Test generating without any clothing items returns 400"""
+        mock_prisma.query_raw.return_value = []
+
+        response = await client.post("/api/outfits/generate", json={})
+
+        assert response.status_code == 400
+
+    async def test_requires_auth(self):
+        """Test the endpoint rejects anonymous requests"""
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            response = await client.post("/api/outfits/generate", json={})
+
+        assert response.status_code == 401
+
+
+class TestJobEndpoints:
+    """Tests for polling and streaming generation jobs"""
+
+    async def test_poll(self, client, runner):
+        """Test polling shows progress and then the result"""
+        job_id = (await client.post("/api/outfits/generate", json={})).json()["job"]["id"]
+        await asyncio.sleep(0.01)
+
+        running = (await client.get(f"/api/outfits/jobs/{job_id}")).json()
+        assert running["status"] == "running"
+        assert running["progress"] == 0.5
+
+        runner.release.set()
+        await asyncio.sleep(0.01)
+        done = (await client.get(f"/api/outfits/jobs/{job_id}")).json()
+        assert done["status"] == "succeeded"
+        assert done["outfitId"] == "outfit-1"
+        assert done["imageUrl"] == "/uploads/outfits/user-123/1.png"
+
+    async def test_other_users_job(self, client, queue):
+        """Test jobs of other users are not visible"""
+        job, _ = await queue.submit("someone-else", "key", {})
+
+        response = await client.get(f"/api/outfits/jobs/{job.id}")
+
+        assert response.status_code == 404
+        assert (await client.get("/api/outfits/jobs/missing")).status_code == 404
+
+    async def test_events(self, client, runner):
+        """Test the SSE stream ends with a done event carrying the result"""
+        job_id = (await client.post("/api/outfits/generate", json={})).json()["job"]["id"]
+        asyncio.get_running_loop().call_later(0.05, runner.release.set)
+
+        response = await client.get(f"/api/outfits/jobs/{job_id}/events")
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+        kinds = [lines[0].removeprefix("event: ") for lines in events]
+        assert kinds[-1] == "done"
+        assert set(kinds[:-1]) <= {"progress"}
+        final = json.loads(events[-1][1].removeprefix("data: "))
+        assert final["status"] == "succeeded"
@@ -0,0 +1,114 @@
+"""
+Unit tests for perceptual hashes and the hash index
+"""
+import io
+import random
+
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance
+
+from app.services.perceptual_hash import (
+    HashIndex,
+    format_hash,
+    hamming,
+    parse_hash,
+    perceptual_hash,
+)
+
+
+def photo(seed, size=(400, 500)):
+    """A synthetic garment photo: random shapes on a gradient"""
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        w, h = rng.randrange(40, 200), rng.randrange(40, 200)
+        fill = tuple(rng.randrange(256) for _ in range(3))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)([x, y, x + w, y + h], fill=fill)
+    return image
+
+
+def reupload(image):
+    """The same photo scaled, slightly cropped, brightened and recompressed"""
+    width, height = image.size
+    image = image.crop((6, 8, width - 6, height - 4)).resize((width * 2 // 3, height * 2 // 3))
+    image = ImageEnhance.Brightness(image).enhance(1.1)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=60)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+class TestPerceptualHash:
+    """Tests for perceptual_hash()"""
+
+    def test_near_duplicates_are_close(self):
+        """Test a re-uploaded photo differs in a few bits and another photo in many"""
+        original = perceptual_hash(photo(1))
+
+        assert hamming(original, perceptual_hash(reupload(photo(1)))) <= 6
+        assert all(hamming(original, perceptual_hash(photo(seed))) > 16 for seed in range(2, 8))
+
+    def test_transparency_flattened(self):
+        """Test a transparent photo hashes like the same photo on white"""
+        image = photo(3).convert("RGBA")
+        image.putalpha(255)
+        opaque = perceptual_hash(image.convert("RGB"))
+
+        assert perceptual_hash(image) == opaque
+
+    def test_format_round_trip(self):
+        """Test hashes are stored as 16 hex digits"""
+        value = perceptual_hash(photo(4))
+
+        assert len(format_hash(value)) == 16
+        assert parse_hash(format_hash(value)) == value
+        assert format_hash(1) == "0000000000000001"
+
+    @pytest.mark.parametrize("value", ["", "abc", "xyzxyzxyzxyzxyzx"])
+    def test_parse_invalid(self, value):
+        """Test malformed stored hashes raise ValueError"""
+        with pytest.raises(ValueError):
+            parse_hash(value)
+
+
+class TestHashIndex:
+    """Tests for HashIndex"""
+
+    def test_matches_brute_force(self):
+        """Test searches find exactly the hashes within the radius"""
+        rng = random.Random(0)
+        centres = [rng.getrandbits(64) for _ in range(50)]
+        # Clusters of near-duplicates around random photos
+        hashes = {}
+        for i in range(2000):
+            value = centres[i % 50]
+            for _ in range(rng.randrange(6)):
+                value ^= 1 << rng.randrange(64)
+            hashes[f"item-{i}"] = value
+        index = HashIndex()
+        for item_id, value in hashes.items():
+            index.add(value, item_id)
+
+        for query in centres[:10] + [rng.getrandbits(64) for _ in range(10)]:
+            for radius in (0, 4, 10):
+                expected = sorted(
+                    (hamming(query, value), item_id)
+                    for item_id, value in hashes.items()
+                    if hamming(query, value) <= radius
+                )
+                assert index.search(query, radius) == expected
+
+        assert len(index) == 2000
+
+    def test_identical_and_high_bit_hashes(self):
+        """Test items with the same hash are all found, whatever the top bit"""
+        index = HashIndex()
+        top = 1 << 63
+        index.add(top | 0xFF, "a")
+        index.add(top | 0xFF, "b")
+        index.add(0xFF, "c")
+
+        assert index.search(top | 0xFF, 0) == [(0, "a"), (0, "b")]
+        assert index.search(top | 0xFF, 1) == [(0, "a"), (0, "b"), (1, "c")]
+        assert HashIndex().search(0xFF, 64) == []
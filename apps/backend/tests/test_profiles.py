@@ -1,15 +1,18 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock
 from app.main import app
+from app.api.deps import get_db
 from app.api.endpoints.profiles import ProfileCreate, StyleOption, OccasionOption
 import json
 
 
 @pytest.fixture
-def client():
-    """Test client for FastAPI app"""
-    return TestClient(app)
+def client(mock_prisma):
+    """Test client for FastAPI app backed by the mocked Prisma client"""
+    app.dependency_overrides[get_db] = lambda: mock_prisma
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_db, None)
 
 
 class TestProfileSchemas:
@@ -112,12 +115,9 @@ class TestProfileEndpoints:
         """Test GET /api/profile/ when profile not found"""
         mock_prisma.profile.find_unique = AsyncMock(return_value=None)
 
-        with patch("app.api.endpoints.profiles.get_prisma") as get_prisma_mock:
-            get_prisma_mock.return_value = mock_prisma
-
-            response = client.get("/api/profile/")
-            assert response.status_code == 404
-            assert "not found" in response.json()["detail"].lower()
+        response = client.get("/api/profile/")
+        assert response.status_code == 404
+        assert "not found" in response.json()["detail"].lower()
 
     def test_get_profile_success(self, client, mock_prisma):
         """Test GET /api/profile/ success"""
@@ -136,18 +136,15 @@ class TestProfileEndpoints:
 
         mock_prisma.profile.find_unique = AsyncMock(return_value=mock_profile)
 
-        with patch("app.api.endpoints.profiles.get_prisma") as get_prisma_mock:
-            get_prisma_mock.return_value = mock_prisma
-
-            response = client.get("/api/profile/")
-            assert response.status_code == 200
-            data = response.json()
-            assert data["id"] == "profile-123"
-            assert data["height"] == 175
-            assert data["weight"] == 70.5
-            assert data["primaryStyle"] == "casual"
-            assert data["secondaryStyle"] == "minimalist"
-            assert isinstance(data["occasions"], list)
+        response = client.get("/api/profile/")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["id"] == "profile-123"
+        assert data["height"] == 175
+        assert data["weight"] == 70.5
+        assert data["primaryStyle"] == "casual"
+        assert data["secondaryStyle"] == "minimalist"
+        assert isinstance(data["occasions"], list)
 
     def test_update_profile_create_new(self, client, mock_prisma):
         """Test PUT /api/profile/ creates new profile"""
@@ -162,14 +159,11 @@ class TestProfileEndpoints:
         mock_prisma.profile.find_unique = AsyncMock(return_value=None)
         mock_prisma.user.find_unique = AsyncMock(return_value=MagicMock(id="test-user-123"))
 
-        with patch("app.api.endpoints.profiles.get_prisma") as get_prisma_mock:
-            get_prisma_mock.return_value = mock_prisma
-
-            response = client.put("/api/profile/", json=profile_data)
-            assert response.status_code == 200
-            data = response.json()
-            assert data["height"] == 180
-            assert data["weight"] == 75.0
+        response = client.put("/api/profile/", json=profile_data)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["height"] == 180
+        assert data["weight"] == 75.0
 
     def test_update_profile_existing(self, client, mock_prisma):
         """Test PUT /api/profile/ updates existing profile"""
@@ -189,14 +183,11 @@ class TestProfileEndpoints:
             "occasions": ["athletic", "casual"],
         }
 
-        with patch("app.api.endpoints.profiles.get_prisma") as get_prisma_mock:
-            get_prisma_mock.return_value = mock_prisma
-
-            response = client.put("/api/profile/", json=profile_data)
-            assert response.status_code == 200
-            data = response.json()
-            assert data["height"] == 165
-            assert data["weight"] == 60.0
+        response = client.put("/api/profile/", json=profile_data)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["height"] == 165
+        assert data["weight"] == 60.0
 
     def test_update_profile_invalid_height(self, client):
         """Test PUT /api/profile/ with invalid height"""
@@ -229,19 +220,20 @@ class TestProfileEndpoints:
 
     def test_update_profile_user_not_found(self, client, mock_prisma):
         """Test PUT /api/profile/ when user doesn't exist"""
-        mock_prisma.user.find_unique = AsyncMock(return_value=None)
+        from prisma.errors import ForeignKeyViolationError
+
+        mock_prisma.profile.upsert = AsyncMock(side_effect=ForeignKeyViolationError(
+            {"user_facing_error": {"error_code": "P2003", "message": "Foreign key constraint failed"}}
+        ))
 
         profile_data = {
             "height": 170,
             "weight": 70.0,
         }
 
-        with patch("app.api.endpoints.profiles.get_prisma") as get_prisma_mock:
-            get_prisma_mock.return_value = mock_prisma
-
-            response = client.put("/api/profile/", json=profile_data)
-            assert response.status_code == 404
-            assert "user not found" in response.json()["detail"].lower()
+        response = client.put("/api/profile/", json=profile_data)
+        assert response.status_code == 404
+        assert "user not found" in response.json()["detail"].lower()
 
     def test_update_profile_empty_occasions(self, client, mock_prisma):
         """Test PUT /api/profile/ with empty occasions list"""
@@ -255,13 +247,10 @@ class TestProfileEndpoints:
             "occasions": [],
         }
 
-        with patch("app.api.endpoints.profiles.get_prisma") as get_prisma_mock:
-            get_prisma_mock.return_value = mock_prisma
-
-            response = client.put("/api/profile/", json=profile_data)
-            assert response.status_code == 200
-            data = response.json()
-            assert data["occasions"] == []
+        response = client.put("/api/profile/", json=profile_data)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["occasions"] == []
 
     def test_update_profile_partial_data(self, client, mock_prisma):
         """Test PUT /api/profile/ with partial data update"""
@@ -279,13 +268,109 @@ class TestProfileEndpoints:
             "height": 185,
         }
 
-        with patch("app.api.endpoints.profiles.get_prisma") as get_prisma_mock:
-            get_prisma_mock.return_value = mock_prisma
+        response = client.put("/api/profile/", json=profile_data)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["height"] == 185
+
+
+    def test_update_profile_single_round_trip(self, client, mock_prisma):
+        """Test PUT /api/profile/ issues exactly one query"""
+        response = client.put("/api/profile/", json={"height": 175, "occasions": ["work"]})
+
+        assert response.status_code == 200
+        mock_prisma.profile.upsert.assert_awaited_once()
+        mock_prisma.user.find_unique.assert_not_awaited()
+        mock_prisma.profile.find_unique.assert_not_awaited()
+        mock_prisma.profile.create.assert_not_awaited()
+        mock_prisma.profile.update.assert_not_awaited()
 
-            response = client.put("/api/profile/", json=profile_data)
+        kwargs = mock_prisma.profile.upsert.call_args.kwargs
+        assert kwargs["where"] == {"userId": "default-user-id"}
+        assert kwargs["data"]["create"]["userId"] == "default-user-id"
+        assert kwargs["data"]["update"]["height"] == 175
+        assert "userId" not in kwargs["data"]["update"]
+
+    def test_update_profile_is_one_round_trip(self, client, mock_prisma):
+        """Test PUT /api/profile/ latency and queries amount to one round trip"""
+        import asyncio
+        import time
+
+        # Long enough that scheduling noise stays well under one round trip
+        round_trip = 0.2
+        upsert = mock_prisma.profile.upsert.side_effect
+
+        async def slow_upsert(**kwargs):
+            await asyncio.sleep(round_trip)
+            return upsert(**kwargs)
+
+        mock_prisma.profile.upsert.side_effect = slow_upsert
+
+        start = time.perf_counter()
+        response = client.put("/api/profile/", json={"height": 175})
+        elapsed = time.perf_counter() - start
+
+        assert response.status_code == 200
+        assert [name for name, _, _ in mock_prisma.mock_calls] == ["profile.upsert"]
+        # The previous find/find/write flow needed three round trips
+        assert elapsed < 2 * round_trip
+
+
+class TestProfileCache:
+    """Test read-through profile caching on the profile endpoints"""
+
+    @pytest.fixture
+    def stored_profile(self, mock_prisma):
+        """Profile row returned by the mocked database"""
+        from datetime import datetime
+
+        profile = MagicMock()
+        profile.id = "profile-123"
+        profile.userId = "default-user-id"
+        profile.height = 175
+        profile.weight = 70.5
+        profile.primaryStyle = "casual"
+        profile.secondaryStyle = None
+        profile.occasions = json.dumps(["work"])
+        profile.createdAt = datetime.now()
+        profile.updatedAt = datetime.now()
+        mock_prisma.profile.find_unique = AsyncMock(return_value=profile)
+        return profile
+
+    def test_repeated_get_served_from_cache(self, client, mock_prisma, stored_profile):
+        """Test only the first GET reaches the database"""
+        for _ in range(3):
+            response = client.get("/api/profile/")
             assert response.status_code == 200
-            data = response.json()
-            assert data["height"] == 185
+            assert response.json()["occasions"] == ["work"]
+
+        mock_prisma.profile.find_unique.assert_awaited_once()
+
+    def test_cache_holds_decoded_response(self, client, stored_profile, fresh_profile_cache):
+        """Test the cached value is the decoded response model"""
+        import asyncio
+        from app.api.endpoints.profiles import ProfileResponse
+
+        client.get("/api/profile/")
+        cached = asyncio.run(fresh_profile_cache.get("default-user-id"))
+
+        assert isinstance(cached, ProfileResponse)
+        assert cached.occasions == ["work"]
+
+    def test_missing_profile_not_cached(self, client, mock_prisma):
+        """Test 404s are not cached so a new profile shows up at once"""
+        client.get("/api/profile/")
+        client.get("/api/profile/")
+
+        assert mock_prisma.profile.find_unique.await_count == 2
+
+    def test_update_invalidates_cache(self, client, mock_prisma, stored_profile):
+        """Test PUT drops the cached profile"""
+        client.get("/api/profile/")
+        client.put("/api/profile/", json={"height": 180})
+        client.get("/api/profile/")
+
+        assert mock_prisma.profile.find_unique.await_count == 2
 
 
 class TestProfileResponse:
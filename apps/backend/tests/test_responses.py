@@ -0,0 +1,125 @@
+"""
+Unit tests for the fast JSON response class
+"""
+import json
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.api.endpoints.profiles import ProfileResponse
+from app.core import responses
+from app.core.responses import FastJSONResponse, dumps
+from app.main import app
+
+
+def make_profile(**overrides) -> ProfileResponse:
+    data = {
+        "id": "profile-1",
+        "userId": "user-1",
+        "height": 170,
+        "weight": 62.5,
+        "primaryStyle": "casual",
+        "secondaryStyle": None,
+        "occasions": ["work", "events/formal"],
+        "createdAt": "2025-01-01T08:00:00+00:00",
+        "updatedAt": "2025-01-02T08:00:00+00:00",
+    }
+    data.update(overrides)
+    return ProfileResponse(**data)
+
+
+class TestDumps:
+    """Tests for dumps()"""
+
+    def test_model_matches_stock_encoder(self):
+        """Test a model serializes to the same document as JSONResponse"""
+        profile = make_profile()
+
+        assert json.loads(dumps(profile)) == json.loads(
+            JSONResponse(jsonable_encoder(profile)).body
+        )
+
+    def test_compact_utf8(self):
+        """Test output is compact and keeps non-ASCII characters"""
+        body = dumps({"name": "Café", "tags": [1, 2]})
+
+        assert body == '{"name":"Café","tags":[1,2]}'.encode("utf-8")
+
+    def test_nested_models_and_sets(self):
+        """Test models and sets nested in plain containers"""
+        body = json.loads(dumps({"items": [make_profile()], "ids": {"a"}}))
+
+        assert body["items"][0]["userId"] == "user-1"
+        assert body["ids"] == ["a"]
+
+    def test_datetime(self):
+        """Test datetimes are written as ISO 8601"""
+        moment = datetime(2025, 1, 1, 8, 0, tzinfo=timezone.utc)
+
+        assert json.loads(dumps({"at": moment})) == {"at": "2025-01-01T08:00:00+00:00"}
+
+    def test_unsupported_type(self):
+        """Test unknown objects raise TypeError"""
+        with pytest.raises(TypeError):
+            dumps({"value": object()})
+
+    def test_stdlib_fallback(self, monkeypatch):
+        """Test the stdlib encoder is used when orjson is unavailable"""
+        monkeypatch.setattr(responses, "orjson", None)
+
+        body = dumps({"name": "Café", "ids": {"a"}})
+
+        assert body == '{"name":"Café","ids":["a"]}'.encode("utf-8")
+
+
+class TestFastJSONResponse:
+    """Tests for FastJSONResponse"""
+
+    def test_app_default_response_class(self):
+        """Test the application renders with FastJSONResponse by default"""
+        assert app.router.default_response_class is FastJSONResponse
+
+    def test_response_model_route(self):
+        """Test a response_model route returns the same body as before"""
+        test_app = FastAPI(default_response_class=FastJSONResponse)
+
+        @test_app.get("/profiles", response_model=list[ProfileResponse])
+        async def list_profiles():
+            return [make_profile(id=f"profile-{i}") for i in range(3)]
+
+        response = TestClient(test_app).get("/profiles")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert [p["id"] for p in response.json()] == ["profile-0", "profile-1", "profile-2"]
+
+    def test_dict_route(self):
+        """Test a route returning a plain dict renders the same document"""
+        test_app = FastAPI()
+
+        @test_app.get("/stats", response_class=FastJSONResponse)
+        async def stats():
+            return {"profiles": [make_profile(id=f"profile-{i}") for i in range(3)], "hit_rate": 0.5}
+
+        response = TestClient(test_app).get("/stats")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert [p["id"] for p in response.json()["profiles"]] == ["profile-0", "profile-1", "profile-2"]
+
+    def test_return_model_directly(self):
+        """Test a model can be passed straight to the response"""
+        test_app = FastAPI()
+
+        @test_app.get("/profile")
+        async def get_profile():
+            return FastJSONResponse(make_profile(), status_code=201)
+
+        response = TestClient(test_app).get("/profile")
+
+        assert response.status_code == 201
+        assert response.json()["occasions"] == ["work", "events/formal"]
@@ -0,0 +1,189 @@
+"""
+Unit tests for local access token verification
+"""
+import asyncio
+import jwt
+import pytest
+from unittest.mock import AsyncMock
+from app.core.security import (
+    JWKSCache,
+    JWTVerifier,
+    TokenVerificationError,
+    UnknownSigningKeyError,
+    user_from_claims,
+)
+
+
+@pytest.fixture
+def jwks_cache(jwks):
+    """JWKS cache whose endpoint returns the local key set"""
+    cache = JWKSCache(
+        jwks_url="https://test.supabase.co/auth/v1/.well-known/jwks.json",
+        refresh_interval=600,
+        min_refresh_interval=30,
+    )
+    cache._fetch = AsyncMock(return_value=jwks)
+    return cache
+
+
+@pytest.fixture
+def verifier(jwks_cache):
+    """Verifier backed by the local key set"""
+    return JWTVerifier(jwks=jwks_cache)
+
+
+class TestJWKSCache:
+    """Tests for signing key caching"""
+
+    async def test_loads_keys_on_first_use(self, jwks_cache):
+        """Test keys are fetched lazily"""
+        key = await jwks_cache.get_key("test-key")
+
+        assert key is not None
+        assert key.key_id == "test-key"
+        jwks_cache._fetch.assert_awaited_once()
+
+    async def test_cached_keys_are_reused(self, jwks_cache):
+        """Test a fresh cache does not refetch"""
+        for _ in range(5):
+            await jwks_cache.get_key("test-key")
+
+        jwks_cache._fetch.assert_awaited_once()
+
+    async def test_unknown_kid_refresh_is_rate_limited(self, jwks_cache):
+        """Test unknown key IDs cannot force a refetch on every request"""
+        await jwks_cache.get_key("test-key")
+
+        assert await jwks_cache.get_key("other-key") is None
+        assert await jwks_cache.get_key("other-key") is None
+        jwks_cache._fetch.assert_awaited_once()
+
+    async def test_unknown_kid_refreshes_after_min_interval(self, jwks_cache, jwks):
+        """Test a rotated key is picked up by an on-demand refresh"""
+        await jwks_cache.get_key("test-key")
+        jwks_cache._loaded_at -= 31
+
+        rotated = {"keys": [dict(jwks["keys"][0], kid="rotated-key")]}
+        jwks_cache._fetch = AsyncMock(return_value=rotated)
+
+        key = await jwks_cache.get_key("rotated-key")
+
+        assert key is not None
+        jwks_cache._fetch.assert_awaited_once()
+
+    async def test_failed_refresh_keeps_previous_keys(self, jwks_cache):
+        """Test an unreachable JWKS endpoint does not drop cached keys"""
+        import httpx
+
+        await jwks_cache.get_key("test-key")
+        jwks_cache._loaded_at -= 601
+        jwks_cache._fetch = AsyncMock(side_effect=httpx.ConnectError("down"))
+
+        assert await jwks_cache.get_key("test-key") is not None
+
+    async def test_background_refresh(self, jwks_cache):
+        """Test the background task refreshes keys periodically"""
+        jwks_cache.refresh_interval = 0.01
+        jwks_cache.min_refresh_interval = 0
+
+        jwks_cache.start()
+        await asyncio.sleep(0.05)
+        await jwks_cache.stop()
+
+        assert jwks_cache._fetch.await_count >= 2
+
+
+class TestJWTVerifier:
+    """Tests for token verification"""
+
+    async def test_verify_valid_token(self, verifier, make_token):
+        """Test a correctly signed token is accepted"""
+        claims = await verifier.verify(make_token())
+
+        assert claims["sub"] == "user-123"
+        assert claims["email"] == "test@example.com"
+
+    async def test_verify_expired_token(self, verifier, make_token):
+        """Test expired tokens are rejected"""
+        with pytest.raises(TokenVerificationError):
+            await verifier.verify(make_token(expires_in=-60))
+
+    async def test_verify_wrong_audience(self, verifier, make_token):
+        """Test tokens for another audience are rejected"""
+        with pytest.raises(TokenVerificationError):
+            await verifier.verify(make_token(aud="anon"))
+
+    async def test_verify_issuer(self, jwks_cache, make_token):
+        """Test the issuer is checked when configured"""
+        verifier = JWTVerifier(jwks=jwks_cache, issuer="https://test.supabase.co/auth/v1")
+
+        claims = await verifier.verify(make_token(iss="https://test.supabase.co/auth/v1"))
+        assert claims["sub"] == "user-123"
+
+        with pytest.raises(TokenVerificationError):
+            await verifier.verify(make_token(iss="https://evil.example.com/auth/v1"))
+
+    async def test_verify_forged_signature(self, verifier, jwks):
+        """Test tokens signed by a different key are rejected"""
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        token = jwt.encode(
+            {"sub": "user-123", "aud": "authenticated", "exp": 9999999999},
+            other_key, algorithm="RS256", headers={"kid": "test-key"}
+        )
+
+        with pytest.raises(TokenVerificationError):
+            await verifier.verify(token)
+
+    async def test_verify_malformed_token(self, verifier):
+        """Test garbage tokens are rejected without a key lookup"""
+        with pytest.raises(TokenVerificationError):
+            await verifier.verify("not-a-jwt")
+
+    async def test_verify_unknown_kid(self, verifier, make_token):
+        """Test unknown key IDs are reported separately"""
+        with pytest.raises(UnknownSigningKeyError):
+            await verifier.verify(make_token(kid="rotated-key"))
+
+    async def test_verify_algorithm_confusion(self, verifier, jwks):
+        """Test an HS256 token signed with the public key is rejected"""
+        token = jwt.encode(
+            {"sub": "user-123", "aud": "authenticated", "exp": 9999999999},
+            "public-key-material", algorithm="HS256", headers={"kid": "test-key"}
+        )
+
+        with pytest.raises(UnknownSigningKeyError):
+            await verifier.verify(token)
+
+    async def test_verify_hs256_with_secret(self, jwks_cache):
+        """Test legacy HS256 tokens verify against the project secret"""
+        secret = "super-secret-jwt-token-with-at-least-32-characters"
+        verifier = JWTVerifier(jwks=jwks_cache, jwt_secret=secret)
+        token = jwt.encode(
+            {"sub": "user-123", "aud": "authenticated", "exp": 9999999999},
+            secret, algorithm="HS256"
+        )
+
+        claims = await verifier.verify(token)
+
+        assert claims["sub"] == "user-123"
+        jwks_cache._fetch.assert_not_awaited()
+
+
+class TestUserFromClaims:
+    """Tests for mapping claims to user data"""
+
+    def test_user_from_claims(self):
+        """Test claims map onto the Supabase user shape"""
+        user = user_from_claims({
+            "sub": "user-123",
+            "email": "test@example.com",
+            "role": "authenticated",
+            "user_metadata": {"full_name": "Test User"},
+        })
+
+        assert user["id"] == "user-123"
+        assert user["email"] == "test@example.com"
+        assert user["user_metadata"]["full_name"] == "Test User"
+        assert user["app_metadata"] == {}
@@ -0,0 +1,135 @@
+"""
+Unit tests for request coalescing
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+from fastapi import HTTPException
+from app.core.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """Tests for SingleFlight"""
+
+    async def test_concurrent_calls_share_one_execution(self):
+        """Test N concurrent callers trigger one call"""
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(10)))
+
+        assert results == ["result"] * 10
+        assert calls == 1
+        assert flight.stats() == {"calls": 10, "shared": 9, "in_flight": 0}
+
+    async def test_different_keys_run_independently(self):
+        """Test distinct keys are not coalesced"""
+        flight = SingleFlight()
+
+        async def work(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(
+            flight.do("a", lambda: work(1)), flight.do("b", lambda: work(2))
+        )
+
+        assert results == [1, 2]
+        assert flight.shared == 0
+
+    async def test_key_released_after_completion(self):
+        """Test sequential calls run again"""
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        assert await flight.do("key", work) == 1
+        assert await flight.do("key", work) == 2
+        assert len(flight) == 0
+
+    async def test_exception_shared(self):
+        """Test every waiter receives the failure"""
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *(flight.do("key", work) for _ in range(3)), return_exceptions=True
+        )
+
+        assert all(isinstance(r, ValueError) for r in results)
+        assert len(flight) == 0
+
+    async def test_cancelled_waiter_does_not_cancel_work(self):
+        """Test one disconnecting caller leaves the shared work running"""
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+
+class TestAuthCoalescing:
+    """Tests for coalesced token verification"""
+
+    async def test_concurrent_verifications_make_one_upstream_call(self):
+        """Test simultaneous requests with the same token verify once"""
+        from app.api.deps import authenticate_token
+
+        calls = 0
+
+        async def slow_verify(token):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"id": "user-123"}, None
+
+        with patch("app.api.deps.verify_token", side_effect=slow_verify):
+            users = await asyncio.gather(
+                *(authenticate_token("same-token") for _ in range(8))
+            )
+
+        assert calls == 1
+        assert all(user["id"] == "user-123" for user in users)
+
+    async def test_concurrent_rejections_share_error(self):
+        """Test simultaneous requests with a bad token all get 401"""
+        from app.api.deps import authenticate_token
+
+        calls = 0
+
+        async def reject(token):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise HTTPException(status_code=401, detail="Invalid or expired session")
+
+        with patch("app.api.deps.verify_token", side_effect=reject):
+            results = await asyncio.gather(
+                *(authenticate_token("bad-token") for _ in range(5)),
+                return_exceptions=True
+            )
+
+        assert calls == 1
+        assert all(isinstance(r, HTTPException) and r.status_code == 401 for r in results)
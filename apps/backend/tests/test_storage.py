@@ -0,0 +1,563 @@
+"""
+Unit tests for storage backends
+"""
+import asyncio
+import hashlib
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from app.core.config import settings
+from app.storage import ContentAddressedStorage, FileTooLargeError, LocalStorage, get_storage
+from app.storage.streams import StreamDigest, iter_chunks, tee
+
+
+async def body(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def join(chunks) -> bytes:
+    return b"".join([c async for c in chunks])
+
+
+class AsyncFile:
+    """Minimal stand-in for FastAPI's UploadFile"""
+
+    def __init__(self, data: bytes):
+        self._buffer = io.BytesIO(data)
+        self.reads = []
+
+    async def read(self, size: int = -1) -> bytes:
+        self.reads.append(size)
+        return self._buffer.read(size)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """Local storage in a temporary directory with a small chunk size"""
+    return LocalStorage(base_dir=str(tmp_path), chunk_size=4)
+
+
+class TestIterChunks:
+    """Tests for iter_chunks()"""
+
+    async def test_async_iterator(self):
+        """Test async iterators are re-chunked, skipping empty chunks"""
+        chunks = [c async for c in iter_chunks(body(b"ab", b"", b"cde"), 2)]
+
+        assert chunks == [b"ab", b"cd", b"e"]
+
+    async def test_async_iterator_small_and_large_chunks(self):
+        """Test tiny chunks are joined and huge ones split"""
+        source = body(*[b"a"] * 5, b"b" * 10, b"c")
+
+        chunks = [c async for c in iter_chunks(source, 4)]
+
+        assert chunks == [b"aaaa", b"abbb", b"bbbb", b"bbbc"]
+
+    async def test_sync_file(self):
+        """Test sync file-likes are read in fixed-size chunks"""
+        chunks = [c async for c in iter_chunks(io.BytesIO(b"abcdefg"), 3)]
+
+        assert chunks == [b"abc", b"def", b"g"]
+
+    async def test_sync_file_read_off_loop(self):
+        """Test sync reads run on the given executor, not the event loop"""
+        threads = set()
+
+        class File(io.BytesIO):
+            def read(self, size=-1):
+                threads.add(threading.get_ident())
+                return super().read(size)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            chunks = [c async for c in iter_chunks(File(b"abcdefg"), 3, executor)]
+
+        assert chunks == [b"abc", b"def", b"g"]
+        assert threading.get_ident() not in threads
+
+    async def test_async_file(self):
+        """Test objects with an async read() are read in fixed-size chunks"""
+        source = AsyncFile(b"abcdefg")
+
+        chunks = [c async for c in iter_chunks(source, 3)]
+
+        assert chunks == [b"abc", b"def", b"g"]
+        assert set(source.reads) == {3}
+
+    async def test_unsupported_source(self):
+        """Test unsupported sources raise TypeError"""
+        with pytest.raises(TypeError):
+            [c async for c in iter_chunks(b"raw bytes", 3)]
+
+
+class TestStreamDigest:
+    """Tests for StreamDigest"""
+
+    def test_size_and_hash(self):
+        """Test size and SHA-256 are accumulated across chunks"""
+        digest = StreamDigest()
+        digest.update(b"hello ")
+        digest.update(b"world")
+
+        assert digest.size == 11
+        assert digest.hexdigest() == hashlib.sha256(b"hello world").hexdigest()
+
+    def test_max_size(self):
+        """Test exceeding the limit raises"""
+        digest = StreamDigest(max_size=5)
+        digest.update(b"12345")
+
+        with pytest.raises(FileTooLargeError) as exc_info:
+            digest.update(b"6")
+
+        assert exc_info.value.max_size == 5
+
+
+class TestTee:
+    """Tests for tee()"""
+
+    async def test_branches_see_every_chunk(self):
+        """Test concurrent readers each get the whole stream"""
+        first, second = tee(body(b"ab", b"cd", b"ef"))
+
+        assert await asyncio.gather(join(first), join(second)) == [b"abcdef"] * 2
+
+    async def test_buffering_is_bounded(self):
+        """Test the source is read no further ahead than the slowest branch allows"""
+        pulled = []
+
+        async def source():
+            for n in range(100):
+                pulled.append(n)
+                yield b"x"
+
+        fast, slow = tee(source(), max_chunks=2)
+        await fast.__anext__()
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        assert len(pulled) <= 4
+        await fast.aclose()
+        await slow.aclose()
+
+    async def test_closed_branch_does_not_stall(self):
+        """Test a branch closed early, even unread, lets the other finish"""
+        first, second = tee(body(*[b"x"] * 20), max_chunks=1)
+        await second.aclose()
+
+        assert len([c async for c in first]) == 20
+
+    async def test_source_error_reaches_branches(self):
+        """Test an error from the source is raised in each branch"""
+
+        async def failing():
+            yield b"ok"
+            raise OSError("connection reset")
+
+        first, second = tee(failing())
+
+        for branch in (first, second):
+            with pytest.raises(OSError):
+                [c async for c in branch]
+
+    async def test_upload_while_reading(self, storage, tmp_path):
+        """Test one branch can be stored while another is consumed"""
+        to_storage, to_reader = tee(body(b"hello ", b"world"))
+
+        result, read = await asyncio.gather(
+            storage.upload_stream("tee.txt", to_storage),
+            join(to_reader),
+        )
+
+        assert read == b"hello world"
+        assert result.sha256 == hashlib.sha256(b"hello world").hexdigest()
+        assert (tmp_path / "tee.txt").read_bytes() == b"hello world"
+
+
+class TestLocalStorageUploadStream:
+    """Tests for LocalStorage.upload_stream"""
+
+    async def test_upload_async_iterator(self, storage, tmp_path):
+        """Test streaming an async iterator to disk"""
+        data = b"x" * 10 + b"y" * 7
+
+        result = await storage.upload_stream("clothing/a.jpg", body(data[:9], data[9:]))
+
+        assert result.url == "/uploads/clothing/a.jpg"
+        assert result.size == len(data)
+        assert result.sha256 == hashlib.sha256(data).hexdigest()
+        assert (tmp_path / "clothing" / "a.jpg").read_bytes() == data
+
+    async def test_upload_file_like(self, storage, tmp_path):
+        """Test streaming an UploadFile-like object in chunk_size reads"""
+        source = AsyncFile(b"0123456789")
+
+        result = await storage.upload_stream("b.jpg", source, content_type="image/jpeg")
+
+        assert result.size == 10
+        assert (tmp_path / "b.jpg").read_bytes() == b"0123456789"
+        assert set(source.reads) == {4}
+
+    async def test_upload_too_large(self, storage, tmp_path):
+        """Test oversized uploads are rejected and leave no files behind"""
+        with pytest.raises(FileTooLargeError):
+            await storage.upload_stream("c.jpg", body(b"1234", b"5678"), max_size=6)
+
+        assert list(tmp_path.iterdir()) == []
+
+    async def test_upload_too_large_keeps_existing_file(self, storage, tmp_path):
+        """Test a rejected upload does not clobber the previous file"""
+        await storage.upload("d.jpg", b"old")
+
+        with pytest.raises(FileTooLargeError):
+            await storage.upload_stream("d.jpg", body(b"new content"), max_size=4)
+
+        assert (tmp_path / "d.jpg").read_bytes() == b"old"
+        assert [p.name for p in tmp_path.iterdir()] == ["d.jpg"]
+
+    async def test_source_error_cleans_up(self, storage, tmp_path):
+        """Test a failing source removes the partial file"""
+
+        async def broken():
+            yield b"1234"
+            raise ConnectionError("client went away")
+
+        with pytest.raises(ConnectionError):
+            await storage.upload_stream("e.jpg", broken())
+
+        assert list(tmp_path.iterdir()) == []
+
+    async def test_overwrite(self, storage, tmp_path):
+        """Test uploading to an existing path replaces it"""
+        await storage.upload_stream("f.jpg", body(b"first"))
+        await storage.upload_stream("f.jpg", body(b"second"))
+
+        assert (tmp_path / "f.jpg").read_bytes() == b"second"
+
+
+class TestLocalStorageDownload:
+    """Tests for LocalStorage streaming and ranged reads"""
+
+    async def test_download_stream(self, storage):
+        """Test the whole file is streamed in chunk_size pieces"""
+        await storage.upload("a.bin", b"0123456789")
+
+        chunks = [c async for c in storage.download_stream("a.bin")]
+
+        assert chunks == [b"0123", b"4567", b"89"]
+
+    async def test_download_stream_range(self, storage):
+        """Test streaming a byte range"""
+        await storage.upload("a.bin", b"0123456789")
+
+        chunks = [c async for c in storage.download_stream("a.bin", 3, 9)]
+
+        assert b"".join(chunks) == b"345678"
+
+    async def test_download_range(self, storage):
+        """Test reading a byte range, clipped at end of file"""
+        await storage.upload("a.bin", b"0123456789")
+
+        assert await storage.download_range("a.bin", 2, 5) == b"234"
+        assert await storage.download_range("a.bin", 8, 100) == b"89"
+        assert await storage.download_range("a.bin", 5, 5) == b""
+
+    async def test_download_stream_missing(self, storage):
+        """Test streaming a missing file raises FileNotFoundError"""
+        with pytest.raises(FileNotFoundError):
+            [c async for c in storage.download_stream("missing.bin")]
+
+    async def test_stat(self, storage):
+        """Test size and a stable entity tag are reported"""
+        await storage.upload("a.bin", b"0123456789")
+
+        info = await storage.stat("a.bin")
+
+        assert info.size == 10
+        assert info.etag.startswith('"') and info.etag.endswith('"')
+        assert await storage.stat("a.bin") == info
+
+    async def test_stat_changes_with_content(self, storage):
+        """Test the entity tag changes when the file is rewritten"""
+        await storage.upload("a.bin", b"short")
+        before = await storage.stat("a.bin")
+        await storage.upload("a.bin", b"much longer")
+
+        assert (await storage.stat("a.bin")).etag != before.etag
+
+    async def test_path_traversal(self, storage):
+        """Test paths escaping the base directory are treated as missing"""
+        with pytest.raises(FileNotFoundError):
+            await storage.stat("../outside.txt")
+        with pytest.raises(FileNotFoundError):
+            storage.local_path("clothing/../../outside.txt")
+
+    def test_local_path(self, storage, tmp_path):
+        """Test local files expose their filesystem path"""
+        assert storage.local_path("clothing/a.jpg") == (tmp_path / "clothing" / "a.jpg").resolve()
+
+
+@pytest.fixture
+def cas(tmp_path):
+    """Content-addressed storage in a temporary directory"""
+    return ContentAddressedStorage(base_dir=str(tmp_path), chunk_size=4)
+
+
+def blob_files(cas):
+    return sorted(p.name for p in cas.blobs_dir.rglob("*") if p.is_file())
+
+
+class TestContentAddressedStorage:
+    """Tests for ContentAddressedStorage"""
+
+    async def test_upload_and_download(self, cas):
+        """Test content is stored under its hash and read back by logical path"""
+        url = await cas.upload("clothing/a.jpg", b"shirt")
+        sha = hashlib.sha256(b"shirt").hexdigest()
+
+        assert url == "/uploads/clothing/a.jpg"
+        assert cas.resolve_hash("clothing/a.jpg") == sha
+        assert (cas.blobs_dir / sha[:2] / sha[2:4] / sha).read_bytes() == b"shirt"
+        assert await cas.download("clothing/a.jpg") == b"shirt"
+        assert await cas.exists("clothing/a.jpg")
+
+    async def test_identical_content_stored_once(self, cas):
+        """Test duplicate uploads share one blob and are reference counted"""
+        await cas.upload("a.jpg", b"same bytes")
+        await cas.upload("b.jpg", b"same bytes")
+        sha = hashlib.sha256(b"same bytes").hexdigest()
+
+        assert blob_files(cas) == [sha]
+        assert cas.refcount(sha) == 2
+
+    async def test_stream_deduplicated(self, cas):
+        """Test streaming known content reports deduplication and keeps one blob"""
+        first = await cas.upload_stream("a.jpg", body(b"same ", b"bytes"))
+        second = await cas.upload_stream("b.jpg", io.BytesIO(b"same bytes"))
+
+        assert not first.deduplicated
+        assert second.deduplicated
+        assert first.sha256 == second.sha256
+        assert blob_files(cas) == [first.sha256]
+        assert list(cas.tmp_dir.iterdir()) == []
+
+    async def test_known_bytes_skip_blob_write(self, cas):
+        """Test uploading stored bytes does not rewrite the blob"""
+        await cas.upload("a.jpg", b"same bytes")
+        sha = hashlib.sha256(b"same bytes").hexdigest()
+        blob = cas.blobs_dir / sha[:2] / sha[2:4] / sha
+        mtime = blob.stat().st_mtime_ns
+
+        await cas.upload("b.jpg", b"same bytes")
+
+        assert blob.stat().st_mtime_ns == mtime
+
+    async def test_delete_keeps_referenced_blob(self, cas):
+        """Test deleting one of two paths keeps the shared blob"""
+        await cas.upload("a.jpg", b"same bytes")
+        await cas.upload("b.jpg", b"same bytes")
+
+        await cas.delete("a.jpg")
+
+        assert not await cas.exists("a.jpg")
+        assert await cas.download("b.jpg") == b"same bytes"
+        assert cas.refcount(hashlib.sha256(b"same bytes").hexdigest()) == 1
+
+    async def test_delete_last_reference_removes_blob(self, cas):
+        """Test the blob is removed with its last reference"""
+        await cas.upload("a.jpg", b"only copy")
+
+        await cas.delete("a.jpg")
+        await cas.delete("a.jpg")  # deleting twice is a no-op
+
+        assert blob_files(cas) == []
+        assert cas.refcount(hashlib.sha256(b"only copy").hexdigest()) == 0
+
+    async def test_overwrite_releases_previous_blob(self, cas):
+        """Test repointing a path releases the blob it used"""
+        await cas.upload("a.jpg", b"v1")
+        await cas.upload("a.jpg", b"v2")
+
+        assert await cas.download("a.jpg") == b"v2"
+        assert blob_files(cas) == [hashlib.sha256(b"v2").hexdigest()]
+
+    async def test_reupload_same_content_same_path(self, cas):
+        """Test uploading identical content to the same path keeps one reference"""
+        await cas.upload("a.jpg", b"v1")
+        await cas.upload("a.jpg", b"v1")
+
+        assert cas.refcount(hashlib.sha256(b"v1").hexdigest()) == 1
+
+    async def test_rejected_stream_leaves_nothing(self, cas):
+        """Test oversized streams leave no blob, mapping or temp file"""
+        with pytest.raises(FileTooLargeError):
+            await cas.upload_stream("a.jpg", body(b"123456"), max_size=3)
+
+        assert blob_files(cas) == []
+        assert not await cas.exists("a.jpg")
+        assert list(cas.tmp_dir.iterdir()) == []
+
+    async def test_stat_and_ranges(self, cas):
+        """Test metadata and ranged reads go through the blob"""
+        await cas.upload("a.bin", b"0123456789")
+
+        info = await cas.stat("a.bin")
+
+        assert info.size == 10
+        assert info.etag == f'"{hashlib.sha256(b"0123456789").hexdigest()}"'
+        assert await cas.download_range("a.bin", 2, 6) == b"2345"
+        assert cas.local_path("a.bin").read_bytes() == b"0123456789"
+
+    async def test_missing_path(self, cas):
+        """Test unknown logical paths behave like missing files"""
+        assert not await cas.exists("missing.jpg")
+        with pytest.raises(FileNotFoundError):
+            await cas.stat("missing.jpg")
+        with pytest.raises(FileNotFoundError):
+            await cas.download("missing.jpg")
+        with pytest.raises(FileNotFoundError):
+            await cas.upload("../escape.jpg", b"x")
+
+    def test_get_storage_selects_cas(self, monkeypatch, tmp_path):
+        """Test the content-addressed mode is selected from settings"""
+        monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+        monkeypatch.setattr(settings, "storage_content_addressed", True)
+
+        assert isinstance(get_storage(), ContentAddressedStorage)
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """Thread pool that counts submitted jobs"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.jobs = 0
+
+    def submit(self, *args, **kwargs):
+        self.jobs += 1
+        return super().submit(*args, **kwargs)
+
+
+@pytest.fixture
+def slow_fs(monkeypatch):
+    """Make metadata calls block for 50 ms, like a slow network filesystem"""
+    delay = 0.05
+    calls = {"mkdir": 0}
+
+    def slow(name):
+        original = getattr(Path, name)
+
+        def wrapper(self, *args, **kwargs):
+            calls[name] = calls.get(name, 0) + 1
+            time.sleep(delay)
+            return original(self, *args, **kwargs)
+
+        return wrapper
+
+    for name in ("exists", "unlink", "mkdir"):
+        monkeypatch.setattr(Path, name, slow(name))
+    return calls
+
+
+async def max_loop_lag(work) -> float:
+    """Run ``work`` while measuring the worst event-loop scheduling delay"""
+    lag = 0.0
+    done = False
+
+    async def monitor():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.perf_counter() - start - 0.005)
+
+    task = asyncio.create_task(monitor())
+    await asyncio.sleep(0)
+    try:
+        await work
+    finally:
+        done = True
+        await task
+    return lag
+
+
+class TestLocalStorageNonBlocking:
+    """Tests for LocalStorage thread-pool offloading and batching"""
+
+    async def test_slow_filesystem_does_not_block_loop(self, tmp_path, slow_fs):
+        """Test event-loop lag stays flat while slow filesystem calls run"""
+        storage = LocalStorage(base_dir=str(tmp_path), executor=ThreadPoolExecutor(8))
+
+        async def work():
+            await asyncio.gather(
+                *(storage.upload(f"user-{i}/a.jpg", b"x") for i in range(8)),
+                *(storage.exists(f"user-{i}/a.jpg") for i in range(8)),
+            )
+            await asyncio.gather(*(storage.delete(f"user-{i}/a.jpg") for i in range(8)))
+
+        lag = await max_loop_lag(work())
+
+        # 24 calls of 50 ms each would stall a blocking loop for over a second
+        assert lag < 0.04
+
+    async def test_directories_created_once(self, tmp_path, slow_fs):
+        """Test repeated uploads into one directory only mkdir once"""
+        storage = LocalStorage(base_dir=str(tmp_path))
+        slow_fs["mkdir"] = 0
+
+        for i in range(3):
+            await storage.upload(f"clothing/{i}.jpg", b"x")
+            await storage.upload_stream(f"clothing/s{i}.jpg", body(b"x"))
+
+        assert slow_fs["mkdir"] == 1
+
+    async def test_exists_many(self, tmp_path):
+        """Test existence of several files is checked in one job"""
+        executor = CountingExecutor(2)
+        storage = LocalStorage(base_dir=str(tmp_path), executor=executor)
+        await storage.upload("a.jpg", b"a")
+        await storage.upload("c.jpg", b"c")
+        executor.jobs = 0
+
+        found = await storage.exists_many(["a.jpg", "b.jpg", "c.jpg"])
+
+        assert found == {"a.jpg": True, "b.jpg": False, "c.jpg": True}
+        assert executor.jobs == 1
+        assert await storage.exists_many([]) == {}
+
+    async def test_delete_many(self, tmp_path):
+        """Test several files are deleted in one job, ignoring missing ones"""
+        executor = CountingExecutor(2)
+        storage = LocalStorage(base_dir=str(tmp_path), executor=executor)
+        await storage.upload("a.jpg", b"a")
+        await storage.upload("b.jpg", b"b")
+        executor.jobs = 0
+
+        await storage.delete_many(["a.jpg", "b.jpg", "missing.jpg"])
+
+        assert executor.jobs == 1
+        assert list(tmp_path.iterdir()) == []
+
+    async def test_cas_bulk_operations(self, tmp_path):
+        """Test bulk operations respect content-addressed references"""
+        cas = ContentAddressedStorage(base_dir=str(tmp_path))
+        await cas.upload("a.jpg", b"same")
+        await cas.upload("b.jpg", b"same")
+        await cas.upload("c.jpg", b"other")
+
+        assert await cas.exists_many(["a.jpg", "d.jpg"]) == {"a.jpg": True, "d.jpg": False}
+
+        await cas.delete_many(["a.jpg", "c.jpg"])
+
+        assert await cas.exists_many(["a.jpg", "b.jpg", "c.jpg"]) == {
+            "a.jpg": False,
+            "b.jpg": True,
+            "c.jpg": False,
+        }
+        assert blob_files(cas) == [hashlib.sha256(b"same").hexdigest()]
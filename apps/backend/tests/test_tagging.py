@@ -0,0 +1,315 @@
+"""
+Unit tests for batched, cached auto-tagging
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from app.core.admission import AdmissionRejected
+from app.core.cache import MemoryCacheBackend
+from app.services.tagging import (
+    GarmentTags,
+    MockTagger,
+    OpenAITagger,
+    TaggingError,
+    TaggingService,
+    content_hash,
+)
+
+TAGS = {"category": "top", "color": "Navy", "pattern": "striped", "material": "cotton"}
+
+
+class ScriptedTagger(MockTagger):
+    """Mock tagger that can fail, hold its calls open or reject photos"""
+
+    def __init__(self, error=None, reject=()):
+        super().__init__()
+        self.error = error
+        self.reject = set(reject)
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def tag_batch(self, images):
+        await self.release.wait()
+        if self.error is not None:
+            self.batches.append(len(images))
+            raise self.error
+        results = await super().tag_batch(images)
+        return [
+            TaggingError("Invalid tags") if image in self.reject else result
+            for image, result in zip(images, results)
+        ]
+
+
+def make_service(tagger, **kwargs):
+    options = {"max_batch": 4, "window": 0.01, "max_concurrent": 2, **kwargs}
+    return TaggingService(tagger, MemoryCacheBackend(maxsize=100, ttl=60), **options)
+
+
+def photos(count):
+    return [(content_hash(image), image) for image in (f"photo-{i}".encode() for i in range(count))]
+
+
+class TestGarmentTags:
+    """Tests for GarmentTags validation"""
+
+    def test_normalizes(self):
+        """Test names are trimmed and lowercased"""
+        tags = GarmentTags(category=" Top ", color="Navy", pattern="Striped")
+        assert (tags.category, tags.color, tags.pattern) == ("top", "navy", "striped")
+        assert tags.material is None
+
+    def test_unknown_category(self):
+        """Test categories outside the app's are rejected"""
+        with pytest.raises(ValueError):
+            GarmentTags(category="hat", color="red", pattern="solid")
+
+
+class TestTaggingService:
+    """Tests for TaggingService"""
+
+    async def test_batches_within_window(self):
+        """Test requests arriving together go out as one call"""
+        tagger = MockTagger()
+        service = make_service(tagger)
+
+        results = await service.tag_many(photos(3))
+
+        assert tagger.batches == [3]
+        assert all(isinstance(result, GarmentTags) for result in results)
+        assert service.stats()["mean_batch_size"] == 3.0
+
+    async def test_full_batch_sent_at_once(self):
+        """Test a full batch does not wait for the window"""
+        tagger = MockTagger()
+        service = make_service(tagger, window=60)
+
+        results = await asyncio.wait_for(service.tag_many(photos(8)), timeout=1)
+
+        assert tagger.batches == [4, 4]
+        assert len(results) == 8
+
+    async def test_results_in_order(self):
+        """Test each caller gets the tags of its own photo"""
+        service = make_service(MockTagger())
+        items = photos(6)
+
+        results = await service.tag_many(items)
+
+        expected = await MockTagger().tag_batch([image for _, image in items])
+        assert results == expected
+
+    async def test_cache_hit(self):
+        """Test a photo tagged before never reaches the model again"""
+        tagger = MockTagger()
+        service = make_service(tagger)
+        (key, image), = photos(1)
+
+        first = await service.tag(key, image)
+        # The rendition may differ between uploads; the hash decides
+        second = await service.tag(key, b"another rendition")
+
+        assert first == second
+        assert tagger.batches == [1]
+        assert service.stats()["cache_hits"] == 1
+
+    async def test_coalesces_identical_photos(self):
+        """Test concurrent requests for one photo share a slot"""
+        tagger = MockTagger()
+        service = make_service(tagger)
+        (key, image), = photos(1)
+
+        results = await asyncio.gather(*(service.tag(key, image) for _ in range(5)))
+
+        assert tagger.batches == [1]
+        assert len(set(result.model_dump_json() for result in results)) == 1
+        assert service.stats()["coalesced"] == 4
+
+    async def test_coalesces_with_running_batch(self):
+        """Test a request for a photo already being tagged waits for it"""
+        tagger = ScriptedTagger()
+        tagger.release.clear()
+        service = make_service(tagger)
+        (key, image), = photos(1)
+
+        first = asyncio.create_task(service.tag(key, image))
+        await asyncio.sleep(0.05)
+        assert service.stats()["in_flight"] == 1
+        second = asyncio.create_task(service.tag(key, image))
+        await asyncio.sleep(0)
+        tagger.release.set()
+
+        assert await first == await second
+        assert tagger.batches == [1]
+
+    async def test_bounded_concurrency(self):
+        """Test no more than max_concurrent calls run at once"""
+        running = 0
+        peak = 0
+
+        class SlowTagger(MockTagger):
+            async def tag_batch(self, images):
+                nonlocal running, peak
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.02)
+                running -= 1
+                return await super().tag_batch(images)
+
+        service = make_service(SlowTagger(), max_batch=1, max_concurrent=2)
+
+        await service.tag_many(photos(6))
+
+        assert peak == 2
+
+    async def test_item_error(self):
+        """Test one unusable photo fails alone and is not cached"""
+        items = photos(3)
+        tagger = ScriptedTagger(reject={items[1][1]})
+        service = make_service(tagger)
+
+        results = await service.tag_many(items)
+
+        assert isinstance(results[0], GarmentTags)
+        assert isinstance(results[1], TaggingError)
+        assert isinstance(results[2], GarmentTags)
+        assert await service.cache.get(items[1][0]) is None
+        assert service.stats()["failed"] == 1
+
+    async def test_batch_error(self):
+        """Test a failed call fails every photo of its batch"""
+        tagger = ScriptedTagger(error=TaggingError("Tagging failed with 500"))
+        service = make_service(tagger)
+        (key, image), = photos(1)
+
+        with pytest.raises(TaggingError, match="500"):
+            await service.tag(key, image)
+        results = await service.tag_many(photos(2))
+
+        assert all(isinstance(result, TaggingError) for result in results)
+        assert service.stats()["in_flight"] == 0
+
+    async def test_unexpected_error(self):
+        """Test a tagger bug surfaces as a tagging error"""
+        service = make_service(ScriptedTagger(error=RuntimeError("boom")))
+        (key, image), = photos(1)
+
+        with pytest.raises(TaggingError, match="boom"):
+            await service.tag(key, image)
+
+    async def test_cancelled_caller(self):
+        """Test a caller giving up does not cancel the batch for others"""
+        tagger = ScriptedTagger()
+        tagger.release.clear()
+        service = make_service(tagger)
+        (key, image), = photos(1)
+
+        first = asyncio.create_task(service.tag(key, image))
+        second = asyncio.create_task(service.tag(key, image))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        tagger.release.set()
+
+        assert isinstance(await second, GarmentTags)
+        assert await service.cache.get(key) is not None
+
+    async def test_aclose_flushes(self):
+        """Test closing sends pending requests without waiting for the window"""
+        tagger = MockTagger()
+        service = make_service(tagger, window=60)
+        (key, image), = photos(1)
+
+        task = asyncio.create_task(service.tag(key, image))
+        await asyncio.sleep(0)
+        await service.aclose()
+
+        assert isinstance(await task, GarmentTags)
+        assert tagger.batches == [1]
+
+    def test_invalid_batch_size(self):
+        """Test batches must hold at least one photo"""
+        with pytest.raises(ValueError):
+            make_service(MockTagger(), max_batch=0)
+
+
+class TestMockTagger:
+    """Tests for MockTagger"""
+
+    async def test_deterministic(self):
+        """Test the same photo always gets the same tags"""
+        first = await MockTagger().tag_batch([b"a", b"b"])
+        second = await MockTagger().tag_batch([b"a", b"b"])
+
+        assert first == second
+
+
+def openai_clients(response=None, error=None):
+    client = SimpleNamespace(post=AsyncMock(return_value=response, side_effect=error))
+    return SimpleNamespace(get=lambda name: client), client
+
+
+def completion(content):
+    return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+
+class TestOpenAITagger:
+    """Tests for OpenAITagger"""
+
+    async def test_one_call_per_batch(self):
+        """Test a batch is sent as one low-detail completion"""
+        clients, client = openai_clients(
+            completion(json.dumps({"items": [TAGS, {**TAGS, "category": "shoes"}]}))
+        )
+        tagger = OpenAITagger(clients, model="vision-model", api_key="sk-test")
+
+        results = await tagger.tag_batch([b"\x89PNG...", b"jpeg"])
+
+        assert [r.category for r in results] == ["top", "shoes"]
+        client.post.assert_awaited_once()
+        body = client.post.await_args.kwargs["json"]
+        assert body["model"] == "vision-model"
+        assert body["response_format"] == {"type": "json_object"}
+        images = [part for part in body["messages"][1]["content"] if part["type"] == "image_url"]
+        assert [image["image_url"]["detail"] for image in images] == ["low", "low"]
+        assert images[0]["image_url"]["url"].startswith("data:image/png;base64,")
+        assert images[1]["image_url"]["url"].startswith("data:image/jpeg;base64,")
+        assert client.post.await_args.kwargs["admission_key"] == "sk-test"
+
+    async def test_invalid_item(self):
+        """Test tags that fail validation fail only their photo"""
+        clients, _ = openai_clients(
+            completion(json.dumps({"items": [TAGS, {**TAGS, "category": "hat"}]}))
+        )
+
+        results = await OpenAITagger(clients, api_key="sk-test").tag_batch([b"a", b"b"])
+
+        assert isinstance(results[0], GarmentTags)
+        assert isinstance(results[1], TaggingError)
+
+    @pytest.mark.parametrize(
+        "response",
+        [
+            httpx.Response(500),
+            completion("not json"),
+            completion(json.dumps({"tags": []})),
+            completion(json.dumps({"items": [TAGS]})),
+        ],
+        ids=["status", "not-json", "no-items", "wrong-count"],
+    )
+    async def test_unusable_response(self, response):
+        """Test an unusable response fails the whole batch"""
+        clients, _ = openai_clients(response)
+
+        with pytest.raises(TaggingError):
+            await OpenAITagger(clients, api_key="sk-test").tag_batch([b"a", b"b"])
+
+    async def test_admission_rejected(self):
+        """Test a saturated upstream fails the batch as a tagging error"""
+        clients, _ = openai_clients(error=AdmissionRejected("openai is saturated", retry_after=1.0))
+
+        with pytest.raises(TaggingError, match="busy"):
+            await OpenAITagger(clients, api_key="sk-test").tag_batch([b"a"])
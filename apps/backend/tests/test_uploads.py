@@ -0,0 +1,303 @@
+"""
+Unit tests for the uploaded file endpoint
+"""
+import io
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from typing import Optional
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.api.endpoints import uploads
+from app.api.endpoints.uploads import RangeNotSatisfiable, parse_range
+from app.main import app
+from app.services.image_cache import DerivativeCache
+from app.services.image_processing import ImageResizer
+from app.storage import ContentAddressedStorage, LocalStorage, get_storage
+
+CONTENT = bytes(range(256)) * 4  # 1 KiB
+
+
+def make_photo(size=(1200, 900)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (120, 80, 40)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class StreamingOnlyStorage(LocalStorage):
+    """Local storage posing as a remote backend, to exercise the streaming path"""
+
+    def local_path(self, file_path: str) -> Optional[str]:
+        return None
+
+
+@pytest.fixture(params=[LocalStorage, StreamingOnlyStorage, ContentAddressedStorage])
+async def storage(request, tmp_path):
+    """Storage with one stored image, for each serving path"""
+    storage = request.param(base_dir=str(tmp_path), chunk_size=100)
+    await storage.upload("clothing/shirt.jpg", CONTENT)
+    return storage
+
+
+@pytest.fixture
+def resizer(tmp_path_factory):
+    """Resizer with a temporary cache, rendering in threads"""
+    cache_dir = tmp_path_factory.mktemp("image-cache")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        cache = DerivativeCache(str(cache_dir), memory_bytes=1024 * 1024, disk_bytes=1024 * 1024)
+        yield ImageResizer(cache, executor=executor)
+
+
+@pytest.fixture
+def client(storage, resizer, monkeypatch):
+    """Test client serving from the temporary storage"""
+    app.dependency_overrides[get_storage] = lambda: storage
+    monkeypatch.setattr(uploads, "get_image_resizer", lambda: resizer)
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_storage, None)
+
+
+@pytest.fixture
+async def photo(storage):
+    """Path of a stored 1200x900 JPEG"""
+    await storage.upload("clothing/photo.jpg", make_photo())
+    return "clothing/photo.jpg"
+
+
+class TestParseRange:
+    """Tests for parse_range()"""
+
+    def test_forms(self):
+        """Test closed, open-ended and suffix ranges"""
+        assert parse_range("bytes=0-99", 1000) == (0, 100)
+        assert parse_range("bytes=900-", 1000) == (900, 1000)
+        assert parse_range("bytes=-100", 1000) == (900, 1000)
+        assert parse_range("bytes=990-2000", 1000) == (990, 1000)
+        assert parse_range("bytes=-5000", 1000) == (0, 1000)
+
+    def test_whole_file(self):
+        """Test missing, multi-range and foreign-unit headers select everything"""
+        assert parse_range(None, 1000) is None
+        assert parse_range("bytes=0-1,5-6", 1000) is None
+        assert parse_range("items=0-1", 1000) is None
+
+    @pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-2", "bytes=abc", "bytes=-0"])
+    def test_unsatisfiable(self, header):
+        """Test ranges outside the file or malformed"""
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range(header, 1000)
+
+
+class TestServeUpload:
+    """Tests for GET /uploads/{path}"""
+
+    def test_full_file(self, client, storage):
+        """Test serving a whole file with validators"""
+        response = client.get("/uploads/clothing/shirt.jpg")
+
+        assert response.status_code == 200
+        assert response.content == CONTENT
+        assert response.headers["content-type"] == "image/jpeg"
+        assert response.headers["content-length"] == str(len(CONTENT))
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["etag"]
+        assert response.headers["last-modified"]
+
+    def test_resizer_not_resolved(self, client, monkeypatch):
+        """Test plain downloads never set up the resizer"""
+        def unexpected():
+            raise AssertionError("resizer resolved for a plain download")
+
+        monkeypatch.setattr(uploads, "get_image_resizer", unexpected)
+
+        assert client.get("/uploads/clothing/shirt.jpg").status_code == 200
+        assert client.head("/uploads/clothing/shirt.jpg").status_code == 200
+
+    def test_public_url_is_served(self, client, storage):
+        """Test the URLs storage hands out resolve to this route"""
+        response = client.get(storage.get_public_url("clothing/shirt.jpg"))
+
+        assert response.status_code == 200
+
+    def test_missing_file(self, client):
+        """Test a missing file returns 404"""
+        response = client.get("/uploads/clothing/missing.jpg")
+
+        assert response.status_code == 404
+
+    def test_path_traversal(self, client):
+        """Test paths escaping the upload directory return 404"""
+        response = client.get("/uploads/clothing/..%2F..%2Fsecret.txt")
+
+        assert response.status_code == 404
+
+    def test_range(self, client):
+        """Test a single byte range returns 206 with only those bytes"""
+        response = client.get("/uploads/clothing/shirt.jpg", headers={"Range": "bytes=100-299"})
+
+        assert response.status_code == 206
+        assert response.content == CONTENT[100:300]
+        assert response.headers["content-range"] == f"bytes 100-299/{len(CONTENT)}"
+        assert response.headers["content-length"] == "200"
+
+    def test_suffix_range(self, client):
+        """Test a suffix range returns the end of the file"""
+        response = client.get("/uploads/clothing/shirt.jpg", headers={"Range": "bytes=-24"})
+
+        assert response.status_code == 206
+        assert response.content == CONTENT[-24:]
+
+    def test_unsatisfiable_range(self, client):
+        """Test a range past the end returns 416"""
+        response = client.get("/uploads/clothing/shirt.jpg", headers={"Range": "bytes=5000-"})
+
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+    def test_if_range_mismatch_sends_full_file(self, client):
+        """Test a stale If-Range validator ignores the range"""
+        response = client.get(
+            "/uploads/clothing/shirt.jpg",
+            headers={"Range": "bytes=0-9", "If-Range": '"stale"'},
+        )
+
+        assert response.status_code == 200
+        assert response.content == CONTENT
+
+    def test_if_range_match(self, client):
+        """Test a current If-Range validator honours the range"""
+        etag = client.get("/uploads/clothing/shirt.jpg").headers["etag"]
+
+        response = client.get(
+            "/uploads/clothing/shirt.jpg",
+            headers={"Range": "bytes=0-9", "If-Range": etag},
+        )
+
+        assert response.status_code == 206
+        assert response.content == CONTENT[:10]
+
+    def test_if_none_match(self, client):
+        """Test a matching ETag returns 304 without a body"""
+        etag = client.get("/uploads/clothing/shirt.jpg").headers["etag"]
+
+        response = client.get("/uploads/clothing/shirt.jpg", headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    def test_if_none_match_weak_and_list(self, client):
+        """Test weak and listed ETags are compared weakly"""
+        etag = client.get("/uploads/clothing/shirt.jpg").headers["etag"]
+
+        response = client.get(
+            "/uploads/clothing/shirt.jpg",
+            headers={"If-None-Match": f'"other", W/{etag}'},
+        )
+
+        assert response.status_code == 304
+
+    def test_if_none_match_stale(self, client):
+        """Test a non-matching ETag returns the file"""
+        response = client.get(
+            "/uploads/clothing/shirt.jpg", headers={"If-None-Match": '"stale"'}
+        )
+
+        assert response.status_code == 200
+        assert response.content == CONTENT
+
+    def test_if_modified_since(self, client):
+        """Test an up-to-date If-Modified-Since returns 304"""
+        last_modified = client.get("/uploads/clothing/shirt.jpg").headers["last-modified"]
+
+        response = client.get(
+            "/uploads/clothing/shirt.jpg", headers={"If-Modified-Since": last_modified}
+        )
+
+        assert response.status_code == 304
+
+    def test_if_modified_since_older(self, client):
+        """Test an older If-Modified-Since returns the file"""
+        response = client.get(
+            "/uploads/clothing/shirt.jpg",
+            headers={"If-Modified-Since": formatdate(0, usegmt=True)},
+        )
+
+        assert response.status_code == 200
+
+    def test_head(self, client):
+        """Test HEAD returns headers without a body"""
+        response = client.head("/uploads/clothing/shirt.jpg")
+
+        assert response.status_code == 200
+        assert response.content == b""
+        assert response.headers["content-length"] == str(len(CONTENT))
+
+
+class TestServeResized:
+    """Tests for GET /uploads/{path}?w=&fmt="""
+
+    def test_resize(self, client, photo, resizer):
+        """Test an image is scaled to the requested width and format"""
+        response = client.get(f"/uploads/{photo}", params={"w": 256, "fmt": "jpeg"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+        image = Image.open(io.BytesIO(response.content))
+        assert image.format == "JPEG"
+        assert image.size == (256, 192)
+        assert response.headers["etag"].endswith('-256.jpeg"')
+
+    def test_defaults(self, client, photo):
+        """Test fmt defaults to WebP and w to the largest width, without enlarging"""
+        response = client.get(f"/uploads/{photo}", params={"fmt": "webp"})
+        image = Image.open(io.BytesIO(response.content))
+
+        assert response.headers["content-type"] == "image/webp"
+        assert image.size == (1200, 900)
+
+        response = client.get(f"/uploads/{photo}", params={"w": 64})
+        assert Image.open(io.BytesIO(response.content)).format == "WEBP"
+
+    def test_cached(self, client, photo, resizer):
+        """Test repeated requests are served from the cache"""
+        first = client.get(f"/uploads/{photo}", params={"w": 128})
+        second = client.get(f"/uploads/{photo}", params={"w": 128})
+
+        assert first.content == second.content
+        assert resizer.cache.stats()["hits"] == 1
+        assert resizer.cache.stats()["misses"] == 1
+
+    @pytest.mark.parametrize("params", [{"w": 100}, {"w": 99999}, {"fmt": "gif"}])
+    def test_not_allowed(self, client, photo, params):
+        """Test widths outside the allowlist and unknown formats return 400"""
+        response = client.get(f"/uploads/{photo}", params=params)
+
+        assert response.status_code == 400
+
+    def test_missing(self, client):
+        """Test resizing a missing file returns 404"""
+        response = client.get("/uploads/clothing/missing.jpg", params={"w": 128})
+
+        assert response.status_code == 404
+
+    def test_not_an_image(self, client):
+        """Test resizing a file that is not an image returns 415"""
+        response = client.get("/uploads/clothing/shirt.jpg", params={"w": 128})
+
+        assert response.status_code == 415
+
+    def test_if_none_match(self, client, photo, resizer):
+        """Test a matching validator returns 304 without rendering"""
+        etag = client.get(f"/uploads/{photo}", params={"w": 128}).headers["etag"]
+        misses = resizer.cache.stats()["misses"]
+
+        response = client.get(
+            f"/uploads/{photo}", params={"w": 128}, headers={"If-None-Match": etag}
+        )
+
+        assert response.status_code == 304
+        assert resizer.cache.stats()["misses"] == misses
+        assert resizer.cache.stats()["hits"] == 0